@@ -1,5 +1,8 @@
+import os
+import asyncio
 from fastapi import FastAPI
 from app.routes import router
+from app.services import agendador, cliente_async
 from fastapi.middleware.cors import CORSMiddleware
 from app.routes import router
 
@@ -7,6 +10,18 @@ app = FastAPI()
 
 app.include_router(router)
 
+@app.on_event("startup")
+async def iniciar_servicos():
+    # Os clientes HTTP dos serviços usam o mesmo event loop da API
+    cliente_async.usar_loop(asyncio.get_running_loop())
+    if os.getenv("AGENDADOR_ATIVO", "1") == "1":
+        agendador.iniciar()
+
+@app.on_event("shutdown")
+async def parar_servicos():
+    agendador.parar()
+    await cliente_async.fechar()
+
 app.add_middleware(
     CORSMiddleware,
     allow_origins=["FRONTEND_URL"],
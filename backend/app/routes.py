@@ -1,13 +1,15 @@
 from fastapi import APIRouter, Request, HTTPException, Depends, status
-from fastapi.responses import StreamingResponse
+from fastapi.responses import StreamingResponse, PlainTextResponse, Response
 from fastapi.security import OAuth2PasswordBearer, OAuth2PasswordRequestForm
 from jose import JWTError, jwt
 from passlib.context import CryptContext
-from app.services import magalu, mercadolivre, amazon
+from app.services import magalu, mercadolivre, amazon, metricas, execucoes, lotes, agendador, fila, relatorios
 from app.services.utils import load_tokens_from_env
 from pydantic import BaseModel
+from typing import List, Optional
 from dotenv import load_dotenv
 import os
+import asyncio
 import secrets
 import time
 from datetime import datetime, timedelta
@@ -35,6 +37,32 @@ class PasswordInput(BaseModel):
 class ColetaRequest(BaseModel):
     plataforma: str
     vendedor: str
+    perfil: bool = False
+    incremental: bool = False
+
+class ItemLote(BaseModel):
+    plataforma: str
+    vendedor: str
+
+class LoteRequest(BaseModel):
+    itens: List[ItemLote] = []
+    todos: bool = False
+    plataformas: List[str] = []
+    perfil: bool = False
+    incremental: bool = False
+
+class EstoqueRequest(BaseModel):
+    vendedor: str
+    skus: List[str] = []
+    asins: List[str] = []
+
+class AgendamentoRequest(BaseModel):
+    plataforma: str
+    vendedor: Optional[str] = None
+    tipo: str = "completa"
+    cron: str
+    jitter_segundos: int = 0
+    recuperar_perdidas: bool = True
 
 def verify_password(plain_password, hashed_password):
     return pwd_context.verify(plain_password, hashed_password)
@@ -88,19 +116,89 @@ async def coletar(
     request: ColetaRequest, 
     current_user: dict = Depends(get_current_user)
 ):
+    if request.plataforma not in execucoes.COLETORES:
+        return {"erro": "Plataforma não suportada"}
+    if fila.ATIVA:
+        return await coletar_pela_fila(request)
     try:
-        if request.plataforma == "magalu":
-            msg = magalu.coletar_dados_magalu(request.vendedor)
-        elif request.plataforma == "mercadolivre":
-            msg = mercadolivre.coletar_dados_ml(request.vendedor)
-        elif request.plataforma == "amazon":
-            msg = amazon.coletar_dados_amazon(request.vendedor)
-        else:
-            return {"erro": "Plataforma não suportada"}
-        return {"mensagem": msg}
+        execucao_id, msg = await asyncio.to_thread(
+            execucoes.executar_coleta,
+            request.plataforma, request.vendedor, perfil=request.perfil, incremental=request.incremental
+        )
+        return {"mensagem": msg, "execucao_id": execucao_id}
+    except (execucoes.ColetaEmAndamento, ValueError) as e:
+        return {"erro": str(e)}
+    except Exception:
+        return {"erro": "Falha na operação de coleta"}
+
+# Enfileira a coleta e aguarda um worker concluí-la (a coleta sobrevive a reinícios da API).
+# Depois de FILA_ESPERA_API_SEGUNDOS responde com o job_id e a situação atual, e o cliente
+# acompanha o job em /admin/fila.
+async def coletar_pela_fila(request: ColetaRequest):
+    try:
+        job_id = await asyncio.to_thread(
+            fila.enfileirar, request.plataforma, request.vendedor, request.incremental, request.perfil
+        )
+        limite = time.monotonic() + fila.ESPERA_API_SEGUNDOS
+        situacao = "pendente"
+        while time.monotonic() < limite:
+            await asyncio.sleep(2)
+            job = await asyncio.to_thread(fila.buscar_job, job_id)
+            if job is None:
+                return {"erro": f"Job {job_id} não encontrado na fila", "job_id": job_id}
+            situacao = job["status"]
+            if situacao == "concluida":
+                return {"mensagem": job["mensagem"], "execucao_id": job["execucao_id"], "job_id": job_id}
+            if situacao == "erro":
+                return {"erro": job["mensagem"] or "Falha na operação de coleta", "job_id": job_id}
+        return {"mensagem": "Coleta enfileirada, ainda não concluída", "job_id": job_id, "status": situacao}
     except Exception:
         return {"erro": "Falha na operação de coleta"}
 
+# Rota síncrona (roda no threadpool do FastAPI): criar e consultar o lote acessam o banco
+# de controle, e o event loop é o mesmo dos clientes HTTP das coletas em andamento
+@router.post("/coletar/lote")
+def coletar_lote(
+    request: LoteRequest,
+    current_user: dict = Depends(get_current_user)
+):
+    itens = [item.dict() for item in request.itens]
+    if request.todos:
+        itens.extend(lotes.todos_os_vendedores(request.plataformas or None))
+    if not itens:
+        return {"erro": "Nenhum vendedor informado"}
+    try:
+        lote_id = lotes.criar_lote(itens, perfil=request.perfil, incremental=request.incremental)
+    except ValueError as e:
+        return {"erro": str(e)}
+    return {"mensagem": "Lote agendado", "lote_id": lote_id, "total": len(lotes.buscar_lote(lote_id)["itens"])}
+
+@router.get("/coletar/lote/{lote_id}")
+def situacao_lote(
+    lote_id: str,
+    current_user: dict = Depends(get_current_user)
+):
+    lote = lotes.buscar_lote(lote_id)
+    if lote is None:
+        raise HTTPException(status_code=404, detail="Lote não encontrado")
+    return lote
+
+# Atualização do estoque FBA apenas dos SKUs/ASINs informados
+@router.post("/amazon/estoque")
+async def atualizar_estoque_amazon(
+    request: EstoqueRequest,
+    current_user: dict = Depends(get_current_user)
+):
+    if not request.skus and not request.asins:
+        return {"erro": "Informe ao menos um SKU ou ASIN"}
+    try:
+        msg = await asyncio.to_thread(
+            amazon.atualizar_estoque_direcionado, request.vendedor, skus=request.skus, asins=request.asins
+        )
+        return {"mensagem": msg}
+    except Exception:
+        return {"erro": "Falha ao atualizar o estoque"}
+
 @router.get("/vendedores/{plataforma}")
 def listar_vendedores(
     plataforma: str, 
@@ -132,7 +230,7 @@ def baixar_zip(
             return {"erro": "Plataforma não suportada"}
 
         return StreamingResponse(
-            zip_stream,
+            relatorios.iterar_arquivo(zip_stream),
             media_type="application/x-zip-compressed",
             headers={"Content-Disposition": f"attachment; filename={nome_base}_Relatorios.zip"}
         )
@@ -148,3 +246,86 @@ async def stream_logs(
     def fake_event():
         yield f"data: Coleta finalizada para {vendedor} na plataforma {plataforma}\n\n"
     return StreamingResponse(fake_event(), media_type="text/event-stream")
+
+@router.get("/metrics", response_class=PlainTextResponse)
+def exportar_metricas():
+    return PlainTextResponse(metricas.renderizar(), media_type="text/plain; version=0.0.4")
+
+@router.get("/admin/execucoes")
+def listar_execucoes(
+    limite: int = 50,
+    current_user: dict = Depends(get_current_user)
+):
+    try:
+        return execucoes.listar_execucoes(limite)
+    except Exception:
+        return {"erro": "Falha ao listar execuções"}
+
+@router.get("/admin/execucoes/{execucao_id}/tempos")
+def baixar_tempos(
+    execucao_id: int,
+    current_user: dict = Depends(get_current_user)
+):
+    execucao = execucoes.buscar_execucao(execucao_id)
+    if not execucao:
+        raise HTTPException(status_code=404, detail="Execução não encontrada")
+    return execucao
+
+@router.get("/admin/execucoes/{execucao_id}/perfil")
+def baixar_perfil(
+    execucao_id: int,
+    current_user: dict = Depends(get_current_user)
+):
+    perfil = execucoes.buscar_perfil(execucao_id)
+    if perfil is None:
+        raise HTTPException(status_code=404, detail="Perfil não encontrado para esta execução")
+    return Response(
+        perfil,
+        media_type="application/octet-stream",
+        headers={"Content-Disposition": f"attachment; filename=execucao_{execucao_id}.prof"}
+    )
+
+@router.get("/admin/fila")
+def listar_fila(
+    status: Optional[str] = None,
+    limite: int = 100,
+    current_user: dict = Depends(get_current_user)
+):
+    try:
+        return fila.listar_jobs(status, limite)
+    except Exception:
+        return {"erro": "Falha ao listar a fila"}
+
+@router.get("/admin/agendamentos")
+def listar_agendamentos(
+    current_user: dict = Depends(get_current_user)
+):
+    try:
+        return agendador.listar_agendamentos()
+    except Exception:
+        return {"erro": "Falha ao listar agendamentos"}
+
+@router.post("/admin/agendamentos")
+def criar_agendamento(
+    request: AgendamentoRequest,
+    current_user: dict = Depends(get_current_user)
+):
+    try:
+        agendamento_id = agendador.criar_agendamento(
+            request.plataforma, request.vendedor, request.tipo, request.cron,
+            request.jitter_segundos, request.recuperar_perdidas
+        )
+        return {"mensagem": "Agendamento criado", "id": agendamento_id}
+    except ValueError as e:
+        return {"erro": str(e)}
+    except Exception:
+        return {"erro": "Falha ao criar agendamento"}
+
+@router.delete("/admin/agendamentos/{agendamento_id}")
+def remover_agendamento(
+    agendamento_id: int,
+    current_user: dict = Depends(get_current_user)
+):
+    if not agendador.remover_agendamento(agendamento_id):
+        raise HTTPException(status_code=404, detail="Agendamento não encontrado")
+    return {"mensagem": "Agendamento removido"}
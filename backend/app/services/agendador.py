@@ -0,0 +1,176 @@
+import os
+import random
+import threading
+from datetime import timedelta
+from croniter import croniter
+from app.services import execucoes, lotes, particoes
+
+# ------------------------- AGENDADOR PERIÓDICO ----------------------------
+
+# Agendador em processo: a cada AGENDADOR_INTERVALO segundos lê a tabela agendamentos
+# (banco de controle) e envia as coletas vencidas ao escalonador de lotes, que aplica
+# os limites de concorrência. Cada agendamento guarda a próxima execução já com o
+# jitter sorteado, o que espalha os vendedores agendados para o mesmo horário.
+#
+# Execuções perdidas (aplicação fora do ar no horário) rodam uma única vez na
+# retomada quando recuperar_perdidas = TRUE; caso contrário são puladas. A trava por
+# vendedor de execucoes.executar_coleta impede duas coletas simultâneas do mesmo vendedor.
+# O ciclo também faz a manutenção das partições (particoes.manutencao_periodica).
+#
+# Variáveis de ambiente:
+#   AGENDADOR_ATIVO        "1" para iniciar junto com a aplicação (padrão "1")
+#   AGENDADOR_INTERVALO    intervalo de verificação em segundos (padrão 30)
+
+INTERVALO = int(os.getenv("AGENDADOR_INTERVALO", 30))
+TIPOS = ("completa", "incremental")
+
+COLUNAS = [
+    "id", "plataforma", "vendedor", "tipo", "cron", "jitter_segundos",
+    "recuperar_perdidas", "ativo", "ultima_execucao", "proxima_execucao"
+]
+
+_parar = threading.Event()
+_thread = None
+
+# Próximo horário da expressão cron após 'base', somado a um jitter aleatório
+def calcular_proxima(cron, base, jitter_segundos=0):
+    proxima = croniter(cron, base).get_next(type(base))
+    if jitter_segundos:
+        proxima += timedelta(seconds=random.uniform(0, jitter_segundos))
+    return proxima
+
+# ------------------------- CONFIGURAÇÃO ----------------------------
+
+def validar_agendamento(plataforma, tipo, cron):
+    if plataforma not in execucoes.COLETORES:
+        raise ValueError(f"Plataforma '{plataforma}' não suportada.")
+    if tipo not in TIPOS:
+        raise ValueError(f"Tipo '{tipo}' inválido (use {', '.join(TIPOS)}).")
+    if tipo == "incremental" and plataforma not in execucoes.PLATAFORMAS_INCREMENTAIS:
+        raise ValueError(f"Plataforma '{plataforma}' não possui coleta incremental.")
+    if not croniter.is_valid(cron):
+        raise ValueError(f"Expressão cron inválida: '{cron}'.")
+
+def listar_agendamentos():
+    conn = execucoes.get_connection()
+    if not conn:
+        return []
+    try:
+        with conn.cursor() as cur:
+            cur.execute(f"SELECT {', '.join(COLUNAS)} FROM agendamentos ORDER BY id")
+            return [dict(zip(COLUNAS, row)) for row in cur.fetchall()]
+    finally:
+        conn.close()
+
+def criar_agendamento(plataforma, vendedor, tipo, cron, jitter_segundos=0, recuperar_perdidas=True):
+    validar_agendamento(plataforma, tipo, cron)
+    conn = execucoes.get_connection()
+    if not conn:
+        raise RuntimeError("Banco de controle indisponível.")
+    try:
+        with conn.cursor() as cur:
+            cur.execute("""
+                INSERT INTO agendamentos (
+                    plataforma, vendedor, tipo, cron, jitter_segundos, recuperar_perdidas, proxima_execucao
+                )
+                VALUES (%s, %s, %s, %s, %s, %s, %s)
+                RETURNING id
+            """, (
+                plataforma, vendedor, tipo, cron, jitter_segundos, recuperar_perdidas,
+                calcular_proxima(cron, execucoes.agora(), jitter_segundos)
+            ))
+            agendamento_id = cur.fetchone()[0]
+        conn.commit()
+        return agendamento_id
+    finally:
+        conn.close()
+
+def remover_agendamento(agendamento_id):
+    conn = execucoes.get_connection()
+    if not conn:
+        raise RuntimeError("Banco de controle indisponível.")
+    try:
+        with conn.cursor() as cur:
+            cur.execute("DELETE FROM agendamentos WHERE id = %s", (agendamento_id,))
+            removido = cur.rowcount > 0
+        conn.commit()
+        return removido
+    finally:
+        conn.close()
+
+# ------------------------- CICLO ----------------------------
+
+# Envia ao escalonador as coletas do agendamento (todos os vendedores se vendedor for NULL)
+def disparar(agendamento):
+    if agendamento["vendedor"]:
+        itens = [{"plataforma": agendamento["plataforma"], "vendedor": agendamento["vendedor"]}]
+    else:
+        itens = lotes.todos_os_vendedores([agendamento["plataforma"]])
+    if not itens:
+        return None
+    return lotes.criar_lote(itens, incremental=agendamento["tipo"] == "incremental")
+
+# Verifica os agendamentos ativos e dispara os vencidos
+def verificar_agendamentos():
+    conn = execucoes.get_connection()
+    if not conn:
+        return
+    try:
+        agora = execucoes.agora()
+        with conn.cursor() as cur:
+            cur.execute(f"SELECT {', '.join(COLUNAS)} FROM agendamentos WHERE ativo ORDER BY id")
+            agendamentos = [dict(zip(COLUNAS, row)) for row in cur.fetchall()]
+
+        for agendamento in agendamentos:
+            prevista = agendamento["proxima_execucao"]
+            if prevista is not None and prevista > agora:
+                continue
+
+            # Execução perdida: mais de um horário do cron passou desde a prevista
+            perdida = prevista is not None and calcular_proxima(agendamento["cron"], prevista) <= agora
+            executar = prevista is not None and (agendamento["recuperar_perdidas"] or not perdida)
+            proxima = calcular_proxima(agendamento["cron"], agora, agendamento["jitter_segundos"])
+
+            # A atualização condicionada à previsão lida garante que, com várias instâncias,
+            # apenas uma dispare o mesmo horário
+            with conn.cursor() as cur:
+                cur.execute("""
+                    UPDATE agendamentos
+                    SET proxima_execucao = %s,
+                        ultima_execucao = CASE WHEN %s THEN %s ELSE ultima_execucao END
+                    WHERE id = %s AND proxima_execucao IS NOT DISTINCT FROM %s
+                """, (proxima, executar, agora, agendamento["id"], prevista))
+                reivindicado = cur.rowcount > 0
+            conn.commit()
+
+            if reivindicado and executar:
+                if perdida:
+                    print(f"Agendamento {agendamento['id']}: recuperando execução perdida de {prevista}.")
+                try:
+                    disparar(agendamento)
+                except Exception as e:
+                    print(f"Erro ao disparar agendamento {agendamento['id']}: {e}")
+    except Exception as e:
+        conn.rollback()
+        print(f"Erro ao verificar agendamentos: {e}")
+    finally:
+        conn.close()
+
+def _ciclo():
+    while not _parar.is_set():
+        verificar_agendamentos()
+        particoes.manutencao_periodica()
+        _parar.wait(INTERVALO)
+
+# ------------------------- INÍCIO / PARADA ----------------------------
+
+def iniciar():
+    global _thread
+    if _thread is not None and _thread.is_alive():
+        return
+    _parar.clear()
+    _thread = threading.Thread(target=_ciclo, name="agendador", daemon=True)
+    _thread.start()
+
+def parar():
+    _parar.set()
@@ -1,16 +1,14 @@
 import os
 import json
-import requests
+import httpx
+import asyncio
 import pandas as pd
 from dotenv import load_dotenv
 from datetime import datetime, timedelta, timezone
-import psycopg2
-from psycopg2.extras import execute_values
-import io
-import zipfile
+from psycopg2.extras import execute_values, Json
 import pytz
-import requests.exceptions
 import time
+from app.services import metricas, tempos, recursos, cliente_async, sonda_imagens, relatorios, particoes, arquivo_bruto, mapeamento, qualidade
 
 # ------------------------- VARIÁVEIS DE AMBIENTE ----------------------------
 
@@ -21,24 +19,59 @@ client_secret = os.getenv("AMAZON_CLIENT_SECRET")
 base_url = os.getenv("AMAZON_URL_BASE_API")
 marketplace_id = os.getenv("AMAZON_MARKETPLACE_ID")
 
+# Pedidos e métricas são coletados em janelas de tempo paralelas
+DIAS_PEDIDOS = int(os.getenv("AMAZON_DIAS_PEDIDOS", 7))
+JANELA_PEDIDOS_HORAS = max(1, int(os.getenv("AMAZON_JANELA_PEDIDOS_HORAS", 24)))
+JANELA_METRICAS_MESES = max(1, int(os.getenv("AMAZON_JANELA_METRICAS_MESES", 3)))
+JANELAS_PARALELAS = max(1, int(os.getenv("AMAZON_JANELAS_PARALELAS", 4)))
+
+# Cota do getOrders (0,0167 req/s com rajada de 20 na SP-API), compartilhada pelas janelas,
+# e tentativas de uma página com 429, 5xx ou falha de rede (espera inicial em segundos,
+# dobrada a cada nova tentativa)
+PEDIDOS_RPS = float(os.getenv("AMAZON_PEDIDOS_RPS", 0.0167))
+PEDIDOS_RAJADA = float(os.getenv("AMAZON_PEDIDOS_RAJADA", 20))
+PEDIDOS_TENTATIVAS = max(1, int(os.getenv("AMAZON_PEDIDOS_TENTATIVAS", 4)))
+PEDIDOS_ESPERA = float(os.getenv("AMAZON_PEDIDOS_ESPERA", 5))
+
+# Cota do getOrderItems (0,5 req/s com rajada de 30 na SP-API) e pedidos por bloco gravado
+ITENS_RPS = float(os.getenv("AMAZON_ITENS_RPS", 0.5))
+ITENS_RAJADA = float(os.getenv("AMAZON_ITENS_RAJADA", 30))
+ITENS_POR_BLOCO = max(1, int(os.getenv("AMAZON_ITENS_POR_BLOCO", 100)))
+
+# Catalog Items API: até 20 ASINs por busca, cota de 2 req/s, e validade do cache por ASIN
+CATALOGO_ASINS_POR_BUSCA = min(20, max(1, int(os.getenv("AMAZON_CATALOGO_ASINS_POR_BUSCA", 20))))
+CATALOGO_RPS = float(os.getenv("AMAZON_CATALOGO_RPS", 2))
+CATALOGO_VALIDADE_HORAS = float(os.getenv("AMAZON_CATALOGO_VALIDADE_HORAS", 24))
+
+# Estoque direcionado: até 50 SKUs por consulta (sellerSkus), cota de 2 req/s
+ESTOQUE_SKUS_POR_CONSULTA = min(50, max(1, int(os.getenv("AMAZON_ESTOQUE_SKUS_POR_CONSULTA", 50))))
+ESTOQUE_RPS = float(os.getenv("AMAZON_ESTOQUE_RPS", 2))
+
+# Pedidos nesses status não mudam mais: os itens já gravados não são consultados de novo
+STATUS_FINALIZADOS = {"Shipped", "Canceled", "Unfulfillable"}
+
 # ------------------------- CONFIGURAÇÃO BANCO DE DADOS ----------------------------
 
 # Conexão com o banco de dados PostgreSQL
 def get_connection():
     try:
-        conn = psycopg2.connect(
+        conn = recursos.conectar(
+            "amazon",
             host=os.getenv("AMAZON_DB_HOST"),
             port=os.getenv("AMAZON_DB_PORT"),
             dbname=os.getenv("AMAZON_DB_NAME"),
             user=os.getenv("AMAZON_DB_USER"),
             password=os.getenv("AMAZON_DB_PASSWORD"),
-            sslmode="require"
+            sslmode=os.getenv("AMAZON_DB_SSLMODE", "require")
         )
         return conn
     except Exception as e:
         print("Erro ao conectar com o banco de dados no Supabase:", e)
         return None
 
+# Tabelas particionadas por dia de data_registro (particoes.py)
+TABELAS_PARTICIONADAS = ["produtos", "pedidos", "estoque", "erros_qualidade_produtos", "erros_qualidade_estoque"]
+
 # ------------------------- TOKENS ----------------------------
 
 # Carrega os tokens do ambiente
@@ -55,7 +88,7 @@ def load_tokens():
     return {}
 
 # Obtém o access_token a partir do refresh_token
-def get_access_token(refresh_token):
+async def get_access_token_async(refresh_token):
     url = os.getenv("AMAZON_URL_BASE_AUTH")
     client_id = os.getenv("AMAZON_CLIENT_ID")
     client_secret = os.getenv("AMAZON_CLIENT_SECRET")
@@ -66,37 +99,49 @@ def get_access_token(refresh_token):
         'refresh_token': refresh_token
     }
     headers = {'Content-Type': 'application/x-www-form-urlencoded'}
-    response = requests.post(url, data=data, headers=headers)
+    response = await cliente_async.requisitar("amazon", "POST", url, data=data, headers=headers)
     if response.status_code == 200:
         token = response.json().get('access_token')
+        metricas.renovacoes_token.inc(plataforma="amazon", resultado="sucesso")
         return token
     else:
+        metricas.renovacoes_token.inc(plataforma="amazon", resultado="falha")
         print(f"Erro ao obter access_token:: Status {response.status_code}")
         return None
 
+def get_access_token(refresh_token):
+    return cliente_async.executar_sync(get_access_token_async(refresh_token))
+
 # ------------------------- CHAMADAS API ----------------------------
 
-# Fazer requisições à API da Amazon
-def make_request(url, headers, params=None, method="GET", timeout=30):
+# Fazer requisições à API da Amazon. Retorna None se a requisição falhar, ou a própria
+# resposta de erro com respostas_de_erro=True (para o chamador decidir se tenta de novo)
+async def make_request_async(url, headers, params=None, method="GET", timeout=30, respostas_de_erro=False):
+    inicio = time.perf_counter()
     try:
         if method == "GET":
-            response = requests.get(url, headers=headers, params=params, timeout=timeout)
+            response = await cliente_async.requisitar("amazon", "GET", url, headers=headers, params=params, timeout=timeout)
         elif method == "POST":
-            response = requests.post(url, headers=headers, data=params, timeout=timeout)
+            response = await cliente_async.requisitar("amazon", "POST", url, headers=headers, data=params, timeout=timeout)
         else:
             raise ValueError("Método HTTP não suportado.")
+        metricas.observar_requisicao("amazon", url, response.status_code, time.perf_counter() - inicio)
         if response.status_code == 200:
             return response
         else:
             print(f"Requisição falhou — status {response.status_code}")
             print(f"Resposta:: Status {response.status_code}")
-            return None
-    except requests.exceptions.RequestException as e:
+            return response if respostas_de_erro else None
+    except httpx.HTTPError as e:
+        metricas.observar_requisicao("amazon", url, "erro", time.perf_counter() - inicio)
         print("Erro na requisição:", e)
         return None
 
+def make_request(url, headers, params=None, method="GET", timeout=30):
+    return cliente_async.executar_sync(make_request_async(url, headers, params, method, timeout))
+
 # Obtém todos os produtos
-def get_listing_items(access_token, seller_id):
+async def get_listing_items_async(access_token, seller_id):
     url = f"{base_url}/listings/2021-08-01/items/{seller_id}"
     created_after = (datetime.now() - timedelta(days=730)).strftime('%Y-%m-%dT%H:%M:%S.000Z')
     headers = {
@@ -114,7 +159,7 @@ def get_listing_items(access_token, seller_id):
         req_params = base_params.copy()
         if page_token:
             req_params["pageToken"] = page_token
-        response = make_request(url, headers, params=req_params, method="GET", timeout=30)
+        response = await make_request_async(url, headers, params=req_params, method="GET", timeout=30)
         if response is None:
             break
         if response.status_code == 200:
@@ -136,47 +181,172 @@ def get_listing_items(access_token, seller_id):
             page_token = data.get("pagination", {}).get("nextToken")
             if not page_token:
                 break
-            time.sleep(2)
+            await asyncio.sleep(2)
         else:
             print(f"Erro ao obter produtos:: Status {response.status_code}")
             break
     return all_items
 
-def get_orders(access_token):
-    created_after = (datetime.now(timezone.utc) - timedelta(days=7)).strftime('%Y-%m-%dT%H:%M:%S.000Z')
+def get_listing_items(access_token, seller_id):
+    return cliente_async.executar_sync(get_listing_items_async(access_token, seller_id))
+
+# Divide o intervalo [inicio, fim) em janelas consecutivas de no máximo 'tamanho'
+def dividir_intervalo(inicio, fim, tamanho):
+    janelas = []
+    atual = inicio
+    while atual < fim:
+        proximo = min(atual + tamanho, fim)
+        janelas.append((atual, proximo))
+        atual = proximo
+    return janelas
+
+# Espera antes de tentar a página de novo: o Retry-After da resposta, se houver
+def _espera_pedidos(response, tentativa):
+    try:
+        return float(response.headers["Retry-After"])
+    except (AttributeError, KeyError, TypeError, ValueError):
+        return PEDIDOS_ESPERA * 2 ** tentativa
+
+# Busca uma página do getOrders dentro da cota. 429, 5xx e falhas de rede são tentados de
+# novo (até AMAZON_PEDIDOS_TENTATIVAS vezes); se a página não vier, levanta um erro: o
+# resto da janela não pode ser descartado como se a cadeia de NextToken tivesse acabado.
+async def pagina_pedidos_async(url, headers, params):
+    for tentativa in range(PEDIDOS_TENTATIVAS):
+        await recursos.limite("amazon_pedidos", PEDIDOS_RPS, PEDIDOS_RAJADA).aguardar_async()
+        response = await make_request_async(url, headers, params=params, method="GET", timeout=180, respostas_de_erro=True)
+        if response is not None and response.status_code == 200:
+            return response.json().get('payload', {})
+        status = response.status_code if response is not None else "sem resposta"
+        if response is not None and response.status_code != 429 and response.status_code < 500:
+            break
+        if tentativa + 1 < PEDIDOS_TENTATIVAS:
+            await asyncio.sleep(_espera_pedidos(response, tentativa))
+    raise Exception(f"Erro ao obter pedidos: Status {status}")
+
+# Percorre a cadeia de NextToken dos pedidos criados em uma janela. A última janela não
+# envia CreatedBefore (a API exige que ele seja ao menos 2 minutos antes da chamada).
+async def get_orders_janela_async(headers, inicio, fim=None):
     url = f"{base_url}/orders/v0/orders"
-    headers = {
-        'Accept': 'application/json',
-        'x-amz-access-token': access_token
-    }
     params = {
-        'CreatedAfter': created_after,
+        'CreatedAfter': inicio.strftime('%Y-%m-%dT%H:%M:%S.000Z'),
         'MarketplaceIds': marketplace_id
     }
-    all_orders = []
+    if fim is not None:
+        params['CreatedBefore'] = fim.strftime('%Y-%m-%dT%H:%M:%S.000Z')
+    orders = []
     next_token = None
     while True:
         req_params = params.copy()
         if next_token:
             req_params = {'MarketplaceIds': marketplace_id, 'NextToken': next_token}
-        response = make_request(url, headers, params=req_params, method="GET", timeout=180)
-        if response is None:
-            break
-        if response.status_code == 200:
-            data = response.json()
-            payload = data.get('payload', {})
-            orders = payload.get('Orders', [])
-            all_orders.extend(orders)
-            next_token = payload.get('NextToken')
-            if not next_token:
-                break
-            time.sleep(2)
-        else:
-            print(f"Erro ao obter pedidos:: Status {response.status_code}")
+        payload = await pagina_pedidos_async(url, headers, req_params)
+        orders.extend(payload.get('Orders', []))
+        next_token = payload.get('NextToken')
+        if not next_token:
             break
-    return all_orders
+        await asyncio.sleep(2)
+    return orders
 
-def get_fba_inventory_summaries(access_token):
+# Obtém os pedidos dos últimos 'dias' dividindo o período em janelas de
+# AMAZON_JANELA_PEDIDOS_HORAS, cada uma com sua própria cadeia de NextToken, executadas
+# em paralelo (até AMAZON_JANELAS_PARALELAS). Pedidos repetidos entre janelas são
+# unificados por AmazonOrderId, ficando a versão com LastUpdateDate mais recente.
+async def get_orders_async(access_token, dias=None):
+    dias = dias or DIAS_PEDIDOS
+    fim = datetime.now(timezone.utc)
+    headers = {
+        'Accept': 'application/json',
+        'x-amz-access-token': access_token
+    }
+    janelas = dividir_intervalo(fim - timedelta(days=dias), fim, timedelta(hours=JANELA_PEDIDOS_HORAS))
+    semaforo = asyncio.Semaphore(JANELAS_PARALELAS)
+
+    async def coletar_janela(indice, inicio, fim_janela):
+        async with semaforo:
+            ultima = indice == len(janelas) - 1
+            return await get_orders_janela_async(headers, inicio, None if ultima else fim_janela)
+
+    resultados = await asyncio.gather(*(coletar_janela(i, ini, f) for i, (ini, f) in enumerate(janelas)))
+
+    all_orders = {}
+    for orders in resultados:
+        for order in orders:
+            order_id = order.get('AmazonOrderId')
+            anterior = all_orders.get(order_id)
+            if anterior is None or (order.get('LastUpdateDate') or '') > (anterior.get('LastUpdateDate') or ''):
+                all_orders[order_id] = order
+    print(f"Total de pedidos coletados: {len(all_orders)} ({len(janelas)} janela(s))")
+    return list(all_orders.values())
+
+def get_orders(access_token, dias=None):
+    return cliente_async.executar_sync(get_orders_async(access_token, dias))
+
+# Busca no Catalog Items API (searchCatalogItems por identificadores) os dados de um
+# grupo de ASINs: imagens, atributos, classificações e resumo. ASINs sem resultado
+# voltam com dados vazios, para também entrarem no cache.
+async def search_catalog_items_async(headers, asins):
+    url = f"{base_url}/catalog/2022-04-01/items"
+    params = {
+        'identifiers': ",".join(asins),
+        'identifiersType': 'ASIN',
+        'marketplaceIds': marketplace_id,
+        'includedData': 'images,attributes,classifications,summaries',
+        'pageSize': len(asins)
+    }
+    await recursos.limite("amazon_catalogo", CATALOGO_RPS).aguardar_async()
+    response = await make_request_async(url, headers, params=params, method="GET", timeout=30)
+    if response is None:
+        return {}
+    encontrados = {item.get("asin"): item for item in response.json().get("items", [])}
+    return {asin: encontrados.get(asin, {}) for asin in asins}
+
+# Busca os dados de catálogo de vários ASINs, em grupos de CATALOGO_ASINS_POR_BUSCA
+async def get_catalog_items_async(access_token, asins):
+    headers = {
+        'Accept': 'application/json',
+        'x-amz-access-token': access_token
+    }
+    grupos = [asins[i:i + CATALOGO_ASINS_POR_BUSCA] for i in range(0, len(asins), CATALOGO_ASINS_POR_BUSCA)]
+    resultados = await asyncio.gather(*(search_catalog_items_async(headers, grupo) for grupo in grupos))
+    catalogo = {}
+    for resultado in resultados:
+        catalogo.update(resultado)
+    return catalogo
+
+def get_catalog_items(access_token, asins):
+    return cliente_async.executar_sync(get_catalog_items_async(access_token, asins))
+
+# Obtém os itens de um pedido (getOrderItems) dentro da cota do endpoint.
+# Retorna None em caso de falha, para que o pedido seja consultado de novo na próxima coleta.
+async def get_order_items_async(headers, order_id):
+    url = f"{base_url}/orders/v0/orders/{order_id}/orderItems"
+    items = []
+    next_token = None
+    while True:
+        params = {'NextToken': next_token} if next_token else None
+        await recursos.limite("amazon_itens", ITENS_RPS, ITENS_RAJADA).aguardar_async()
+        response = await make_request_async(url, headers, params=params, method="GET", timeout=30)
+        if response is None:
+            return None
+        payload = response.json().get('payload', {})
+        items.extend(payload.get('OrderItems', []))
+        next_token = payload.get('NextToken')
+        if not next_token:
+            return items
+
+# Obtém os itens de vários pedidos em paralelo; o token bucket dita o ritmo
+async def get_orders_items_async(access_token, order_ids):
+    headers = {
+        'Accept': 'application/json',
+        'x-amz-access-token': access_token
+    }
+    resultados = await asyncio.gather(*(get_order_items_async(headers, order_id) for order_id in order_ids))
+    return dict(zip(order_ids, resultados))
+
+def get_orders_items(access_token, order_ids):
+    return cliente_async.executar_sync(get_orders_items_async(access_token, order_ids))
+
+async def get_fba_inventory_summaries_async(access_token):
     start_date = (datetime.now(timezone.utc) - timedelta(days=90)).strftime('%Y-%m-%dT%H:%M:%S.000Z')
     url = f"{base_url}/fba/inventory/v1/summaries"
     headers = {
@@ -196,7 +366,7 @@ def get_fba_inventory_summaries(access_token):
         req_params = base_params.copy()
         if next_token:
             req_params['nextToken'] = next_token
-        response = make_request(url, headers, params=req_params, method="GET", timeout=30)
+        response = await make_request_async(url, headers, params=req_params, method="GET", timeout=30)
         if response is None:
             break
         data = response.json()
@@ -206,52 +376,116 @@ def get_fba_inventory_summaries(access_token):
         next_token = data.get('pagination', {}).get('nextToken')
         if not next_token:
             break
-        time.sleep(2)
+        await asyncio.sleep(2)
     return all_summaries
 
-def get_order_metrics(access_token):
-    interval_start = (datetime.now(timezone.utc) - timedelta(days=365)).strftime('%Y-%m-%dT00:00:00Z')
-    interval_end = datetime.now(timezone.utc).strftime('%Y-%m-%dT23:59:59Z')
-    interval = f"{interval_start}--{interval_end}"
-    url = f"{base_url}/sales/v1/orderMetrics"
+def get_fba_inventory_summaries(access_token):
+    return cliente_async.executar_sync(get_fba_inventory_summaries_async(access_token))
+
+# Consulta o estoque de um grupo de SKUs (sellerSkus), seguindo o nextToken se houver
+async def get_fba_inventory_skus_async(headers, skus):
+    url = f"{base_url}/fba/inventory/v1/summaries"
+    base_params = {
+        'marketplaceIds': marketplace_id,
+        'details': 'true',
+        'granularityType': 'Marketplace',
+        'granularityId': marketplace_id,
+        'sellerSkus': ",".join(skus)
+    }
+    summaries = []
+    next_token = None
+    while True:
+        req_params = base_params.copy()
+        if next_token:
+            req_params['nextToken'] = next_token
+        await recursos.limite("amazon_estoque", ESTOQUE_RPS).aguardar_async()
+        response = await make_request_async(url, headers, params=req_params, method="GET", timeout=30)
+        if response is None:
+            break
+        data = response.json()
+        summaries.extend(data.get('payload', {}).get('inventorySummaries', []))
+        next_token = data.get('pagination', {}).get('nextToken')
+        if not next_token:
+            break
+    return summaries
+
+# Estoque apenas dos SKUs informados, em grupos de ESTOQUE_SKUS_POR_CONSULTA consultados em paralelo
+async def get_fba_inventory_by_skus_async(access_token, skus):
     headers = {
         'Accept': 'application/json',
         'x-amz-access-token': access_token
     }
+    skus = sorted(set(skus))
+    grupos = [skus[i:i + ESTOQUE_SKUS_POR_CONSULTA] for i in range(0, len(skus), ESTOQUE_SKUS_POR_CONSULTA)]
+    resultados = await asyncio.gather(*(get_fba_inventory_skus_async(headers, grupo) for grupo in grupos))
+    return [summary for resultado in resultados for summary in resultado]
+
+def get_fba_inventory_by_skus(access_token, skus):
+    return cliente_async.executar_sync(get_fba_inventory_by_skus_async(access_token, skus))
+
+
+# Obtém as métricas mensais de um intervalo (datas no fuso de São Paulo)
+async def get_order_metrics_janela_async(headers, inicio, fim):
+    url = f"{base_url}/sales/v1/orderMetrics"
     params = {
         'marketplaceIds': marketplace_id,
-        'interval': interval,
+        'interval': f"{inicio.strftime('%Y-%m-%dT00:00:00-03:00')}--{fim.strftime('%Y-%m-%dT00:00:00-03:00')}",
         'granularityTimeZone': 'America/Sao_Paulo',
         'granularity': 'Month'
     }
-    all_metrics = []
-    response = make_request(url, headers, params=params, method="GET", timeout=30)
+    response = await make_request_async(url, headers, params=params, method="GET", timeout=30)
     if response and response.status_code == 200:
-        data = response.json()
-        payload = data.get('payload', [])
-        if isinstance(payload, list):
-            all_metrics.extend(payload)
-    else:
-        print(f"Erro ao obter métricas de pedidos: Status {response.status_code}" if response else "Sem resposta")
-    return all_metrics
+        payload = response.json().get('payload', [])
+        return payload if isinstance(payload, list) else []
+    print(f"Erro ao obter métricas de pedidos: Status {response.status_code}" if response else "Sem resposta")
+    return []
+
+# Primeiro dia do mês 'meses' meses antes (ou depois, se negativo) de 'data'
+def inicio_do_mes(data, meses=0):
+    total = data.year * 12 + data.month - 1 - meses
+    return data.replace(year=total // 12, month=total % 12 + 1, day=1)
+
+# Obtém as métricas dos últimos 12 meses em janelas de AMAZON_JANELA_METRICAS_MESES
+# meses alinhadas ao início do mês, executadas em paralelo. Meses repetidos são
+# unificados pelo intervalo.
+async def get_order_metrics_async(access_token):
+    headers = {
+        'Accept': 'application/json',
+        'x-amz-access-token': access_token
+    }
+    hoje = datetime.now(pytz.timezone('America/Sao_Paulo')).date()
+    fim = hoje + timedelta(days=1)
+    limites = [inicio_do_mes(hoje, m) for m in range(12, 0, -JANELA_METRICAS_MESES)] + [fim]
+    semaforo = asyncio.Semaphore(JANELAS_PARALELAS)
+
+    async def coletar_janela(inicio, fim_janela):
+        async with semaforo:
+            return await get_order_metrics_janela_async(headers, inicio, fim_janela)
+
+    resultados = await asyncio.gather(*(coletar_janela(a, b) for a, b in zip(limites, limites[1:])))
+
+    all_metrics = {}
+    for metrics in resultados:
+        for metric in metrics:
+            all_metrics[metric.get('interval')] = metric
+    return list(all_metrics.values())
+
+def get_order_metrics(access_token):
+    return cliente_async.executar_sync(get_order_metrics_async(access_token))
 
 # ------------------------- TRATAMENTO DE DADOS ----------------------------
 
-# Função utilitária para remover timezone dos DataFrames
-def remover_timezone_df(df):
-    for col in df.select_dtypes(include=['datetimetz']).columns:
-        df[col] = df[col].dt.tz_localize(None)
-    return df
+TRADUCAO_STATUS_PEDIDO = {
+    "Canceled": "Cancelado",
+    "Shipped": "Enviado",
+    "Pending": "Pendente"
+}
 
+# Função utilitária para remover timezone dos DataFrames
 def traduzir_status_pedido(status):
-    mapa = {
-        "Canceled": "Cancelado",
-        "Shipped": "Enviado",
-        "Pending": "Pendente"
-    }
     if not status:
         return "Não informado"
-    return mapa.get(status, status)
+    return TRADUCAO_STATUS_PEDIDO.get(status, status)
 
 def traduzir_detalhes_pagamento(detalhes):
     if not detalhes:
@@ -312,130 +546,213 @@ def traduzir_status_produto(status):
         return ", ".join([mapa.get(s, s) for s in status])
     return mapa.get(status, status)
 
+# ------------------------- MAPEAMENTOS DOS PAYLOADS ----------------------------
+
+# Especificações dos registros de cada entidade (mapeamento.py), compiladas no import.
+# vendedor, data_registro e data_consultada vêm do contexto da chamada.
+
+# Pedido cancelado ou pendente não tem valor nem endereço de entrega definitivos
+SITUACAO_PEDIDO = {"conforme": {"campo": "status", "valores": {"Cancelado": "Pedido cancelado", "Pendente": "Pendente"}}}
+
+MAPA_PRODUTOS = mapeamento.compilar("amazon.produtos", {
+    "asin": "summaries.0.asin",
+    "sku": "sku",
+    "tipo_produto": {"caminho": "summaries.0.productType", "funcao": traduzir_tipo_produto},
+    "tipo_condicao": {"caminho": "summaries.0.conditionType", "funcao": traduzir_tipo_condicao},
+    "status": {"caminho": "summaries.0.status", "funcao": traduzir_status_produto},
+    "nome_item": "summaries.0.itemName",
+    "data_criacao": "summaries.0.createdDate",
+    "data_atualizacao": "summaries.0.lastUpdatedDate",
+    "imagem_url": {"caminho": "summaries.0.mainImage.link", "se_nulo": "Sem imagem"},
+    "imagem_largura": {"caminho": "summaries.0.mainImage.width", "se_nulo": 0},
+    "imagem_altura": {"caminho": "summaries.0.mainImage.height", "se_nulo": 0},
+    "vendedor": {"contexto": "vendedor"},
+    "data_registro": {"contexto": "data_registro"},
+    "data_consultada": {"contexto": "data_consultada"}
+})
+
+MAPA_PEDIDOS = mapeamento.compilar("amazon.pedidos", {
+    "id_pedido": "AmazonOrderId",
+    "municipio_comprador": {"caminho": "BuyerInfo.BuyerCounty", "se_vazio": "Não informado", "vazios": ["----------"]},
+    "status": {"caminho": "OrderStatus", "se_vazio": "Não informado", "traducao": TRADUCAO_STATUS_PEDIDO},
+    "data_compra": "PurchaseDate",
+    "data_aprovacao": "LastUpdateDate",
+    "canal_venda": "SalesChannel",
+    "canal_fulfillment": "FulfillmentChannel",
+    "detalhes_pagamento": {"caminho": "PaymentMethodDetails", "funcao": traduzir_detalhes_pagamento},
+    "total_pedido": {"caminho": "OrderTotal.Amount", **SITUACAO_PEDIDO},
+    "moeda": {"caminho": "OrderTotal.CurrencyCode", **SITUACAO_PEDIDO},
+    "itens_enviados": "NumberOfItemsShipped",
+    "itens_nao_enviados": "NumberOfItemsUnshipped",
+    "prime": "IsPrime",
+    "pedido_empresarial": "IsBusinessOrder",
+    "estado_entrega": {"caminho": "ShippingAddress.StateOrRegion", **SITUACAO_PEDIDO},
+    "cidade_entrega": {"caminho": "ShippingAddress.City", **SITUACAO_PEDIDO},
+    "vendedor": {"contexto": "vendedor"},
+    "data_registro": {"contexto": "data_registro"},
+    "data_consultada": {"contexto": "data_consultada"}
+})
+
+MAPA_ITENS_PEDIDO = mapeamento.compilar("amazon.itens_pedido", {
+    "id_pedido": {"contexto": "id_pedido"},
+    "id_item_pedido": "OrderItemId",
+    "asin": "ASIN",
+    "sku": "SellerSKU",
+    "titulo": "Title",
+    "quantidade_pedida": "QuantityOrdered",
+    "quantidade_enviada": "QuantityShipped",
+    "preco_item": "ItemPrice.Amount",
+    "moeda": "ItemPrice.CurrencyCode",
+    "imposto_item": "ItemTax.Amount",
+    "desconto_promocional": "PromotionDiscount.Amount",
+    "vendedor": {"contexto": "vendedor"},
+    "data_registro": {"contexto": "data_registro"}
+})
+
+MAPA_ESTOQUE = mapeamento.compilar("amazon.estoque", {
+    "asin": "asin",
+    "fnsku": "fnSku",
+    "condicao": "condition",
+    "disponivel_vendavel": "inventoryDetails.fulfillableQuantity",
+    "recebendo_em_estoque": "inventoryDetails.inboundReceivingQuantity",
+    "reservado_total": "inventoryDetails.reservedQuantity.totalReservedQuantity",
+    "reservado_cliente": "inventoryDetails.reservedQuantity.pendingCustomerOrderQuantity",
+    "reservado_transito": "inventoryDetails.reservedQuantity.pendingTransshipmentQuantity",
+    "reservado_processamento": "inventoryDetails.reservedQuantity.fcProcessingQuantity",
+    "em_pesquisa_total": "inventoryDetails.researchingQuantity.totalResearchingQuantity",
+    "pesquisa_curto_prazo": {"valor": 0},
+    "pesquisa_medio_prazo": {"valor": 0},
+    "pesquisa_longo_prazo": {"valor": 0},
+    "inutilizavel_total": "inventoryDetails.unfulfillableQuantity.totalUnfulfillableQuantity",
+    "inutilizavel_danificado_cliente": "inventoryDetails.unfulfillableQuantity.customerDamagedQuantity",
+    "inutilizavel_danificado_armazem": "inventoryDetails.unfulfillableQuantity.warehouseDamagedQuantity",
+    "inutilizavel_danificado_distribuidor": "inventoryDetails.unfulfillableQuantity.distributorDamagedQuantity",
+    "inutilizavel_danificado_transportadora": "inventoryDetails.unfulfillableQuantity.carrierDamagedQuantity",
+    "inutilizavel_defeituoso": "inventoryDetails.unfulfillableQuantity.defectiveQuantity",
+    "inutilizavel_vencido": "inventoryDetails.unfulfillableQuantity.expiredQuantity",
+    "fornecimento_futuro_reservado": "inventoryDetails.futureSupplyQuantity.reservedFutureSupplyQuantity",
+    "fornecimento_futuro_compravel": "inventoryDetails.futureSupplyQuantity.futureSupplyBuyableQuantity",
+    "nome_produto": "productName",
+    "quantidade_total": "totalQuantity",
+    "ultima_atualizacao": "lastUpdatedTime",
+    "vendedor": {"contexto": "vendedor"},
+    "data_registro": {"contexto": "data_registro"},
+    "data_consultada": {"contexto": "data_consultada"}
+})
+
+# "inicio--fim" do intervalo das métricas
+def inicio_intervalo(intervalo):
+    return intervalo.split("--")[0]
+
+def fim_intervalo(intervalo):
+    return intervalo.split("--")[-1] if "--" in intervalo else None
+
+MAPA_FATURAMENTO = mapeamento.compilar("amazon.faturamento", {
+    "periodo_inicio": {"caminho": "interval", "padrao": "", "funcao": inicio_intervalo},
+    "periodo_fim": {"caminho": "interval", "padrao": "", "funcao": fim_intervalo},
+    "unidades_vendidas": "unitCount",
+    "itens_vendidos": "orderItemCount",
+    "pedidos": "orderCount",
+    "preco_medio_unitario": "averageUnitPrice.amount",
+    "moeda_unitario": "averageUnitPrice.currencyCode",
+    "total_vendas": "totalSales.amount",
+    "moeda_vendas": "totalSales.currencyCode",
+    "vendedor": {"contexto": "vendedor"},
+    "data_registro": {"contexto": "data_registro"}
+})
+
+# Contexto dos mapeamentos: os registros de uma chamada compartilham a data de registro
+def _contexto(vendedor, data_consultada=None, **outros):
+    return {
+        "vendedor": vendedor,
+        "data_registro": datetime.now(timezone.utc).replace(tzinfo=None),
+        "data_consultada": data_consultada.replace(tzinfo=None) if data_consultada else None,
+        **outros
+    }
+
 # Padroniza os dados dos produtos
 def tratar_dados_produtos(produtos, vendedor, data_consultada=None):
-    produtos_tratados = []
+    return MAPA_PRODUTOS.varios(produtos, _contexto(vendedor, data_consultada))
+
+# Substitui largura/altura da imagem principal (metadados do summaries) pelas lidas da imagem
+def atualizar_dimensoes_imagens(produtos, somente_cache=False):
+    if not sonda_imagens.ATIVA:
+        return
+    urls = [p.get("imagem_url") for p in produtos if p.get("imagem_url") != "Sem imagem"]
+    medidas = sonda_imagens.sondar_imagens(urls, get_connection, somente_cache)
     for p in produtos:
-        summary = p.get("summaries", [{}])[0]
-        main_image = summary.get("mainImage", {})
-        produto = {
-            "asin": summary.get("asin"),
-            "sku": p.get("sku"),
-            "tipo_produto": traduzir_tipo_produto(summary.get("productType")),
-            "tipo_condicao": traduzir_tipo_condicao(summary.get("conditionType")),
-            "status": traduzir_status_produto(summary.get("status")),
-            "nome_item": summary.get("itemName"),
-            "data_criacao": summary.get("createdDate"),
-            "data_atualizacao": summary.get("lastUpdatedDate"),
-            "imagem_url": main_image.get("link") if main_image.get("link") is not None else "Sem imagem",
-            "imagem_largura": main_image.get("width") if main_image.get("width") is not None else 0,
-            "imagem_altura": main_image.get("height") if main_image.get("height") is not None else 0,
-            "vendedor": vendedor,
-            "data_registro": datetime.now(timezone.utc).replace(tzinfo=None),
-            "data_consultada": data_consultada.replace(tzinfo=None) if data_consultada else None
-        }
-        produtos_tratados.append(produto)
-    return produtos_tratados
+        medida = medidas.get(p.get("imagem_url"))
+        if medida:
+            p["imagem_largura"], p["imagem_altura"] = medida
 
 # Padroniza os dados dos pedidos
 def tratar_dados_pedidos(pedidos, vendedor, data_consultada=None):
-    pedidos_tratados = []
-    for p in pedidos:
-        status_traduzido = traduzir_status_pedido(p.get("OrderStatus"))
-        cancelado = status_traduzido == "Cancelado"
-        pendente = status_traduzido == "Pendente"
-        pedido = {
-            "id_pedido": p.get("AmazonOrderId"),
-            "municipio_comprador": p.get("BuyerInfo", {}).get("BuyerCounty") if p.get("BuyerInfo", {}).get("BuyerCounty") and p.get("BuyerInfo", {}).get("BuyerCounty") != "----------" else "Não informado",
-            "status": status_traduzido,
-            "data_compra": p.get("PurchaseDate"),
-            "data_aprovacao": p.get("LastUpdateDate"),
-            "canal_venda": p.get("SalesChannel"),
-            "canal_fulfillment": p.get("FulfillmentChannel"),
-            "detalhes_pagamento": traduzir_detalhes_pagamento(p.get("PaymentMethodDetails")),
-            "total_pedido": "Pedido cancelado" if cancelado else "Pendente" if pendente else p.get("OrderTotal", {}).get("Amount"),
-            "moeda": "Pedido cancelado" if cancelado else "Pendente" if pendente else p.get("OrderTotal", {}).get("CurrencyCode"),
-            "itens_enviados": p.get("NumberOfItemsShipped"),
-            "itens_nao_enviados": p.get("NumberOfItemsUnshipped"),
-            "prime": p.get("IsPrime"),
-            "pedido_empresarial": p.get("IsBusinessOrder"),
-            "estado_entrega": "Pedido cancelado" if cancelado else "Pendente" if pendente else p.get("ShippingAddress", {}).get("StateOrRegion"),
-            "cidade_entrega": "Pedido cancelado" if cancelado else "Pendente" if pendente else p.get("ShippingAddress", {}).get("City"),
-            "vendedor": vendedor,
-            "data_registro": datetime.now(timezone.utc).replace(tzinfo=None),
-            "data_consultada": data_consultada.replace(tzinfo=None) if data_consultada else None
-        }
-        pedidos_tratados.append(pedido)
-    return pedidos_tratados
+    return MAPA_PEDIDOS.varios(pedidos, _contexto(vendedor, data_consultada))
+
+# Padroniza os itens de um pedido
+def tratar_dados_itens_pedido(order_id, items, vendedor):
+    return MAPA_ITENS_PEDIDO.varios(items, _contexto(vendedor, id_pedido=order_id))
 
 # Padroniza os dados do estoque
 def tratar_dados_estoque(estoque, vendedor, data_consultada=None):
-    estoque_tratado = []
-    for e in estoque:
-        item = {
-            "asin": e.get("asin"),
-            "fnsku": e.get("fnSku"),
-            "condicao": e.get("condition"),
-            "disponivel_vendavel": e.get("inventoryDetails", {}).get("fulfillableQuantity"),
-            "recebendo_em_estoque": e.get("inventoryDetails", {}).get("inboundReceivingQuantity"),
-            "reservado_total": e.get("inventoryDetails", {}).get("reservedQuantity", {}).get("totalReservedQuantity"),
-            "reservado_cliente": e.get("inventoryDetails", {}).get("reservedQuantity", {}).get("pendingCustomerOrderQuantity"),
-            "reservado_transito": e.get("inventoryDetails", {}).get("reservedQuantity", {}).get("pendingTransshipmentQuantity"),
-            "reservado_processamento": e.get("inventoryDetails", {}).get("reservedQuantity", {}).get("fcProcessingQuantity"),
-            "em_pesquisa_total": e.get("inventoryDetails", {}).get("researchingQuantity", {}).get("totalResearchingQuantity"),
-            "pesquisa_curto_prazo": 0,
-            "pesquisa_medio_prazo": 0,
-            "pesquisa_longo_prazo": 0,
-            "inutilizavel_total": e.get("inventoryDetails", {}).get("unfulfillableQuantity", {}).get("totalUnfulfillableQuantity"),
-            "inutilizavel_danificado_cliente": e.get("inventoryDetails", {}).get("unfulfillableQuantity", {}).get("customerDamagedQuantity"),
-            "inutilizavel_danificado_armazem": e.get("inventoryDetails", {}).get("unfulfillableQuantity", {}).get("warehouseDamagedQuantity"),
-            "inutilizavel_danificado_distribuidor": e.get("inventoryDetails", {}).get("unfulfillableQuantity", {}).get("distributorDamagedQuantity"),
-            "inutilizavel_danificado_transportadora": e.get("inventoryDetails", {}).get("unfulfillableQuantity", {}).get("carrierDamagedQuantity"),
-            "inutilizavel_defeituoso": e.get("inventoryDetails", {}).get("unfulfillableQuantity", {}).get("defectiveQuantity"),
-            "inutilizavel_vencido": e.get("inventoryDetails", {}).get("unfulfillableQuantity", {}).get("expiredQuantity"),
-            "fornecimento_futuro_reservado": e.get("inventoryDetails", {}).get("futureSupplyQuantity", {}).get("reservedFutureSupplyQuantity"),
-            "fornecimento_futuro_compravel": e.get("inventoryDetails", {}).get("futureSupplyQuantity", {}).get("futureSupplyBuyableQuantity"),
-            "nome_produto": e.get("productName"),
-            "quantidade_total": e.get("totalQuantity"),
-            "ultima_atualizacao": e.get("lastUpdatedTime"),
-            "vendedor": vendedor,
-            "data_registro": datetime.now(timezone.utc).replace(tzinfo=None),
-            "data_consultada": data_consultada.replace(tzinfo=None) if data_consultada else None
-        }
-        estoque_tratado.append(item)
-    return estoque_tratado
+    return MAPA_ESTOQUE.varios(estoque, _contexto(vendedor, data_consultada))
 
 # Padroniza os dados do faturamento
 def tratar_dados_faturamento(faturamento, vendedor):
-    faturamento_tratado = []
-    for f in faturamento:
-        item = {
-            "periodo_inicio": f.get("interval", "").split("--")[0],
-            "periodo_fim": f.get("interval", "").split("--")[-1] if "--" in f.get("interval", "") else None,
-            "unidades_vendidas": f.get("unitCount"),
-            "itens_vendidos": f.get("orderItemCount"),
-            "pedidos": f.get("orderCount"),
-            "preco_medio_unitario": f.get("averageUnitPrice", {}).get("amount"),
-            "moeda_unitario": f.get("averageUnitPrice", {}).get("currencyCode"),
-            "total_vendas": f.get("totalSales", {}).get("amount"),
-            "moeda_vendas": f.get("totalSales", {}).get("currencyCode"),
-            "vendedor": vendedor,
-            "data_registro": datetime.now(timezone.utc).replace(tzinfo=None)
+    return MAPA_FATURAMENTO.varios(faturamento, _contexto(vendedor))
+
+# Atributos do catálogo que devem estar preenchidos em todo anúncio
+ATRIBUTOS_ESPERADOS = ["brand", "item_name", "bullet_point", "product_description", "manufacturer", "model_number"]
+
+# Verificações de qualidade a partir dos dados de catálogo do ASIN, nos mesmos moldes
+# das verificações do Mercado Livre e da Magalu (quantidade de imagens, atributos vazios, marca)
+def avaliar_catalogo(item):
+    if not item:
+        return {
+            "qtd_imagem": "Sem dados de catálogo",
+            "atributos": "Sem dados de catálogo",
+            "marca": "Sem dados de catálogo",
+            "classificacao": "Sem dados de catálogo"
         }
-        faturamento_tratado.append(item)
-    return faturamento_tratado
+    imagens = [
+        imagem
+        for grupo in item.get("images", []) if grupo.get("marketplaceId") in (None, marketplace_id)
+        for imagem in grupo.get("images", [])
+    ]
+    # Cada imagem vem em vários tamanhos: conta as distintas pela variante (MAIN, PT01, ...)
+    qtd_imagens = len({imagem.get("variant") or imagem.get("link") for imagem in imagens})
+    atributos = item.get("attributes", {})
+    atributos_vazios = sum(
+        1 for nome in ATRIBUTOS_ESPERADOS
+        if not any(str(v.get("value", "")).strip() for v in atributos.get(nome, []) if isinstance(v, dict))
+    )
+    resumo = (item.get("summaries") or [{}])[0]
+    marca = resumo.get("brand") or next((v.get("value") for v in atributos.get("brand", []) if isinstance(v, dict)), None)
+    classificacoes = [c for grupo in item.get("classifications", []) for c in grupo.get("classifications", [])]
+    return {
+        "qtd_imagem": "OK" if qtd_imagens > 3 else f"Necessário adicionar mais {4 - qtd_imagens} imagens",
+        "atributos": f"{atributos_vazios} campos vazios",
+        "marca": "OK" if marca and str(marca).strip() else "Necessário preencher",
+        "classificacao": "OK" if classificacoes else "Sem classificação"
+    }
 
-# Padroniza os erros de qualidade dos produtos
-def tratar_erros_qualidade_produtos(produtos, vendedor, data_consultada=None):
+# Padroniza os erros de qualidade dos produtos (resolução da imagem pelas regras da Amazon em
+# qualidade.REGRAS; quantidade de imagens, atributos e marca pelo catálogo)
+@metricas.cronometrar_tratamento("amazon")
+def tratar_erros_qualidade_produtos(produtos, vendedor, data_consultada=None, catalogo=None):
+    catalogo = catalogo or {}
+    verificacoes = qualidade.avaliar("amazon", "produtos", pd.DataFrame(produtos, dtype=object)).to_dict("records") if produtos else []
     erros = []
-    for p in produtos:
+    for p, verificacao in zip(produtos, verificacoes):
+        qualidade_catalogo = avaliar_catalogo(catalogo.get(p.get("asin")))
         erro = {
             "asin": p.get("asin"),
             "sku": p.get("sku"),
             "titulo": p.get("nome_item"),
             "status": traduzir_status_produto(p.get("status")),
             "url_imagem_principal": p.get("imagem_url"),
-            "resolucao_imagem": "OK" if p.get("imagem_largura") and p.get("imagem_altura") and p.get("imagem_largura") >= 500 and p.get("imagem_altura") >= 500 else "Resolução baixa",
+            **verificacao,
+            **qualidade_catalogo,
             "vendedor": vendedor,
             "data_registro": datetime.now(timezone.utc).replace(tzinfo=None),
             "data_consultada": data_consultada.replace(tzinfo=None) if data_consultada else None
@@ -443,14 +760,15 @@ def tratar_erros_qualidade_produtos(produtos, vendedor, data_consultada=None):
         erros.append(erro)
     return erros
 
-# Padroniza os erros de qualidade do estoque
+# Padroniza os erros de qualidade do estoque pelas regras da Amazon em qualidade.REGRAS
+@metricas.cronometrar_tratamento("amazon")
 def tratar_erros_qualidade_estoque(estoque, vendedor, data_consultada=None):
+    verificacoes = qualidade.avaliar("amazon", "estoque", pd.DataFrame(estoque, dtype=object)).to_dict("records") if estoque else []
     erros = []
-    for e in estoque:
+    for e, verificacao in zip(estoque, verificacoes):
         erro = {
             "asin": e.get("asin"),
-            "disponivel_vendavel": "Sem estoque" if e.get("disponivel_vendavel") is None else "OK",
-            "inutilizavel_total": "OK" if e.get("inutilizavel_total") is None or e.get("inutilizavel_total") == 0 else f"{e.get('inutilizavel_total')} itens inutilizáveis",
+            **verificacao,
             "vendedor": vendedor,
             "data_registro": datetime.now(timezone.utc).replace(tzinfo=None),
             "data_consultada": data_consultada.replace(tzinfo=None) if data_consultada else None
@@ -460,6 +778,8 @@ def tratar_erros_qualidade_estoque(estoque, vendedor, data_consultada=None):
 
 # ------------------------- SALVAR NO BANCO DE DADOS ----------------------------
 
+# Limpa os dados do vendedor no dia (nas tabelas particionadas os dias anteriores saem
+# pela retenção das partições)
 def limpar_dados_antigos(vendedor):
     conn = get_connection()
     if not conn:
@@ -467,9 +787,13 @@ def limpar_dados_antigos(vendedor):
         return
     try:
         cursor = conn.cursor()
+        hoje = datetime.now(timezone.utc).date()
         tabelas = ["erros_qualidade_produtos", "erros_qualidade_estoque", "estoque", "pedidos", "faturamento", "produtos"]
         for tabela in tabelas:
-            cursor.execute(f"DELETE FROM {tabela} WHERE vendedor = %s", (vendedor,))
+            if tabela in TABELAS_PARTICIONADAS:
+                particoes.limpar_dia(cursor, tabela, vendedor, hoje)
+            else:
+                cursor.execute(f"DELETE FROM {tabela} WHERE vendedor = %s", (vendedor,))
         conn.commit()
         print(f"\nRegistros antigos removidos para o vendedor {vendedor}.")
     except Exception as e:
@@ -479,6 +803,15 @@ def limpar_dados_antigos(vendedor):
         cursor.close()
         conn.close()
 
+# Garante as partições dos dias dos registros e remove desses dias as versões já gravadas
+# das mesmas chaves: o upsert só encontra conflitos dentro da partição do próprio dia
+def substituir_no_dia(cur, tabela, registros, coluna):
+    chaves = {}
+    for r in registros:
+        chaves.setdefault((r.get("vendedor"), r.get("data_registro").date()), []).append(r.get(coluna))
+    for (vendedor, dia), valores in chaves.items():
+        particoes.limpar_dia(cur, tabela, vendedor, dia, coluna, valores)
+
 def salvar_produtos_no_banco(produtos):
     if not produtos:
         return "Nenhum produto para salvar."
@@ -494,40 +827,42 @@ def salvar_produtos_no_banco(produtos):
         produtos_unicos[chave] = p
     produtos_final = list(produtos_unicos.values())
     try:
-        with conn.cursor() as cur:
-            execute_values(cur, """
-                INSERT INTO produtos (asin, sku, tipo_produto, tipo_condicao, status, nome_item, data_criacao, data_atualizacao, imagem_url, imagem_largura, imagem_altura, vendedor, data_registro, data_consultada)
-                VALUES %s
-                ON CONFLICT (asin, vendedor) DO UPDATE SET
-                    sku=EXCLUDED.sku,
-                    tipo_produto=EXCLUDED.tipo_produto,
-                    tipo_condicao=EXCLUDED.tipo_condicao,
-                    status=EXCLUDED.status,
-                    nome_item=EXCLUDED.nome_item,
-                    data_criacao=EXCLUDED.data_criacao,
-                    data_atualizacao=EXCLUDED.data_atualizacao,
-                    imagem_url=EXCLUDED.imagem_url,
-                    imagem_largura=EXCLUDED.imagem_largura,
-                    imagem_altura=EXCLUDED.imagem_altura,
-                    data_registro=EXCLUDED.data_registro,
-                    data_consultada=EXCLUDED.data_consultada
-            """, [(
-                p.get("asin"),
-                p.get("sku"),
-                p.get("tipo_produto"),
-                p.get("tipo_condicao"),
-                p.get("status"),
-                p.get("nome_item"),
-                p.get("data_criacao"),
-                p.get("data_atualizacao"),
-                p.get("imagem_url"),
-                p.get("imagem_largura"),
-                p.get("imagem_altura"),
-                p.get("vendedor"),
-                p.get("data_registro"),
-                p.get("data_consultada")
-            ) for p in produtos_final])
-        conn.commit()
+        with metricas.cronometrar_escrita("amazon", "produtos", len(produtos_final)):
+            with conn.cursor() as cur:
+                substituir_no_dia(cur, "produtos", produtos_final, "asin")
+                execute_values(cur, """
+                    INSERT INTO produtos (asin, sku, tipo_produto, tipo_condicao, status, nome_item, data_criacao, data_atualizacao, imagem_url, imagem_largura, imagem_altura, vendedor, data_registro, data_consultada)
+                    VALUES %s
+                    ON CONFLICT (asin, vendedor, data_registro) DO UPDATE SET
+                        sku=EXCLUDED.sku,
+                        tipo_produto=EXCLUDED.tipo_produto,
+                        tipo_condicao=EXCLUDED.tipo_condicao,
+                        status=EXCLUDED.status,
+                        nome_item=EXCLUDED.nome_item,
+                        data_criacao=EXCLUDED.data_criacao,
+                        data_atualizacao=EXCLUDED.data_atualizacao,
+                        imagem_url=EXCLUDED.imagem_url,
+                        imagem_largura=EXCLUDED.imagem_largura,
+                        imagem_altura=EXCLUDED.imagem_altura,
+                        data_registro=EXCLUDED.data_registro,
+                        data_consultada=EXCLUDED.data_consultada
+                """, [(
+                    p.get("asin"),
+                    p.get("sku"),
+                    p.get("tipo_produto"),
+                    p.get("tipo_condicao"),
+                    p.get("status"),
+                    p.get("nome_item"),
+                    p.get("data_criacao"),
+                    p.get("data_atualizacao"),
+                    p.get("imagem_url"),
+                    p.get("imagem_largura"),
+                    p.get("imagem_altura"),
+                    p.get("vendedor"),
+                    p.get("data_registro"),
+                    p.get("data_consultada")
+                ) for p in produtos_final])
+            conn.commit()
         return f"{len(produtos_final)} produtos salvos com sucesso."
     except Exception as e:
         return f"Erro ao salvar produtos: {e}"
@@ -541,56 +876,196 @@ def salvar_pedidos_no_banco(pedidos):
     if not pedidos:
         return "Nenhum pedido para salvar."
     try:
-        with conn.cursor() as cur:
-            execute_values(cur, """
-                INSERT INTO pedidos (id_pedido, municipio_comprador, status, data_compra, data_aprovacao, canal_venda, canal_fulfillment, detalhes_pagamento, total_pedido, moeda, itens_enviados, itens_nao_enviados, prime, pedido_empresarial, estado_entrega, cidade_entrega, vendedor, data_registro, data_consultada)
-                VALUES %s
-                ON CONFLICT (id_pedido, vendedor) DO UPDATE SET
-                    municipio_comprador=EXCLUDED.municipio_comprador,
-                    status=EXCLUDED.status,
-                    data_compra=EXCLUDED.data_compra,
-                    data_aprovacao=EXCLUDED.data_aprovacao,
-                    canal_venda=EXCLUDED.canal_venda,
-                    canal_fulfillment=EXCLUDED.canal_fulfillment,
-                    detalhes_pagamento=EXCLUDED.detalhes_pagamento,
-                    total_pedido=EXCLUDED.total_pedido,
-                    moeda=EXCLUDED.moeda,
-                    itens_enviados=EXCLUDED.itens_enviados,
-                    itens_nao_enviados=EXCLUDED.itens_nao_enviados,
-                    prime=EXCLUDED.prime,
-                    pedido_empresarial=EXCLUDED.pedido_empresarial,
-                    estado_entrega=EXCLUDED.estado_entrega,
-                    cidade_entrega=EXCLUDED.cidade_entrega,
-                    data_registro=EXCLUDED.data_registro,
-                    data_consultada=EXCLUDED.data_consultada
-            """, [(
-                p.get("id_pedido"),
-                p.get("municipio_comprador"),
-                p.get("status"),
-                p.get("data_compra"),
-                p.get("data_aprovacao"),
-                p.get("canal_venda"),
-                p.get("canal_fulfillment"),
-                p.get("detalhes_pagamento"),
-                p.get("total_pedido"),
-                p.get("moeda"),
-                p.get("itens_enviados"),
-                p.get("itens_nao_enviados"),
-                p.get("prime"),
-                p.get("pedido_empresarial"),
-                p.get("estado_entrega"),
-                p.get("cidade_entrega"),
-                p.get("vendedor"),
-                p.get("data_registro"),
-                p.get("data_consultada")
-            ) for p in pedidos])
-        conn.commit()
+        with metricas.cronometrar_escrita("amazon", "pedidos", len(pedidos)):
+            with conn.cursor() as cur:
+                substituir_no_dia(cur, "pedidos", pedidos, "id_pedido")
+                execute_values(cur, """
+                    INSERT INTO pedidos (id_pedido, municipio_comprador, status, data_compra, data_aprovacao, canal_venda, canal_fulfillment, detalhes_pagamento, total_pedido, moeda, itens_enviados, itens_nao_enviados, prime, pedido_empresarial, estado_entrega, cidade_entrega, vendedor, data_registro, data_consultada)
+                    VALUES %s
+                    ON CONFLICT (id_pedido, vendedor, data_registro) DO UPDATE SET
+                        municipio_comprador=EXCLUDED.municipio_comprador,
+                        status=EXCLUDED.status,
+                        data_compra=EXCLUDED.data_compra,
+                        data_aprovacao=EXCLUDED.data_aprovacao,
+                        canal_venda=EXCLUDED.canal_venda,
+                        canal_fulfillment=EXCLUDED.canal_fulfillment,
+                        detalhes_pagamento=EXCLUDED.detalhes_pagamento,
+                        total_pedido=EXCLUDED.total_pedido,
+                        moeda=EXCLUDED.moeda,
+                        itens_enviados=EXCLUDED.itens_enviados,
+                        itens_nao_enviados=EXCLUDED.itens_nao_enviados,
+                        prime=EXCLUDED.prime,
+                        pedido_empresarial=EXCLUDED.pedido_empresarial,
+                        estado_entrega=EXCLUDED.estado_entrega,
+                        cidade_entrega=EXCLUDED.cidade_entrega,
+                        data_registro=EXCLUDED.data_registro,
+                        data_consultada=EXCLUDED.data_consultada
+                """, [(
+                    p.get("id_pedido"),
+                    p.get("municipio_comprador"),
+                    p.get("status"),
+                    p.get("data_compra"),
+                    p.get("data_aprovacao"),
+                    p.get("canal_venda"),
+                    p.get("canal_fulfillment"),
+                    p.get("detalhes_pagamento"),
+                    p.get("total_pedido"),
+                    p.get("moeda"),
+                    p.get("itens_enviados"),
+                    p.get("itens_nao_enviados"),
+                    p.get("prime"),
+                    p.get("pedido_empresarial"),
+                    p.get("estado_entrega"),
+                    p.get("cidade_entrega"),
+                    p.get("vendedor"),
+                    p.get("data_registro"),
+                    p.get("data_consultada")
+                ) for p in pedidos])
+            conn.commit()
         return f"{len(pedidos)} pedidos salvos com sucesso."
     except Exception as e:
         return f"Erro ao salvar pedidos: {e}"
     finally:
         conn.close()
 
+# Pedidos cujos itens precisam ser consultados: novos, ou alterados (LastUpdateDate mais
+# recente que o da última consulta) e ainda não finalizados
+def selecionar_pedidos_para_itens(pedidos_raw, vendedor):
+    conn = get_connection()
+    if not conn:
+        return []
+    try:
+        with conn.cursor() as cur:
+            cur.execute("""
+                SELECT id_pedido, status, ultima_atualizacao FROM pedido_itens_controle
+                WHERE vendedor = %s AND id_pedido = ANY(%s)
+            """, (vendedor, [p.get("AmazonOrderId") for p in pedidos_raw]))
+            controle = {row[0]: (row[1], row[2]) for row in cur.fetchall()}
+    finally:
+        conn.close()
+
+    selecionados = []
+    for p in pedidos_raw:
+        anterior = controle.get(p.get("AmazonOrderId"))
+        if anterior is None:
+            selecionados.append(p)
+            continue
+        status, ultima_atualizacao = anterior
+        if status in STATUS_FINALIZADOS:
+            continue
+        atualizacao = pd.to_datetime(p.get("LastUpdateDate"), utc=True, errors="coerce")
+        if ultima_atualizacao is None or pd.isna(atualizacao) or atualizacao > ultima_atualizacao:
+            selecionados.append(p)
+    return selecionados
+
+# Substitui os itens dos pedidos consultados e registra a versão de cada pedido, na mesma transação
+def salvar_itens_pedidos_no_banco(pedidos_raw, itens, vendedor):
+    if not pedidos_raw:
+        return "Nenhum item de pedido para salvar."
+    conn = get_connection()
+    if not conn:
+        return "Erro ao conectar com o banco de dados."
+    data_registro = datetime.now(timezone.utc).replace(tzinfo=None)
+    try:
+        with metricas.cronometrar_escrita("amazon", "pedido_itens", len(itens)):
+            with conn.cursor() as cur:
+                cur.execute("""
+                    DELETE FROM pedido_itens WHERE vendedor = %s AND id_pedido = ANY(%s)
+                """, (vendedor, [p.get("AmazonOrderId") for p in pedidos_raw]))
+                if itens:
+                    execute_values(cur, """
+                        INSERT INTO pedido_itens (id_pedido, id_item_pedido, asin, sku, titulo, quantidade_pedida, quantidade_enviada, preco_item, moeda, imposto_item, desconto_promocional, vendedor, data_registro)
+                        VALUES %s
+                        ON CONFLICT (id_pedido, id_item_pedido, vendedor) DO NOTHING
+                    """, [(
+                        i.get("id_pedido"),
+                        i.get("id_item_pedido"),
+                        i.get("asin"),
+                        i.get("sku"),
+                        i.get("titulo"),
+                        i.get("quantidade_pedida"),
+                        i.get("quantidade_enviada"),
+                        i.get("preco_item"),
+                        i.get("moeda"),
+                        i.get("imposto_item"),
+                        i.get("desconto_promocional"),
+                        i.get("vendedor"),
+                        i.get("data_registro")
+                    ) for i in itens])
+                execute_values(cur, """
+                    INSERT INTO pedido_itens_controle (id_pedido, vendedor, status, ultima_atualizacao, data_registro)
+                    VALUES %s
+                    ON CONFLICT (id_pedido, vendedor) DO UPDATE SET
+                        status=EXCLUDED.status,
+                        ultima_atualizacao=EXCLUDED.ultima_atualizacao,
+                        data_registro=EXCLUDED.data_registro
+                """, [(
+                    p.get("AmazonOrderId"),
+                    vendedor,
+                    p.get("OrderStatus"),
+                    p.get("LastUpdateDate"),
+                    data_registro
+                ) for p in pedidos_raw])
+            conn.commit()
+        return f"{len(itens)} itens de {len(pedidos_raw)} pedidos salvos com sucesso."
+    except Exception as e:
+        conn.rollback()
+        return f"Erro ao salvar itens de pedidos: {e}"
+    finally:
+        conn.close()
+
+# Fase de itens dos pedidos: consulta apenas os pedidos novos ou alterados, em blocos de
+# ITENS_POR_BLOCO gravados conforme terminam (uma coleta interrompida não perde o progresso)
+def coletar_itens_pedidos(access_token, pedidos_raw, vendedor):
+    pendentes = selecionar_pedidos_para_itens(pedidos_raw, vendedor)
+    print(f"Itens de pedidos: {len(pendentes)} de {len(pedidos_raw)} pedidos precisam ser consultados.")
+    total_itens = 0
+    for inicio in range(0, len(pendentes), ITENS_POR_BLOCO):
+        bloco = pendentes[inicio:inicio + ITENS_POR_BLOCO]
+        with tempos.etapa("itens_pedidos"):
+            resultados = get_orders_items(access_token, [p.get("AmazonOrderId") for p in bloco])
+        with tempos.etapa("transformacao"):
+            consultados = [p for p in bloco if resultados.get(p.get("AmazonOrderId")) is not None]
+            itens = []
+            for p in consultados:
+                itens.extend(tratar_dados_itens_pedido(p.get("AmazonOrderId"), resultados[p.get("AmazonOrderId")], vendedor))
+        with tempos.etapa("gravacao_banco"):
+            print(salvar_itens_pedidos_no_banco(consultados, itens, vendedor))
+        total_itens += len(itens)
+    return f"{total_itens} itens de {len(pendentes)} pedidos coletados."
+
+# SKUs dos ASINs informados, a partir dos produtos já gravados do vendedor
+def skus_dos_asins(asins, vendedor):
+    if not asins:
+        return []
+    conn = get_connection()
+    if not conn:
+        return []
+    try:
+        with conn.cursor() as cur:
+            cur.execute("""
+                SELECT DISTINCT sku FROM produtos WHERE vendedor = %s AND asin = ANY(%s) AND sku IS NOT NULL
+            """, (vendedor, list(asins)))
+            return [row[0] for row in cur.fetchall()]
+    finally:
+        conn.close()
+
+# SKUs vendidos nos pedidos informados (itens gravados em pedido_itens)
+def skus_dos_pedidos(order_ids, vendedor):
+    if not order_ids:
+        return []
+    conn = get_connection()
+    if not conn:
+        return []
+    try:
+        with conn.cursor() as cur:
+            cur.execute("""
+                SELECT DISTINCT sku FROM pedido_itens WHERE vendedor = %s AND id_pedido = ANY(%s) AND sku IS NOT NULL
+            """, (vendedor, list(order_ids)))
+            return [row[0] for row in cur.fetchall()]
+    finally:
+        conn.close()
+
 def remover_duplicados_estoque(estoque):
     vistos = set()
     estoque_unico = []
@@ -609,75 +1084,128 @@ def salvar_estoque_no_banco(estoque):
     if not conn:
         print("Erro ao conectar com o banco de dados.")
         return "Erro ao conectar com o banco de dados."
+    try:
+        with metricas.cronometrar_escrita("amazon", "estoque", len(estoque)):
+            with conn.cursor() as cur:
+                substituir_no_dia(cur, "estoque", estoque, "asin")
+                execute_values(cur, """
+                    INSERT INTO estoque (asin, fnsku, condicao, disponivel_vendavel, recebendo_em_estoque, reservado_total, reservado_cliente, reservado_transito, reservado_processamento, em_pesquisa_total, pesquisa_curto_prazo, pesquisa_medio_prazo, pesquisa_longo_prazo, inutilizavel_total, inutilizavel_danificado_cliente, inutilizavel_danificado_armazem, inutilizavel_danificado_distribuidor, inutilizavel_danificado_transportadora, inutilizavel_defeituoso, inutilizavel_vencido, fornecimento_futuro_reservado, fornecimento_futuro_compravel, nome_produto, quantidade_total, ultima_atualizacao, vendedor, data_registro, data_consultada)
+                    VALUES %s
+                    ON CONFLICT (asin, vendedor, data_registro) DO UPDATE SET
+                        fnsku=EXCLUDED.fnsku,
+                        condicao=EXCLUDED.condicao,
+                        disponivel_vendavel=EXCLUDED.disponivel_vendavel,
+                        recebendo_em_estoque=EXCLUDED.recebendo_em_estoque,
+                        reservado_total=EXCLUDED.reservado_total,
+                        reservado_cliente=EXCLUDED.reservado_cliente,
+                        reservado_transito=EXCLUDED.reservado_transito,
+                        reservado_processamento=EXCLUDED.reservado_processamento,
+                        em_pesquisa_total=EXCLUDED.em_pesquisa_total,
+                        pesquisa_curto_prazo=EXCLUDED.pesquisa_curto_prazo,
+                        pesquisa_medio_prazo=EXCLUDED.pesquisa_medio_prazo,
+                        pesquisa_longo_prazo=EXCLUDED.pesquisa_longo_prazo,
+                        inutilizavel_total=EXCLUDED.inutilizavel_total,
+                        inutilizavel_danificado_cliente=EXCLUDED.inutilizavel_danificado_cliente,
+                        inutilizavel_danificado_armazem=EXCLUDED.inutilizavel_danificado_armazem,
+                        inutilizavel_danificado_distribuidor=EXCLUDED.inutilizavel_danificado_distribuidor,
+                        inutilizavel_danificado_transportadora=EXCLUDED.inutilizavel_danificado_transportadora,
+                        inutilizavel_defeituoso=EXCLUDED.inutilizavel_defeituoso,
+                        inutilizavel_vencido=EXCLUDED.inutilizavel_vencido,
+                        fornecimento_futuro_reservado=EXCLUDED.fornecimento_futuro_reservado,
+                        fornecimento_futuro_compravel=EXCLUDED.fornecimento_futuro_compravel,
+                        nome_produto=EXCLUDED.nome_produto,
+                        quantidade_total=EXCLUDED.quantidade_total,
+                        ultima_atualizacao=EXCLUDED.ultima_atualizacao,
+                        data_registro=EXCLUDED.data_registro,
+                        data_consultada=EXCLUDED.data_consultada
+                """, [(
+                    e.get("asin"),
+                    e.get("fnsku"),
+                    e.get("condicao"),
+                    e.get("disponivel_vendavel"),
+                    e.get("recebendo_em_estoque"),
+                    e.get("reservado_total"),
+                    e.get("reservado_cliente"),
+                    e.get("reservado_transito"),
+                    e.get("reservado_processamento"),
+                    e.get("em_pesquisa_total"),
+                    e.get("pesquisa_curto_prazo"),
+                    e.get("pesquisa_medio_prazo"),
+                    e.get("pesquisa_longo_prazo"),
+                    e.get("inutilizavel_total"),
+                    e.get("inutilizavel_danificado_cliente"),
+                    e.get("inutilizavel_danificado_armazem"),
+                    e.get("inutilizavel_danificado_distribuidor"),
+                    e.get("inutilizavel_danificado_transportadora"),
+                    e.get("inutilizavel_defeituoso"),
+                    e.get("inutilizavel_vencido"),
+                    e.get("fornecimento_futuro_reservado"),
+                    e.get("fornecimento_futuro_compravel"),
+                    e.get("nome_produto"),
+                    e.get("quantidade_total"),
+                    e.get("ultima_atualizacao"),
+                    e.get("vendedor"),
+                    e.get("data_registro"),
+                    e.get("data_consultada")
+                ) for e in estoque])
+            conn.commit()
+    except Exception as e:
+        print(f"Erro ao salvar estoque: {e}")
+        return f"Erro ao salvar estoque: {e}"
+    finally:
+        conn.close()
+
+# Dados de catálogo ainda válidos no cache para os ASINs informados (com incluir_vencidos,
+# todos os do cache, como no reprocessamento sem rede)
+def carregar_cache_catalogo(asins, incluir_vencidos=False):
+    conn = get_connection()
+    if not conn:
+        return {}
+    try:
+        with conn.cursor() as cur:
+            cur.execute("""
+                SELECT asin, dados FROM catalogo_cache
+                WHERE asin = ANY(%s) AND (%s OR atualizado_em > %s)
+            """, (asins, incluir_vencidos, datetime.now() - timedelta(hours=CATALOGO_VALIDADE_HORAS)))
+            return {asin: dados for asin, dados in cur.fetchall()}
+    finally:
+        conn.close()
+
+def salvar_cache_catalogo(catalogo):
+    if not catalogo:
+        return
+    conn = get_connection()
+    if not conn:
+        return
     try:
         with conn.cursor() as cur:
             execute_values(cur, """
-                INSERT INTO estoque (asin, fnsku, condicao, disponivel_vendavel, recebendo_em_estoque, reservado_total, reservado_cliente, reservado_transito, reservado_processamento, em_pesquisa_total, pesquisa_curto_prazo, pesquisa_medio_prazo, pesquisa_longo_prazo, inutilizavel_total, inutilizavel_danificado_cliente, inutilizavel_danificado_armazem, inutilizavel_danificado_distribuidor, inutilizavel_danificado_transportadora, inutilizavel_defeituoso, inutilizavel_vencido, fornecimento_futuro_reservado, fornecimento_futuro_compravel, nome_produto, quantidade_total, ultima_atualizacao, vendedor, data_registro, data_consultada)
+                INSERT INTO catalogo_cache (asin, dados, atualizado_em)
                 VALUES %s
-                ON CONFLICT (asin, vendedor) DO UPDATE SET
-                    fnsku=EXCLUDED.fnsku,
-                    condicao=EXCLUDED.condicao,
-                    disponivel_vendavel=EXCLUDED.disponivel_vendavel,
-                    recebendo_em_estoque=EXCLUDED.recebendo_em_estoque,
-                    reservado_total=EXCLUDED.reservado_total,
-                    reservado_cliente=EXCLUDED.reservado_cliente,
-                    reservado_transito=EXCLUDED.reservado_transito,
-                    reservado_processamento=EXCLUDED.reservado_processamento,
-                    em_pesquisa_total=EXCLUDED.em_pesquisa_total,
-                    pesquisa_curto_prazo=EXCLUDED.pesquisa_curto_prazo,
-                    pesquisa_medio_prazo=EXCLUDED.pesquisa_medio_prazo,
-                    pesquisa_longo_prazo=EXCLUDED.pesquisa_longo_prazo,
-                    inutilizavel_total=EXCLUDED.inutilizavel_total,
-                    inutilizavel_danificado_cliente=EXCLUDED.inutilizavel_danificado_cliente,
-                    inutilizavel_danificado_armazem=EXCLUDED.inutilizavel_danificado_armazem,
-                    inutilizavel_danificado_distribuidor=EXCLUDED.inutilizavel_danificado_distribuidor,
-                    inutilizavel_danificado_transportadora=EXCLUDED.inutilizavel_danificado_transportadora,
-                    inutilizavel_defeituoso=EXCLUDED.inutilizavel_defeituoso,
-                    inutilizavel_vencido=EXCLUDED.inutilizavel_vencido,
-                    fornecimento_futuro_reservado=EXCLUDED.fornecimento_futuro_reservado,
-                    fornecimento_futuro_compravel=EXCLUDED.fornecimento_futuro_compravel,
-                    nome_produto=EXCLUDED.nome_produto,
-                    quantidade_total=EXCLUDED.quantidade_total,
-                    ultima_atualizacao=EXCLUDED.ultima_atualizacao,
-                    data_registro=EXCLUDED.data_registro,
-                    data_consultada=EXCLUDED.data_consultada
-            """, [(
-                e.get("asin"),
-                e.get("fnsku"),
-                e.get("condicao"),
-                e.get("disponivel_vendavel"),
-                e.get("recebendo_em_estoque"),
-                e.get("reservado_total"),
-                e.get("reservado_cliente"),
-                e.get("reservado_transito"),
-                e.get("reservado_processamento"),
-                e.get("em_pesquisa_total"),
-                e.get("pesquisa_curto_prazo"),
-                e.get("pesquisa_medio_prazo"),
-                e.get("pesquisa_longo_prazo"),
-                e.get("inutilizavel_total"),
-                e.get("inutilizavel_danificado_cliente"),
-                e.get("inutilizavel_danificado_armazem"),
-                e.get("inutilizavel_danificado_distribuidor"),
-                e.get("inutilizavel_danificado_transportadora"),
-                e.get("inutilizavel_defeituoso"),
-                e.get("inutilizavel_vencido"),
-                e.get("fornecimento_futuro_reservado"),
-                e.get("fornecimento_futuro_compravel"),
-                e.get("nome_produto"),
-                e.get("quantidade_total"),
-                e.get("ultima_atualizacao"),
-                e.get("vendedor"),
-                e.get("data_registro"),
-                e.get("data_consultada")
-            ) for e in estoque])
+                ON CONFLICT (asin) DO UPDATE SET
+                    dados=EXCLUDED.dados,
+                    atualizado_em=EXCLUDED.atualizado_em
+            """, [(asin, Json(dados), datetime.now()) for asin, dados in catalogo.items()])
         conn.commit()
     except Exception as e:
-        print(f"Erro ao salvar estoque: {e}")
-        return f"Erro ao salvar estoque: {e}"
+        conn.rollback()
+        print(f"Erro ao salvar cache de catálogo: {e}")
     finally:
         conn.close()
 
+# Enriquecimento dos produtos com os dados de catálogo: usa o cache e busca na API
+# apenas os ASINs ausentes ou vencidos, vários por requisição
+def enriquecer_catalogo(access_token, asins):
+    asins = sorted({a for a in asins if a})
+    catalogo = carregar_cache_catalogo(asins)
+    faltantes = [a for a in asins if a not in catalogo]
+    print(f"Catálogo: {len(asins) - len(faltantes)} ASINs do cache, {len(faltantes)} a consultar.")
+    if faltantes:
+        novos = get_catalog_items(access_token, faltantes)
+        salvar_cache_catalogo(novos)
+        catalogo.update(novos)
+    return catalogo
+
 def salvar_erros_qualidade_produtos(erros):
     if not erros:
         return "Nenhum erro de qualidade de produtos para salvar."
@@ -690,30 +1218,40 @@ def salvar_erros_qualidade_produtos(erros):
     if not conn:
         return "Erro ao conectar com o banco de dados."
     try:
-        with conn.cursor() as cur:
-            execute_values(cur, """
-                INSERT INTO erros_qualidade_produtos (asin, sku, titulo, status, url_imagem_principal, resolucao_imagem, vendedor, data_registro, data_consultada)
-                VALUES %s
-                ON CONFLICT (asin, vendedor) DO UPDATE SET
-                    sku=EXCLUDED.sku,
-                    titulo=EXCLUDED.titulo,
-                    status=EXCLUDED.status,
-                    url_imagem_principal=EXCLUDED.url_imagem_principal,
-                    resolucao_imagem=EXCLUDED.resolucao_imagem,
-                    data_registro=EXCLUDED.data_registro,
-                    data_consultada=EXCLUDED.data_consultada
-            """, [(
-                e.get("asin"),
-                e.get("sku"),
-                e.get("titulo"),
-                e.get("status"),
-                e.get("url_imagem_principal"),
-                e.get("resolucao_imagem"),
-                e.get("vendedor"),
-                e.get("data_registro"),
-                e.get("data_consultada")
-            ) for e in erros_final])
-        conn.commit()
+        with metricas.cronometrar_escrita("amazon", "erros_qualidade_produtos", len(erros_final)):
+            with conn.cursor() as cur:
+                substituir_no_dia(cur, "erros_qualidade_produtos", erros_final, "asin")
+                execute_values(cur, """
+                    INSERT INTO erros_qualidade_produtos (asin, sku, titulo, status, url_imagem_principal, resolucao_imagem, qtd_imagem, atributos, marca, classificacao, vendedor, data_registro, data_consultada)
+                    VALUES %s
+                    ON CONFLICT (asin, vendedor, data_registro) DO UPDATE SET
+                        sku=EXCLUDED.sku,
+                        titulo=EXCLUDED.titulo,
+                        status=EXCLUDED.status,
+                        url_imagem_principal=EXCLUDED.url_imagem_principal,
+                        resolucao_imagem=EXCLUDED.resolucao_imagem,
+                        qtd_imagem=EXCLUDED.qtd_imagem,
+                        atributos=EXCLUDED.atributos,
+                        marca=EXCLUDED.marca,
+                        classificacao=EXCLUDED.classificacao,
+                        data_registro=EXCLUDED.data_registro,
+                        data_consultada=EXCLUDED.data_consultada
+                """, [(
+                    e.get("asin"),
+                    e.get("sku"),
+                    e.get("titulo"),
+                    e.get("status"),
+                    e.get("url_imagem_principal"),
+                    e.get("resolucao_imagem"),
+                    e.get("qtd_imagem"),
+                    e.get("atributos"),
+                    e.get("marca"),
+                    e.get("classificacao"),
+                    e.get("vendedor"),
+                    e.get("data_registro"),
+                    e.get("data_consultada")
+                ) for e in erros_final])
+            conn.commit()
         return f"{len(erros_final)} erros de qualidade de produtos salvos com sucesso."
     except Exception as e:
         return f"Erro ao salvar erros de qualidade de produtos: {e}"
@@ -738,24 +1276,26 @@ def salvar_erros_qualidade_estoque(erros):
     if not conn:
         return "Erro ao conectar com o banco de dados."
     try:
-        with conn.cursor() as cur:
-            execute_values(cur, """
-                INSERT INTO erros_qualidade_estoque (asin, disponivel_vendavel, inutilizavel_total, vendedor, data_registro, data_consultada)
-                VALUES %s
-                ON CONFLICT (asin, vendedor) DO UPDATE SET
-                    disponivel_vendavel=EXCLUDED.disponivel_vendavel,
-                    inutilizavel_total=EXCLUDED.inutilizavel_total,
-                    data_registro=EXCLUDED.data_registro,
-                    data_consultada=EXCLUDED.data_consultada
-            """, [(
-                e.get("asin"),
-                e.get("disponivel_vendavel"),
-                e.get("inutilizavel_total"),
-                e.get("vendedor"),
-                e.get("data_registro"),
-                e.get("data_consultada")
-            ) for e in erros])
-        conn.commit()
+        with metricas.cronometrar_escrita("amazon", "erros_qualidade_estoque", len(erros)):
+            with conn.cursor() as cur:
+                substituir_no_dia(cur, "erros_qualidade_estoque", erros, "asin")
+                execute_values(cur, """
+                    INSERT INTO erros_qualidade_estoque (asin, disponivel_vendavel, inutilizavel_total, vendedor, data_registro, data_consultada)
+                    VALUES %s
+                    ON CONFLICT (asin, vendedor, data_registro) DO UPDATE SET
+                        disponivel_vendavel=EXCLUDED.disponivel_vendavel,
+                        inutilizavel_total=EXCLUDED.inutilizavel_total,
+                        data_registro=EXCLUDED.data_registro,
+                        data_consultada=EXCLUDED.data_consultada
+                """, [(
+                    e.get("asin"),
+                    e.get("disponivel_vendavel"),
+                    e.get("inutilizavel_total"),
+                    e.get("vendedor"),
+                    e.get("data_registro"),
+                    e.get("data_consultada")
+                ) for e in erros])
+            conn.commit()
         return f"{len(erros)} erros de qualidade de estoque salvos com sucesso."
     except Exception as e:
         return f"Erro ao salvar erros de qualidade de estoque: {e}"
@@ -769,37 +1309,38 @@ def salvar_faturamento_no_banco(faturamento):
     if not faturamento:
         return "Nenhum faturamento para salvar."
     try:
-        with conn.cursor() as cur:
-            execute_values(cur, """
-                INSERT INTO faturamento (
-                    periodo_inicio, periodo_fim, unidades_vendidas, itens_vendidos, pedidos,
-                    preco_medio_unitario, moeda_unitario, total_vendas, moeda_vendas,
-                    vendedor, data_registro
-                )
-                VALUES %s
-                ON CONFLICT (periodo_inicio, periodo_fim, vendedor) DO UPDATE SET
-                    unidades_vendidas=EXCLUDED.unidades_vendidas,
-                    itens_vendidos=EXCLUDED.itens_vendidos,
-                    pedidos=EXCLUDED.pedidos,
-                    preco_medio_unitario=EXCLUDED.preco_medio_unitario,
-                    moeda_unitario=EXCLUDED.moeda_unitario,
-                    total_vendas=EXCLUDED.total_vendas,
-                    moeda_vendas=EXCLUDED.moeda_vendas,
-                    data_registro=EXCLUDED.data_registro
-            """, [(
-                f.get("periodo_inicio"),
-                f.get("periodo_fim"),
-                f.get("unidades_vendidas"),
-                f.get("itens_vendidos"),
-                f.get("pedidos"),
-                f.get("preco_medio_unitario"),
-                f.get("moeda_unitario"),
-                f.get("total_vendas"),
-                f.get("moeda_vendas"),
-                f.get("vendedor"),
-                f.get("data_registro")
-            ) for f in faturamento])
-        conn.commit()
+        with metricas.cronometrar_escrita("amazon", "faturamento", len(faturamento)):
+            with conn.cursor() as cur:
+                execute_values(cur, """
+                    INSERT INTO faturamento (
+                        periodo_inicio, periodo_fim, unidades_vendidas, itens_vendidos, pedidos,
+                        preco_medio_unitario, moeda_unitario, total_vendas, moeda_vendas,
+                        vendedor, data_registro
+                    )
+                    VALUES %s
+                    ON CONFLICT (periodo_inicio, periodo_fim, vendedor) DO UPDATE SET
+                        unidades_vendidas=EXCLUDED.unidades_vendidas,
+                        itens_vendidos=EXCLUDED.itens_vendidos,
+                        pedidos=EXCLUDED.pedidos,
+                        preco_medio_unitario=EXCLUDED.preco_medio_unitario,
+                        moeda_unitario=EXCLUDED.moeda_unitario,
+                        total_vendas=EXCLUDED.total_vendas,
+                        moeda_vendas=EXCLUDED.moeda_vendas,
+                        data_registro=EXCLUDED.data_registro
+                """, [(
+                    f.get("periodo_inicio"),
+                    f.get("periodo_fim"),
+                    f.get("unidades_vendidas"),
+                    f.get("itens_vendidos"),
+                    f.get("pedidos"),
+                    f.get("preco_medio_unitario"),
+                    f.get("moeda_unitario"),
+                    f.get("total_vendas"),
+                    f.get("moeda_vendas"),
+                    f.get("vendedor"),
+                    f.get("data_registro")
+                ) for f in faturamento])
+            conn.commit()
         return f"{len(faturamento)} registros de faturamento salvos com sucesso."
     except Exception as e:
         return f"Erro ao salvar faturamento: {e}"
@@ -808,215 +1349,235 @@ def salvar_faturamento_no_banco(faturamento):
 
 # ------------------------- BUSCAR NO BANCO DE DADOS PARA DOWNLOAD ----------------------------
 
+# As buscas geram lotes de linhas lidos por cursor nomeado (relatorios.ler_em_lotes);
+# o fuso das colunas com timezone é removido na escrita das planilhas
+
+# Intervalo do dia corrente em UTC, o mesmo dia em que as coletas gravam data_registro
+def intervalo_hoje():
+    return particoes.intervalo_dia(particoes.hoje("amazon"))
+
 def buscar_produtos_do_dia(vendedor):
-    conn = get_connection()
-    if not conn:
-        return pd.DataFrame()
-    try:
-        cursor = conn.cursor()
-        cursor.execute("""
-            SELECT * FROM produtos WHERE vendedor = %s AND data_registro::date = CURRENT_DATE
-        """, (vendedor,))
-        colunas = [desc[0] for desc in cursor.description]
-        rows = cursor.fetchall()
-        if not rows:
-            return pd.DataFrame()
-        return pd.DataFrame([dict(zip(colunas, row)) for row in rows])
-    finally:
-        cursor.close()
-        conn.close()
+    return relatorios.ler_em_lotes(get_connection, """
+        SELECT * FROM produtos WHERE vendedor = %s AND data_registro >= %s AND data_registro < %s
+    """, (vendedor, *intervalo_hoje()))
 
 def buscar_pedidos_do_dia(vendedor):
-    conn = get_connection()
-    if not conn:
-        return pd.DataFrame()
-    try:
-        cursor = conn.cursor()
-        cursor.execute("""
-            SELECT * FROM pedidos WHERE vendedor = %s AND data_registro::date = CURRENT_DATE
-        """, (vendedor,))
-        colunas = [desc[0] for desc in cursor.description]
-        rows = cursor.fetchall()
-        if not rows:
-            return pd.DataFrame()
-        return pd.DataFrame([dict(zip(colunas, row)) for row in rows])
-    finally:
-        cursor.close()
-        conn.close()
+    return relatorios.ler_em_lotes(get_connection, """
+        SELECT * FROM pedidos WHERE vendedor = %s AND data_registro >= %s AND data_registro < %s
+    """, (vendedor, *intervalo_hoje()))
+
+def buscar_itens_pedidos_do_dia(vendedor):
+    return relatorios.ler_em_lotes(get_connection, """
+        SELECT i.* FROM pedido_itens i
+        JOIN pedidos p ON p.id_pedido = i.id_pedido AND p.vendedor = i.vendedor
+        WHERE i.vendedor = %s AND p.data_registro >= %s AND p.data_registro < %s
+    """, (vendedor, *intervalo_hoje()))
 
 def buscar_estoque_do_dia(vendedor):
-    conn = get_connection()
-    if not conn:
-        return pd.DataFrame()
-    try:
-        cursor = conn.cursor()
-        cursor.execute("""
-            SELECT * FROM estoque WHERE vendedor = %s AND data_registro::date = CURRENT_DATE
-        """, (vendedor,))
-        colunas = [desc[0] for desc in cursor.description]
-        rows = cursor.fetchall()
-        if not rows:
-            return pd.DataFrame()
-        return pd.DataFrame([dict(zip(colunas, row)) for row in rows])
-    finally:
-        cursor.close()
-        conn.close()
+    return relatorios.ler_em_lotes(get_connection, """
+        SELECT * FROM estoque WHERE vendedor = %s AND data_registro >= %s AND data_registro < %s
+    """, (vendedor, *intervalo_hoje()))
 
 def buscar_faturamento_do_dia(vendedor):
-    conn = get_connection()
-    if not conn:
-        return pd.DataFrame()
-    try:
-        cursor = conn.cursor()
-        cursor.execute("""
-            SELECT * FROM faturamento WHERE vendedor = %s AND data_registro::date = CURRENT_DATE
-        """, (vendedor,))
-        colunas = [desc[0] for desc in cursor.description]
-        rows = cursor.fetchall()
-        if not rows:
-            return pd.DataFrame()
-        return pd.DataFrame([dict(zip(colunas, row)) for row in rows])
-    finally:
-        cursor.close()
-        conn.close()
+    return relatorios.ler_em_lotes(get_connection, """
+        SELECT * FROM faturamento WHERE vendedor = %s AND data_registro >= %s AND data_registro < %s
+    """, (vendedor, *intervalo_hoje()))
 
 def buscar_erros_produtos_do_dia(vendedor):
-    conn = get_connection()
-    if not conn:
-        return pd.DataFrame()
-    try:
-        cursor = conn.cursor()
-        cursor.execute("""
-            SELECT * FROM erros_qualidade_produtos WHERE vendedor = %s AND data_registro::date = CURRENT_DATE
-        """, (vendedor,))
-        colunas = [desc[0] for desc in cursor.description]
-        rows = cursor.fetchall()
-        if not rows:
-            return pd.DataFrame()
-        return pd.DataFrame([dict(zip(colunas, row)) for row in rows])
-    finally:
-        cursor.close()
-        conn.close()
+    return relatorios.ler_em_lotes(get_connection, """
+        SELECT * FROM erros_qualidade_produtos WHERE vendedor = %s AND data_registro >= %s AND data_registro < %s
+    """, (vendedor, *intervalo_hoje()))
 
 def buscar_erros_estoque_do_dia(vendedor):
-    conn = get_connection()
-    if not conn:
-        return pd.DataFrame()
-    try:
-        cursor = conn.cursor()
-        cursor.execute("""
-            SELECT * FROM erros_qualidade_estoque WHERE vendedor = %s AND data_registro::date = CURRENT_DATE
-        """, (vendedor,))
-        colunas = [desc[0] for desc in cursor.description]
-        rows = cursor.fetchall()
-        if not rows:
-            return pd.DataFrame()
-        return pd.DataFrame([dict(zip(colunas, row)) for row in rows])
-    finally:
-        cursor.close()
-        conn.close()
+    return relatorios.ler_em_lotes(get_connection, """
+        SELECT * FROM erros_qualidade_estoque WHERE vendedor = %s AND data_registro >= %s AND data_registro < %s
+    """, (vendedor, *intervalo_hoje()))
 
 # ------------------------- GERAR XLSX E ZIP ----------------------------
 
-def df_to_xlsx_bytes(df):
-    output = io.BytesIO()
-    with pd.ExcelWriter(output, engine='xlsxwriter') as writer:
-        df.to_excel(writer, index=False)
-    return output.getvalue()
-
+@metricas.rastrear_zip("amazon")
 def gerar_zip_relatorios_do_dia(vendedor):
     try:
-        produtos = buscar_produtos_do_dia(vendedor)
-        pedidos = buscar_pedidos_do_dia(vendedor)
-        estoque = buscar_estoque_do_dia(vendedor)
-        faturamento = buscar_faturamento_do_dia(vendedor)
-        erros_produtos = buscar_erros_produtos_do_dia(vendedor)
-        erros_estoque = buscar_erros_estoque_do_dia(vendedor)
-
-        zip_stream = io.BytesIO()
-        with zipfile.ZipFile(zip_stream, "w") as zf:
-            if produtos is not None and not produtos.empty:
-                zf.writestr("produtos.xlsx", df_to_xlsx_bytes(remover_timezone_df(produtos)))
-            if pedidos is not None and not pedidos.empty:
-                zf.writestr("pedidos.xlsx", df_to_xlsx_bytes(remover_timezone_df(pedidos)))
-            if estoque is not None and not estoque.empty:
-                zf.writestr("estoque_FBA.xlsx", df_to_xlsx_bytes(remover_timezone_df(estoque)))
-            if faturamento is not None and not faturamento.empty:
-                zf.writestr("faturamento.xlsx", df_to_xlsx_bytes(remover_timezone_df(faturamento)))
-            if erros_produtos is not None and not erros_produtos.empty:
-                zf.writestr("erros_qualidade_produtos.xlsx", df_to_xlsx_bytes(remover_timezone_df(erros_produtos)))
-            if erros_estoque is not None and not erros_estoque.empty:
-                zf.writestr("erros_qualidade_estoque_FBA.xlsx", df_to_xlsx_bytes(remover_timezone_df(erros_estoque)))
-        zip_stream.seek(0)
-        return zip_stream
+        return relatorios.gerar_zip([
+            ("produtos.xlsx", buscar_produtos_do_dia(vendedor)),
+            ("pedidos.xlsx", buscar_pedidos_do_dia(vendedor)),
+            ("itens_pedidos.xlsx", buscar_itens_pedidos_do_dia(vendedor)),
+            ("estoque_FBA.xlsx", buscar_estoque_do_dia(vendedor)),
+            ("faturamento.xlsx", buscar_faturamento_do_dia(vendedor)),
+            ("erros_qualidade_produtos.xlsx", buscar_erros_produtos_do_dia(vendedor)),
+            ("erros_qualidade_estoque_FBA.xlsx", buscar_erros_estoque_do_dia(vendedor))
+        ])
     except Exception as e:
         print(f"Erro ao gerar ZIP Amazon: {e}")
         import traceback
         traceback.print_exc()
         raise
 
+# ------------------------- ESTOQUE DIRECIONADO ----------------------------
+
+# Atualiza o estoque apenas dos SKUs/ASINs informados (ex.: os vendidos nos pedidos
+# recentes), sem percorrer o inventário inteiro. Só as linhas afetadas de estoque e
+# erros_qualidade_estoque são regravadas.
+def atualizar_estoque_direcionado(vendedor, access_token=None, skus=None, asins=None):
+    if access_token is None:
+        tokens = load_tokens()
+        if vendedor not in tokens:
+            return f"Vendedor {vendedor} não encontrado nos tokens."
+        access_token = get_access_token(tokens[vendedor]['refresh_token'])
+        if not access_token:
+            return "Não foi possível obter access_token."
+    skus = set(skus or []) | set(skus_dos_asins(asins, vendedor))
+    if not skus:
+        return "Nenhum SKU para atualizar o estoque."
+    particoes.preparar(get_connection, TABELAS_PARTICIONADAS, "amazon")
+    with tempos.etapa("estoque"):
+        estoque_raw = get_fba_inventory_by_skus(access_token, skus)
+    with tempos.etapa("transformacao"):
+        estoque = tratar_dados_estoque(estoque_raw, vendedor)
+    with tempos.etapa("gravacao_banco"):
+        salvar_estoque_no_banco(estoque)
+    with tempos.etapa("qualidade"):
+        erros_estoque = tratar_erros_qualidade_estoque(estoque, vendedor)
+    with tempos.etapa("gravacao_erros"):
+        salvar_erros_qualidade_estoque(erros_estoque)
+    return f"Estoque atualizado para {len(estoque)} itens de {len(skus)} SKUs."
+
 # ------------------------- EXECUÇÃO PRINCIPAL ----------------------------
 
 # Função principal para coletar dados da Amazon
-def coletar_dados_amazon(vendedor: str):
-    print(f"\nIniciando coleta Amazon para o vendedor: {vendedor}")
+@metricas.rastrear_coleta("amazon")
+@arquivo_bruto.arquivar("amazon")
+def coletar_dados_amazon(vendedor: str, incremental: bool = False):
+    print(f"\nIniciando coleta Amazon {'incremental ' if incremental else ''}para o vendedor: {vendedor}")
     mensagens = []
     try:
         # Verifica se o vendedor está na lista de tokens
         tokens = load_tokens()
         if vendedor not in tokens:
-            msg = f"Vendedor {vendedor} não encontrado nos tokens."
-            print(msg)
-            return msg
+            raise Exception(f"Vendedor {vendedor} não encontrado nos tokens.")
         
         # Obtém os tokens do vendedor
         refresh_token = tokens[vendedor]['refresh_token']
         seller_id = tokens[vendedor]['seller_id']
         access_token = get_access_token(refresh_token)
         if not access_token:
-            msg = "Não foi possível obter access_token."
-            print(msg)
-            return msg
-
-        # Produtos
-        created_after_produtos = (datetime.now() - timedelta(days=730)).replace(tzinfo=timezone.utc)
-        produtos_raw = get_listing_items(access_token, seller_id)
-        produtos = tratar_dados_produtos(produtos_raw, vendedor, data_consultada=created_after_produtos)
-        msg_produtos = salvar_produtos_no_banco(produtos)
-        mensagens.append(msg_produtos)
-        erros_produtos = tratar_erros_qualidade_produtos(produtos, vendedor, data_consultada=created_after_produtos)
-        msg_erros_produtos = salvar_erros_qualidade_produtos(erros_produtos)
-        mensagens.append(msg_erros_produtos)
-        produtos_global = tratar_dados_produtos(produtos_raw, vendedor, data_consultada=created_after_produtos)
-        produtos_dict = {(p['asin'], p['vendedor']): p['status'] for p in produtos_global}
+            raise Exception("Não foi possível obter access_token.")
+        with tempos.etapa("particoes"):
+            particoes.preparar(get_connection, TABELAS_PARTICIONADAS, "amazon")
+
+        # Produtos (a coleta incremental atualiza apenas pedidos, estoque e faturamento)
+        if not incremental:
+            created_after_produtos = (datetime.now() - timedelta(days=730)).replace(tzinfo=timezone.utc)
+            with tempos.etapa("listagem_ids"):
+                produtos_raw = get_listing_items(access_token, seller_id)
+            arquivo_bruto.registrar_varios("produtos", produtos_raw)
+            with tempos.etapa("transformacao"):
+                produtos = tratar_dados_produtos(produtos_raw, vendedor, data_consultada=created_after_produtos)
+            with tempos.etapa("sondagem_imagens"):
+                atualizar_dimensoes_imagens(produtos)
+            with tempos.etapa("gravacao_banco"):
+                msg_produtos = salvar_produtos_no_banco(produtos)
+            mensagens.append(msg_produtos)
+            with tempos.etapa("catalogo"):
+                catalogo = enriquecer_catalogo(access_token, [p.get("asin") for p in produtos])
+            with tempos.etapa("qualidade"):
+                erros_produtos = tratar_erros_qualidade_produtos(
+                    produtos, vendedor, data_consultada=created_after_produtos, catalogo=catalogo
+                )
+            with tempos.etapa("gravacao_erros"):
+                msg_erros_produtos = salvar_erros_qualidade_produtos(erros_produtos)
+            mensagens.append(msg_erros_produtos)
+            produtos_global = tratar_dados_produtos(produtos_raw, vendedor, data_consultada=created_after_produtos)
+            produtos_dict = {(p['asin'], p['vendedor']): p['status'] for p in produtos_global}
 
         # Pedidos
         created_after_pedidos = (datetime.now(timezone.utc) - timedelta(days=30))
-        pedidos_raw = get_orders(access_token)
-        pedidos = tratar_dados_pedidos(pedidos_raw, vendedor, data_consultada=created_after_pedidos)
-        msg_pedidos = salvar_pedidos_no_banco(pedidos)
+        with tempos.etapa("pedidos"):
+            pedidos_raw = get_orders(access_token)
+        arquivo_bruto.registrar_varios("pedidos", pedidos_raw)
+        with tempos.etapa("transformacao"):
+            pedidos = tratar_dados_pedidos(pedidos_raw, vendedor, data_consultada=created_after_pedidos)
+        with tempos.etapa("gravacao_banco"):
+            msg_pedidos = salvar_pedidos_no_banco(pedidos)
         mensagens.append(msg_pedidos)
 
-        # Estoque
-        start_date_estoque = (datetime.now(timezone.utc) - timedelta(days=90))
-        estoque_raw = get_fba_inventory_summaries(access_token)
-        estoque = tratar_dados_estoque(estoque_raw, vendedor, data_consultada=start_date_estoque)
-        msg_estoque = salvar_estoque_no_banco(estoque)
-        mensagens.append(msg_estoque)
-        erros_estoque = tratar_erros_qualidade_estoque(estoque, vendedor, data_consultada=start_date_estoque)
-        msg_erros_estoque = salvar_erros_qualidade_estoque(erros_estoque)
-        mensagens.append(msg_erros_estoque)
+        # Itens dos pedidos novos ou alterados
+        mensagens.append(coletar_itens_pedidos(access_token, pedidos_raw, vendedor))
+
+        # Estoque: a coleta incremental atualiza apenas os SKUs vendidos nos pedidos recentes
+        if incremental:
+            skus_vendidos = skus_dos_pedidos([p.get("AmazonOrderId") for p in pedidos_raw], vendedor)
+            mensagens.append(atualizar_estoque_direcionado(vendedor, access_token, skus=skus_vendidos))
+        else:
+            start_date_estoque = (datetime.now(timezone.utc) - timedelta(days=90))
+            with tempos.etapa("estoque"):
+                estoque_raw = get_fba_inventory_summaries(access_token)
+            arquivo_bruto.registrar_varios("estoque", estoque_raw)
+            with tempos.etapa("transformacao"):
+                estoque = tratar_dados_estoque(estoque_raw, vendedor, data_consultada=start_date_estoque)
+            with tempos.etapa("gravacao_banco"):
+                msg_estoque = salvar_estoque_no_banco(estoque)
+            mensagens.append(msg_estoque)
+            with tempos.etapa("qualidade"):
+                erros_estoque = tratar_erros_qualidade_estoque(estoque, vendedor, data_consultada=start_date_estoque)
+            with tempos.etapa("gravacao_erros"):
+                msg_erros_estoque = salvar_erros_qualidade_estoque(erros_estoque)
+            mensagens.append(msg_erros_estoque)
 
         # Faturamento
-        faturamento_raw = get_order_metrics(access_token)
-        faturamento = tratar_dados_faturamento(faturamento_raw, vendedor)
-        msg_faturamento = salvar_faturamento_no_banco(faturamento)
+        with tempos.etapa("faturamento"):
+            faturamento_raw = get_order_metrics(access_token)
+        arquivo_bruto.registrar_varios("faturamento", faturamento_raw)
+        with tempos.etapa("transformacao"):
+            faturamento = tratar_dados_faturamento(faturamento_raw, vendedor)
+        with tempos.etapa("gravacao_banco"):
+            msg_faturamento = salvar_faturamento_no_banco(faturamento)
         mensagens.append(msg_faturamento)
 
+        arquivo_bruto.concluir()
         print(f"\nColeta Amazon finalizada para {vendedor}\n")
         return f"\nColeta Amazon finalizada para {vendedor}"
     except Exception as e:
+        # Registra e propaga: a execução (e o job da fila) precisa terminar como erro
         print(f"Erro durante a coleta Amazon: {e}")
         import traceback
         traceback.print_exc()
-        return f"Erro durante a coleta Amazon: {e}"
+        raise
+
+# Reprocessa a última coleta completa arquivada do vendedor (arquivo_bruto) com as funções
+# atuais de tratamento e qualidade, sem acessar a API. Os itens dos pedidos não são
+# arquivados: pedido_itens não depende do dia e continua como está.
+def reprocessar(vendedor):
+    execucoes = arquivo_bruto.selecionar(arquivo_bruto.listar_execucoes("amazon", vendedor))
+    if not execucoes:
+        return f"Nenhuma coleta completa arquivada para {vendedor}."
+    particoes.preparar(get_connection, TABELAS_PARTICIONADAS, "amazon")
+    mensagens = []
+
+    created_after_produtos = (datetime.now() - timedelta(days=730)).replace(tzinfo=timezone.utc)
+    produtos_raw = list(arquivo_bruto.ler("amazon", vendedor, "produtos", execucoes))
+    produtos = tratar_dados_produtos(produtos_raw, vendedor, data_consultada=created_after_produtos)
+    atualizar_dimensoes_imagens(produtos, somente_cache=True)
+    mensagens.append(salvar_produtos_no_banco(produtos))
+    catalogo = carregar_cache_catalogo(sorted({p.get("asin") for p in produtos if p.get("asin")}), incluir_vencidos=True)
+    erros_produtos = tratar_erros_qualidade_produtos(
+        produtos, vendedor, data_consultada=created_after_produtos, catalogo=catalogo
+    )
+    mensagens.append(salvar_erros_qualidade_produtos(erros_produtos))
+
+    created_after_pedidos = (datetime.now(timezone.utc) - timedelta(days=30))
+    pedidos_raw = list(arquivo_bruto.ler("amazon", vendedor, "pedidos", execucoes))
+    mensagens.append(salvar_pedidos_no_banco(tratar_dados_pedidos(pedidos_raw, vendedor, data_consultada=created_after_pedidos)))
+
+    start_date_estoque = (datetime.now(timezone.utc) - timedelta(days=90))
+    estoque_raw = list(arquivo_bruto.ler("amazon", vendedor, "estoque", execucoes))
+    estoque = tratar_dados_estoque(estoque_raw, vendedor, data_consultada=start_date_estoque)
+    mensagens.append(salvar_estoque_no_banco(estoque))
+    erros_estoque = tratar_erros_qualidade_estoque(estoque, vendedor, data_consultada=start_date_estoque)
+    mensagens.append(salvar_erros_qualidade_estoque(erros_estoque))
+
+    faturamento_raw = list(arquivo_bruto.ler("amazon", vendedor, "faturamento", execucoes))
+    mensagens.append(salvar_faturamento_no_banco(tratar_dados_faturamento(faturamento_raw, vendedor)))
+
+    print("\n".join(str(m) for m in mensagens if m))
+    return f"Reprocessados {len(produtos)} produtos, {len(pedidos_raw)} pedidos e {len(estoque)} itens de estoque de {vendedor}."
@@ -0,0 +1,271 @@
+import os
+import io
+import sys
+import json
+import shutil
+import threading
+import importlib
+from functools import wraps
+from contextvars import ContextVar
+from datetime import datetime
+
+try:
+    import zstandard
+    ZSTD_DISPONIVEL = True
+except ImportError:
+    ZSTD_DISPONIVEL = False
+
+# ------------------------- ARQUIVO DAS RESPOSTAS BRUTAS ----------------------------
+
+# Cada coleta guarda o JSON bruto recebido das APIs em disco local, por vendedor e
+# execução, para que mudanças nas traduções (traduzir_status, traduzir_tipo_produto...)
+# ou nas verificações de qualidade possam ser aplicadas sem coletar de novo:
+#
+#   <ARQUIVO_BRUTO_DIR>/<plataforma>/<vendedor>/indice.jsonl
+#   <ARQUIVO_BRUTO_DIR>/<plataforma>/<vendedor>/<execucao>/<fluxo>.jsonl.zst
+#
+# Os arquivos de cada fluxo (itens, skus, pedidos...) têm um registro JSON por linha,
+# comprimidos com zstd e só recebem acréscimos. O índice também só recebe acréscimos:
+# uma linha no início e outra no fim de cada execução (com registros e bytes por fluxo),
+# e uma linha quando a pasta de uma execução antiga é removida.
+#
+# O reprocessamento lê o arquivo da última coleta completa (no Mercado Livre, junto com
+# as execuções interrompidas que ela retomou) e passa os registros pelas mesmas funções
+# de transformação e de qualidade da coleta, gravando o resultado no dia corrente, sem
+# rede (resoluções de imagens, hashes e catálogo vêm só dos caches do banco):
+#   python -m app.services.arquivo_bruto reprocessar mercadolivre|magalu|amazon <vendedor>
+#
+# Os registros devem ser feitos no código síncrono da coleta: o contexto da execução
+# (ContextVar) não chega às corrotinas do cliente_async, que rodam em outra thread.
+#
+# Variáveis de ambiente:
+#   ARQUIVO_BRUTO             "1" para arquivar as coletas (padrão "1"; requer o pacote zstandard)
+#   ARQUIVO_BRUTO_DIR         diretório do arquivo (padrão "arquivo_bruto")
+#   ARQUIVO_BRUTO_NIVEL       nível de compressão do zstd (padrão 3)
+#   ARQUIVO_BRUTO_EXECUCOES   execuções mantidas por vendedor, além das usadas no reprocessamento (padrão 7)
+
+ATIVO = os.getenv("ARQUIVO_BRUTO", "1") == "1" and ZSTD_DISPONIVEL
+DIRETORIO = os.getenv("ARQUIVO_BRUTO_DIR", "arquivo_bruto")
+NIVEL = int(os.getenv("ARQUIVO_BRUTO_NIVEL", 3))
+EXECUCOES_MANTIDAS = max(1, int(os.getenv("ARQUIVO_BRUTO_EXECUCOES", 7)))
+
+PLATAFORMAS = ("mercadolivre", "magalu", "amazon")
+
+# Execução sendo arquivada no contexto atual
+_execucao_atual = ContextVar("arquivo_bruto_execucao", default=None)
+
+def pasta_vendedor(plataforma, vendedor):
+    return os.path.join(DIRETORIO, plataforma, vendedor)
+
+def arquivo_indice(plataforma, vendedor):
+    return os.path.join(pasta_vendedor(plataforma, vendedor), "indice.jsonl")
+
+def _acrescentar_indice(plataforma, vendedor, entrada):
+    os.makedirs(pasta_vendedor(plataforma, vendedor), exist_ok=True)
+    with open(arquivo_indice(plataforma, vendedor), "a", encoding="utf-8") as f:
+        f.write(json.dumps(entrada, ensure_ascii=False) + "\n")
+
+# ------------------------- GRAVAÇÃO ----------------------------
+
+class Execucao:
+    def __init__(self, plataforma, vendedor, incremental=False):
+        self.plataforma = plataforma
+        self.vendedor = vendedor
+        self.incremental = incremental
+        self.inicio = datetime.now()
+        self.nome = self.inicio.strftime("%Y%m%dT%H%M%S%f")
+        self.pasta = os.path.join(pasta_vendedor(plataforma, vendedor), self.nome)
+        self.completa = False
+        self.retomada = False
+        self._fluxos = {}
+        self._lock = threading.Lock()
+        _acrescentar_indice(plataforma, vendedor, {
+            "evento": "inicio", "execucao": self.nome, "incremental": incremental, "inicio": self.inicio.isoformat()
+        })
+
+    def registrar(self, fluxo, registros):
+        dados = "".join(json.dumps(r, ensure_ascii=False, default=str) + "\n" for r in registros).encode("utf-8")
+        with self._lock:
+            aberto = self._fluxos.get(fluxo)
+            if aberto is None:
+                os.makedirs(self.pasta, exist_ok=True)
+                arquivo = open(os.path.join(self.pasta, f"{fluxo}.jsonl.zst"), "ab")
+                escritor = zstandard.ZstdCompressor(level=NIVEL).stream_writer(arquivo)
+                aberto = self._fluxos[fluxo] = {"escritor": escritor, "registros": 0}
+            aberto["escritor"].write(dados)
+            aberto["registros"] += len(registros)
+
+    # Fecha o bloco zstd em andamento: o que foi registrado até aqui fica legível mesmo
+    # que o processo termine sem fechar os arquivos
+    def descarregar(self):
+        with self._lock:
+            for aberto in self._fluxos.values():
+                aberto["escritor"].flush(zstandard.FLUSH_BLOCK)
+
+    def fechar(self):
+        fluxos = {}
+        with self._lock:
+            for fluxo, aberto in self._fluxos.items():
+                aberto["escritor"].close()
+                fluxos[fluxo] = {
+                    "registros": aberto["registros"],
+                    "bytes": os.path.getsize(os.path.join(self.pasta, f"{fluxo}.jsonl.zst"))
+                }
+            self._fluxos = {}
+        _acrescentar_indice(self.plataforma, self.vendedor, {
+            "evento": "fim", "execucao": self.nome, "completa": self.completa, "retomada": self.retomada,
+            "fim": datetime.now().isoformat(), "fluxos": fluxos
+        })
+
+# Registra um (ou vários) registros brutos no fluxo da execução atual. Sem execução ativa
+# (arquivo desligado, reprocessamento, chamadas fora da coleta) não faz nada.
+def registrar(fluxo, registro):
+    execucao = _execucao_atual.get()
+    if execucao is not None and registro is not None:
+        execucao.registrar(fluxo, [registro])
+
+def registrar_varios(fluxo, registros):
+    execucao = _execucao_atual.get()
+    if execucao is not None and registros:
+        execucao.registrar(fluxo, list(registros))
+
+def descarregar():
+    execucao = _execucao_atual.get()
+    if execucao is not None:
+        execucao.descarregar()
+
+# A execução atual continua uma coleta interrompida (checkpoint): o reprocessamento lê
+# também as execuções anteriores que ela completa
+def marcar_retomada():
+    execucao = _execucao_atual.get()
+    if execucao is not None:
+        execucao.retomada = True
+
+# A coleta terminou com sucesso; só execuções completas são reprocessadas
+def concluir():
+    execucao = _execucao_atual.get()
+    if execucao is not None:
+        execucao.completa = True
+
+# Decorador das funções de coleta (coletar_dados_*): arquiva a execução do vendedor,
+# que a própria coleta marca como completa com concluir()
+def arquivar(plataforma):
+    def decorador(func):
+        @wraps(func)
+        def wrapper(vendedor, *args, **kwargs):
+            if not ATIVO:
+                return func(vendedor, *args, **kwargs)
+            try:
+                execucao = Execucao(plataforma, vendedor, bool(kwargs.get("incremental")))
+            except OSError as e:
+                print(f"Erro ao iniciar o arquivo bruto de {vendedor}: {e}")
+                return func(vendedor, *args, **kwargs)
+            token = _execucao_atual.set(execucao)
+            try:
+                return func(vendedor, *args, **kwargs)
+            finally:
+                _execucao_atual.reset(token)
+                try:
+                    execucao.fechar()
+                    podar(plataforma, vendedor)
+                except OSError as e:
+                    print(f"Erro ao fechar o arquivo bruto de {vendedor}: {e}")
+        return wrapper
+    return decorador
+
+# ------------------------- LEITURA ----------------------------
+
+# Execuções do vendedor na ordem em que começaram, combinando as linhas do índice
+def listar_execucoes(plataforma, vendedor):
+    caminho = arquivo_indice(plataforma, vendedor)
+    if not os.path.exists(caminho):
+        return []
+    execucoes = {}
+    with open(caminho, encoding="utf-8") as f:
+        for linha in f:
+            try:
+                entrada = json.loads(linha)
+            except ValueError:
+                continue
+            execucao = execucoes.setdefault(entrada["execucao"], {
+                "execucao": entrada["execucao"], "completa": False, "retomada": False, "removida": False, "fluxos": {}
+            })
+            if entrada["evento"] == "removida":
+                execucao["removida"] = True
+            else:
+                execucao.update({k: v for k, v in entrada.items() if k != "evento"})
+    return sorted(execucoes.values(), key=lambda e: e["execucao"])
+
+# Execuções lidas no reprocessamento: a última coleta completa (não incremental) e,
+# se ela retomou um checkpoint, as execuções interrompidas imediatamente anteriores.
+# Retorna da mais antiga para a mais recente.
+def selecionar(execucoes):
+    for posicao in range(len(execucoes) - 1, -1, -1):
+        execucao = execucoes[posicao]
+        if execucao["completa"] and not execucao.get("incremental") and not execucao["removida"]:
+            selecionadas = [execucao]
+            anterior = posicao - 1
+            while selecionadas[-1]["retomada"] and anterior >= 0:
+                candidata = execucoes[anterior]
+                if candidata["completa"] or candidata["removida"]:
+                    break
+                selecionadas.append(candidata)
+                anterior -= 1
+            return list(reversed(selecionadas))
+    return []
+
+# Registros de um fluxo nas execuções informadas, na ordem em que foram gravados. Um
+# arquivo cortado no meio (processo encerrado durante a coleta) é lido até o último
+# bloco completo.
+def ler(plataforma, vendedor, fluxo, execucoes):
+    for execucao in execucoes:
+        caminho = os.path.join(pasta_vendedor(plataforma, vendedor), execucao["execucao"], f"{fluxo}.jsonl.zst")
+        if not os.path.exists(caminho):
+            continue
+        with open(caminho, "rb") as f:
+            leitor = zstandard.ZstdDecompressor().stream_reader(f, read_across_frames=True)
+            texto = io.TextIOWrapper(leitor, encoding="utf-8")
+            try:
+                for linha in texto:
+                    if linha.endswith("\n"):
+                        yield json.loads(linha)
+            except zstandard.ZstdError as e:
+                print(f"Arquivo {caminho} incompleto, lido até o último bloco válido: {e}")
+
+# ------------------------- LIMPEZA ----------------------------
+
+# Remove as pastas das execuções antigas, mantendo as EXECUCOES_MANTIDAS mais recentes
+# e as que o reprocessamento usaria
+def podar(plataforma, vendedor, mantidas=None):
+    mantidas = EXECUCOES_MANTIDAS if mantidas is None else mantidas
+    execucoes = [e for e in listar_execucoes(plataforma, vendedor) if not e["removida"]]
+    preservadas = {e["execucao"] for e in execucoes[-mantidas:]} | {e["execucao"] for e in selecionar(execucoes)}
+    removidas = []
+    for execucao in execucoes:
+        if execucao["execucao"] in preservadas:
+            continue
+        shutil.rmtree(os.path.join(pasta_vendedor(plataforma, vendedor), execucao["execucao"]), ignore_errors=True)
+        _acrescentar_indice(plataforma, vendedor, {"evento": "removida", "execucao": execucao["execucao"]})
+        removidas.append(execucao["execucao"])
+    return removidas
+
+# ------------------------- REPROCESSAMENTO ----------------------------
+
+# python -m app.services.arquivo_bruto reprocessar <plataforma> <vendedor>
+def main(argv=None):
+    argv = sys.argv[1:] if argv is None else argv
+    if len(argv) != 3 or argv[0] != "reprocessar" or argv[1] not in PLATAFORMAS:
+        print("Uso: python -m app.services.arquivo_bruto reprocessar mercadolivre|magalu|amazon <vendedor>")
+        return 1
+    if not ZSTD_DISPONIVEL:
+        print("O reprocessamento requer o pacote zstandard.")
+        return 1
+    from app.services import execucoes
+    _, plataforma, vendedor = argv
+    modulo = importlib.import_module(f"app.services.{plataforma}")
+    with execucoes.trava_vendedor(plataforma, vendedor):
+        print(modulo.reprocessar(vendedor))
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
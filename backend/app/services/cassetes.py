@@ -0,0 +1,190 @@
+import os
+import gzip
+import json
+import time
+import atexit
+import base64
+import asyncio
+import hashlib
+import threading
+from urllib.parse import urlencode
+import httpx
+
+# ------------------------- CASSETES HTTP (GRAVAÇÃO E REPRODUÇÃO) ----------------------------
+
+# Grava os pares requisição/resposta de todas as chamadas HTTP dos serviços (make_request,
+# paginação, tokens, imagens) e os devolve depois, sem rede. O gancho é um transporte do
+# httpx instalado nos clientes de cliente_async, então nenhuma função dos serviços muda:
+# com CASSETES_MODO=reproduzir, uma coleta (ou o benchmark) roda contra os payloads
+# gravados em produção, com as respostas idênticas byte a byte.
+#
+# Cada plataforma tem um arquivo <CASSETES_DIR>/<CASSETES_NOME>/<plataforma>.jsonl.gz com
+# uma resposta por linha (status, headers e corpo como vieram do servidor, e a duração).
+# A chave de uma requisição é o método, o caminho, os parâmetros ordenados e o hash do
+# corpo; o host fica de fora (o mesmo cassete serve para outra porta do servidor falso) e
+# os headers também (o token de acesso muda a cada execução). Na reprodução, requisições
+# repetidas recebem as respostas na ordem em que foram gravadas. Parâmetros com a hora
+# atual (CreatedAfter da Amazon, intervalos de métricas) não se repetem entre execuções:
+# sem a chave exata, vale a próxima resposta gravada para o mesmo caminho e os mesmos
+# nomes de parâmetros. Requisições que não estão no cassete falham com erro de conexão.
+#
+# Os cassetes guardam as respostas dos endpoints de token (tokens de acesso): não devem
+# ser versionados nem compartilhados fora da equipe.
+#
+# Variáveis de ambiente:
+#   CASSETES_MODO       "gravar" ou "reproduzir" (padrão vazio: desligado)
+#   CASSETES_DIR        diretório dos cassetes (padrão "cassetes")
+#   CASSETES_NOME       nome do cassete gravado/reproduzido (padrão "padrao")
+#   CASSETES_LATENCIA   na reprodução, "gravada" para esperar a duração original de cada
+#                       resposta ou um valor fixo em ms (padrão 0)
+
+MODO = os.getenv("CASSETES_MODO", "").strip().lower()
+DIRETORIO = os.getenv("CASSETES_DIR", "cassetes")
+NOME = os.getenv("CASSETES_NOME", "padrao")
+LATENCIA = os.getenv("CASSETES_LATENCIA", "0").strip().lower()
+
+ATIVO = MODO in ("gravar", "reproduzir")
+
+# Headers recalculados pelo httpx ao montar a resposta a partir do corpo gravado
+_HEADERS_IGNORADOS = {"transfer-encoding", "content-length"}
+
+def arquivo(plataforma, nome=None):
+    return os.path.join(DIRETORIO, nome or NOME, f"{plataforma}.jsonl.gz")
+
+# ------------------------- CHAVES ----------------------------
+
+async def _chaves(request):
+    corpo = await request.aread()
+    parametros = sorted(request.url.params.multi_items())
+    caminho = request.url.raw_path.split(b"?")[0].decode("ascii")
+    digest = hashlib.sha1(corpo).hexdigest()[:16] if corpo else ""
+    exata = f"{request.method} {caminho}?{urlencode(parametros)} {digest}"
+    aproximada = f"{request.method} {caminho}?{','.join(sorted({n for n, _ in parametros}))}"
+    return exata, aproximada
+
+def _codificar(corpo):
+    try:
+        return {"texto": corpo.decode("utf-8")}
+    except UnicodeDecodeError:
+        return {"base64": base64.b64encode(corpo).decode("ascii")}
+
+def _decodificar(gravada):
+    if "texto" in gravada:
+        return gravada["texto"].encode("utf-8")
+    return base64.b64decode(gravada.get("base64", ""))
+
+# ------------------------- GRAVAÇÃO ----------------------------
+
+class Gravador:
+    def __init__(self, plataforma):
+        caminho = arquivo(plataforma)
+        os.makedirs(os.path.dirname(caminho), exist_ok=True)
+        self._arquivo = gzip.open(caminho, "at", encoding="utf-8")
+        self._lock = threading.Lock()
+        atexit.register(self.fechar)
+
+    def gravar(self, entrada):
+        linha = json.dumps(entrada, ensure_ascii=False, separators=(",", ":")) + "\n"
+        with self._lock:
+            if not self._arquivo.closed:
+                self._arquivo.write(linha)
+
+    def fechar(self):
+        with self._lock:
+            if not self._arquivo.closed:
+                self._arquivo.close()
+
+# ------------------------- REPRODUÇÃO ----------------------------
+
+class Cassete:
+    def __init__(self, plataforma):
+        self._exatas = {}
+        self._aproximadas = {}
+        self._lock = threading.Lock()
+        caminho = arquivo(plataforma)
+        if not os.path.exists(caminho):
+            print(f"Cassete {caminho} não encontrado: as requisições de {plataforma} vão falhar.")
+            return
+        total = 0
+        try:
+            with gzip.open(caminho, "rt", encoding="utf-8") as f:
+                for linha in f:
+                    entrada = json.loads(linha)
+                    entrada["usada"] = False
+                    self._exatas.setdefault(entrada["chave"], []).append(entrada)
+                    self._aproximadas.setdefault(entrada["aproximada"], []).append(entrada)
+                    total += 1
+        except (EOFError, ValueError) as e:
+            # Gravação interrompida sem fechar o arquivo: vale o que foi lido
+            print(f"Cassete {caminho} incompleto, lido até a resposta {total}: {e}")
+        print(f"Cassete {caminho}: {total} respostas carregadas.")
+
+    # Próxima resposta ainda não usada da chave; esgotadas, a última se repete
+    def _proxima(self, entradas):
+        for entrada in entradas:
+            if not entrada["usada"]:
+                entrada["usada"] = True
+                return entrada
+        return entradas[-1]
+
+    def buscar(self, exata, aproximada):
+        with self._lock:
+            if exata in self._exatas:
+                return self._proxima(self._exatas[exata])
+            if aproximada in self._aproximadas:
+                return self._proxima(self._aproximadas[aproximada])
+            return None
+
+# ------------------------- TRANSPORTE ----------------------------
+
+class TransporteCassete(httpx.AsyncBaseTransport):
+    def __init__(self, plataforma, interno):
+        self.plataforma = plataforma
+        self.interno = interno
+        self.gravador = Gravador(plataforma) if MODO == "gravar" else None
+        self.cassete = Cassete(plataforma) if MODO == "reproduzir" else None
+
+    async def handle_async_request(self, request):
+        exata, aproximada = await _chaves(request)
+
+        if self.cassete is not None:
+            gravada = self.cassete.buscar(exata, aproximada)
+            if gravada is None:
+                raise httpx.ConnectError(f"Requisição ausente do cassete: {exata}", request=request)
+            espera = gravada["duracao"] if LATENCIA == "gravada" else float(LATENCIA or 0) / 1000
+            if espera > 0:
+                await asyncio.sleep(espera)
+            return httpx.Response(
+                gravada["status"], headers=gravada["headers"], content=_decodificar(gravada), request=request
+            )
+
+        inicio = time.perf_counter()
+        response = await self.interno.handle_async_request(request)
+        try:
+            corpo = b"".join([pedaco async for pedaco in response.aiter_raw()])
+        finally:
+            await response.aclose()
+        headers = [(k, v) for k, v in response.headers.multi_items() if k.lower() not in _HEADERS_IGNORADOS]
+        self.gravador.gravar({
+            "chave": exata,
+            "aproximada": aproximada,
+            "status": response.status_code,
+            "headers": headers,
+            "duracao": round(time.perf_counter() - inicio, 4),
+            **_codificar(corpo)
+        })
+        return httpx.Response(
+            response.status_code, headers=headers, content=corpo, request=request, extensions=response.extensions
+        )
+
+    async def aclose(self):
+        await self.interno.aclose()
+        if self.gravador is not None:
+            self.gravador.fechar()
+
+# Transporte dos clientes de cliente_async: o padrão do httpx quando os cassetes estão
+# desligados (None), senão o de gravação/reprodução em volta dele
+def transporte(plataforma, **opcoes):
+    if not ATIVO:
+        return None
+    return TransporteCassete(plataforma, httpx.AsyncHTTPTransport(**opcoes))
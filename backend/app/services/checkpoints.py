@@ -0,0 +1,65 @@
+import os
+import json
+from datetime import timedelta
+from app.services import escrita_staging
+
+# ------------------------- COLETAS RETOMÁVEIS ----------------------------
+
+# A coleta grava os registros em tabelas de staging (stg_<tabela>) a cada N itens, na
+# mesma transação que avança o checkpoint (tabela checkpoints_coleta, no banco da
+# plataforma). Se a coleta falhar, a próxima execução do mesmo vendedor retoma da
+# posição salva. Ao final, promover() substitui os dados do vendedor nas tabelas
+# definitivas em uma única transação, então os dados antigos só somem junto com a
+# chegada dos novos. A gravação do staging roda em segundo plano (escrita_staging.py).
+#
+# Variáveis de ambiente:
+#   CHECKPOINT_ITENS            itens processados entre checkpoints (padrão 500)
+#   CHECKPOINT_VALIDADE_HORAS   checkpoints mais antigos são descartados (padrão 24)
+
+ITENS_POR_CHECKPOINT = int(os.getenv("CHECKPOINT_ITENS", 500))
+VALIDADE_HORAS = float(os.getenv("CHECKPOINT_VALIDADE_HORAS", 24))
+
+# Retorna o checkpoint válido do vendedor ({"ids", "posicao", "iniciado_em"}) ou None.
+# Checkpoints vencidos são descartados junto com o staging.
+def carregar(conn, vendedor, tabelas, agora):
+    with conn.cursor() as cur:
+        cur.execute("""
+            SELECT ids, posicao, iniciado_em FROM checkpoints_coleta WHERE vendedor = %s
+        """, (vendedor,))
+        row = cur.fetchone()
+    if row is None:
+        return None
+    ids, posicao, iniciado_em = row
+    if agora - iniciado_em > timedelta(hours=VALIDADE_HORAS):
+        print(f"Checkpoint de {vendedor} iniciado em {iniciado_em} expirou; coleta será refeita.")
+        with conn.cursor() as cur:
+            descartar(cur, vendedor, tabelas)
+        conn.commit()
+        return None
+    return {"ids": ids if isinstance(ids, list) else json.loads(ids), "posicao": posicao, "iniciado_em": iniciado_em}
+
+# Começa uma coleta nova: limpa o staging do vendedor e grava a lista de ids a processar
+def iniciar(conn, vendedor, ids, tabelas, agora):
+    with conn.cursor() as cur:
+        descartar(cur, vendedor, tabelas)
+        cur.execute("""
+            INSERT INTO checkpoints_coleta (vendedor, ids, posicao, iniciado_em, atualizado_em)
+            VALUES (%s, %s, 0, %s, %s)
+        """, (vendedor, json.dumps(ids), agora, agora))
+    conn.commit()
+
+# Avança o checkpoint (deve rodar na mesma transação que grava o staging)
+def avancar(cur, vendedor, posicao, agora):
+    cur.execute("""
+        UPDATE checkpoints_coleta SET posicao = %s, atualizado_em = %s WHERE vendedor = %s
+    """, (posicao, agora, vendedor))
+
+def descartar(cur, vendedor, tabelas):
+    escrita_staging.limpar(cur, vendedor, tabelas)
+    cur.execute("DELETE FROM checkpoints_coleta WHERE vendedor = %s", (vendedor,))
+
+# Substitui os dados do vendedor no dia de data_registro (partição do dia) pelos do
+# staging e remove o checkpoint. Não faz commit: o chamador confirma tudo em uma única transação.
+def promover(cur, vendedor, tabelas, data_registro):
+    escrita_staging.promover(cur, vendedor, tabelas, data_registro)
+    cur.execute("DELETE FROM checkpoints_coleta WHERE vendedor = %s", (vendedor,))
@@ -0,0 +1,111 @@
+import os
+import asyncio
+import threading
+import httpx
+from app.services import recursos, cassetes
+
+# ------------------------- CLIENTE HTTP ASSÍNCRONO ----------------------------
+
+# Um httpx.AsyncClient por plataforma, todos no mesmo event loop. Dentro da API o loop é
+# o do FastAPI (registrado no startup com usar_loop); fora dela (worker, benchmark) um
+# loop próprio é criado em uma thread de fundo na primeira chamada.
+#
+# As funções síncronas dos serviços são wrappers finos: executar_sync agenda a corrotina
+# nesse loop e aguarda o resultado na thread chamadora. Com HTTP/2 (quando o servidor
+# negocia via ALPN) as requisições em paralelo compartilham a mesma conexão.
+#
+# Variáveis de ambiente:
+#   HTTP2_ATIVO               "1" para negociar HTTP/2 (padrão "1"; requer o pacote h2)
+#   {PLATAFORMA}_HTTP_POOL    conexões mantidas abertas por plataforma (padrão 10)
+
+try:
+    import h2  # noqa: F401
+    HTTP2_DISPONIVEL = True
+except ImportError:
+    HTTP2_DISPONIVEL = False
+
+HTTP2 = os.getenv("HTTP2_ATIVO", "1") == "1" and HTTP2_DISPONIVEL
+
+_lock = threading.Lock()
+_loop = None
+_clientes = {}
+
+# ------------------------- EVENT LOOP ----------------------------
+
+# Registra o loop em execução (FastAPI) como o loop compartilhado dos clientes
+def usar_loop(loop):
+    global _loop
+    with _lock:
+        _loop = loop
+        _clientes.clear()
+
+def _iniciar_loop_proprio():
+    loop = asyncio.new_event_loop()
+    thread = threading.Thread(target=loop.run_forever, name="cliente_async", daemon=True)
+    thread.start()
+    return loop
+
+def obter_loop():
+    global _loop
+    with _lock:
+        if _loop is None or _loop.is_closed():
+            _loop = _iniciar_loop_proprio()
+            _clientes.clear()
+        return _loop
+
+# Executa a corrotina no loop compartilhado a partir de código síncrono
+def executar_sync(corrotina):
+    loop = obter_loop()
+    try:
+        atual = asyncio.get_running_loop()
+    except RuntimeError:
+        atual = None
+    if atual is loop:
+        corrotina.close()
+        raise RuntimeError("Chamada síncrona dentro do event loop: use a versão assíncrona da função.")
+    return asyncio.run_coroutine_threadsafe(corrotina, loop).result()
+
+# Percorre um gerador assíncrono a partir de código síncrono, um item por vez.
+# Se o consumidor parar antes do fim, o gerador é fechado (cancelando o que estiver pendente).
+def iterar_sync(gerador):
+    try:
+        while True:
+            try:
+                yield executar_sync(gerador.__anext__())
+            except StopAsyncIteration:
+                return
+    finally:
+        executar_sync(gerador.aclose())
+
+# ------------------------- CLIENTES ----------------------------
+
+# Cliente da plataforma (criado no loop compartilhado na primeira requisição). Com os
+# cassetes ligados (cassetes.py) as requisições passam pelo transporte de gravação/reprodução.
+def cliente(plataforma):
+    if plataforma not in _clientes:
+        tamanho = int(os.getenv(f"{plataforma.upper()}_HTTP_POOL", 10))
+        limites = httpx.Limits(max_connections=tamanho, max_keepalive_connections=tamanho)
+        _clientes[plataforma] = httpx.AsyncClient(
+            http2=HTTP2,
+            limits=limites,
+            timeout=30,
+            transport=cassetes.transporte(plataforma, http2=HTTP2, limits=limites)
+        )
+    return _clientes[plataforma]
+
+# Faz a requisição pelo cliente da plataforma, respeitando o orçamento de requisições
+async def requisitar(plataforma, metodo, url, **kwargs):
+    await recursos.limite(plataforma).aguardar_async()
+    return await cliente(plataforma).request(metodo, url, **kwargs)
+
+# Chama a função de renovação de token, seja ela síncrona ou assíncrona
+async def chamar(funcao):
+    if asyncio.iscoroutinefunction(funcao):
+        return await funcao()
+    return await asyncio.to_thread(funcao)
+
+async def fechar():
+    clientes = list(_clientes.values())
+    _clientes.clear()
+    for c in clientes:
+        await c.aclose()
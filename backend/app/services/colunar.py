@@ -0,0 +1,242 @@
+import array
+import numpy as np
+import pandas as pd
+
+# ------------------------- LOTES COLUNARES ----------------------------
+
+# Registros intermediários da coleta guardados por coluna em vez de um dict por linha.
+# Um dict por registro custa centenas de bytes (a tabela de hash e um objeto por valor,
+# com cada string do JSON da API repetida em memória); aqui cada coluna é um array
+# tipado ou uma lista de objetos:
+#
+#   "texto"    codificado por dicionário: um array de códigos (4 bytes por linha) e a
+#              lista dos valores distintos (status, nomes de atributos, sku_id repetido
+#              nas imagens e atributos...). Valores não hasheáveis entram sem deduplicar.
+#   "inteiro"  array de int64, com máscara de nulos criada só se aparecer um None
+#   "real"     array de float64, None vira NaN
+#   "objeto"   lista comum (textos quase sempre únicos: títulos, descrições, URLs)
+#
+# Os lotes alimentam a verificação de qualidade (para_dataframe, sem passar por dicts),
+# a gravação no banco (linhas gera as tuplas do execute_values) e podem ser juntados
+# (estender_lote) sem decodificar os textos. Os dicts ficam restritos a um SKU por vez.
+
+class _Texto:
+    def __init__(self):
+        self.codigos = array.array("i")
+        self.valores = []
+        self.indice = {}
+
+    def codificar(self, valor):
+        if valor is None:
+            return -1
+        try:
+            codigo = self.indice.get(valor)
+            if codigo is None:
+                codigo = self.indice[valor] = len(self.valores)
+                self.valores.append(valor)
+            return codigo
+        except TypeError:
+            self.valores.append(valor)
+            return len(self.valores) - 1
+
+    def acrescentar(self, valor):
+        self.codigos.append(self.codificar(valor))
+
+    def acrescentar_varios(self, valores):
+        indice = self.indice
+        codigos = []
+        for valor in valores:
+            codigo = indice.get(valor, -1) if valor.__hash__ is not None else -1
+            codigos.append(codigo if codigo >= 0 else self.codificar(valor))
+        self.codigos.extend(codigos)
+
+    def valor(self, i):
+        codigo = self.codigos[i]
+        return None if codigo < 0 else self.valores[codigo]
+
+    def definir(self, i, valor):
+        self.codigos[i] = self.codificar(valor)
+
+    def lista(self):
+        valores = self.valores
+        return [None if c < 0 else valores[c] for c in self.codigos]
+
+    # Decodifica de uma vez pelo numpy (take), compartilhando os objetos do dicionário
+    def serie(self):
+        codigos = np.frombuffer(self.codigos, dtype=np.int32) if len(self.codigos) else np.zeros(0, dtype=np.int32)
+        dicionario = np.empty(len(self.valores) + 1, dtype=object)
+        dicionario[:-1] = self.valores
+        dicionario[-1] = None
+        return dicionario[codigos]
+
+    def estender(self, outra):
+        traducao = [self.codificar(v) for v in outra.valores]
+        self.codigos.extend(-1 if c < 0 else traducao[c] for c in outra.codigos)
+
+class _Numero:
+    def __init__(self, codigo, nulo, converter):
+        self.numeros = array.array(codigo)
+        self.nulo = nulo
+        self.converter = converter
+        self.mascara = None
+
+    def acrescentar(self, valor):
+        if valor is None or (valor != valor):
+            self.numeros.append(self.nulo)
+            self._marcar(len(self.numeros) - 1)
+            return
+        try:
+            self.numeros.append(valor)
+        except TypeError:
+            # 3.0 numa coluna inteira, "12" vindo como texto da API...
+            self.numeros.append(self.converter(valor))
+        if self.mascara is not None:
+            self.mascara.append(0)
+
+    def acrescentar_varios(self, valores):
+        for valor in valores:
+            self.acrescentar(valor)
+
+    def _marcar(self, i):
+        if self.mascara is None:
+            self.mascara = bytearray(len(self.numeros))
+        while len(self.mascara) <= i:
+            self.mascara.append(0)
+        self.mascara[i] = 1
+
+    def valor(self, i):
+        if self.mascara is not None and self.mascara[i]:
+            return None
+        return self.numeros[i]
+
+    def definir(self, i, valor):
+        if valor is None:
+            self.numeros[i] = self.nulo
+            self._marcar(i)
+        else:
+            self.numeros[i] = self.converter(valor)
+            if self.mascara is not None:
+                self.mascara[i] = 0
+
+    def lista(self):
+        return [self.valor(i) for i in range(len(self.numeros))]
+
+    # Como o pandas monta a partir de dicts: int64 sem nulos, float64 com NaN nos nulos
+    def serie(self):
+        valores = np.frombuffer(self.numeros, dtype=np.int64 if self.numeros.typecode == "q" else np.float64) \
+            if len(self.numeros) else np.zeros(0, dtype=np.int64 if self.numeros.typecode == "q" else np.float64)
+        if self.mascara is not None and any(self.mascara):
+            valores = valores.astype(np.float64)
+            valores[np.frombuffer(bytes(self.mascara), dtype=np.uint8).astype(bool)] = np.nan
+        return valores.copy()
+
+    def estender(self, outra):
+        inicio = len(self.numeros)
+        self.numeros.extend(outra.numeros)
+        if outra.mascara is not None:
+            for i, nulo in enumerate(outra.mascara):
+                if nulo:
+                    self._marcar(inicio + i)
+        if self.mascara is not None:
+            while len(self.mascara) < len(self.numeros):
+                self.mascara.append(0)
+
+class _Objeto:
+    def __init__(self):
+        self.itens = []
+
+    def acrescentar(self, valor):
+        self.itens.append(valor)
+
+    def acrescentar_varios(self, valores):
+        self.itens.extend(valores)
+
+    def valor(self, i):
+        return self.itens[i]
+
+    def definir(self, i, valor):
+        self.itens[i] = valor
+
+    def lista(self):
+        return list(self.itens)
+
+    def serie(self):
+        serie = np.empty(len(self.itens), dtype=object)
+        serie[:] = self.itens
+        return serie
+
+    def estender(self, outra):
+        self.itens.extend(outra.itens)
+
+def _nova_coluna(tipo):
+    if tipo == "texto":
+        return _Texto()
+    if tipo == "inteiro":
+        return _Numero("q", 0, int)
+    if tipo == "real":
+        return _Numero("d", float("nan"), float)
+    if tipo == "objeto":
+        return _Objeto()
+    raise ValueError(f"Tipo de coluna desconhecido: {tipo}")
+
+# ------------------------- LOTE ----------------------------
+
+class Lote:
+    # 'esquema' é uma lista de (coluna, tipo) na ordem das colunas
+    def __init__(self, esquema):
+        self.esquema = list(esquema)
+        self.nomes = [nome for nome, _ in self.esquema]
+        self._colunas = {nome: _nova_coluna(tipo) for nome, tipo in self.esquema}
+        self._tamanho = 0
+
+    @classmethod
+    def de_registros(cls, esquema, registros):
+        lote = cls(esquema)
+        lote.estender(registros)
+        return lote
+
+    def __len__(self):
+        return self._tamanho
+
+    # Acrescenta um registro (dict); colunas ausentes ficam nulas e chaves fora do esquema são ignoradas
+    def acrescentar(self, registro):
+        for nome, coluna in self._colunas.items():
+            coluna.acrescentar(registro.get(nome))
+        self._tamanho += 1
+
+    # Acrescenta vários registros, uma coluna por vez
+    def estender(self, registros):
+        registros = registros if isinstance(registros, list) else list(registros)
+        for nome, coluna in self._colunas.items():
+            coluna.acrescentar_varios([registro.get(nome) for registro in registros])
+        self._tamanho += len(registros)
+
+    # Junta outro lote com o mesmo esquema (os textos são recodificados pelo dicionário, sem decodificar)
+    def estender_lote(self, outro):
+        if outro.nomes != self.nomes:
+            raise ValueError("Lotes com esquemas diferentes.")
+        for nome, coluna in self._colunas.items():
+            coluna.estender(outro._colunas[nome])
+        self._tamanho += len(outro)
+
+    def coluna(self, nome):
+        return self._colunas[nome].lista()
+
+    def valor(self, nome, i):
+        return self._colunas[nome].valor(i)
+
+    def definir(self, nome, i, valor):
+        self._colunas[nome].definir(i, valor)
+
+    # Tuplas com as colunas pedidas (todas, por padrão), para o execute_values
+    def linhas(self, colunas=None):
+        listas = [self._colunas[nome].lista() for nome in (colunas or self.nomes)]
+        return zip(*listas) if listas else iter(())
+
+    # Um dict por linha, gerado sob demanda (para código que ainda lê registros)
+    def registros(self):
+        for valores in self.linhas():
+            yield dict(zip(self.nomes, valores))
+
+    def para_dataframe(self):
+        return pd.DataFrame({nome: coluna.serie() for nome, coluna in self._colunas.items()}, columns=self.nomes)
@@ -0,0 +1,173 @@
+import os
+import sys
+import importlib
+from psycopg2.extras import Json
+from app.services import particoes
+
+# ------------------------- ATRIBUTOS E VARIAÇÕES EM DOCUMENTOS ----------------------------
+
+# As tabelas atributos e variacoes guardam um documento JSONB por SKU em vez de uma
+# linha por atributo (e por atributo de cada variação):
+#
+#   atributos.atributos  {"Cor": "Azul", "Voltagem": "220V", ...}
+#   variacoes.variacoes  [{"id_variacao": ..., "preco_variacao": ..., "atributos": {"Cor": "Azul"}}, ...]
+#
+# Um catálogo de 50 mil SKUs grava 50 mil linhas em cada tabela, não milhões. Os
+# documentos têm índice GIN (jsonb_path_ops) para consultas por atributo, por exemplo
+# atributos @> '{"Cor": "Azul"}'. A coleta continua produzindo os registros no formato
+# antigo (sku_id, atributo, valor): eles são agrupados só na gravação e os relatórios
+# voltam a expandi-los linha a linha na exportação.
+#
+# Bancos com as tabelas no formato antigo são convertidos com (a partir de backend/):
+#   python -m app.services.documentos mercadolivre|magalu
+
+COLUNAS_ATRIBUTOS = ["sku_id", "atributo", "valor", "vendedor", "data_registro"]
+COLUNAS_VARIACOES = ["id_variacao", "sku_id", "preco_variacao", "atributo", "valor", "vendedor", "data_registro"]
+
+# ------------------------- GRAVAÇÃO ----------------------------
+
+# {sku_id: {atributo: valor}} a partir dos registros (sku_id, atributo, valor)
+def agrupar_atributos(atributos):
+    documentos = {}
+    for a in atributos:
+        documentos.setdefault(a['sku_id'], {})[a['atributo']] = a['valor']
+    return documentos
+
+# {sku_id: [{"id_variacao", "preco_variacao", "atributos"}]} a partir dos registros
+# (id_variacao, sku_id, preco_variacao, atributo, valor)
+def agrupar_variacoes(variacoes):
+    por_sku = {}
+    for v in variacoes:
+        variacao = por_sku.setdefault(v['sku_id'], {}).setdefault(v['id_variacao'], {
+            "id_variacao": v['id_variacao'],
+            "preco_variacao": v['preco_variacao'],
+            "atributos": {}
+        })
+        variacao["preco_variacao"] = v['preco_variacao']
+        variacao["atributos"][v['atributo']] = v['valor']
+    return {sku_id: list(variacoes_sku.values()) for sku_id, variacoes_sku in por_sku.items()}
+
+# Linhas (sku_id, documento, vendedor, data_registro) para o execute_values
+def linhas(documentos, vendedor, data_registro):
+    return [(sku_id, Json(documento), vendedor, data_registro) for sku_id, documento in documentos.items()]
+
+# ------------------------- EXPORTAÇÃO ----------------------------
+
+# As funções abaixo recebem lotes de (sku_id, documento, vendedor, data_registro) lidos
+# por relatorios.ler_em_lotes e geram lotes no formato de uma linha por atributo
+
+def expandir_atributos(lotes):
+    for _, registros in lotes:
+        expandidas = [
+            (sku_id, atributo, valor, vendedor, data_registro)
+            for sku_id, documento, vendedor, data_registro in registros
+            for atributo, valor in (documento or {}).items()
+        ]
+        if expandidas:
+            yield COLUNAS_ATRIBUTOS, expandidas
+
+def expandir_variacoes(lotes):
+    for _, registros in lotes:
+        expandidas = [
+            (v.get("id_variacao"), sku_id, v.get("preco_variacao"), atributo, valor, vendedor, data_registro)
+            for sku_id, documento, vendedor, data_registro in registros
+            for v in (documento or [])
+            for atributo, valor in (v.get("atributos") or {}).items()
+        ]
+        if expandidas:
+            yield COLUNAS_VARIACOES, expandidas
+
+# ------------------------- CONVERSÃO ----------------------------
+
+# Consultas que montam os documentos a partir das tabelas no formato antigo: um documento
+# por SKU, vendedor e dia, com o data_registro mais recente do dia
+AGREGACOES = {
+    "atributos": """
+        INSERT INTO {destino} (sku_id, atributos, vendedor, data_registro)
+        SELECT sku_id, jsonb_object_agg(atributo, valor ORDER BY data_registro), vendedor, max(data_registro)
+        FROM {antiga} WHERE data_registro IS NOT NULL
+        GROUP BY sku_id, vendedor, data_registro::date
+    """,
+    "variacoes": """
+        INSERT INTO {destino} (sku_id, variacoes, vendedor, data_registro)
+        SELECT sku_id, jsonb_agg(variacao ORDER BY id_variacao), vendedor, max(data_registro)
+        FROM (
+            SELECT sku_id, id_variacao, vendedor, data_registro::date AS dia, max(data_registro) AS data_registro,
+                   jsonb_build_object(
+                       'id_variacao', id_variacao,
+                       'preco_variacao', max(preco_variacao),
+                       'atributos', jsonb_object_agg(atributo, valor ORDER BY data_registro)
+                   ) AS variacao
+            FROM {antiga} WHERE data_registro IS NOT NULL
+            GROUP BY sku_id, id_variacao, vendedor, data_registro::date
+        ) v
+        GROUP BY sku_id, vendedor, dia
+    """
+}
+
+def _formato_antigo(cur, tabela):
+    cur.execute("""
+        SELECT 1 FROM pg_attribute WHERE attrelid = to_regclass(%s) AND attname = 'atributo' AND NOT attisdropped
+    """, (tabela,))
+    return cur.fetchone() is not None
+
+# Converte as tabelas de atributos/variações no formato de uma linha por atributo (comuns
+# ou já particionadas por dia, e o staging stg_<tabela>) para documentos, em uma única transação
+def converter(conn, tabelas, arquivo_sql):
+    with open(arquivo_sql, encoding="utf-8") as f:
+        esquema = f.read()
+    try:
+        with conn.cursor() as cur:
+            antigas = []
+            for tabela in tabelas:
+                for destino in [tabela, f"stg_{tabela}"]:
+                    if not _formato_antigo(cur, destino):
+                        continue
+                    # As partições também são renomeadas para liberar os nomes <tabela>_AAAAMMDD
+                    for particao, dia in particoes.listar(cur, destino):
+                        cur.execute(f"ALTER TABLE {particao} RENAME TO {particoes.nome_particao(destino + '_eav', dia)}")
+                    cur.execute(f"ALTER TABLE {destino} RENAME TO {destino}_eav")
+                    antigas.append((tabela, destino))
+            if not antigas:
+                print("Nenhuma tabela a converter.")
+                return []
+
+            cur.execute(esquema)
+            for tabela, destino in antigas:
+                antiga = f"{destino}_eav"
+                if destino == tabela:
+                    cur.execute(f"SELECT DISTINCT data_registro::date FROM {antiga} WHERE data_registro IS NOT NULL")
+                    particoes.garantir(cur, tabela, [row[0] for row in cur.fetchall()])
+                cur.execute(f"SELECT count(*) FROM {antiga}")
+                linhas_antigas = cur.fetchone()[0]
+                cur.execute(AGREGACOES[tabela].format(destino=destino, antiga=antiga))
+                print(f"{destino}: {linhas_antigas} linhas convertidas em {cur.rowcount} documentos.")
+                cur.execute(f"DROP TABLE {antiga} CASCADE")
+                particoes.restaurar_nome_chave(cur, destino)
+            cur.execute(esquema)
+        conn.commit()
+        return [destino for _, destino in antigas]
+    except Exception:
+        conn.rollback()
+        raise
+
+# python -m app.services.documentos <plataforma>
+def main(argv=None):
+    argv = sys.argv[1:] if argv is None else argv
+    if len(argv) != 1 or argv[0] not in ("mercadolivre", "magalu"):
+        print("Uso: python -m app.services.documentos mercadolivre|magalu")
+        return 1
+    plataforma = argv[0]
+    modulo = importlib.import_module(f"app.services.{plataforma}")
+    conn = modulo.get_connection()
+    if not conn:
+        print("Erro ao conectar com o banco de dados.")
+        return 1
+    try:
+        converter(conn, modulo.TABELAS_DOCUMENTOS, os.path.join(particoes.DIR_SQL, f"{plataforma}.sql"))
+    finally:
+        conn.close()
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
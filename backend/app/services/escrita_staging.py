@@ -0,0 +1,132 @@
+import os
+import queue
+import threading
+import contextvars
+from app.services import tempos, particoes, perfis
+
+# ------------------------- GRAVAÇÃO EM SEGUNDO PLANO NO STAGING ----------------------------
+
+# As coletas gravam os registros em lotes nas tabelas de staging (stg_<tabela>) enquanto
+# continuam buscando os próximos itens: cada lote vai para uma fila e uma thread de
+# gravação o grava (sondagem das imagens incluída), então rede e banco se sobrepõem em
+# vez de se somarem. A fila é limitada: se o banco ficar para trás, o envio do próximo
+# lote espera (etapa "espera_gravacao") e a memória não cresce com o catálogo.
+#
+# Os lotes são gravados um por vez, na ordem de envio. Se a gravação de um lote falhar,
+# os seguintes são descartados e o erro é levantado na coleta (no próximo envio ou ao
+# final). Ao final, promover() troca os dados do vendedor no dia pelos do staging em uma
+# única transação.
+#
+# Variáveis de ambiente:
+#   ESCRITA_ASSINCRONA        "1" para gravar em uma thread separada (padrão "1"; "0" grava no envio)
+#   ESCRITA_LOTES_PENDENTES   lotes aguardando gravação antes de o envio esperar (padrão 2)
+
+ATIVA = os.getenv("ESCRITA_ASSINCRONA", "1") == "1"
+LOTES_PENDENTES = max(1, int(os.getenv("ESCRITA_LOTES_PENDENTES", 2)))
+
+_FIM = object()
+
+def tabela_staging(tabela):
+    return f"stg_{tabela}"
+
+# ------------------------- GRAVADOR ----------------------------
+
+# Grava os lotes enviados chamando gravar(*lote) em uma thread própria. A thread herda o
+# contexto de quem criou o gravador (tempos por etapa, arquivo bruto e perfil da execução),
+# e gravar marca as próprias etapas.
+class GravadorEmSegundoPlano:
+    def __init__(self, gravar, nome="gravacao_staging", pendentes=None, assincrono=None):
+        self._gravar = gravar
+        self.nome = nome
+        self.assincrono = ATIVA if assincrono is None else assincrono
+        self.lotes = 0
+        self._erro = None
+        self._thread = None
+        if self.assincrono:
+            self._fila = queue.Queue(maxsize=LOTES_PENDENTES if pendentes is None else pendentes)
+            self._thread = threading.Thread(
+                target=contextvars.copy_context().run, args=(self._executar,), name=nome, daemon=True
+            )
+            self._thread.start()
+
+    def _executar(self):
+        with perfis.thread():
+            self._consumir()
+
+    def _consumir(self):
+        while True:
+            lote = self._fila.get()
+            if lote is _FIM:
+                return
+            if self._erro is not None:
+                continue
+            try:
+                self._gravar(*lote)
+            except Exception as e:
+                print(f"Erro na gravação em segundo plano ({self.nome}): {e}")
+                self._erro = e
+
+    # Envia um lote para gravação; espera se a fila estiver cheia
+    def enviar(self, *lote):
+        if self._erro is not None:
+            raise self._erro
+        self.lotes += 1
+        if not self.assincrono:
+            self._gravar(*lote)
+            return
+        with tempos.etapa("espera_gravacao"):
+            self._fila.put(lote)
+
+    # Espera a gravação dos lotes pendentes e levanta o erro da gravação, se houver
+    def finalizar(self):
+        if self._thread is not None:
+            with tempos.etapa("espera_gravacao"):
+                self._fila.put(_FIM)
+                self._thread.join()
+            self._thread = None
+        if self._erro is not None:
+            raise self._erro
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, tipo, erro, rastro):
+        if tipo is None:
+            self.finalizar()
+        else:
+            # A coleta já falhou: só espera a thread terminar, sem trocar o erro original
+            try:
+                self.finalizar()
+            except Exception:
+                pass
+        return False
+
+# ------------------------- STAGING ----------------------------
+
+# Uma linha por chave (a última ocorrência, na ordem de chegada): um upsert não pode
+# alterar a mesma linha duas vezes no mesmo comando, e um SKU pode se repetir no lote
+# (janelas de offset paralelas, itens refeitos ao retomar um checkpoint)
+def unicas(linhas, posicoes_chave):
+    por_chave = {}
+    for linha in linhas:
+        por_chave[tuple(linha[p] for p in posicoes_chave)] = linha
+    return list(por_chave.values())
+
+# Remove as linhas do vendedor no staging
+def limpar(cur, vendedor, tabelas):
+    for tabela in tabelas:
+        cur.execute(f"DELETE FROM {tabela_staging(tabela)} WHERE vendedor = %s", (vendedor,))
+
+# Substitui os dados do vendedor no dia de data_registro (partição do dia) pelos do
+# staging e limpa o staging. As colunas são copiadas pelo nome (as comuns às duas tabelas),
+# não pela ordem, que muda quando uma delas ganha coluna por ALTER TABLE. Não faz commit:
+# o chamador confirma tudo em uma única transação.
+def promover(cur, vendedor, tabelas, data_registro):
+    for tabela in tabelas:
+        staging = tabela_staging(tabela)
+        destino = particoes.colunas_tabela(cur, tabela)
+        colunas = ", ".join(c for c in particoes.colunas_tabela(cur, staging) if c in destino)
+        cur.execute(f"UPDATE {staging} SET data_registro = %s WHERE vendedor = %s", (data_registro, vendedor))
+        particoes.limpar_dia(cur, tabela, vendedor, data_registro)
+        cur.execute(f"INSERT INTO {tabela} ({colunas}) SELECT {colunas} FROM {staging} WHERE vendedor = %s", (vendedor,))
+    limpar(cur, vendedor, tabelas)
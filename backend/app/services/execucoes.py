@@ -0,0 +1,237 @@
+import os
+import json
+import threading
+import zlib
+import psycopg2
+import pytz
+from contextlib import contextmanager
+from dotenv import load_dotenv
+from datetime import datetime
+from app.services import magalu, mercadolivre, amazon, tempos, perfis
+
+# ------------------------- VARIÁVEIS DE AMBIENTE ----------------------------
+
+load_dotenv()
+
+# ------------------------- CONFIGURAÇÃO BANCO DE DADOS ----------------------------
+
+# Conexão com o banco de controle (registro das execuções de coleta)
+def get_connection():
+    try:
+        conn = psycopg2.connect(
+            host=os.getenv("CONTROLE_DB_HOST"),
+            port=os.getenv("CONTROLE_DB_PORT"),
+            dbname=os.getenv("CONTROLE_DB_NAME"),
+            user=os.getenv("CONTROLE_DB_USER"),
+            password=os.getenv("CONTROLE_DB_PASSWORD"),
+            sslmode=os.getenv("CONTROLE_DB_SSLMODE", "require")
+        )
+        return conn
+    except Exception as e:
+        print("\nErro ao conectar com o banco de controle:", e)
+        return None
+
+# ------------------------- COLETORES ----------------------------
+
+COLETORES = {
+    "magalu": magalu.coletar_dados_magalu,
+    "mercadolivre": mercadolivre.coletar_dados_ml,
+    "amazon": amazon.coletar_dados_amazon
+}
+
+# Plataformas com coleta incremental (refresh barato, sem refazer o catálogo)
+PLATAFORMAS_INCREMENTAIS = {"magalu", "amazon"}
+
+class ColetaEmAndamento(Exception):
+    pass
+
+def agora():
+    fuso_brasilia = pytz.timezone("America/Sao_Paulo")
+    return datetime.now(fuso_brasilia).replace(tzinfo=None)
+
+# ------------------------- REGISTRO DAS EXECUÇÕES ----------------------------
+
+# Cria o registro da execução e retorna o id (ou None se o banco de controle estiver indisponível)
+def criar_execucao(plataforma, vendedor, perfil=False, incremental=False):
+    conn = get_connection()
+    if not conn:
+        return None
+    try:
+        with conn.cursor() as cur:
+            cur.execute("""
+                INSERT INTO execucoes (plataforma, vendedor, status, perfil_solicitado, incremental, inicio)
+                VALUES (%s, %s, 'em_andamento', %s, %s, %s)
+                RETURNING id
+            """, (plataforma, vendedor, perfil, incremental, agora()))
+            execucao_id = cur.fetchone()[0]
+        conn.commit()
+        return execucao_id
+    except Exception as e:
+        conn.rollback()
+        print(f"Erro ao registrar execução: {e}")
+        return None
+    finally:
+        conn.close()
+
+# Grava o resultado, o relatório de tempos e o perfil da execução
+def finalizar_execucao(execucao_id, status, mensagem, relatorio_tempos, perfil=None):
+    if execucao_id is None:
+        return
+    conn = get_connection()
+    if not conn:
+        return
+    try:
+        with conn.cursor() as cur:
+            cur.execute("""
+                UPDATE execucoes
+                SET status = %s, mensagem = %s, tempos = %s, perfil = %s, fim = %s
+                WHERE id = %s
+            """, (
+                status,
+                mensagem,
+                json.dumps(relatorio_tempos),
+                psycopg2.Binary(perfil) if perfil is not None else None,
+                agora(),
+                execucao_id
+            ))
+        conn.commit()
+    except Exception as e:
+        conn.rollback()
+        print(f"Erro ao finalizar execução {execucao_id}: {e}")
+    finally:
+        conn.close()
+
+# ------------------------- TRAVA POR VENDEDOR ----------------------------
+
+# Vendedores com coleta em andamento neste processo
+_em_andamento = set()
+_em_andamento_lock = threading.Lock()
+
+# Garante que o mesmo vendedor não seja coletado duas vezes ao mesmo tempo. Dentro do
+# processo usa um conjunto em memória; entre processos, um advisory lock no banco de
+# controle (mantido pela conexão aberta durante a coleta).
+@contextmanager
+def trava_vendedor(plataforma, vendedor):
+    chave = (plataforma, vendedor)
+    with _em_andamento_lock:
+        if chave in _em_andamento:
+            raise ColetaEmAndamento(f"Coleta de '{vendedor}' ({plataforma}) já está em andamento.")
+        _em_andamento.add(chave)
+
+    conn = get_connection()
+    try:
+        if conn:
+            conn.autocommit = True
+            with conn.cursor() as cur:
+                cur.execute("SELECT pg_try_advisory_lock(%s)", (zlib.crc32(f"{plataforma}:{vendedor}".encode()),))
+                if not cur.fetchone()[0]:
+                    raise ColetaEmAndamento(f"Coleta de '{vendedor}' ({plataforma}) já está em andamento em outra instância.")
+        yield
+    finally:
+        if conn:
+            conn.close()
+        with _em_andamento_lock:
+            _em_andamento.discard(chave)
+
+# ------------------------- EXECUÇÃO ----------------------------
+
+# Executa a coleta registrando tempos por etapa e, opcionalmente, o perfil (cProfile da
+# coleta, das suas threads de gravação e do event loop das requisições; perfis.py)
+def executar_coleta(plataforma, vendedor, perfil=False, incremental=False):
+    coletor = COLETORES.get(plataforma)
+    if coletor is None:
+        raise ValueError(f"Plataforma '{plataforma}' não suportada.")
+    if incremental and plataforma not in PLATAFORMAS_INCREMENTAIS:
+        raise ValueError(f"Plataforma '{plataforma}' não possui coleta incremental.")
+
+    with trava_vendedor(plataforma, vendedor):
+        execucao_id = criar_execucao(plataforma, vendedor, perfil, incremental)
+        relatorio = tempos.RelatorioTempos()
+        token = tempos.ativar(relatorio)
+        perfil_coleta = perfis.PerfilColeta() if perfil else None
+        status = "erro"
+        mensagem = None
+        try:
+            if perfil_coleta:
+                perfil_coleta.iniciar()
+            mensagem = coletor(vendedor, incremental=True) if incremental else coletor(vendedor)
+            status = "concluida"
+            return execucao_id, mensagem
+        except Exception as e:
+            mensagem = str(e)
+            raise
+        finally:
+            if perfil_coleta:
+                perfil_coleta.parar()
+            relatorio.finalizar()
+            tempos.desativar(token)
+            dados_perfil = perfil_coleta.serializar() if perfil_coleta else None
+            finalizar_execucao(execucao_id, status, mensagem, relatorio.como_dict(), dados_perfil)
+
+# ------------------------- CONSULTAS ----------------------------
+
+COLUNAS_RESUMO = ["id", "plataforma", "vendedor", "status", "mensagem", "perfil_solicitado", "incremental", "inicio", "fim", "tempos"]
+
+# Lista as execuções mais recentes (sem o conteúdo do perfil)
+def listar_execucoes(limite=50):
+    conn = get_connection()
+    if not conn:
+        return []
+    try:
+        with conn.cursor() as cur:
+            cur.execute(f"""
+                SELECT {", ".join(COLUNAS_RESUMO)} FROM execucoes
+                ORDER BY id DESC LIMIT %s
+            """, (limite,))
+            return [dict(zip(COLUNAS_RESUMO, row)) for row in cur.fetchall()]
+    finally:
+        conn.close()
+
+# Busca uma execução pelo id (sem o conteúdo do perfil)
+def buscar_execucao(execucao_id):
+    conn = get_connection()
+    if not conn:
+        return None
+    try:
+        with conn.cursor() as cur:
+            cur.execute(f"""
+                SELECT {", ".join(COLUNAS_RESUMO)} FROM execucoes WHERE id = %s
+            """, (execucao_id,))
+            row = cur.fetchone()
+            return dict(zip(COLUNAS_RESUMO, row)) if row else None
+    finally:
+        conn.close()
+
+# Duração (segundos) da última coleta completa concluída de cada (plataforma, vendedor)
+def duracoes_anteriores():
+    conn = get_connection()
+    if not conn:
+        return {}
+    try:
+        with conn.cursor() as cur:
+            cur.execute("""
+                SELECT DISTINCT ON (plataforma, vendedor)
+                    plataforma, vendedor, EXTRACT(EPOCH FROM fim - inicio)
+                FROM execucoes
+                WHERE status = 'concluida' AND NOT incremental AND fim IS NOT NULL
+                ORDER BY plataforma, vendedor, id DESC
+            """)
+            return {(p, v): float(d) for p, v, d in cur.fetchall()}
+    except Exception as e:
+        print(f"Erro ao consultar durações anteriores: {e}")
+        return {}
+    finally:
+        conn.close()
+
+# Retorna o perfil (bytes no formato pstats) de uma execução
+def buscar_perfil(execucao_id):
+    conn = get_connection()
+    if not conn:
+        return None
+    try:
+        with conn.cursor() as cur:
+            cur.execute("SELECT perfil FROM execucoes WHERE id = %s", (execucao_id,))
+            row = cur.fetchone()
+            return bytes(row[0]) if row and row[0] is not None else None
+    finally:
+        conn.close()
@@ -0,0 +1,244 @@
+import os
+import socket
+import threading
+from app.services import execucoes, lotes
+
+# ------------------------- FILA DURÁVEL DE COLETAS ----------------------------
+
+# Fila de coletas na tabela fila_coletas (banco de controle). Com FILA_ATIVA=1 a API
+# apenas enfileira (/coletar, lotes e agendamentos) e os workers (python -m app.worker)
+# executam. Cada job reivindicado recebe um lease renovado por heartbeat; jobs cujo
+# lease expirou (worker caiu ou foi reiniciado) voltam para a fila automaticamente.
+#
+# Variáveis de ambiente:
+#   FILA_ATIVA               "1" para a API enfileirar em vez de coletar no próprio processo
+#   FILA_LEASE_SEGUNDOS      duração do lease (padrão 120)
+#   FILA_HEARTBEAT_SEGUNDOS  intervalo do heartbeat (padrão 30)
+#   FILA_MAX_TENTATIVAS      tentativas antes de marcar o job como erro (padrão 3)
+#   FILA_ESPERA_API_SEGUNDOS espera máxima do /coletar pelo fim do job; depois a API responde
+#                            com o job_id e a situação atual, acompanhada em /admin/fila (padrão 300)
+
+ATIVA = os.getenv("FILA_ATIVA", "0") == "1"
+LEASE_SEGUNDOS = int(os.getenv("FILA_LEASE_SEGUNDOS", 120))
+HEARTBEAT_SEGUNDOS = int(os.getenv("FILA_HEARTBEAT_SEGUNDOS", 30))
+MAX_TENTATIVAS = int(os.getenv("FILA_MAX_TENTATIVAS", 3))
+ESPERA_API_SEGUNDOS = float(os.getenv("FILA_ESPERA_API_SEGUNDOS", 300))
+
+# Chave do advisory lock que serializa as reivindicações (respeito aos limites por plataforma)
+CHAVE_REIVINDICACAO = 830031
+
+COLUNAS = [
+    "id", "lote", "plataforma", "vendedor", "incremental", "perfil", "status", "tentativas",
+    "worker", "execucao_id", "mensagem", "criado_em", "iniciado_em", "heartbeat", "lease_ate", "finalizado_em"
+]
+
+def identificador_processo():
+    return f"{socket.gethostname()}:{os.getpid()}"
+
+def identificador_worker():
+    return f"{identificador_processo()}:{threading.get_ident()}"
+
+def _executar(sql, parametros=(), retorno=None):
+    conn = execucoes.get_connection()
+    if not conn:
+        raise RuntimeError("Banco de controle indisponível.")
+    try:
+        with conn.cursor() as cur:
+            cur.execute(sql, parametros)
+            if retorno == "um":
+                resultado = cur.fetchone()
+            elif retorno == "todos":
+                resultado = cur.fetchall()
+            else:
+                resultado = cur.rowcount
+        conn.commit()
+        return resultado
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        conn.close()
+
+# ------------------------- ENFILEIRAR / CONSULTAR ----------------------------
+
+def enfileirar(plataforma, vendedor, incremental=False, perfil=False, lote=None):
+    return _executar("""
+        INSERT INTO fila_coletas (lote, plataforma, vendedor, incremental, perfil, status, criado_em, disponivel_em)
+        VALUES (%s, %s, %s, %s, %s, 'pendente', now(), now())
+        RETURNING id
+    """, (lote, plataforma, vendedor, incremental, perfil), retorno="um")[0]
+
+def buscar_job(job_id):
+    row = _executar(f"SELECT {', '.join(COLUNAS)} FROM fila_coletas WHERE id = %s", (job_id,), retorno="um")
+    return dict(zip(COLUNAS, row)) if row else None
+
+def listar_jobs(status=None, limite=100):
+    if status:
+        rows = _executar(
+            f"SELECT {', '.join(COLUNAS)} FROM fila_coletas WHERE status = %s ORDER BY id DESC LIMIT %s",
+            (status, limite), retorno="todos"
+        )
+    else:
+        rows = _executar(
+            f"SELECT {', '.join(COLUNAS)} FROM fila_coletas ORDER BY id DESC LIMIT %s",
+            (limite,), retorno="todos"
+        )
+    return [dict(zip(COLUNAS, row)) for row in rows]
+
+# Situação de um lote enfileirado, no mesmo formato de lotes.buscar_lote
+def buscar_lote(lote_id):
+    rows = _executar(
+        f"SELECT {', '.join(COLUNAS)} FROM fila_coletas WHERE lote = %s ORDER BY id",
+        (lote_id,), retorno="todos"
+    )
+    if not rows:
+        return None
+    itens = [dict(zip(COLUNAS, row)) for row in rows]
+    resumo = {}
+    for item in itens:
+        resumo[item["status"]] = resumo.get(item["status"], 0) + 1
+    return {"id": lote_id, "resumo": resumo, "itens": itens}
+
+# ------------------------- REIVINDICAÇÃO ----------------------------
+
+# Reivindica o próximo job, respeitando os mesmos limites do escalonador de lotes
+# (LOTE_MAX_GLOBAL e LOTE_MAX_{PLATAFORMA}) somados entre todos os workers.
+# Plataformas no limite de coletas simultâneas são puladas e,
+# entre as demais, a com menos jobs em andamento tem prioridade (rodízio entre plataformas).
+# Vendedores que já têm job em andamento também são pulados.
+def reivindicar(worker):
+    conn = execucoes.get_connection()
+    if not conn:
+        return None
+    try:
+        with conn.cursor() as cur:
+            cur.execute("SELECT pg_advisory_xact_lock(%s)", (CHAVE_REIVINDICACAO,))
+            cur.execute("""
+                SELECT plataforma, count(*) FROM fila_coletas
+                WHERE status = 'em_andamento' GROUP BY plataforma
+            """)
+            em_andamento = dict(cur.fetchall())
+            if sum(em_andamento.values()) >= lotes.LIMITE_GLOBAL:
+                conn.commit()
+                return None
+            elegiveis = sorted(
+                (p for p in execucoes.COLETORES if em_andamento.get(p, 0) < lotes.limite_plataforma(p)),
+                key=lambda p: em_andamento.get(p, 0)
+            )
+            if not elegiveis:
+                conn.commit()
+                return None
+            cur.execute("""
+                SELECT id FROM fila_coletas f
+                WHERE status = 'pendente'
+                  AND disponivel_em <= now()
+                  AND plataforma = ANY(%s)
+                  AND NOT EXISTS (
+                      SELECT 1 FROM fila_coletas a
+                      WHERE a.status = 'em_andamento' AND a.plataforma = f.plataforma AND a.vendedor = f.vendedor
+                  )
+                ORDER BY array_position(%s::text[], plataforma), id
+                LIMIT 1
+                FOR UPDATE SKIP LOCKED
+            """, (elegiveis, elegiveis))
+            row = cur.fetchone()
+            if row is None:
+                conn.commit()
+                return None
+            cur.execute(f"""
+                UPDATE fila_coletas
+                SET status = 'em_andamento', worker = %s, tentativas = tentativas + 1,
+                    iniciado_em = now(), heartbeat = now(), lease_ate = now() + make_interval(secs => %s)
+                WHERE id = %s
+                RETURNING {', '.join(COLUNAS)}
+            """, (worker, LEASE_SEGUNDOS, row[0]))
+            job = dict(zip(COLUNAS, cur.fetchone()))
+        conn.commit()
+        return job
+    except Exception as e:
+        conn.rollback()
+        print(f"Erro ao reivindicar job: {e}")
+        return None
+    finally:
+        conn.close()
+
+# Renova o lease; retorna False se o job não pertence mais a este worker
+def heartbeat(job_id, worker):
+    return _executar("""
+        UPDATE fila_coletas
+        SET heartbeat = now(), lease_ate = now() + make_interval(secs => %s)
+        WHERE id = %s AND worker = %s AND status = 'em_andamento'
+    """, (LEASE_SEGUNDOS, job_id, worker)) > 0
+
+def concluir(job_id, worker, execucao_id, mensagem):
+    _executar("""
+        UPDATE fila_coletas
+        SET status = 'concluida', execucao_id = %s, mensagem = %s, finalizado_em = now(), lease_ate = NULL
+        WHERE id = %s AND worker = %s
+    """, (execucao_id, mensagem, job_id, worker))
+
+# Falha: volta para a fila com espera crescente até esgotar as tentativas
+def falhar(job_id, worker, mensagem, contar_tentativa=True):
+    _executar("""
+        UPDATE fila_coletas
+        SET status = CASE WHEN %s AND tentativas >= %s THEN 'erro' ELSE 'pendente' END,
+            tentativas = CASE WHEN %s THEN tentativas ELSE tentativas - 1 END,
+            mensagem = %s,
+            worker = NULL,
+            lease_ate = NULL,
+            disponivel_em = now() + make_interval(secs => 60 * tentativas),
+            finalizado_em = CASE WHEN %s AND tentativas >= %s THEN now() ELSE NULL END
+        WHERE id = %s AND worker = %s
+    """, (
+        contar_tentativa, MAX_TENTATIVAS, contar_tentativa, mensagem,
+        contar_tentativa, MAX_TENTATIVAS, job_id, worker
+    ))
+
+# Devolve à fila os jobs em andamento do processo (desligamento), sem contar a tentativa
+def devolver_processo(processo):
+    return _executar("""
+        UPDATE fila_coletas
+        SET status = 'pendente', tentativas = tentativas - 1, worker = NULL, lease_ate = NULL
+        WHERE worker LIKE %s AND status = 'em_andamento'
+    """, (processo + ":%",))
+
+# Jobs com lease expirado (worker morto) voltam para a fila ou viram erro se esgotaram as tentativas
+def reenfileirar_expirados():
+    return _executar("""
+        UPDATE fila_coletas
+        SET status = CASE WHEN tentativas >= %s THEN 'erro' ELSE 'pendente' END,
+            mensagem = 'Lease expirado (worker ' || coalesce(worker, '?') || ')',
+            finalizado_em = CASE WHEN tentativas >= %s THEN now() ELSE NULL END,
+            worker = NULL,
+            lease_ate = NULL
+        WHERE status = 'em_andamento' AND lease_ate < now()
+    """, (MAX_TENTATIVAS, MAX_TENTATIVAS))
+
+# ------------------------- EXECUÇÃO DE UM JOB ----------------------------
+
+# Executa o job mantendo o heartbeat em uma thread paralela
+def processar(job, worker):
+    parar_heartbeat = threading.Event()
+
+    def manter_lease():
+        while not parar_heartbeat.wait(HEARTBEAT_SEGUNDOS):
+            try:
+                if not heartbeat(job["id"], worker):
+                    print(f"Job {job['id']} não pertence mais a {worker}.")
+                    return
+            except Exception as e:
+                print(f"Erro no heartbeat do job {job['id']}: {e}")
+
+    thread = threading.Thread(target=manter_lease, daemon=True)
+    thread.start()
+    try:
+        execucao_id, mensagem = execucoes.executar_coleta(
+            job["plataforma"], job["vendedor"], perfil=job["perfil"], incremental=job["incremental"]
+        )
+        concluir(job["id"], worker, execucao_id, mensagem)
+    except execucoes.ColetaEmAndamento as e:
+        falhar(job["id"], worker, str(e), contar_tentativa=False)
+    except Exception as e:
+        falhar(job["id"], worker, str(e))
+    finally:
+        parar_heartbeat.set()
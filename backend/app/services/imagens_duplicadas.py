@@ -0,0 +1,225 @@
+import io
+import os
+import time
+import asyncio
+import httpx
+from itertools import combinations
+from datetime import datetime
+from psycopg2.extras import execute_values
+from app.services import metricas, recursos, cliente_async
+
+try:
+    from PIL import Image
+    PIL_DISPONIVEL = True
+except ImportError:
+    PIL_DISPONIVEL = False
+
+# ------------------------- IMAGENS DUPLICADAS ENTRE ANÚNCIOS ----------------------------
+
+# Etapa opcional da verificação de qualidade: encontra imagens iguais ou quase iguais
+# usadas em anúncios diferentes do mesmo vendedor. Cada imagem recebe um hash
+# perceptual de 64 bits (dHash), gravado por URL na coluna hash_perceptual de
+# imagens_sondadas, então só imagens novas (ou com ETag alterada) são baixadas.
+#
+# A busca de pares não compara todas as imagens entre si: o hash é dividido em blocos
+# indexados separadamente e, pela casa dos pombos, dois hashes próximos são próximos
+# também em algum bloco; só esses candidatos são comparados (multi-index hashing).
+#
+# Variáveis de ambiente:
+#   IMAGENS_DUPLICADAS            "1" para ativar a etapa (padrão "0"; requer o pacote Pillow)
+#   IMAGENS_DISTANCIA_DUPLICADA   bits de diferença aceitos entre imagens duplicadas (padrão 4)
+#   IMAGENS_PARALELAS             downloads simultâneos (compartilhado com a sondagem)
+
+ATIVA = os.getenv("IMAGENS_DUPLICADAS", "0") == "1" and PIL_DISPONIVEL
+DISTANCIA = max(0, int(os.getenv("IMAGENS_DISTANCIA_DUPLICADA", 4)))
+PARALELAS = max(1, int(os.getenv("IMAGENS_PARALELAS", 16)))
+
+# ------------------------- HASH PERCEPTUAL ----------------------------
+
+# dHash: reduz a imagem para 9x8 em tons de cinza e marca, em cada linha, se o pixel
+# é mais claro que o vizinho da direita. Retorna (hash, (largura, altura)).
+def calcular_hash(dados):
+    imagem = Image.open(io.BytesIO(dados))
+    tamanho = imagem.size
+    imagem.draft("L", (64, 64))
+    pixels = list(imagem.convert("L").resize((9, 8), Image.BILINEAR).getdata())
+    valor = 0
+    for linha in range(8):
+        for coluna in range(8):
+            valor = (valor << 1) | (pixels[linha * 9 + coluna] > pixels[linha * 9 + coluna + 1])
+    return valor, tamanho
+
+def distancia(a, b):
+    return bin(a ^ b).count("1")
+
+# O Postgres não tem inteiro de 64 bits sem sinal
+def para_bigint(valor):
+    return valor - (1 << 64) if valor >= (1 << 63) else valor
+
+def de_bigint(valor):
+    return valor + (1 << 64) if valor < 0 else valor
+
+async def baixar_e_calcular_async(url):
+    inicio = time.perf_counter()
+    origem = httpx.URL(url)
+    status = "erro"
+    try:
+        await recursos.limite("imagens").aguardar_async()
+        response = await cliente_async.cliente("imagens").get(url, follow_redirects=True)
+        status = response.status_code
+        if response.status_code != 200:
+            return None
+        valor, (largura, altura) = await asyncio.to_thread(calcular_hash, response.content)
+        return {"url": url, "etag": response.headers.get("etag"), "hash": valor, "largura": largura, "altura": altura}
+    except httpx.HTTPError as e:
+        print(f"Erro ao baixar imagem {url}: {e}")
+        return None
+    except Exception as e:
+        print(f"Imagem {url} não pôde ser decodificada: {e}")
+        return None
+    finally:
+        metricas.observar_requisicao("imagens", f"{origem.scheme}://{origem.host}/", status, time.perf_counter() - inicio)
+
+async def calcular_varios_async(urls):
+    semaforo = asyncio.Semaphore(PARALELAS)
+
+    async def calcular(url):
+        async with semaforo:
+            return await baixar_e_calcular_async(url)
+
+    return await asyncio.gather(*(calcular(url) for url in urls))
+
+# ------------------------- CACHE ----------------------------
+
+def carregar_hashes(conn, urls):
+    with conn.cursor() as cur:
+        cur.execute("""
+            SELECT url, hash_perceptual FROM imagens_sondadas
+            WHERE url = ANY(%s) AND hash_perceptual IS NOT NULL
+        """, (urls,))
+        return {url: de_bigint(valor) for url, valor in cur.fetchall()}
+
+# A imagem foi baixada inteira, então as dimensões também são gravadas
+def salvar_hashes(conn, calculados):
+    if not calculados:
+        return
+    agora = datetime.now()
+    with conn.cursor() as cur:
+        execute_values(cur, """
+            INSERT INTO imagens_sondadas (url, etag, largura, altura, hash_perceptual, verificado_em)
+            VALUES %s
+            ON CONFLICT (url) DO UPDATE SET
+                etag = EXCLUDED.etag,
+                largura = EXCLUDED.largura,
+                altura = EXCLUDED.altura,
+                hash_perceptual = EXCLUDED.hash_perceptual,
+                verificado_em = EXCLUDED.verificado_em
+        """, [
+            (c["url"], c["etag"], c["largura"], c["altura"], para_bigint(c["hash"]), agora)
+            for c in calculados
+        ])
+    conn.commit()
+
+# Hash de cada URL: do cache, calculando os que faltam (com somente_cache, só os do cache)
+def obter_hashes(urls, get_connection, somente_cache=False):
+    urls = sorted({u for u in urls if u})
+    conn = get_connection()
+    try:
+        hashes = carregar_hashes(conn, urls) if conn else {}
+        faltantes = [] if somente_cache else [u for u in urls if u not in hashes]
+        if faltantes:
+            calculados = [c for c in cliente_async.executar_sync(calcular_varios_async(faltantes)) if c]
+            if conn:
+                try:
+                    salvar_hashes(conn, calculados)
+                except Exception as e:
+                    conn.rollback()
+                    print(f"Erro ao salvar hashes de imagens: {e}")
+            hashes.update({c["url"]: c["hash"] for c in calculados})
+        print(f"Hashes de imagens: {len(urls) - len(faltantes)} do cache, {len(faltantes)} calculados.")
+        return hashes
+    finally:
+        if conn:
+            conn.close()
+
+# ------------------------- BUSCA DE DUPLICADAS ----------------------------
+
+# Divide os 64 bits em 'partes' blocos contíguos: [(deslocamento, tamanho)]
+def _blocos(partes):
+    blocos = []
+    inicio = 0
+    for i in range(partes):
+        tamanho = (64 - inicio) // (partes - i)
+        blocos.append((inicio, tamanho))
+        inicio += tamanho
+    return blocos
+
+# Máscaras XOR que levam um bloco aos valores a até 'raio' bits de distância
+def _mascaras_vizinhos(tamanho, raio):
+    mascaras = [0]
+    for quantidade in range(1, raio + 1):
+        for bits in combinations(range(tamanho), quantidade):
+            mascaras.append(sum(1 << bit for bit in bits))
+    return mascaras
+
+# Agrupa os hashes a até 'limite' bits de distância (união transitiva).
+# Retorna {hash: representante do grupo}.
+#
+# Com 'partes' blocos e raio limite // partes por bloco, dois hashes a até 'limite'
+# bits de diferença ficam a até 'raio' bits em algum bloco. Os blocos têm cerca de
+# log2(n) bits, então cada bucket guarda poucos hashes e os candidatos comparados
+# crescem linearmente com o catálogo.
+def agrupar_hashes(hashes, limite=None):
+    limite = DISTANCIA if limite is None else limite
+    unicos = sorted(set(hashes))
+    pai = {h: h for h in unicos}
+
+    def raiz(h):
+        while pai[h] != h:
+            pai[h] = pai[pai[h]]
+            h = pai[h]
+        return h
+
+    if 0 < limite < 64 and len(unicos) > 1:
+        bits_por_bloco = max(8, len(unicos).bit_length())
+        partes = max(1, min(limite + 1, 64 // bits_por_bloco))
+        raio = limite // partes
+        for deslocamento, tamanho in _blocos(partes):
+            mascara = (1 << tamanho) - 1
+            vizinhos = _mascaras_vizinhos(tamanho, raio)
+            indice = {}
+            for h in unicos:
+                indice.setdefault((h >> deslocamento) & mascara, []).append(h)
+            for h in unicos:
+                bloco = (h >> deslocamento) & mascara
+                for chave in [bloco ^ m for m in vizinhos]:
+                    for candidato in indice.get(chave, ()):
+                        if candidato > h and distancia(h, candidato) <= limite:
+                            a, b = raiz(h), raiz(candidato)
+                            if a != b:
+                                pai[b] = a
+    return {h: raiz(h) for h in unicos}
+
+# Para cada anúncio, quantas das suas imagens se repetem (iguais ou quase iguais) em
+# outros anúncios do vendedor. 'imagens' é uma lista de (sku_id, url).
+def contar_duplicadas(imagens, get_connection, somente_cache=False):
+    hashes = obter_hashes([url for _, url in imagens], get_connection, somente_cache)
+    grupos = agrupar_hashes(hashes.values())
+
+    skus_por_grupo = {}
+    for sku_id, url in imagens:
+        if url in hashes:
+            skus_por_grupo.setdefault(grupos[hashes[url]], set()).add(sku_id)
+
+    duplicadas = {}
+    for sku_id, url in imagens:
+        if url in hashes and len(skus_por_grupo[grupos[hashes[url]]]) > 1:
+            duplicadas[sku_id] = duplicadas.get(sku_id, 0) + 1
+    return duplicadas
+
+# Mensagem da coluna imagens_duplicadas do relatório de qualidade
+def mensagem(duplicadas, sku_id):
+    if duplicadas is None:
+        return None
+    quantidade = duplicadas.get(sku_id, 0)
+    return "OK" if quantidade == 0 else f"{quantidade} imagens repetidas em outros anúncios"
@@ -0,0 +1,143 @@
+import os
+import uuid
+import threading
+from collections import deque
+from app.services import execucoes, fila
+from app.services.utils import load_tokens_from_env
+
+# ------------------------- COLETA EM LOTE ----------------------------
+
+# Coleta de vários vendedores (de uma ou mais plataformas) em um único pedido.
+# As tarefas passam por um escalonador justo: há um limite global de coletas
+# simultâneas e um limite por plataforma, e as plataformas são atendidas em
+# rodízio, de modo que um vendedor (ou plataforma) grande ocupa no máximo uma
+# vaga e não impede o andamento dos demais.
+#
+# Variáveis de ambiente:
+#   LOTE_MAX_GLOBAL           coletas simultâneas no total (padrão 4)
+#   LOTE_MAX_{PLATAFORMA}     coletas simultâneas por plataforma (padrão 2)
+
+LIMITE_GLOBAL = int(os.getenv("LOTE_MAX_GLOBAL", 4))
+
+def limite_plataforma(plataforma):
+    return int(os.getenv(f"LOTE_MAX_{plataforma.upper()}", 2))
+
+# ------------------------- ESCALONADOR ----------------------------
+
+class EscalonadorJusto:
+    def __init__(self, limite_global, limite_plataforma):
+        self.limite_global = limite_global
+        self.limite_plataforma = limite_plataforma
+        self.filas = {}
+        self.ativos = {}
+        self.rodada = 0
+        self.cond = threading.Condition()
+        self.workers = []
+
+    # Enfileira uma tarefa (plataforma, funcao) e garante que os workers estão rodando
+    def adicionar(self, plataforma, funcao):
+        with self.cond:
+            self.filas.setdefault(plataforma, deque()).append(funcao)
+            self.ativos.setdefault(plataforma, 0)
+            while len(self.workers) < self.limite_global:
+                worker = threading.Thread(target=self._executar, daemon=True)
+                self.workers.append(worker)
+                worker.start()
+            self.cond.notify_all()
+
+    # Próxima tarefa em rodízio entre as plataformas com fila e vaga disponível
+    def _proxima(self):
+        plataformas = list(self.filas)
+        for i in range(len(plataformas)):
+            plataforma = plataformas[(self.rodada + i) % len(plataformas)]
+            if self.filas[plataforma] and self.ativos[plataforma] < self.limite_plataforma(plataforma):
+                self.rodada = (self.rodada + i + 1) % len(plataformas)
+                self.ativos[plataforma] += 1
+                return plataforma, self.filas[plataforma].popleft()
+        return None, None
+
+    def _executar(self):
+        while True:
+            with self.cond:
+                plataforma, funcao = self._proxima()
+                while funcao is None:
+                    self.cond.wait()
+                    plataforma, funcao = self._proxima()
+            try:
+                funcao()
+            except Exception as e:
+                print(f"Erro na tarefa do lote ({plataforma}): {e}")
+            finally:
+                with self.cond:
+                    self.ativos[plataforma] -= 1
+                    self.cond.notify_all()
+
+escalonador = EscalonadorJusto(LIMITE_GLOBAL, limite_plataforma)
+
+# ------------------------- LOTES ----------------------------
+
+_lotes = {}
+_lotes_lock = threading.Lock()
+
+# Lista os vendedores configurados (tokens no ambiente) de cada plataforma
+def todos_os_vendedores(plataformas=None):
+    itens = []
+    for plataforma in plataformas or execucoes.COLETORES:
+        for vendedor in load_tokens_from_env(plataforma):
+            itens.append({"plataforma": plataforma, "vendedor": vendedor})
+    return itens
+
+# Ordena os itens de cada plataforma pela duração da última coleta (mais longas primeiro),
+# para que os vendedores grandes comecem cedo e não fiquem para o fim da janela
+def ordenar_por_duracao(itens):
+    duracoes = execucoes.duracoes_anteriores()
+    return sorted(itens, key=lambda i: -duracoes.get((i["plataforma"], i["vendedor"]), 0))
+
+def _executar_item(item, perfil, incremental):
+    with _lotes_lock:
+        item["status"] = "em_andamento"
+    try:
+        execucao_id, mensagem = execucoes.executar_coleta(
+            item["plataforma"], item["vendedor"], perfil=perfil, incremental=incremental
+        )
+        resultado = {"status": "concluida", "execucao_id": execucao_id, "mensagem": mensagem}
+    except Exception as e:
+        resultado = {"status": "erro", "mensagem": str(e)}
+    with _lotes_lock:
+        item.update(resultado)
+
+# Cria o lote e agenda as coletas (ou as enfileira, com FILA_ATIVA); retorna o id do lote
+def criar_lote(itens, perfil=False, incremental=False):
+    vistos = set()
+    unicos = []
+    for item in itens:
+        chave = (item["plataforma"], item["vendedor"])
+        if item["plataforma"] not in execucoes.COLETORES:
+            raise ValueError(f"Plataforma '{item['plataforma']}' não suportada.")
+        if chave not in vistos:
+            vistos.add(chave)
+            unicos.append({"plataforma": chave[0], "vendedor": chave[1], "status": "pendente"})
+
+    lote_id = uuid.uuid4().hex
+    if fila.ATIVA:
+        for item in ordenar_por_duracao(unicos):
+            fila.enfileirar(item["plataforma"], item["vendedor"], incremental, perfil, lote=lote_id)
+        return lote_id
+
+    with _lotes_lock:
+        _lotes[lote_id] = {"id": lote_id, "itens": unicos}
+    for item in ordenar_por_duracao(unicos):
+        escalonador.adicionar(item["plataforma"], lambda item=item: _executar_item(item, perfil, incremental))
+    return lote_id
+
+# Situação do lote: itens e contagem por status
+def buscar_lote(lote_id):
+    with _lotes_lock:
+        lote = _lotes.get(lote_id)
+        if lote is None:
+            return fila.buscar_lote(lote_id) if fila.ATIVA else None
+        itens = [dict(item) for item in lote["itens"]]
+    resumo = {}
+    for item in itens:
+        resumo[item["status"]] = resumo.get(item["status"], 0) + 1
+    return {"id": lote_id, "resumo": resumo, "itens": itens}
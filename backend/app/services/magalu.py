@@ -1,14 +1,14 @@
-import requests
 import json
+import time
+import asyncio
+import httpx
 import pandas as pd
 import os
 from dotenv import load_dotenv
-import psycopg2
 from psycopg2.extras import execute_values
-import io
 from datetime import datetime
 import pytz
-import zipfile
+from app.services import metricas, tempos, recursos, cliente_async, sonda_imagens, imagens_duplicadas, relatorios, particoes, documentos, arquivo_bruto, escrita_staging, colunar, mapeamento, qualidade
 
 # ------------------------- VARIÁVEIS DE AMBIENTE ----------------------------
 
@@ -18,24 +18,64 @@ url_base_api = os.getenv('MAGALU_URL_BASE_API')
 client_id = os.getenv('MAGALU_CLIENT_ID')
 client_secret = os.getenv('MAGALU_CLIENT_SECRET')
 
+# Requisições de páginas (SKUs e pedidos) em voo ao mesmo tempo durante a listagem
+PAGINAS_PARALELAS = max(1, int(os.getenv('MAGALU_PAGINAS_PARALELAS', 4)))
+
+# Tentativas de uma página da listagem que recebeu 429, 5xx ou falha de rede, e a espera
+# (em segundos) antes da segunda tentativa, dobrada a cada nova tentativa
+TENTATIVAS_PAGINA = max(1, int(os.getenv('MAGALU_PAGINAS_TENTATIVAS', 4)))
+ESPERA_PAGINA = float(os.getenv('MAGALU_PAGINAS_ESPERA', 1))
+
 # ------------------------- CONFIGURAÇÃO BANCO DE DADOS ----------------------------
 
 # Conexão com o banco de dados PostgreSQL
 def get_connection():
     try:
-        conn = psycopg2.connect(
+        conn = recursos.conectar(
+            "magalu",
             host=os.getenv("MAGALU_DB_HOST"),
             port=os.getenv("MAGALU_DB_PORT"),
             dbname=os.getenv("MAGALU_DB_NAME"),
             user=os.getenv("MAGALU_DB_USER"),
             password=os.getenv("MAGALU_DB_PASSWORD"),
-            sslmode="require"
+            sslmode=os.getenv("MAGALU_DB_SSLMODE", "require")
         )
         return conn
     except Exception as e:
         print("\nErro ao conectar com o banco de dados no Supabase:", e)
         return None
 
+# Tabelas preenchidas pelos SKUs da coleta (gravadas primeiro no staging stg_<tabela>)
+TABELAS_COLETA = ["produtos", "imagens", "atributos"]
+
+# Tabelas particionadas por dia de data_registro (particoes.py)
+TABELAS_PARTICIONADAS = ["produtos", "imagens", "atributos", "pedidos", "erros_qualidade"]
+
+# Tabelas com um documento JSONB por SKU (documentos.py)
+TABELAS_DOCUMENTOS = ["atributos"]
+
+# Colunas dos lotes colunares (colunar.py) em que a coleta acumula os registros: os SKUs
+# do catálogo inteiro ficam em memória até a verificação de qualidade
+ESQUEMA_PRODUTOS = [
+    ("sku_id", "texto"), ("titulo", "objeto"), ("descricao", "objeto"), ("marca", "texto"),
+    ("status", "texto"), ("data_criacao", "texto"), ("data_atualizacao", "texto"),
+    ("preco", "real"), ("estoque_disponivel", "inteiro")
+]
+ESQUEMA_ATRIBUTOS = [("sku_id", "texto"), ("atributo", "texto"), ("valor", "texto")]
+ESQUEMA_IMAGENS = [("id_imagem", "objeto"), ("sku_id", "texto"), ("secure_url", "objeto"), ("resolucao", "texto")]
+ESQUEMA_PEDIDOS = [
+    ("id", "objeto"), ("status", "texto"), ("data_criacao", "texto"), ("valor", "real"),
+    ("pagamento_status", "texto"), ("metodo_pagamento", "texto"), ("moeda", "texto")
+]
+
+# Lotes vazios de produtos, atributos e imagens
+def lotes_skus():
+    return (
+        colunar.Lote(ESQUEMA_PRODUTOS),
+        colunar.Lote(ESQUEMA_ATRIBUTOS),
+        colunar.Lote(ESQUEMA_IMAGENS)
+    )
+
 # ------------------------- TOKENS ----------------------------
 
 # Carrega os tokens do ambiente
@@ -52,7 +92,7 @@ def load_tokens():
     return {}
 
 # Renova o access_token usando o refresh_token
-def refresh_access_token(client_id, client_secret, refresh_token):
+async def refresh_access_token_async(client_id, client_secret, refresh_token):
     url = f"{url_base_auth}/oauth/token"
     payload = {
         'grant_type': 'refresh_token',
@@ -60,23 +100,32 @@ def refresh_access_token(client_id, client_secret, refresh_token):
         'client_secret': client_secret,
         'refresh_token': refresh_token
     }
-    response = requests.post(url, data=payload)
+    response = await cliente_async.requisitar("magalu", "POST", url, data=payload)
     if response.status_code == 200:
         data = response.json()
         new_access_token = data['access_token']
         new_refresh_token = data.get('refresh_token', refresh_token)
+        metricas.renovacoes_token.inc(plataforma="magalu", resultado="sucesso")
         print("Token renovado com sucesso!")
         return new_access_token, new_refresh_token
     else:
+        metricas.renovacoes_token.inc(plataforma="magalu", resultado="falha")
         print(f"\nErro ao renovar token: Status {response.status_code}")
         raise Exception()
 
+def refresh_access_token(client_id, client_secret, refresh_token):
+    return cliente_async.executar_sync(refresh_access_token_async(client_id, client_secret, refresh_token))
+
 # ------------------------- CHAMADAS API ----------------------------
 
-# Fazer requisições à API da Magalu
-def make_request(url, headers, params=None, refresh_token_func=None):
+# Fazer requisições à API da Magalu. refresh_token_func pode ser síncrona ou assíncrona
+# e deve retornar os headers atualizados. Retorna a resposta (também quando o status é de
+# erro, para o chamador decidir) ou None se a requisição não chegou a ser respondida.
+async def make_request_async(url, headers, params=None, refresh_token_func=None):
+    inicio = time.perf_counter()
     try:
-        response = requests.get(url, headers=headers, params=params, timeout=30)
+        response = await cliente_async.requisitar("magalu", "GET", url, headers=headers, params=params, timeout=30)
+        metricas.observar_requisicao("magalu", url, response.status_code, time.perf_counter() - inicio)
 
         if response.status_code == 200:
             return response
@@ -85,48 +134,92 @@ def make_request(url, headers, params=None, refresh_token_func=None):
 
         if response.status_code == 401 and refresh_token_func:
             print("Token expirado. Tentando renovar...")
-            headers = refresh_token_func()
-            response = requests.get(url, headers=headers, params=params, timeout=30)
+            headers = await cliente_async.chamar(refresh_token_func)
+            inicio = time.perf_counter()
+            response = await cliente_async.requisitar("magalu", "GET", url, headers=headers, params=params, timeout=30)
+            metricas.observar_requisicao("magalu", url, response.status_code, time.perf_counter() - inicio)
 
             if response.status_code == 200:
                 return response
             else:
                 print(f"Após renovação, ainda falhou — {response.status_code}")
 
-        return None
+        return response
 
-    except requests.exceptions.RequestException as e:
+    except httpx.HTTPError as e:
+        metricas.observar_requisicao("magalu", url, "erro", time.perf_counter() - inicio)
         print("Erro na requisição:", e)
         return None
 
-# Listar todos os SKUs de um vendedor
-def listar_todos_skus(headers, refresh_token_func=None, limit=100):
-    todos_skus = []
-    offset = 0
-
-    while True:
-        params = {'_limit': limit, '_offset': offset}
-        url = f"{url_base_api}/seller/v1/portfolios/skus"
-        response = make_request(url, headers, params=params, refresh_token_func=refresh_token_func)
+def make_request(url, headers, params=None, refresh_token_func=None):
+    return cliente_async.executar_sync(make_request_async(url, headers, params, refresh_token_func))
 
-        if response is None or response.status_code != 200:
-            print(f"Erro ao listar SKUs: Status {response.status_code}" if response else "Sem resposta")
-            print(f"Resposta: Status {response.status_code}" if response else "None")
+# Espera antes de tentar a página de novo: o Retry-After da resposta, se houver
+def _espera_pagina(response, tentativa):
+    try:
+        return float(response.headers["Retry-After"])
+    except (AttributeError, KeyError, TypeError, ValueError):
+        return ESPERA_PAGINA * 2 ** tentativa
+
+# Busca uma página da listagem. 429, 5xx e falhas de rede são tentados de novo (até
+# MAGALU_PAGINAS_TENTATIVAS vezes); se a página não vier, levanta um erro: uma página
+# perdida não pode encerrar a listagem como se fosse a última.
+async def pagina_async(url, headers, params, refresh_token_func=None, descricao="registros"):
+    for tentativa in range(TENTATIVAS_PAGINA):
+        response = await make_request_async(url, headers, params=params, refresh_token_func=refresh_token_func)
+        if response is not None and response.status_code == 200:
+            return response.json().get("results", [])
+        status = response.status_code if response is not None else "sem resposta"
+        if response is not None and response.status_code != 429 and response.status_code < 500:
             break
+        if tentativa + 1 < TENTATIVAS_PAGINA:
+            await asyncio.sleep(_espera_pagina(response, tentativa))
+    raise Exception(f"Erro ao listar {descricao} (offset {params['_offset']}): Status {status}")
+
+# Paginação por offset em paralelo: a primeira página é buscada sozinha e, se vier
+# cheia, as janelas de offset seguintes são pedidas em paralelo (até
+# MAGALU_PAGINAS_PARALELAS em voo). As páginas são entregues em ordem de offset assim
+# que chegam; só uma página curta ou vazia encerra a listagem (cancelando as requisições
+# de offsets posteriores). Uma página que falha em todas as tentativas interrompe a coleta.
+async def paginar_async(url, headers, refresh_token_func=None, limit=100, descricao="registros"):
+    pendentes = []
+    proximo_offset = 0
+
+    def agendar():
+        nonlocal proximo_offset
+        params = {'_limit': limit, '_offset': proximo_offset}
+        pendentes.append(asyncio.ensure_future(
+            pagina_async(url, headers, params, refresh_token_func=refresh_token_func, descricao=descricao)
+        ))
+        proximo_offset += limit
 
-        dados = response.json()
-        resultados = dados.get("results", [])
-        if not resultados:
-            break
+    try:
+        agendar()
+        while pendentes:
+            resultados = await pendentes.pop(0)
+            if not resultados:
+                return
 
-        todos_skus.extend(resultados)
+            # Página cheia: completa a janela de requisições em paralelo
+            if len(resultados) == limit:
+                while len(pendentes) < PAGINAS_PARALELAS:
+                    agendar()
 
-        if len(resultados) < limit:
-            break
+            yield resultados
 
-        offset += limit
+            if len(resultados) < limit:
+                return
+    finally:
+        for tarefa in pendentes:
+            tarefa.cancel()
 
-    return {"results": todos_skus}
+# Páginas de SKUs de um vendedor, entregues conforme chegam
+def paginas_skus_async(headers, refresh_token_func=None, limit=100):
+    url = f"{url_base_api}/seller/v1/portfolios/skus"
+    return paginar_async(url, headers, refresh_token_func, limit, descricao="SKUs")
+
+def paginas_skus(headers, refresh_token_func=None, limit=100):
+    return cliente_async.iterar_sync(paginas_skus_async(headers, refresh_token_func, limit))
 
 # Consultar informações de um SKU específico
 def consultar_sku(headers, sku_id, refresh_token_func=None):
@@ -161,40 +254,107 @@ def consultar_estoque(headers, sku_id, refresh_token_func=None):
     print(f"Erro ao consultar estoque do SKU {sku_id} — status {response.status_code}")
     return None
 
-# Listar pedidos de um vendedor
-def listar_pedidos(headers, refresh_token_func=None, limit=100):
-    todos_pedidos = []
-    offset = 0
-
-    while True:
-        params = {'_limit': limit, '_offset': offset}
-        url = f"{url_base_api}/seller/v1/orders"
-        response = make_request(url, headers, params=params, refresh_token_func=refresh_token_func)
-
-        if response is None or response.status_code != 200:
-            break
-
-        dados = response.json()
-        pedidos_lote = dados.get("results", [])
-        if not pedidos_lote:
-            break
-
-        todos_pedidos.extend(pedidos_lote)
-
-        if len(pedidos_lote) < limit:
-            break
-
-        offset += limit
+# Páginas de pedidos de um vendedor, entregues conforme chegam
+def paginas_pedidos_async(headers, refresh_token_func=None, limit=100):
+    url = f"{url_base_api}/seller/v1/orders"
+    return paginar_async(url, headers, refresh_token_func, limit, descricao="pedidos")
 
-    print(f"Total de pedidos coletados: {len(todos_pedidos)}")
-    return {"results": todos_pedidos}
+def paginas_pedidos(headers, refresh_token_func=None, limit=100):
+    return cliente_async.iterar_sync(paginas_pedidos_async(headers, refresh_token_func, limit))
 
 # ------------------------- OBTENÇÃO DE DADOS ----------------------------
 
 # Caso os dados dos produtos sejam obtidos de vários endpoints, eles devem ser combinados aqui.
 
-# Obtém todos os dados de produtos de um vendedor
-def obter_todos_os_dados(dados_skus, access_token, refresh_token, nickname):
+# ------------------------- MAPEAMENTOS DOS PAYLOADS ----------------------------
+
+# Especificações dos registros (mapeamento.py), compiladas no import
+
+TRADUCAO_STATUS_SKU = {
+    "INACTIVE": "Inativo",
+    "UNPUBLISHED": "Não publicado",
+    "PUBLISHED": "Publicado",
+    "BLOCKED": "Bloqueado"
+}
+
+# Tradução dos nomes dos atributos e atributos internos que não vão para a ficha
+TRADUCAO_ATRIBUTOS = {
+    "update_only_front": "Apenas atualização no frontend",
+    "color": "Cor"
+}
+ATRIBUTOS_IGNORADOS = {"IdProduct", "fulfillment"}
+
+# Medidas do SKU (dimensions) gravadas como atributos
+DIMENSOES = [
+    ("height", "Altura (cm)"),
+    ("width", "Largura (cm)"),
+    ("length", "Comprimento (cm)"),
+    ("weight", "Peso (g)")
+]
+
+def centavos_para_reais(valor):
+    return round(valor / 100, 2)
+
+# Produto a partir de {"item", "info", "preco", "estoque"} (respostas da listagem, da ficha, do preço e do estoque)
+MAPA_PRODUTO = mapeamento.compilar("magalu.produtos", {
+    "sku_id": "item.sku",
+    "titulo": {"caminho": "info.title", "padrao": ""},
+    "descricao": {"caminho": "info.description", "padrao": ""},
+    "marca": {"caminho": "info.brand", "padrao": ""},
+    "status": {"caminho": "info.status", "padrao": "", "traducao": TRADUCAO_STATUS_SKU, "chave_traducao": str.upper},
+    "data_criacao": "info.created_at",
+    "data_atualizacao": "info.updated_at",
+    "preco": {"caminho": "preco.results.0.price", "padrao": 0, "funcao": centavos_para_reais},
+    "estoque_disponivel": {"caminho": "estoque.results.0.quantity", "padrao": 0}
+})
+
+# Atributo de attributes, datasheet ou extra_data (só os preenchidos e que vão para a ficha)
+MAPA_ATRIBUTO = mapeamento.compilar("magalu.atributos", {
+    "sku_id": {"contexto": "sku_id"},
+    "atributo": {"caminho": "name", "padrao": "", "traducao": TRADUCAO_ATRIBUTOS},
+    "valor": {"caminho": "value", "padrao": ""}
+}, obrigatorios=["atributo", "valor"], descartar={"atributo": ATRIBUTOS_IGNORADOS})
+
+# id_imagem ("<sku>_<posição>") é preenchido depois da extração
+MAPA_IMAGEM = mapeamento.compilar("magalu.imagens", {
+    "id_imagem": {"valor": None},
+    "sku_id": {"contexto": "sku_id"},
+    "secure_url": "reference",
+    "resolucao": "type"
+})
+
+# Monta os registros de produto, atributos e imagens de um SKU
+def montar_registros_sku(item, info, preco, estoque):
+    info = info or {}
+    produto = MAPA_PRODUTO.extrair({"item": item, "info": info, "preco": preco, "estoque": estoque})
+    sku_id = produto["sku_id"]
+    contexto = {"sku_id": sku_id}
+
+    # ATRIBUTOS (attributes da listagem, datasheet e extra_data da ficha)
+    atributos = []
+    for fonte in (item.get("attributes", []), info.get("datasheet", []), info.get("extra_data", [])):
+        atributos.extend(MAPA_ATRIBUTO.varios(fonte, contexto))
+
+    # DIMENSIONS
+    dim = info.get("dimensions", {})
+    if isinstance(dim, dict):
+        for chave, nome in DIMENSOES:
+            valor = (dim.get(chave) or {}).get("value")
+            if valor:
+                atributos.append({"sku_id": sku_id, "atributo": nome, "valor": valor})
+
+    # IMAGENS
+    imagens = MAPA_IMAGEM.varios(info.get("images", []), contexto)
+    for idx, imagem in enumerate(imagens):
+        imagem["id_imagem"] = f"{sku_id}_{idx}"
+
+    return produto, atributos, imagens
+
+# Obtém todos os dados de produtos de um vendedor. 'paginas' é um iterável de páginas de
+# SKUs (ver paginas_skus): o detalhamento de uma página começa assim que ela chega, e as
+# páginas detalhadas são gravadas no staging em segundo plano enquanto as seguintes são buscadas.
+# Retorna os lotes colunares de produtos, atributos e imagens do catálogo.
+def obter_todos_os_dados(paginas, access_token, refresh_token, nickname):
     token_data = {'access_token': access_token, 'refresh_token': refresh_token}
     headers = {'Authorization': f'Bearer {token_data["access_token"]}'}
 
@@ -207,138 +367,59 @@ def obter_todos_os_dados(dados_skus, access_token, refresh_token, nickname):
         headers['Authorization'] = f'Bearer {new_access_token}'
         return headers
 
-    produtos = []
-    atributos = []
-    imagens = []
+    acumulados = lotes_skus()
+
+    total_skus = 0
+    paginas = iter(paginas)
 
     print(f"\nToken validado!")
-    print(f"\nTotal de SKUs coletados: {len(dados_skus.get('results', []))}")
 
-    for item in dados_skus.get("results", []):
+    limpar_staging(nickname)
+    with escrita_staging.GravadorEmSegundoPlano(gravar_pagina) as gravador:
+        while True:
+            with tempos.etapa("listagem_ids"):
+                pagina = next(paginas, None)
+            if pagina is None:
+                break
+            total_skus += len(pagina)
+            produtos_pagina, atributos_pagina, imagens_pagina = detalhar_pagina(pagina, headers, refresh_token_func)
+            gravador.enviar(produtos_pagina, atributos_pagina, imagens_pagina, nickname, acumulados)
+
+    print(f"\nTotal de SKUs coletados: {total_skus}")
+    return acumulados
+
+# Grava uma página detalhada no staging, com a resolução lida das próprias imagens (a API
+# informa apenas o tipo da imagem), e junta os lotes da página aos 'acumulados' da coleta
+def gravar_pagina(produtos, atributos, imagens, vendedor, acumulados=None):
+    with tempos.etapa("sondagem_imagens"):
+        sonda_imagens.atualizar_resolucoes_lote(imagens, get_connection)
+    with tempos.etapa("gravacao_staging"):
+        salvar_no_staging(produtos, atributos, imagens, vendedor)
+    if acumulados is not None:
+        for acumulado, lote in zip(acumulados, (produtos, atributos, imagens)):
+            acumulado.estender_lote(lote)
+
+# Detalha (preço, estoque e ficha) os SKUs de uma página da listagem em lotes colunares
+def detalhar_pagina(pagina, headers, refresh_token_func):
+    produtos, atributos, imagens = lotes_skus()
+
+    for item in pagina:
         sku_id = item.get("sku")
         if not sku_id:
             print("SKU sem ID encontrado, pulando este item.")
             continue
 
-        preco = consultar_preco(headers, sku_id, refresh_token_func)
-        estoque = consultar_estoque(headers, sku_id, refresh_token_func)
-        info = consultar_sku(headers, sku_id, refresh_token_func)
-
-        preco_info = preco.get("results", [{}])[0] if preco and "results" in preco else {}
-        estoque_info = estoque.get("results", [{}])[0] if estoque and "results" in estoque else {}
-
-        # Tradução do status
-        status_map = {
-            "INACTIVE": "Inativo",
-            "UNPUBLISHED": "Não publicado",
-            "PUBLISHED": "Publicado",
-            "BLOCKED": "Bloqueado"
-        }
-        status_original = info.get("status", "") if info else ""
-        status_traduzido = status_map.get(status_original.upper(), status_original)
+        with tempos.etapa("detalhes"):
+            preco = consultar_preco(headers, sku_id, refresh_token_func)
+            estoque = consultar_estoque(headers, sku_id, refresh_token_func)
+            info = consultar_sku(headers, sku_id, refresh_token_func)
+        arquivo_bruto.registrar("skus", {"item": item, "info": info, "preco": preco, "estoque": estoque})
 
-        # PRODUTOS
-        produto = {
-            "sku_id": sku_id,
-            "titulo": info.get("title", "") if info else "",
-            "descricao": info.get("description", "") if info else "",
-            "marca": info.get("brand", "") if info else "",
-            "status": status_traduzido,
-            "data_criacao": info.get("created_at") if info else None,
-            "data_atualizacao": info.get("updated_at") if info else None,
-            "preco": round(preco_info.get("price", 0) / 100, 2),
-            "estoque_disponivel": estoque_info.get("quantity", 0)
-        }
-        produtos.append(produto)
-
-        # ATRIBUTOS
-        for attr in item.get("attributes", []):
-            nome = attr.get("name", "")
-            valor = attr.get("value", "")
-            # Tradução dos nomes dos atributos
-            if nome == "update_only_front":
-                nome_traduzido = "Apenas atualização no frontend"
-            elif nome == "color":
-                nome_traduzido = "Cor"
-            else:
-                nome_traduzido = nome
-            if nome and valor and nome != "IdProduct" and nome != "fulfillment":
-                atributos.append({
-                    "sku_id": sku_id,
-                    "atributo": nome_traduzido,
-                    "valor": valor
-                })
-
-        # DATASHEET
-        for attr in info.get("datasheet", []) if info else []:
-            nome = attr.get("name", "")
-            valor = attr.get("value", "")
-            if nome == "update_only_front":
-                nome_traduzido = "Apenas atualização no frontend"
-            elif nome == "color":
-                nome_traduzido = "Cor"
-            else:
-                nome_traduzido = nome
-            if nome and valor and nome != "IdProduct" and nome != "fulfillment":
-                atributos.append({
-                    "sku_id": sku_id,
-                    "atributo": nome_traduzido,
-                    "valor": valor
-                })
-
-        # EXTRA_DATA
-        for attr in info.get("extra_data", []) if info else []:
-            nome = attr.get("name", "")
-            valor = attr.get("value", "")
-            if nome == "update_only_front":
-                nome_traduzido = "Apenas atualização no frontend"
-            elif nome == "color":
-                nome_traduzido = "Cor"
-            else:
-                nome_traduzido = nome
-            if nome and valor and nome != "IdProduct" and nome != "fulfillment":
-                atributos.append({
-                    "sku_id": sku_id,
-                    "atributo": nome_traduzido,
-                    "valor": valor
-                })
-
-        # DIMENSIONS
-        dim = info.get("dimensions", {})
-        if isinstance(dim, dict):
-            if dim.get("height", {}).get("value"):
-                atributos.append({
-                    "sku_id": sku_id,
-                    "atributo": "Altura (cm)",
-                    "valor": dim["height"]["value"]
-                })
-            if dim.get("width", {}).get("value"):
-                atributos.append({
-                    "sku_id": sku_id,
-                    "atributo": "Largura (cm)",
-                    "valor": dim["width"]["value"]
-                })
-            if dim.get("length", {}).get("value"):
-                atributos.append({
-                    "sku_id": sku_id,
-                    "atributo": "Comprimento (cm)",
-                    "valor": dim["length"]["value"]
-                })
-            if dim.get("weight", {}).get("value"):
-                atributos.append({
-                    "sku_id": sku_id,
-                    "atributo": "Peso (g)",
-                    "valor": dim["weight"]["value"]
-                })
-
-        # IMAGENS
-        for idx, img in enumerate(info.get("images", []) if info else []):
-            imagens.append({
-                "id_imagem": f"{sku_id}_{idx}",
-                "sku_id": sku_id,
-                "secure_url": img.get("reference"),
-                "resolucao": img.get("type")
-            })
+        with tempos.etapa("transformacao"):
+            produto, atributos_sku, imagens_sku = montar_registros_sku(item, info, preco, estoque)
+            produtos.acrescentar(produto)
+            atributos.estender(atributos_sku)
+            imagens.estender(imagens_sku)
 
     return produtos, atributos, imagens
 
@@ -393,88 +474,58 @@ def processar_pedidos(pedidos_raw):
 
     return pedidos
 
-# ------------------------- TRATAMENTO DE DADOS ----------------------------
+# Coleta e processa os pedidos página a página, em um lote colunar
+def coletar_pedidos(headers, refresh_token_func=None):
+    pedidos = colunar.Lote(ESQUEMA_PEDIDOS)
+    paginas = iter(paginas_pedidos(headers, refresh_token_func=refresh_token_func))
+    while True:
+        with tempos.etapa("pedidos"):
+            pagina = next(paginas, None)
+        if pagina is None:
+            break
+        arquivo_bruto.registrar_varios("pedidos", pagina)
+        with tempos.etapa("transformacao"):
+            pedidos.estender(processar_pedidos({"results": pagina}))
+    print(f"Total de pedidos coletados: {len(pedidos)}")
+    return pedidos
 
-# Trata os dados verificando erros comuns e salvando um relatório de erros
-def tratar_dados(df_produtos, df_imagens, df_atributos):
-    def contar_imagens_baixa_resolucao(resolucoes):
-        baixa = 0
-        for r in resolucoes:
-            try:
-                w, h = map(int, r.lower().split('x'))
-                if w < 1000 or h < 1000:
-                    baixa += 1
-            except:
-                continue
-        return baixa
-
-    erros = []
-
-    for _, row in df_produtos.iterrows():
-        sku = row['sku_id']
-        titulo = row['titulo']
-        descricao = row['descricao']
-        status = row.get('status', '')
-
-        imagens_produto = df_imagens[df_imagens['sku_id'] == sku] if df_imagens is not None else pd.DataFrame()
-        qtd_imagens = len(imagens_produto)
-        qtd_imagem_msg = "OK" if qtd_imagens > 3 else f"Necessário adicionar mais {3 - qtd_imagens} imagens"
-        resolucoes = imagens_produto['resolucao'].dropna().tolist() if 'resolucao' in imagens_produto else []
-        baixa_qtd = contar_imagens_baixa_resolucao(resolucoes)
-        resolucao_msg = "OK" if baixa_qtd == 0 else f"{baixa_qtd} imagens com qualidade baixa"
-        descricao_msg = "OK" if pd.notna(descricao) and str(descricao).strip() != "" and len(str(descricao)) > 500 else "Necessário preencher"
-        titulo_msg = "OK" if pd.notna(titulo) and 10 <= len(str(titulo)) <= 60 else "Necessário preencher"
-        marca_msg = "OK" if pd.notna(row['marca']) and row['marca'].strip() != "" else "Necessário preencher"
-        atributos_produto = df_atributos[df_atributos['sku_id'] == sku] if df_atributos is not None else pd.DataFrame()
-        atributos_vazios = atributos_produto['valor'].isna().sum() + (atributos_produto['valor'] == '').sum() if 'valor' in atributos_produto else 0
-        atributos_msg = f"{atributos_vazios} campos vazios"
-
-        erros.append({
-            'sku_id': sku,
-            'produto': titulo,
-            'status': status,
-            'titulo': titulo_msg,
-            'qtd_imagem': qtd_imagem_msg,
-            'resolucao_imagem': resolucao_msg,
-            'descricao': descricao_msg,
-            'atributos': atributos_msg,
-            'marca': marca_msg
-        })
+# ------------------------- TRATAMENTO DE DADOS ----------------------------
 
-    df_erros = pd.DataFrame(erros)
+# Trata os dados verificando erros comuns e salvando um relatório de erros.
+# As verificações são as regras da Magalu em qualidade.REGRAS, avaliadas de uma vez sobre
+# as três tabelas; 'duplicadas' ({sku_id: quantidade}) vem da etapa opcional de imagens
+# duplicadas.
+@metricas.cronometrar_tratamento("magalu")
+def tratar_dados(df_produtos, df_imagens, df_atributos, duplicadas=None):
+    verificacoes = qualidade.avaliar("magalu", "produtos", df_produtos, imagens=df_imagens, atributos=df_atributos)
+    df_erros = pd.DataFrame({
+        'sku_id': df_produtos['sku_id'],
+        'produto': df_produtos['titulo'],
+        'status': df_produtos['status'] if 'status' in df_produtos else '',
+        **{coluna: verificacoes[coluna] for coluna in verificacoes.columns},
+        'imagens_duplicadas': [imagens_duplicadas.mensagem(duplicadas, sku) for sku in df_produtos['sku_id']]
+    }).reset_index(drop=True)
     return df_erros
 
 # ------------------------- SALVAR NO BANCO DE DADOS ----------------------------
 
-# Limpa dados antigos do vendedor
-def limpar_dados_antigos(vendedor):
+# Remove as linhas do vendedor no staging (restos de uma coleta que falhou)
+def limpar_staging(vendedor):
     conn = get_connection()
     if not conn:
-        print("Erro ao conectar com o banco para limpar dados antigos.")
-        return
+        raise Exception("Erro ao conectar com o banco de dados no Supabase.")
     try:
-        cursor = conn.cursor()
-        tabelas = ["erros_qualidade", "atributos", "imagens", "pedidos", "produtos"]
-        for tabela in tabelas:
-            cursor.execute(f"DELETE FROM {tabela} WHERE vendedor = %s", (vendedor,))
+        with conn.cursor() as cursor:
+            escrita_staging.limpar(cursor, vendedor, TABELAS_COLETA)
         conn.commit()
-        print(f"\nRegistros antigos removidos para o vendedor {vendedor}.")
-    except Exception as e:
-        print(f"Erro ao limpar dados antigos: {e}")
-        conn.rollback()
     finally:
-        cursor.close()
         conn.close()
 
-# Salva os dados no banco de dados
-def salvar_no_banco(produtos, atributos, imagens, pedidos, vendedor):
-
-    limpar_dados_antigos(vendedor)
-
+# Grava os lotes de produtos, imagens e atributos de uma página no staging (uma linha por chave)
+def salvar_no_staging(produtos, atributos, imagens, vendedor):
     conn = get_connection()
     if not conn:
-        print("Erro ao conectar com o banco de dados no Supabase.")
-        return
+        raise Exception("Erro ao conectar com o banco de dados no Supabase.")
 
     try:
         conn.set_session(autocommit=False)
@@ -484,25 +535,16 @@ def salvar_no_banco(produtos, atributos, imagens, pedidos, vendedor):
         data_registro = datetime.now(fuso_brasilia).replace(tzinfo=None)
 
         # PRODUTOS
-        produtos_valores = [
-            (
-                p['sku_id'],
-                p['titulo'],
-                p['descricao'],
-                p['marca'],
-                p['status'],
-                p['preco'],
-                p['estoque_disponivel'],
-                p['data_criacao'],
-                p['data_atualizacao'],
-                vendedor,
-                data_registro
-            )
-            for p in produtos
-        ]
+        produtos_valores = escrita_staging.unicas([
+            (*linha, vendedor, data_registro)
+            for linha in produtos.linhas([
+                'sku_id', 'titulo', 'descricao', 'marca', 'status', 'preco',
+                'estoque_disponivel', 'data_criacao', 'data_atualizacao'
+            ])
+        ], [0])
 
         query_produtos = """
-            INSERT INTO produtos (
+            INSERT INTO stg_produtos (
                 sku_id, titulo, descricao, marca, status, preco, estoque_disponivel,
                 data_criacao, data_atualizacao, vendedor, data_registro
             )
@@ -521,8 +563,8 @@ def salvar_no_banco(produtos, atributos, imagens, pedidos, vendedor):
         """
 
         template_produtos = "(%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s)"
-        for i in range(0, len(produtos_valores), batch_size):
-            try:
+        with metricas.cronometrar_escrita("magalu", "produtos", len(produtos_valores)):
+            for i in range(0, len(produtos_valores), batch_size):
                 execute_values(
                     cursor,
                     query_produtos,
@@ -530,17 +572,15 @@ def salvar_no_banco(produtos, atributos, imagens, pedidos, vendedor):
                     template=template_produtos,
                     page_size=batch_size
                 )
-            except Exception as e:
-                print(f"Erro ao inserir batch de produtos ({i}): {e}")
 
         # IMAGENS
-        imagens_valores = [
-            (img['id_imagem'], img['sku_id'], img['secure_url'], img['resolucao'], vendedor, data_registro)
-            for img in imagens
-        ]
+        imagens_valores = escrita_staging.unicas([
+            (*linha, vendedor, data_registro)
+            for linha in imagens.linhas(['id_imagem', 'sku_id', 'secure_url', 'resolucao'])
+        ], [0, 1])
 
         query_imagens = """
-            INSERT INTO imagens (
+            INSERT INTO stg_imagens (
                 id_imagem, sku_id, secure_url, resolucao, vendedor, data_registro
             )
             VALUES %s
@@ -552,8 +592,8 @@ def salvar_no_banco(produtos, atributos, imagens, pedidos, vendedor):
         """
 
         template_imagens = "(%s, %s, %s, %s, %s, %s)"
-        for i in range(0, len(imagens_valores), batch_size):
-            try:
+        with metricas.cronometrar_escrita("magalu", "imagens", len(imagens_valores)):
+            for i in range(0, len(imagens_valores), batch_size):
                 execute_values(
                     cursor,
                     query_imagens,
@@ -561,39 +601,27 @@ def salvar_no_banco(produtos, atributos, imagens, pedidos, vendedor):
                     template=template_imagens,
                     page_size=batch_size
                 )
-            except Exception as e:
-                print(f"Erro ao inserir batch de imagens ({i}): {e}")
 
         # ATRIBUTOS
-        atributos_validos = []
-        for idx, a in enumerate(atributos):
-            try:
-                if not isinstance(a, dict):
-                    print(f"Atributo malformado (não é dict): {a}")
-                    continue
-                if a.get('atributo') and a.get('valor') is not None:
-                    atributos_validos.append(a)
-            except Exception as e:
-                print(f"Erro no atributo #{idx}: {a} — {e}")
-
-        atributos_valores = [
-            (a['sku_id'], a['atributo'], a['valor'], vendedor, data_registro) for a in atributos_validos
-        ]
+        atributos_validos = [a for a in atributos.registros() if a['atributo'] and a['valor'] is not None]
+
+        # Um documento por SKU
+        atributos_valores = documentos.linhas(documentos.agrupar_atributos(atributos_validos), vendedor, data_registro)
 
         query_atributos = """
-            INSERT INTO atributos (
-                sku_id, atributo, valor, vendedor, data_registro
+            INSERT INTO stg_atributos (
+                sku_id, atributos, vendedor, data_registro
             )
             VALUES %s
-            ON CONFLICT (sku_id, atributo, vendedor)
+            ON CONFLICT (sku_id, vendedor)
             DO UPDATE SET
-                valor = EXCLUDED.valor,
+                atributos = EXCLUDED.atributos,
                 data_registro = EXCLUDED.data_registro;
         """
 
-        template_atributos = "(%s, %s, %s, %s, %s)"
-        for i in range(0, len(atributos_valores), batch_size):
-            try:
+        template_atributos = "(%s, %s, %s, %s)"
+        with metricas.cronometrar_escrita("magalu", "atributos", len(atributos_valores)):
+            for i in range(0, len(atributos_valores), batch_size):
                 execute_values(
                     cursor,
                     query_atributos,
@@ -601,70 +629,113 @@ def salvar_no_banco(produtos, atributos, imagens, pedidos, vendedor):
                     template=template_atributos,
                     page_size=batch_size
                 )
-            except Exception as e:
-                print(f"Erro ao inserir batch de atributos ({i}): {e}")
-
 
-        # PEDIDOS
-        pedidos_valores = [
-            (
-                p['id'],
-                p['status'],
-                p['data_criacao'],
-                p['valor'],
-                p['pagamento_status'],
-                p['metodo_pagamento'], 
-                p['moeda'], 
-                vendedor,
-                data_registro
-            )
-            for p in pedidos
-        ]
-
-        query_pedidos = """
-            INSERT INTO pedidos (
-                id, status, data_criacao, valor, pagamento_status,
-                metodo_pagamento, moeda, vendedor, data_registro
-            )
-            VALUES %s
-            ON CONFLICT (id)
-            DO UPDATE SET
-                status = EXCLUDED.status,
-                data_criacao = EXCLUDED.data_criacao,
-                valor = EXCLUDED.valor,
-                pagamento_status = EXCLUDED.pagamento_status,
-                metodo_pagamento = EXCLUDED.metodo_pagamento,
-                moeda = EXCLUDED.moeda,
-                vendedor = EXCLUDED.vendedor,
-                data_registro = EXCLUDED.data_registro;
-        """
+        conn.commit()
 
-        template_pedidos = "(%s, %s, %s, %s, %s, %s, %s, %s, %s)"
-        for i in range(0, len(pedidos_valores), batch_size):
-            try:
-                execute_values(
-                    cursor,
-                    query_pedidos,
-                    pedidos_valores[i:i+batch_size],
-                    template=template_pedidos,
-                    page_size=batch_size
-                )
-            except Exception as e:
-                print(f"Erro ao inserir batch de pedidos ({i}): {e}")
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        cursor.close()
+        conn.close()
 
+# Substitui os dados do vendedor no dia pelos do staging e grava os pedidos, em uma
+# única transação (os dias anteriores saem pela retenção das partições)
+def salvar_no_banco(pedidos, vendedor):
+    conn = get_connection()
+    if not conn:
+        raise Exception("Erro ao conectar com o banco de dados no Supabase.")
 
+    try:
+        cursor = conn.cursor()
+        fuso_brasilia = pytz.timezone("America/Sao_Paulo")
+        data_registro = datetime.now(fuso_brasilia).replace(tzinfo=None)
+        particoes.limpar_dia(cursor, "pedidos", vendedor, data_registro)
+        escrita_staging.promover(cursor, vendedor, TABELAS_COLETA, data_registro)
+        inserir_pedidos(cursor, pedidos, vendedor, data_registro)
         conn.commit()
         print("Dados salvos no banco de dados.")
 
     except Exception as e:
         conn.rollback()
         print(f"\nErro ao salvar no banco de dados: {e}")
+        raise
+    finally:
+        cursor.close()
+        conn.close()
+
+# Insere (ou atualiza) os pedidos usando o cursor informado
+def inserir_pedidos(cursor, pedidos, vendedor, data_registro, batch_size=500):
+    particoes.garantir(cursor, "pedidos", data_registro)
+    pedidos_valores = escrita_staging.unicas([
+        (*linha, vendedor, data_registro)
+        for linha in pedidos.linhas([
+            'id', 'status', 'data_criacao', 'valor', 'pagamento_status', 'metodo_pagamento', 'moeda'
+        ])
+    ], [0])
+
+    query_pedidos = """
+        INSERT INTO pedidos (
+            id, status, data_criacao, valor, pagamento_status,
+            metodo_pagamento, moeda, vendedor, data_registro
+        )
+        VALUES %s
+        ON CONFLICT (id, data_registro)
+        DO UPDATE SET
+            status = EXCLUDED.status,
+            data_criacao = EXCLUDED.data_criacao,
+            valor = EXCLUDED.valor,
+            pagamento_status = EXCLUDED.pagamento_status,
+            metodo_pagamento = EXCLUDED.metodo_pagamento,
+            moeda = EXCLUDED.moeda,
+            vendedor = EXCLUDED.vendedor,
+            data_registro = EXCLUDED.data_registro;
+    """
+
+    template_pedidos = "(%s, %s, %s, %s, %s, %s, %s, %s, %s)"
+    with metricas.cronometrar_escrita("magalu", "pedidos", len(pedidos_valores)):
+        for i in range(0, len(pedidos_valores), batch_size):
+            execute_values(
+                cursor,
+                query_pedidos,
+                pedidos_valores[i:i+batch_size],
+                template=template_pedidos,
+                page_size=batch_size
+            )
+
+# Salva apenas os pedidos (coleta incremental), sem apagar os demais dados do vendedor.
+# Os pedidos recebidos substituem as versões gravadas antes no mesmo dia.
+def salvar_pedidos_no_banco(pedidos, vendedor):
+    conn = get_connection()
+    if not conn:
+        raise Exception("Erro ao conectar com o banco de dados no Supabase.")
+
+    try:
+        cursor = conn.cursor()
+        fuso_brasilia = pytz.timezone("America/Sao_Paulo")
+        data_registro = datetime.now(fuso_brasilia).replace(tzinfo=None)
+        particoes.limpar_dia(cursor, "pedidos", vendedor, data_registro, "id", pedidos.coluna("id"))
+        inserir_pedidos(cursor, pedidos, vendedor, data_registro)
+        conn.commit()
+        print("Pedidos salvos no banco de dados.")
+    except Exception as e:
+        conn.rollback()
+        print(f"\nErro ao salvar pedidos no banco de dados: {e}")
+        raise
     finally:
         cursor.close()
         conn.close()
 
-# Salva os erros no banco de dados
-def salvar_erros_no_banco(df_erros, vendedor):
+# Colunas de erros_qualidade copiadas entre dias pela verificação incremental
+COLUNAS_ERROS = [
+    "sku_id", "produto", "status", "titulo", "qtd_imagem", "resolucao_imagem",
+    "descricao", "atributos", "marca", "imagens_duplicadas", "vendedor", "hash_entradas"
+]
+
+# Salva os erros no banco de dados. 'df_erros' traz só os SKUs reavaliados (com a coluna
+# hash_entradas); 'skus' são todos os SKUs do catálogo gravado e 'ultimo'/'anteriores' vêm
+# de qualidade.ultimos_hashes, para manter as linhas dos SKUs inalterados.
+def salvar_erros_no_banco(df_erros, vendedor, skus=None, ultimo=None, anteriores=None):
     conn = get_connection()
     if not conn:
         print("Erro ao conectar com o banco para salvar erros.")
@@ -674,38 +745,38 @@ def salvar_erros_no_banco(df_erros, vendedor):
         cursor = conn.cursor()
         fuso_brasilia = pytz.timezone("America/Sao_Paulo")
         data_registro = datetime.now(fuso_brasilia).replace(tzinfo=None)
-
-        # Filtra apenas erros cujo sku_id existe em produtos
-        cursor.execute(
-            "SELECT sku_id FROM produtos WHERE vendedor = %s", (vendedor,)
+        copiados = qualidade.preparar_dia(
+            cursor, "erros_qualidade", COLUNAS_ERROS, vendedor, data_registro, ultimo, anteriores or {},
+            df_erros['sku_id'] if skus is None else skus, df_erros['sku_id']
         )
-        skus_validos = set(row[0] for row in cursor.fetchall())
-        df_erros = df_erros[df_erros['sku_id'].isin(skus_validos)]
 
         valores = [
             (
-                row['sku_id'],
-                row['produto'],
-                row['status'],
-                row['titulo'],
-                row['qtd_imagem'],
-                row['resolucao_imagem'],
-                row['descricao'],
-                row['atributos'],
-                row['marca'],
+                row.sku_id,
+                row.produto,
+                row.status,
+                row.titulo,
+                row.qtd_imagem,
+                row.resolucao_imagem,
+                row.descricao,
+                row.atributos,
+                row.marca,
+                row.imagens_duplicadas,
                 vendedor,
+                row.hash_entradas,
                 data_registro
             )
-            for _, row in df_erros.iterrows()
+            for row in df_erros.itertuples(index=False)
         ]
+        print(f"Erros de qualidade: {len(valores)} SKUs reavaliados, {copiados} inalterados copiados do último dia.")
 
         query = """
             INSERT INTO erros_qualidade (
                 sku_id, produto, status, titulo, qtd_imagem, resolucao_imagem,
-                descricao, atributos, marca, vendedor, data_registro
+                descricao, atributos, marca, imagens_duplicadas, vendedor, hash_entradas, data_registro
             )
             VALUES %s
-            ON CONFLICT (sku_id, vendedor)
+            ON CONFLICT (sku_id, vendedor, data_registro)
             DO UPDATE SET
                 produto = EXCLUDED.produto,
                 status = EXCLUDED.status,
@@ -715,18 +786,20 @@ def salvar_erros_no_banco(df_erros, vendedor):
                 descricao = EXCLUDED.descricao,
                 atributos = EXCLUDED.atributos,
                 marca = EXCLUDED.marca,
+                imagens_duplicadas = EXCLUDED.imagens_duplicadas,
+                hash_entradas = EXCLUDED.hash_entradas,
                 data_registro = EXCLUDED.data_registro;
         """
 
-        template_erros = "(%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s)"
-        execute_values(
-            cursor,
-            query,
-            valores,
-            template=template_erros
-        )
-
-        conn.commit()
+        template_erros = "(%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s)"
+        with metricas.cronometrar_escrita("magalu", "erros_qualidade", len(valores)):
+            execute_values(
+                cursor,
+                query,
+                valores,
+                template=template_erros
+            )
+            conn.commit()
 
     except Exception as e:
         print("Erro ao salvar erros no banco:", e)
@@ -737,142 +810,95 @@ def salvar_erros_no_banco(df_erros, vendedor):
 
 # ------------------------- BUSCAR NO BANCO DE DADOS PARA DOWNLOAD ----------------------------
 
+# As buscas geram lotes de linhas lidos por cursor nomeado (relatorios.ler_em_lotes)
+def data_hoje():
+    return datetime.now(pytz.timezone("America/Sao_Paulo")).date()
+
 # Busca os dados do dia para download
 def buscar_produtos_do_dia(vendedor):
-    conn = get_connection()
-    if not conn:
-        return []
-    try:
-        cursor = conn.cursor()
-        fuso_brasilia = pytz.timezone("America/Sao_Paulo")
-        data_hoje = datetime.now(fuso_brasilia)
-        cursor.execute("""
-            SELECT * FROM produtos WHERE vendedor = %s AND data_registro::date = %s
-        """, (vendedor, data_hoje.date()))
-        colunas = [desc[0] for desc in cursor.description]
-        return [dict(zip(colunas, row)) for row in cursor.fetchall()]
-    finally:
-        cursor.close()
-        conn.close()
+    return relatorios.ler_em_lotes(get_connection, """
+        SELECT * FROM produtos WHERE vendedor = %s AND data_registro >= %s AND data_registro < %s
+    """, (vendedor, *particoes.intervalo_dia(data_hoje())))
 
-# Busca os atributos do dia para download
+# Busca os atributos do dia para download (documentos expandidos em uma linha por atributo)
 def buscar_atributos_do_dia(vendedor):
-    conn = get_connection()
-    if not conn:
-        return []
-    try:
-        cursor = conn.cursor()
-        fuso_brasilia = pytz.timezone("America/Sao_Paulo")
-        data_hoje = datetime.now(fuso_brasilia)
-        cursor.execute("""
-            SELECT * FROM atributos WHERE vendedor = %s AND data_registro::date = %s
-        """, (vendedor, data_hoje.date()))
-        colunas = [desc[0] for desc in cursor.description]
-        return [dict(zip(colunas, row)) for row in cursor.fetchall()]
-    finally:
-        cursor.close()
-        conn.close()
+    return documentos.expandir_atributos(relatorios.ler_em_lotes(get_connection, """
+        SELECT sku_id, atributos, vendedor, data_registro FROM atributos
+        WHERE vendedor = %s AND data_registro >= %s AND data_registro < %s
+    """, (vendedor, *particoes.intervalo_dia(data_hoje()))))
 
 # Busca as imagens do dia para download
 def buscar_imagens_do_dia(vendedor):
-    conn = get_connection()
-    if not conn:
-        return []
-    try:
-        cursor = conn.cursor()
-        fuso_brasilia = pytz.timezone("America/Sao_Paulo")
-        data_hoje = datetime.now(fuso_brasilia)
-        cursor.execute("""
-            SELECT * FROM imagens WHERE vendedor = %s AND data_registro::date = %s
-        """, (vendedor, data_hoje.date()))
-        colunas = [desc[0] for desc in cursor.description]
-        return [dict(zip(colunas, row)) for row in cursor.fetchall()]
-    finally:
-        cursor.close()
-        conn.close()
+    return relatorios.ler_em_lotes(get_connection, """
+        SELECT * FROM imagens WHERE vendedor = %s AND data_registro >= %s AND data_registro < %s
+    """, (vendedor, *particoes.intervalo_dia(data_hoje())))
 
 # Busca os pedidos do dia para download
 def buscar_pedidos_do_dia(vendedor):
-    conn = get_connection()
-    if not conn:
-        return []
-    try:
-        cursor = conn.cursor()
-        fuso_brasilia = pytz.timezone("America/Sao_Paulo")
-        data_hoje = datetime.now(fuso_brasilia)
-        cursor.execute("""
-            SELECT * FROM pedidos WHERE vendedor = %s AND data_registro::date = %s
-        """, (vendedor, data_hoje.date()))
-        colunas = [desc[0] for desc in cursor.description]
-        return [dict(zip(colunas, row)) for row in cursor.fetchall()]
-    finally:
-        cursor.close()
-        conn.close()
+    return relatorios.ler_em_lotes(get_connection, """
+        SELECT * FROM pedidos WHERE vendedor = %s AND data_registro >= %s AND data_registro < %s
+    """, (vendedor, *particoes.intervalo_dia(data_hoje())))
 
 # Busca os erros do dia para download
 def buscar_erros_do_dia(vendedor):
-    conn = get_connection()
-    if not conn:
-        return pd.DataFrame()
-    try:
-        cursor = conn.cursor()
-        fuso_brasilia = pytz.timezone("America/Sao_Paulo")
-        data_hoje = datetime.now(fuso_brasilia)
-        cursor.execute("""
-            SELECT * FROM erros_qualidade WHERE vendedor = %s AND data_registro::date = %s
-        """, (vendedor, data_hoje.date()))
-        colunas = [desc[0] for desc in cursor.description]
-        rows = cursor.fetchall()
-        if not rows:
-            return pd.DataFrame()
-        return pd.DataFrame([dict(zip(colunas, row)) for row in rows])
-    finally:
-        cursor.close()
-        conn.close()
+    return relatorios.ler_em_lotes(get_connection, """
+        SELECT * FROM erros_qualidade WHERE vendedor = %s AND data_registro >= %s AND data_registro < %s
+    """, (vendedor, *particoes.intervalo_dia(data_hoje())))
 
 # ------------------------- GERAR XLSX E ZIP----------------------------
 
-# Gera um arquivo ZIP com os relatórios do dia
+# Gera um arquivo ZIP com os relatórios do dia, planilha por planilha
+@metricas.rastrear_zip("magalu")
 def gerar_zip_relatorios_do_dia(vendedor):
-
-    produtos = buscar_produtos_do_dia(vendedor)
-    atributos = buscar_atributos_do_dia(vendedor)
-    imagens = buscar_imagens_do_dia(vendedor)
-    pedidos = buscar_pedidos_do_dia(vendedor)
-    df_erros = buscar_erros_do_dia(vendedor)
-
-    def df_to_xlsx_bytes(df):
-        output = io.BytesIO()
-        with pd.ExcelWriter(output, engine='xlsxwriter') as writer:
-            df.to_excel(writer, index=False)
-        output.seek(0)
-        return output.read()
-
-    zip_stream = io.BytesIO()
-    with zipfile.ZipFile(zip_stream, "w") as zf:
-        if produtos:
-            df_produtos = pd.DataFrame(produtos)
-            zf.writestr(f"produtos_{vendedor}.xlsx", df_to_xlsx_bytes(df_produtos))
-        if imagens:
-            df_imagens = pd.DataFrame(imagens)
-            zf.writestr(f"imagens_{vendedor}.xlsx", df_to_xlsx_bytes(df_imagens))
-        if atributos:
-            df_atributos = pd.DataFrame(atributos)
-            zf.writestr(f"atributos_{vendedor}.xlsx", df_to_xlsx_bytes(df_atributos))
-        if pedidos:
-            df_pedidos = pd.DataFrame(pedidos)
-            zf.writestr(f"pedidos_{vendedor}.xlsx", df_to_xlsx_bytes(df_pedidos))
-        if df_erros is not None and not df_erros.empty:
-            zf.writestr(f"erros_gerais_{vendedor}.xlsx", df_to_xlsx_bytes(df_erros))
-    zip_stream.seek(0)
-    return zip_stream
+    return relatorios.gerar_zip([
+        (f"produtos_{vendedor}.xlsx", buscar_produtos_do_dia(vendedor)),
+        (f"imagens_{vendedor}.xlsx", buscar_imagens_do_dia(vendedor)),
+        (f"atributos_{vendedor}.xlsx", buscar_atributos_do_dia(vendedor)),
+        (f"pedidos_{vendedor}.xlsx", buscar_pedidos_do_dia(vendedor)),
+        (f"erros_gerais_{vendedor}.xlsx", buscar_erros_do_dia(vendedor))
+    ])
 
 # -------------------------------- EXECUÇÃO PRINCIPAL --------------------------------
 
+# Gera os erros de qualidade dos SKUs (lotes colunares da coleta) e salva no banco. Só os
+# SKUs com entradas alteradas desde a última verificação são reavaliados e regravados
+# (qualidade.ultimos_hashes). Com somente_cache, os hashes das imagens vêm só do cache
+# (sem baixar imagens).
+def verificar_qualidade(produtos, atributos, imagens, vendedor, somente_cache=False):
+    # Imagens repetidas entre anúncios (etapa opcional)
+    duplicadas = None
+    if imagens_duplicadas.ATIVA and len(imagens):
+        with tempos.etapa("imagens_duplicadas"):
+            duplicadas = imagens_duplicadas.contar_duplicadas(
+                list(imagens.linhas(['sku_id', 'secure_url'])), get_connection, somente_cache
+            )
+
+    with tempos.etapa("qualidade"):
+        # Um SKU repetido entre páginas fica no staging com a última versão: o mesmo aqui
+        df_produtos = produtos.para_dataframe().drop_duplicates('sku_id', keep='last')
+        df_imagens = imagens.para_dataframe().drop_duplicates(['id_imagem', 'sku_id'], keep='last')
+        df_atributos = atributos.para_dataframe().drop_duplicates(['sku_id', 'atributo'], keep='last')
+        df_erros, skus, ultimo, anteriores = pd.DataFrame(columns=COLUNAS_ERROS), [], None, {}
+        if not df_produtos.empty:
+            skus = df_produtos['sku_id']
+            alterados, hashes, ultimo, anteriores = qualidade.selecionar(
+                get_connection, "magalu", "erros_qualidade", vendedor, df_produtos, colunas=['status'],
+                extras=[imagens_duplicadas.mensagem(duplicadas, sku) for sku in skus],
+                imagens=df_imagens, atributos=df_atributos
+            )
+            df_erros = tratar_dados(
+                df_produtos[alterados], *qualidade.filtrar([df_imagens, df_atributos], set(skus[alterados])), duplicadas
+            )
+            df_erros['hash_entradas'] = hashes[alterados].tolist()
+    with tempos.etapa("gravacao_erros"):
+        salvar_erros_no_banco(df_erros, vendedor, skus, ultimo, anteriores)
+
 # Função principal para coletar dados da Magalu
-def coletar_dados_magalu(vendedor: str):
+@metricas.rastrear_coleta("magalu")
+@arquivo_bruto.arquivar("magalu")
+def coletar_dados_magalu(vendedor: str, incremental: bool = False):
 
-    print(f"\nIniciando coleta Magalu para o vendedor: {vendedor}")
+    print(f"\nIniciando coleta Magalu {'incremental ' if incremental else ''}para o vendedor: {vendedor}")
 
     # Verifica se o vendedor está na lista de tokens
     tokens = load_tokens()
@@ -896,29 +922,65 @@ def coletar_dados_magalu(vendedor: str):
         headers['Authorization'] = f'Bearer {new_access_token}'
         return headers
 
-    # Coleta dados de SKUs
-    dados_skus = listar_todos_skus(headers, refresh_token_func=refresh_token_func)
-    if not dados_skus or not dados_skus.get("results"):
-        raise Exception("Falha ao acessar SKUs, mesmo após renovação de token.")
+    # Cria as partições do dia antes de gravar (transação curta e própria)
+    with tempos.etapa("particoes"):
+        particoes.preparar(get_connection, TABELAS_PARTICIONADAS, "magalu")
 
-    # Coleta dados detalhados
+    # Coleta incremental: apenas os pedidos, sem refazer o catálogo
+    if incremental:
+        pedidos = coletar_pedidos(headers, refresh_token_func)
+        with tempos.etapa("gravacao_banco"):
+            salvar_pedidos_no_banco(pedidos, vendedor)
+        arquivo_bruto.concluir()
+        print(f"\nColeta incremental Magalu finalizada para {vendedor}")
+        return f"\nColeta incremental Magalu finalizada para {vendedor}"
+
+    # Coleta os SKUs, detalhando cada página assim que ela chega
     produtos, atributos, imagens = obter_todos_os_dados(
-        dados_skus, token_data['access_token'], token_data['refresh_token'], vendedor
+        paginas_skus(headers, refresh_token_func=refresh_token_func),
+        token_data['access_token'], token_data['refresh_token'], vendedor
     )
+    if not len(produtos):
+        raise Exception("Falha ao acessar SKUs, mesmo após renovação de token.")
 
     # Coleta pedidos
-    pedidos_raw = listar_pedidos(headers, refresh_token_func=refresh_token_func)
-    pedidos = processar_pedidos(pedidos_raw) if pedidos_raw else []
+    pedidos = coletar_pedidos(headers, refresh_token_func)
 
     # Salva no banco
-    salvar_no_banco(produtos, atributos, imagens, pedidos, vendedor)
+    with tempos.etapa("gravacao_banco"):
+        salvar_no_banco(pedidos, vendedor)
 
-    # Gera erros de qualidade e salva no banco
-    df_produtos = pd.DataFrame(produtos)
-    df_imagens = pd.DataFrame(imagens)
-    df_atributos = pd.DataFrame(atributos)
-    df_erros = tratar_dados(df_produtos, df_imagens, df_atributos)
-    salvar_erros_no_banco(df_erros, vendedor)
+    verificar_qualidade(produtos, atributos, imagens, vendedor)
 
+    arquivo_bruto.concluir()
     print(f"\nColeta Magalu finalizada para {vendedor}")
     return f"\nColeta Magalu finalizada para {vendedor}"
+
+# Reprocessa a última coleta completa arquivada do vendedor (arquivo_bruto) com as funções
+# atuais de transformação e qualidade, sem acessar a API
+def reprocessar(vendedor):
+    execucoes = arquivo_bruto.selecionar(arquivo_bruto.listar_execucoes("magalu", vendedor))
+    if not execucoes:
+        return f"Nenhuma coleta completa arquivada para {vendedor}."
+    particoes.preparar(get_connection, TABELAS_PARTICIONADAS, "magalu")
+
+    produtos, atributos, imagens = lotes_skus()
+    for registro in arquivo_bruto.ler("magalu", vendedor, "skus", execucoes):
+        produto, atributos_sku, imagens_sku = montar_registros_sku(
+            registro["item"], registro["info"], registro["preco"], registro["estoque"]
+        )
+        produtos.acrescentar(produto)
+        atributos.estender(atributos_sku)
+        imagens.estender(imagens_sku)
+    pedidos = colunar.Lote.de_registros(
+        ESQUEMA_PEDIDOS,
+        processar_pedidos({"results": list(arquivo_bruto.ler("magalu", vendedor, "pedidos", execucoes))})
+    )
+
+    sonda_imagens.atualizar_resolucoes_lote(imagens, get_connection, somente_cache=True)
+    limpar_staging(vendedor)
+    salvar_no_staging(produtos, atributos, imagens, vendedor)
+    salvar_no_banco(pedidos, vendedor)
+    verificar_qualidade(produtos, atributos, imagens, vendedor, somente_cache=True)
+
+    return f"Reprocessados {len(produtos)} SKUs e {len(pedidos)} pedidos de {vendedor}."
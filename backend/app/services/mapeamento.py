@@ -0,0 +1,180 @@
+# ------------------------- MAPEAMENTO DECLARATIVO DE CAMPOS ----------------------------
+
+# Achata os payloads das APIs em registros a partir de uma especificação por entidade,
+# compilada uma única vez (no import do serviço) em uma função Python gerada: cada prefixo
+# de caminho ("inventoryDetails", "inventoryDetails.reservedQuantity"...) é lido uma vez
+# por registro, e traduções e funções viram referências diretas, sem interpretar a
+# especificação a cada linha.
+#
+# A especificação é um dict {campo_de_saida: regra}, na ordem das colunas. A regra é um
+# caminho ("a.b.0.c"; números indexam listas) ou um dict com:
+#   caminho         caminho no payload
+#   padrao          valor quando o caminho não existe (como dict.get; padrão None)
+#   se_nulo         valor quando o caminho existe com null
+#   se_vazio        valor quando o resultado é vazio (None, "", 0, []) ou está em 'vazios'
+#   vazios          valores tratados como vazios além dos falsos (ex.: "----------")
+#   traducao        dict aplicado ao valor (mapa.get(valor, valor))
+#   chave_traducao  função aplicada ao valor antes da busca na tradução (ex.: str.upper)
+#   funcao          função aplicada ao valor ao final
+#   conforme        {"campo": <campo anterior>, "valores": {valor_do_campo: substituto}}:
+#                   substitui o valor conforme um campo já extraído (ex.: pedido cancelado)
+#   contexto        nome de um valor passado na chamada (vendedor, data_registro...)
+#   valor           constante
+#   derivado        função do payload inteiro, para campos que não são um caminho
+# Nessa ordem: padrao, se_nulo, se_vazio, traducao, funcao, conforme.
+#
+# 'obrigatorios' (campos que precisam sair preenchidos) e 'descartar' ({campo: valores})
+# filtram os registros: o registro que não passa vira None na extração de um payload e é
+# omitido em varios(). varios() é compilado como um laço próprio, com o contexto lido
+# uma vez por chamada.
+#
+# Os valores padrão e constantes são compartilhados entre os registros: não devem ser
+# modificados depois da extração.
+
+_VAZIO_DICT = {}
+_VAZIO_LISTA = ()
+
+_OPCOES = {
+    "caminho", "padrao", "se_nulo", "se_vazio", "vazios", "traducao", "chave_traducao",
+    "funcao", "conforme", "contexto", "valor", "derivado"
+}
+
+class Mapeamento:
+    def __init__(self, nome, campos, obrigatorios=(), descartar=None):
+        self.nome = nome
+        self.campos = {campo: _normalizar(nome, campo, regra) for campo, regra in campos.items()}
+        filtros = _filtros(nome, self.campos, obrigatorios, descartar or {})
+        self.codigo, funcoes = _compilar(nome, self.campos, filtros)
+        # As funções geradas são chamadas diretamente, sem um método intermediário:
+        #   extrair(origem, contexto={})  um registro a partir de um payload
+        #   varios(origens, contexto={})  registros de vários payloads com o mesmo contexto
+        self.extrair = funcoes["extrair"]
+        self.varios = funcoes["varios"]
+
+def compilar(nome, campos, obrigatorios=(), descartar=None):
+    return Mapeamento(nome, campos, obrigatorios, descartar)
+
+# ------------------------- COMPILAÇÃO ----------------------------
+
+def _normalizar(nome, campo, regra):
+    if isinstance(regra, str):
+        regra = {"caminho": regra}
+    desconhecidas = set(regra) - _OPCOES
+    if desconhecidas:
+        raise ValueError(f"Mapeamento {nome}, campo {campo}: opções desconhecidas {sorted(desconhecidas)}")
+    fontes = [opcao for opcao in ("caminho", "contexto", "valor", "derivado") if opcao in regra]
+    if len(fontes) != 1:
+        raise ValueError(f"Mapeamento {nome}, campo {campo}: informe exatamente um de caminho, contexto, valor ou derivado")
+    if "caminho" in regra:
+        regra = {**regra, "caminho": [int(p) if p.isdigit() else p for p in regra["caminho"].split(".")]}
+    return regra
+
+def _filtros(nome, campos, obrigatorios, descartar):
+    for campo in list(obrigatorios) + list(descartar):
+        if campo not in campos:
+            raise ValueError(f"Mapeamento {nome}: filtro com campo desconhecido {campo}")
+    return [(campo, None) for campo in obrigatorios] + [(campo, frozenset(valores)) for campo, valores in descartar.items()]
+
+# Gera o corpo da extração de um registro (linhas sem indentação) e o compila duas vezes:
+# extrair(o, contexto) e varios(origens, contexto), com o corpo dentro do laço
+def _compilar(nome, campos, filtros):
+    constantes = {"_VAZIO_DICT": _VAZIO_DICT, "_VAZIO_LISTA": _VAZIO_LISTA}
+    linhas = []
+    do_contexto = {}
+    prefixos = {(): "o"}
+    variaveis = {}
+
+    # Literais simples vão direto no código; o resto vira uma referência
+    def constante(valor):
+        if valor is None or valor.__class__ in (bool, int, str):
+            return repr(valor)
+        nome_constante = f"_k{len(constantes)}"
+        constantes[nome_constante] = valor
+        return nome_constante
+
+    # Variável com o contêiner no prefixo informado (dict ou lista, conforme o próximo segmento)
+    def conteiner(prefixo, proximo):
+        if prefixo in prefixos:
+            return prefixos[prefixo]
+        pai = conteiner(prefixo[:-1], prefixo[-1])
+        variavel = f"p{len(prefixos)}"
+        prefixos[prefixo] = variavel
+        linhas.append(f"{variavel} = {_acesso(pai, prefixo[-1], 'None')}")
+        if isinstance(proximo, int):
+            linhas.append(f"if {variavel}.__class__ is not list and {variavel}.__class__ is not tuple: {variavel} = _VAZIO_LISTA")
+        else:
+            linhas.append(f"if {variavel}.__class__ is not dict: {variavel} = _VAZIO_DICT")
+        return variavel
+
+    for posicao, (campo, regra) in enumerate(campos.items()):
+        v = f"c{posicao}"
+        variaveis[campo] = v
+        if "valor" in regra:
+            linhas.append(f"{v} = {constante(regra['valor'])}")
+        elif "contexto" in regra:
+            do_contexto.setdefault(regra["contexto"], f"x{len(do_contexto)}")
+            if set(regra) == {"contexto"}:
+                variaveis[campo] = do_contexto[regra["contexto"]]
+                continue
+            linhas.append(f"{v} = {do_contexto[regra['contexto']]}")
+        elif "derivado" in regra:
+            linhas.append(f"{v} = {constante(regra['derivado'])}(o)")
+        else:
+            caminho = tuple(regra["caminho"])
+            pai = conteiner(caminho[:-1], caminho[-1])
+            linhas.append(f"{v} = {_acesso(pai, caminho[-1], constante(regra.get('padrao')))}")
+
+        if "se_nulo" in regra:
+            linhas.append(f"if {v} is None: {v} = {constante(regra['se_nulo'])}")
+        if "se_vazio" in regra:
+            condicao = f"not {v}"
+            if regra.get("vazios"):
+                condicao += f" or {v} in {constante(tuple(regra['vazios']))}"
+            linhas.append(f"if {condicao}: {v} = {constante(regra['se_vazio'])}")
+        if "traducao" in regra:
+            traducao = constante(regra["traducao"])
+            if "chave_traducao" in regra:
+                chave = constante(regra["chave_traducao"])
+                linhas.append(f"if {v}.__class__ is str: {v} = {traducao}.get({chave}({v}), {v})")
+            else:
+                linhas.append(f"if {v}.__hash__ is not None: {v} = {traducao}.get({v}, {v})")
+        if "funcao" in regra:
+            linhas.append(f"{v} = {constante(regra['funcao'])}({v})")
+        if "conforme" in regra:
+            referencia = regra["conforme"]["campo"]
+            if referencia not in variaveis or referencia == campo:
+                raise ValueError(f"Mapeamento {nome}, campo {campo}: 'conforme' deve usar um campo anterior")
+            substitutos = constante(regra["conforme"]["valores"])
+            ref = variaveis[referencia]
+            linhas.append(f"if {ref}.__hash__ is not None and {ref} in {substitutos}: {v} = {substitutos}[{ref}]")
+
+    condicoes = []
+    for campo, valores in filtros:
+        if valores is None:
+            condicoes.append(f"not {variaveis[campo]}")
+        else:
+            condicoes.append(f"({variaveis[campo]}.__hash__ is not None and {variaveis[campo]} in {constante(valores)})")
+    registro = "{" + ", ".join(f"{campo!r}: {variaveis[campo]}" for campo in campos) + "}"
+    leituras = [f"{variavel} = contexto.get({chave!r})" for chave, variavel in do_contexto.items()]
+
+    codigo = ["def extrair(o, contexto=_VAZIO_DICT):"]
+    codigo += [f"    {linha}" for linha in leituras + linhas]
+    if condicoes:
+        codigo.append(f"    if {' or '.join(condicoes)}: return None")
+    codigo.append(f"    return {registro}")
+    codigo += ["", "def varios(origens, contexto=_VAZIO_DICT):", "    registros = []", "    acrescentar = registros.append"]
+    codigo += [f"    {linha}" for linha in leituras]
+    codigo.append("    for o in origens:")
+    codigo += [f"        {linha}" for linha in linhas]
+    if condicoes:
+        codigo.append(f"        if {' or '.join(condicoes)}: continue")
+    codigo += [f"        acrescentar({registro})", "    return registros"]
+    codigo = "\n".join(codigo) + "\n"
+    exec(compile(codigo, f"<mapeamento {nome}>", "exec"), constantes)
+    return codigo, constantes
+
+# Leitura de um segmento do caminho em um contêiner já validado
+def _acesso(pai, segmento, padrao):
+    if isinstance(segmento, int):
+        return f"{pai}[{segmento}] if len({pai}) > {segmento} else {padrao}"
+    return f"{pai}.get({segmento!r}, {padrao})"
@@ -1,15 +1,14 @@
-import requests
 import time
+import httpx
+import asyncio
 import json
 import pandas as pd
 import os
 from dotenv import load_dotenv
 from datetime import datetime
-import psycopg2
 from psycopg2.extras import execute_values
-import io
-import zipfile
 import pytz
+from app.services import metricas, tempos, recursos, checkpoints, cliente_async, sonda_imagens, imagens_duplicadas, relatorios, particoes, documentos, arquivo_bruto, escrita_staging, mapeamento, qualidade
 
 # ------------------------- VARIÁVEIS DE AMBIENTE ----------------------------
 
@@ -23,19 +22,33 @@ client_secret = os.getenv('MERCADOLIVRE_CLIENT_SECRET')
 # Conexão com o banco de dados PostgreSQL
 def get_connection():
     try:
-        conn = psycopg2.connect(
+        conn = recursos.conectar(
+            "mercadolivre",
             host=os.getenv("MERCADOLIVRE_DB_HOST"),
             port=os.getenv("MERCADOLIVRE_DB_PORT"),
             dbname=os.getenv("MERCADOLIVRE_DB_NAME"),
             user=os.getenv("MERCADOLIVRE_DB_USER"),
             password=os.getenv("MERCADOLIVRE_DB_PASSWORD"),
-            sslmode="require"
+            sslmode=os.getenv("MERCADOLIVRE_DB_SSLMODE", "require")
         )
         return conn
     except Exception as e:
         print("\nErro ao conectar com o banco de dados no Supabase:", e)
         return None
 
+# Tabelas preenchidas pela coleta (gravadas primeiro no staging stg_<tabela>)
+TABELAS_COLETA = ["produtos", "imagens", "atributos", "variacoes"]
+
+# Tabelas particionadas por dia de data_registro (particoes.py)
+TABELAS_PARTICIONADAS = TABELAS_COLETA + ["erros_qualidade"]
+
+# Tabelas com um documento JSONB por SKU (documentos.py)
+TABELAS_DOCUMENTOS = ["atributos", "variacoes"]
+
+def agora():
+    fuso_brasilia = pytz.timezone("America/Sao_Paulo")
+    return datetime.now(fuso_brasilia).replace(tzinfo=None)
+
 # ------------------------- TOKENS ----------------------------
 
 # Carrega os tokens do ambiente
@@ -52,17 +65,20 @@ def load_tokens():
     return {}
 
 # Obtém o nickname do vendedor usando o seller_id e access_token
-def get_nickname(seller_id, access_token):
+async def get_nickname_async(seller_id, access_token):
     url = f"{url_base}/users/{seller_id}"
     headers = {'Authorization': f'Bearer {access_token}'}
-    response = requests.get(url, headers=headers)
+    response = await cliente_async.requisitar("mercadolivre", "GET", url, headers=headers)
     if response.status_code == 200:
         return response.json().get('nickname')
     else:
         raise Exception("Erro ao obter o nickname do vendedor")
 
+def get_nickname(seller_id, access_token):
+    return cliente_async.executar_sync(get_nickname_async(seller_id, access_token))
+
 # Renova o access_token usando o refresh_token
-def refresh_access_token(client_id, client_secret, refresh_token, nickname, seller_id):
+async def refresh_access_token_async(client_id, client_secret, refresh_token, nickname, seller_id):
     url = f"{url_base}/oauth/token"
     payload = {
         'grant_type': 'refresh_token',
@@ -70,23 +86,33 @@ def refresh_access_token(client_id, client_secret, refresh_token, nickname, sell
         'client_secret': client_secret,
         'refresh_token': refresh_token
     }
-    response = requests.post(url, data=payload)
+    response = await cliente_async.requisitar("mercadolivre", "POST", url, data=payload)
     if response.status_code == 200:
         data = response.json()
         new_access_token = data['access_token']
         new_refresh_token = data.get('refresh_token', refresh_token)
+        metricas.renovacoes_token.inc(plataforma="mercadolivre", resultado="sucesso")
         print("Token renovado com sucesso!")
         return new_access_token, new_refresh_token
     else:
+        metricas.renovacoes_token.inc(plataforma="mercadolivre", resultado="falha")
         print(f"\nErro ao renovar token: Status {response.status_code}")
         raise Exception()
 
+def refresh_access_token(client_id, client_secret, refresh_token, nickname, seller_id):
+    return cliente_async.executar_sync(
+        refresh_access_token_async(client_id, client_secret, refresh_token, nickname, seller_id)
+    )
+
 # ------------------------- CHAMADAS API ----------------------------
 
-# Fazer requisições à API do Mercado Livre
-def make_request(url, headers, params=None, refresh_token_func=None):
+# Fazer requisições à API do Mercado Livre. refresh_token_func pode ser síncrona ou assíncrona
+# e deve retornar os headers atualizados.
+async def make_request_async(url, headers, params=None, refresh_token_func=None):
+    inicio = time.perf_counter()
     try:
-        response = requests.get(url, headers=headers, params=params, timeout=30)
+        response = await cliente_async.requisitar("mercadolivre", "GET", url, headers=headers, params=params, timeout=30)
+        metricas.observar_requisicao("mercadolivre", url, response.status_code, time.perf_counter() - inicio)
         if response.status_code == 200:
             return response
         else:
@@ -94,8 +120,10 @@ def make_request(url, headers, params=None, refresh_token_func=None):
 
         if response.status_code == 401 and refresh_token_func:
             print("Token expirado. Tentando renovar...")
-            headers = refresh_token_func()
-            response = requests.get(url, headers=headers, params=params, timeout=30)
+            headers = await cliente_async.chamar(refresh_token_func)
+            inicio = time.perf_counter()
+            response = await cliente_async.requisitar("mercadolivre", "GET", url, headers=headers, params=params, timeout=30)
+            metricas.observar_requisicao("mercadolivre", url, response.status_code, time.perf_counter() - inicio)
             if response.status_code == 200:
                 return response
             else:
@@ -103,12 +131,16 @@ def make_request(url, headers, params=None, refresh_token_func=None):
 
         return None
 
-    except requests.exceptions.RequestException as e:
+    except httpx.HTTPError as e:
+        metricas.observar_requisicao("mercadolivre", url, "erro", time.perf_counter() - inicio)
         print("Erro na requisição:", e)
         return None
 
+def make_request(url, headers, params=None, refresh_token_func=None):
+    return cliente_async.executar_sync(make_request_async(url, headers, params, refresh_token_func))
+
 # Obtém todos os IDs de produtos do vendedor
-def get_all_product_ids(seller_id, headers, refresh_token_func):
+async def get_all_product_ids_async(seller_id, headers, refresh_token_func):
     url = f"{url_base}/users/{seller_id}/items/search"
     all_ids = []
     scroll_id = None
@@ -116,7 +148,7 @@ def get_all_product_ids(seller_id, headers, refresh_token_func):
     while True:
         if scroll_id:
             params['scroll_id'] = scroll_id
-        response = make_request(url, params=params, headers=headers, refresh_token_func=refresh_token_func)
+        response = await make_request_async(url, params=params, headers=headers, refresh_token_func=refresh_token_func)
         if response is None or response.status_code != 200:
             print(f"Erro ao obter IDs de produtos: status {response.status_code if response else 'sem resposta'}")
             break
@@ -126,11 +158,14 @@ def get_all_product_ids(seller_id, headers, refresh_token_func):
         if not produtos:
             break
         all_ids.extend(produtos)
-        time.sleep(0.5)
+        await asyncio.sleep(0.5)
         if not scroll_id:
             break
     return all_ids
 
+def get_all_product_ids(seller_id, headers, refresh_token_func):
+    return cliente_async.executar_sync(get_all_product_ids_async(seller_id, headers, refresh_token_func))
+
 # Obtém detalhes do produto usando o item_id
 def get_product_details(item_id, headers, refresh_token_func):
     url = f"{url_base}/items/{item_id}"
@@ -162,7 +197,101 @@ def buscar_categoria_produto(category_id, headers, refresh_token_func):
 
 # Caso os dados dos produtos sejam obtidos de vários endpoints, eles devem ser combinados aqui.
 
-# Obtém todos os dados de produtos de um vendedor
+# ------------------------- MAPEAMENTOS DOS PAYLOADS ----------------------------
+
+# Especificações dos registros (mapeamento.py), compiladas no import. descricao e
+# nome_categoria vêm de outros endpoints e entram pelo contexto.
+
+TRADUCAO_STATUS = {
+    "closed": "Fechado",
+    "active": "Ativo",
+    "paused": "Pausado"
+}
+
+def tratar_garantia(garantia):
+    if garantia is None or str(garantia).lower() == "null":
+        return "Sem garantia informada"
+    return garantia
+
+def juntar_links(imagens):
+    return ', '.join([img.get('secure_url') for img in imagens if img.get('secure_url')])
+
+# value_name do primeiro atributo do item com o id informado (GTIN, BRAND...)
+def valor_atributo(id_atributo):
+    def extrair(detalhes):
+        return next((a.get('value_name') for a in detalhes.get('attributes', []) if a.get('id') == id_atributo), '')
+    return extrair
+
+MAPA_PRODUTO = mapeamento.compilar("mercadolivre.produtos", {
+    "sku_id": "id",
+    "titulo": {"caminho": "title", "padrao": ""},
+    "descricao": {"contexto": "descricao"},
+    "categoria_id": "category_id",
+    "nome_categoria": {"contexto": "nome_categoria"},
+    "preco": {"caminho": "price", "padrao": 0},
+    "quantidade_variacoes": {"caminho": "variations", "padrao": [], "funcao": len},
+    "status": {"caminho": "status", "padrao": "", "traducao": TRADUCAO_STATUS},
+    "health": {"caminho": "health", "padrao": ""},
+    "quantidade_inicial": {"caminho": "initial_quantity", "padrao": 0},
+    "quantidade_vendida": {"caminho": "sold_quantity", "padrao": 0},
+    "quantidade_disponivel": {"caminho": "available_quantity", "padrao": 0},
+    "gtin": {"derivado": valor_atributo("GTIN")},
+    "marca": {"derivado": valor_atributo("BRAND")},
+    "permalink": {"caminho": "permalink", "padrao": ""},
+    "aceita_mercado_pago": {"caminho": "accepts_mercadopago", "padrao": False},
+    "garantia": {"caminho": "warranty", "funcao": tratar_garantia},
+    "imagens": {"caminho": "pictures", "padrao": [], "funcao": len},
+    "link_imagem": {"caminho": "pictures", "padrao": [], "funcao": juntar_links}
+})
+
+# Só os atributos preenchidos
+MAPA_ATRIBUTO = mapeamento.compilar("mercadolivre.atributos", {
+    "sku_id": {"contexto": "sku_id"},
+    "atributo": {"caminho": "name", "padrao": ""},
+    "valor": {"caminho": "value_name", "padrao": ""}
+}, obrigatorios=["atributo", "valor"], descartar={"atributo": ["IdProduct"]})
+
+MAPA_IMAGEM = mapeamento.compilar("mercadolivre.imagens", {
+    "id_imagem": "id",
+    "sku_id": {"contexto": "sku_id"},
+    "secure_url": "secure_url",
+    "resolucao": "size"
+})
+
+# Uma linha por atributo de cada variação (attribute_combinations)
+MAPA_VARIACAO = mapeamento.compilar("mercadolivre.variacoes", {
+    "sku_id": {"contexto": "sku_id"},
+    "id_variacao": {"contexto": "id_variacao"},
+    "preco_variacao": {"contexto": "preco_variacao"},
+    "atributo": "name",
+    "valor": "value_name"
+})
+
+# Monta os registros de produto, imagens, atributos e variações de um item
+def montar_registros_item(detalhes, descricao, nome_categoria):
+    produto = MAPA_PRODUTO.extrair(detalhes, {"descricao": tratar_descricao(descricao), "nome_categoria": nome_categoria})
+    sku_id = produto["sku_id"]
+    contexto = {"sku_id": sku_id}
+
+    # ATRIBUTOS
+    atributos = MAPA_ATRIBUTO.varios(detalhes.get('attributes', []), contexto)
+
+    # IMAGENS
+    imagens = MAPA_IMAGEM.varios(detalhes.get('pictures', []), contexto)
+
+    # VARIAÇÕES
+    variacoes = []
+    for variacao in detalhes.get('variations', []):
+        variacoes.extend(MAPA_VARIACAO.varios(
+            variacao.get('attribute_combinations', []),
+            {"sku_id": sku_id, "id_variacao": variacao.get('id'), "preco_variacao": variacao.get('price')}
+        ))
+
+    return produto, imagens, atributos, variacoes
+
+# Obtém todos os dados de produtos de um vendedor e grava no staging, com checkpoint a cada
+# checkpoints.ITENS_POR_CHECKPOINT itens. Se houver checkpoint válido, retoma dele. Os
+# lotes são gravados em segundo plano enquanto os itens seguintes são buscados.
 def obter_todos_os_dados(seller_id, access_token, refresh_token, nickname):
     time.sleep(0.5)
     token_data = {'access_token': access_token, 'refresh_token': refresh_token}
@@ -177,7 +306,23 @@ def obter_todos_os_dados(seller_id, access_token, refresh_token, nickname):
         headers['Authorization'] = f'Bearer {new_access_token}'
         return headers
 
-    produtos_ids = get_all_product_ids(seller_id, headers, refresh_token_func)
+    conn = get_connection()
+    if not conn:
+        raise Exception("Erro ao conectar com o banco de dados no Supabase.")
+    try:
+        checkpoint = checkpoints.carregar(conn, nickname, TABELAS_COLETA, agora())
+        if checkpoint:
+            produtos_ids = checkpoint["ids"]
+            posicao = checkpoint["posicao"]
+            arquivo_bruto.marcar_retomada()
+            print(f"\nRetomando coleta de {nickname} a partir do item {posicao} de {len(produtos_ids)}.")
+        else:
+            with tempos.etapa("listagem_ids"):
+                produtos_ids = get_all_product_ids(seller_id, headers, refresh_token_func)
+            checkpoints.iniciar(conn, nickname, produtos_ids, TABELAS_COLETA, agora())
+            posicao = 0
+    finally:
+        conn.close()
 
     produtos = []
     imagens = []
@@ -187,82 +332,40 @@ def obter_todos_os_dados(seller_id, access_token, refresh_token, nickname):
     print(f"\nToken validado!")
     print(f"\nTotal de SKUs coletados: {len(produtos_ids)}\n")
 
-    for item_id in produtos_ids:
-        detalhes = get_product_details(item_id, headers, refresh_token_func)
-        if not detalhes:
-            continue
-
-        descricao = get_product_description(item_id, headers, refresh_token_func)
-        descricao_tratada = tratar_descricao(descricao)
-        nome_categoria = buscar_categoria_produto(detalhes.get('category_id'), headers, refresh_token_func)
-        imagens_item = detalhes.get('pictures', [])
-        atributos_item = detalhes.get('attributes', [])
-        variacoes_item = detalhes.get('variations', [])
-
-        # Garantia
-        garantia_valor = detalhes.get('warranty')
-        if garantia_valor is None or str(garantia_valor).lower() == "null":
-            garantia_valor = "Sem garantia informada"
-
-        # PRODUTOS
-        produto = {
-            "sku_id": detalhes.get('id'),
-            "titulo": detalhes.get('title', ''),
-            "descricao": descricao_tratada,
-            "categoria_id": detalhes.get('category_id'),
-            "nome_categoria": nome_categoria,
-            "preco": detalhes.get('price', 0),
-            "quantidade_variacoes": len(variacoes_item),
-            "status": traduzir_status(detalhes.get('status', '')),
-            "health": detalhes.get('health', ''),
-            "quantidade_inicial": detalhes.get('initial_quantity', 0),
-            "quantidade_vendida": detalhes.get('sold_quantity', 0),
-            "quantidade_disponivel": detalhes.get('available_quantity', 0),
-            "gtin": next((a.get('value_name') for a in atributos_item if a.get('id') == 'GTIN'), ''),
-            "marca": next((a.get('value_name') for a in atributos_item if a.get('id') == 'BRAND'), ''),
-            "permalink": detalhes.get('permalink', ''),
-            "aceita_mercado_pago": detalhes.get('accepts_mercadopago', False),
-            "garantia": garantia_valor,
-            "imagens": len(imagens_item),
-            "link_imagem": ', '.join([img.get('secure_url') for img in imagens_item if img.get('secure_url')])
-        }
-        produtos.append(produto)
-
-        # ATRIBUTOS
-        for attr in atributos_item:
-            nome = attr.get("name", "")
-            valor = attr.get("value_name", "")
-            if nome and valor and nome != "IdProduct":
-                atributos.append({
-                    "sku_id": detalhes.get('id'),
-                    "atributo": nome,
-                    "valor": valor
-                })
-
-        # IMAGENS
-        for img in imagens_item:
-            imagens.append({
-                "id_imagem": img.get("id"),
-                "sku_id": detalhes.get('id'),
-                "secure_url": img.get("secure_url"),
-                "resolucao": img.get("size")
-            })
-
-        # VARIAÇÕES
-        for variacao in variacoes_item:
-            id_variacao = variacao.get('id')
-            preco_variacao = variacao.get('price')
-            atributos_var = variacao.get('attribute_combinations', [])
-            for atributo in atributos_var:
-                variacoes.append({
-                    'sku_id': detalhes.get('id'),
-                    'id_variacao': id_variacao,
-                    'preco_variacao': preco_variacao,
-                    'atributo': atributo.get('name'),
-                    'valor': atributo.get('value_name')
-                })
-
-    return produtos, imagens, atributos, variacoes
+    with escrita_staging.GravadorEmSegundoPlano(gravar_lote) as gravador:
+        for indice in range(posicao, len(produtos_ids)):
+            item_id = produtos_ids[indice]
+            with tempos.etapa("detalhes"):
+                detalhes = get_product_details(item_id, headers, refresh_token_func)
+
+            if detalhes:
+                with tempos.etapa("descricoes_categorias"):
+                    descricao = get_product_description(item_id, headers, refresh_token_func)
+                    nome_categoria = buscar_categoria_produto(detalhes.get('category_id'), headers, refresh_token_func)
+                arquivo_bruto.registrar("itens", {"detalhes": detalhes, "descricao": descricao, "nome_categoria": nome_categoria})
+
+                with tempos.etapa("transformacao"):
+                    produto, imagens_item, atributos_item, variacoes_item = montar_registros_item(
+                        detalhes, descricao, nome_categoria
+                    )
+                produtos.append(produto)
+                imagens.extend(imagens_item)
+                atributos.extend(atributos_item)
+                variacoes.extend(variacoes_item)
+
+            if (indice + 1 - posicao) % checkpoints.ITENS_POR_CHECKPOINT == 0:
+                gravador.enviar(produtos, imagens, atributos, variacoes, nickname, indice + 1)
+                produtos, imagens, atributos, variacoes = [], [], [], []
+
+        gravador.enviar(produtos, imagens, atributos, variacoes, nickname, len(produtos_ids))
+
+# Grava um lote de itens no staging: resolução das imagens, registros e checkpoint
+def gravar_lote(produtos, imagens, atributos, variacoes, vendedor, posicao):
+    with tempos.etapa("sondagem_imagens"):
+        sonda_imagens.atualizar_resolucoes(imagens, get_connection)
+    with tempos.etapa("gravacao_staging"):
+        salvar_no_staging(produtos, imagens, atributos, variacoes, vendedor, posicao)
+    arquivo_bruto.descarregar()
 
 # ------------------------- TRATAMENTO DE DADOS ----------------------------
 
@@ -274,238 +377,174 @@ def tratar_descricao(descricao):
 
 # Traduz o status do produto
 def traduzir_status(status):
-    if status == "closed":
-        return "Fechado"
-    elif status == "active":
-        return "Ativo"
-    elif status == "paused":
-        return "Pausado"
-    return status
-
-# Trata os dados verificando erros comuns e salvando um relatório de erros
-def tratar_dados(df_produtos, df_imagens, df_atributos):
-    def contar_imagens_baixa_resolucao(resolucoes):
-        baixa = 0
-        for r in resolucoes:
-            try:
-                w, h = map(int, r.lower().split('x'))
-                if w < 1000 or h < 1000:
-                    baixa += 1
-            except:
-                continue
-        return baixa
-
-    erros = []
-
-    for _, row in df_produtos.iterrows():
-        sku_id = row['sku_id']
-        titulo = row['titulo']
-        descricao = row['descricao']
-        status = row.get('status', '')
-
-        descricao_tratada = tratar_descricao(descricao)
-        status_traduzido = traduzir_status(status)
-
-        garantia = row.get('garantia', '')
-        if garantia is None or str(garantia).strip().lower() in ["", "null", "sem garantia informada"]:
-            garantia_erro = "Sem garantia informada"
-        else:
-            garantia_erro = "OK"
-
-        imagens_produto = df_imagens[df_imagens['sku_id'] == sku_id] if df_imagens is not None else pd.DataFrame()
-        qtd_imagens = len(imagens_produto)
-        qtd_imagem_msg = "OK" if qtd_imagens >= 6 else f"Necessário adicionar mais {6 - qtd_imagens} imagens"
-
-        resolucoes = imagens_produto['resolucao'].dropna().tolist() if 'resolucao' in imagens_produto else []
-        baixa_qtd = contar_imagens_baixa_resolucao(resolucoes)
-        resolucao_msg = "OK" if baixa_qtd == 0 else f"{baixa_qtd} imagens com a qualidade baixa"
-
-        descricao_msg = "OK" if pd.notna(descricao) and str(descricao).strip() != "" and len(descricao) > 500 else "Necessário preencher"
-        titulo_msg = "OK" if pd.notna(titulo) and 50 <= len(str(titulo)) <= 60 else "Necessário preencher"
-
-        atributos_produto = df_atributos[df_atributos['sku_id'] == sku_id] if df_atributos is not None else pd.DataFrame()
-        atributos_vazios = atributos_produto['valor'].isna().sum() + (atributos_produto['valor'] == '').sum() if 'valor' in atributos_produto else 0
-        atributos_msg = f"{atributos_vazios} campos vazios"
-
-        erros.append({
-            'sku_id': sku_id,
-            'produto': titulo,
-            'status': status,
-            'titulo': titulo_msg,
-            'qtd_imagem': qtd_imagem_msg,
-            'resolucao_imagem': resolucao_msg,
-            'descricao': descricao_msg,
-            'garantia': garantia_erro,
-            'atributos': atributos_msg
-        })
-
-    df_erros_gerais = pd.DataFrame(erros)
+    return TRADUCAO_STATUS.get(status, status)
+
+# Trata os dados verificando erros comuns e salvando um relatório de erros.
+# As verificações são as regras do Mercado Livre em qualidade.REGRAS, avaliadas de uma vez
+# sobre as três tabelas; 'duplicadas' ({sku_id: quantidade}) vem da etapa opcional de
+# imagens duplicadas.
+@metricas.cronometrar_tratamento("mercadolivre")
+def tratar_dados(df_produtos, df_imagens, df_atributos, duplicadas=None):
+    verificacoes = qualidade.avaliar("mercadolivre", "produtos", df_produtos, imagens=df_imagens, atributos=df_atributos)
+    df_erros_gerais = pd.DataFrame({
+        'sku_id': df_produtos['sku_id'],
+        'produto': df_produtos['titulo'],
+        'status': df_produtos['status'] if 'status' in df_produtos else '',
+        **{coluna: verificacoes[coluna] for coluna in verificacoes.columns},
+        'imagens_duplicadas': [imagens_duplicadas.mensagem(duplicadas, sku_id) for sku_id in df_produtos['sku_id']]
+    }).reset_index(drop=True)
     return df_erros_gerais
 
 # ------------------------- SALVAR NO BANCO DE DADOS ----------------------------
 
-# Limpa dados antigos do vendedor
-def limpar_dados_antigos(vendedor):
+# Insere (ou atualiza) os registros nas tabelas de staging (stg_*) usando o cursor informado.
+# Os ON CONFLICT usam as chaves do staging: as tabelas do dia têm data_registro na chave.
+def inserir_registros(cursor, produtos, imagens, atributos, variacoes, vendedor, data_registro, batch_size=500):
+    # PRODUTOS
+    produtos_valores = escrita_staging.unicas([
+        (
+            p['sku_id'], p['titulo'], p['descricao'], p['categoria_id'], p['nome_categoria'],
+            p['preco'], p['quantidade_variacoes'],
+            p['status'], p['health'], p['quantidade_inicial'], p['quantidade_vendida'],
+            p['quantidade_disponivel'], p['gtin'], p['marca'], p['permalink'],
+            p['aceita_mercado_pago'], p['garantia'], p['imagens'], p['link_imagem'], vendedor, data_registro
+        )
+        for p in produtos
+    ], [0])
+
+    query_produto = """
+        INSERT INTO stg_produtos (
+            sku_id, titulo, descricao, categoria_id, nome_categoria,
+            preco, quantidade_variacoes,
+            status, health, quantidade_inicial, quantidade_vendida,
+            quantidade_disponivel, gtin, marca, permalink,
+            aceita_mercado_pago, garantia, imagens, link_imagem, vendedor, data_registro
+        )
+        VALUES %s
+        ON CONFLICT (sku_id, vendedor) DO UPDATE SET
+            titulo = EXCLUDED.titulo,
+            descricao = EXCLUDED.descricao,
+            categoria_id = EXCLUDED.categoria_id,
+            nome_categoria = EXCLUDED.nome_categoria,
+            preco = EXCLUDED.preco,
+            quantidade_variacoes = EXCLUDED.quantidade_variacoes,
+            status = EXCLUDED.status,
+            health = EXCLUDED.health,
+            quantidade_inicial = EXCLUDED.quantidade_inicial,
+            quantidade_vendida = EXCLUDED.quantidade_vendida,
+            quantidade_disponivel = EXCLUDED.quantidade_disponivel,
+            gtin = EXCLUDED.gtin,
+            marca = EXCLUDED.marca,
+            permalink = EXCLUDED.permalink,
+            aceita_mercado_pago = EXCLUDED.aceita_mercado_pago,
+            garantia = EXCLUDED.garantia,
+            imagens = EXCLUDED.imagens,
+            link_imagem = EXCLUDED.link_imagem,
+            vendedor = EXCLUDED.vendedor,
+            data_registro = EXCLUDED.data_registro;
+    """
+
+    with metricas.cronometrar_escrita("mercadolivre", "stg_produtos", len(produtos_valores)):
+        for i in range(0, len(produtos_valores), batch_size):
+            execute_values(cursor, query_produto, produtos_valores[i:i+batch_size], page_size=batch_size)
+
+    # IMAGENS
+    imagens_valores = escrita_staging.unicas([
+        (img['id_imagem'], img['sku_id'], img['secure_url'], img['resolucao'], vendedor, data_registro)
+        for img in imagens
+    ], [0, 1])
+
+    query_imagem = """
+        INSERT INTO stg_imagens (id_imagem, sku_id, secure_url, resolucao, vendedor, data_registro)
+        VALUES %s
+        ON CONFLICT (id_imagem, sku_id, vendedor) DO UPDATE SET
+            secure_url = EXCLUDED.secure_url,
+            resolucao = EXCLUDED.resolucao,
+            vendedor = EXCLUDED.vendedor,
+            data_registro = EXCLUDED.data_registro;
+    """
+
+    with metricas.cronometrar_escrita("mercadolivre", "stg_imagens", len(imagens_valores)):
+        for i in range(0, len(imagens_valores), batch_size):
+            execute_values(cursor, query_imagem, imagens_valores[i:i+batch_size], page_size=batch_size)
+
+    # ATRIBUTOS (um documento por SKU)
+    atributos_valores = documentos.linhas(documentos.agrupar_atributos(atributos), vendedor, data_registro)
+
+    query_atributo = """
+        INSERT INTO stg_atributos (sku_id, atributos, vendedor, data_registro)
+        VALUES %s
+        ON CONFLICT (sku_id, vendedor) DO UPDATE SET
+            atributos = EXCLUDED.atributos,
+            vendedor = EXCLUDED.vendedor,
+            data_registro = EXCLUDED.data_registro;
+    """
+
+    with metricas.cronometrar_escrita("mercadolivre", "stg_atributos", len(atributos_valores)):
+        for i in range(0, len(atributos_valores), batch_size):
+            execute_values(cursor, query_atributo, atributos_valores[i:i+batch_size], page_size=batch_size)
+
+    # VARIAÇÕES (um documento por SKU)
+    variacoes_valores = documentos.linhas(documentos.agrupar_variacoes(variacoes), vendedor, data_registro)
+
+    query_variacao = """
+        INSERT INTO stg_variacoes (sku_id, variacoes, vendedor, data_registro)
+        VALUES %s
+        ON CONFLICT (sku_id, vendedor) DO UPDATE SET
+            variacoes = EXCLUDED.variacoes,
+            vendedor = EXCLUDED.vendedor,
+            data_registro = EXCLUDED.data_registro;
+    """
+
+    with metricas.cronometrar_escrita("mercadolivre", "stg_variacoes", len(variacoes_valores)):
+        for i in range(0, len(variacoes_valores), batch_size):
+            execute_values(cursor, query_variacao, variacoes_valores[i:i+batch_size], page_size=batch_size)
+
+# Grava um lote de registros no staging e avança o checkpoint na mesma transação
+def salvar_no_staging(produtos, imagens, atributos, variacoes, vendedor, posicao):
     conn = get_connection()
     if not conn:
-        print("Erro ao conectar com o banco para limpar dados antigos.")
-        return
+        raise Exception("Erro ao conectar com o banco de dados no Supabase.")
     try:
         cursor = conn.cursor()
-        tabelas = ["erros_qualidade", "variacoes", "atributos", "imagens", "produtos"]
-        for tabela in tabelas:
-            cursor.execute(f"DELETE FROM {tabela} WHERE vendedor = %s", (vendedor,))
+        inserir_registros(cursor, produtos, imagens, atributos, variacoes, vendedor, agora())
+        checkpoints.avancar(cursor, vendedor, posicao, agora())
         conn.commit()
-        print(f"Registros antigos removidos para o vendedor {vendedor}.")
-    except Exception as e:
-        print(f"Erro ao limpar dados antigos: {e}")
+    except Exception:
         conn.rollback()
+        raise
     finally:
         cursor.close()
         conn.close()
 
-# Salva os dados no banco de dados
-def salvar_no_banco(produtos, imagens, atributos, variacoes, vendedor):
-    limpar_dados_antigos(vendedor)
-
+# Substitui os dados do vendedor pelos do staging em uma única transação
+def promover_staging(vendedor):
     conn = get_connection()
     if not conn:
-        print("Erro ao conectar com o banco de dados no Supabase.")
-        return
-
+        raise Exception("Erro ao conectar com o banco de dados no Supabase.")
     try:
-        conn.set_session(autocommit=False)
         cursor = conn.cursor()
-        batch_size = 500
-        fuso_brasilia = pytz.timezone("America/Sao_Paulo")
-        data_registro = datetime.now(fuso_brasilia).replace(tzinfo=None)
-
-        # PRODUTOS
-        produtos_valores = [
-            (
-                p['sku_id'], p['titulo'], p['descricao'], p['categoria_id'], p['nome_categoria'],
-                p['preco'], p['quantidade_variacoes'],
-                p['status'], p['health'], p['quantidade_inicial'], p['quantidade_vendida'],
-                p['quantidade_disponivel'], p['gtin'], p['marca'], p['permalink'],
-                p['aceita_mercado_pago'], p['garantia'], p['imagens'], p['link_imagem'], vendedor, data_registro
-            )
-            for p in produtos
-        ]
-
-        query_produto = """
-            INSERT INTO produtos (
-                sku_id, titulo, descricao, categoria_id, nome_categoria,
-                preco, quantidade_variacoes,
-                status, health, quantidade_inicial, quantidade_vendida,
-                quantidade_disponivel, gtin, marca, permalink,
-                aceita_mercado_pago, garantia, imagens, link_imagem, vendedor, data_registro
-            )
-            VALUES %s
-            ON CONFLICT (sku_id, vendedor) DO UPDATE SET
-                titulo = EXCLUDED.titulo,
-                descricao = EXCLUDED.descricao,
-                categoria_id = EXCLUDED.categoria_id,
-                nome_categoria = EXCLUDED.nome_categoria,
-                preco = EXCLUDED.preco,
-                quantidade_variacoes = EXCLUDED.quantidade_variacoes,
-                status = EXCLUDED.status,
-                health = EXCLUDED.health,
-                quantidade_inicial = EXCLUDED.quantidade_inicial,
-                quantidade_vendida = EXCLUDED.quantidade_vendida,
-                quantidade_disponivel = EXCLUDED.quantidade_disponivel,
-                gtin = EXCLUDED.gtin,
-                marca = EXCLUDED.marca,
-                permalink = EXCLUDED.permalink,
-                aceita_mercado_pago = EXCLUDED.aceita_mercado_pago,
-                garantia = EXCLUDED.garantia,
-                imagens = EXCLUDED.imagens,
-                link_imagem = EXCLUDED.link_imagem,
-                vendedor = EXCLUDED.vendedor,
-                data_registro = EXCLUDED.data_registro;
-        """
-
-        for i in range(0, len(produtos_valores), batch_size):
-            try:
-                execute_values(cursor, query_produto, produtos_valores[i:i+batch_size], page_size=batch_size)
-            except Exception as e:
-                print(f"Erro ao inserir batch de produtos ({i}): {e}")
-
-        # IMAGENS
-        imagens_valores = [
-            (img['id_imagem'], img['sku_id'], img['secure_url'], img['resolucao'], vendedor, data_registro)
-            for img in imagens
-        ]
-
-        query_imagem = """
-            INSERT INTO imagens (id_imagem, sku_id, secure_url, resolucao, vendedor, data_registro)
-            VALUES %s
-            ON CONFLICT (id_imagem, sku_id, vendedor) DO UPDATE SET
-                secure_url = EXCLUDED.secure_url,
-                resolucao = EXCLUDED.resolucao,
-                vendedor = EXCLUDED.vendedor,
-                data_registro = EXCLUDED.data_registro;
-        """
-
-        for i in range(0, len(imagens_valores), batch_size):
-            try:
-                execute_values(cursor, query_imagem, imagens_valores[i:i+batch_size], page_size=batch_size)
-            except Exception as e:
-                print(f"Erro ao inserir batch de imagens ({i}): {e}")
-
-        # ATRIBUTOS
-        atributos_valores = [
-            (a['sku_id'], a['atributo'], a['valor'], vendedor, data_registro) for a in atributos
-        ]
-
-        query_atributo = """
-            INSERT INTO atributos (sku_id, atributo, valor, vendedor, data_registro)
-            VALUES %s
-            ON CONFLICT (sku_id, atributo, vendedor) DO UPDATE SET
-                valor = EXCLUDED.valor,
-                vendedor = EXCLUDED.vendedor,
-                data_registro = EXCLUDED.data_registro;
-        """
-
-        for i in range(0, len(atributos_valores), batch_size):
-            try:
-                execute_values(cursor, query_atributo, atributos_valores[i:i+batch_size], page_size=batch_size)
-            except Exception as e:
-                print(f"Erro ao inserir batch de atributos ({i}): {e}")
-
-        # VARIAÇÕES
-        variacoes_valores = [
-            (v['id_variacao'], v['sku_id'], v['preco_variacao'], v['atributo'], v['valor'], vendedor, data_registro)
-            for v in variacoes
-        ]
-
-        query_variacao = """
-            INSERT INTO variacoes (id_variacao, sku_id, preco_variacao, atributo, valor, vendedor, data_registro)
-            VALUES %s
-            ON CONFLICT (id_variacao, sku_id, atributo, vendedor) DO UPDATE SET
-                preco_variacao = EXCLUDED.preco_variacao,
-                valor = EXCLUDED.valor,
-                vendedor = EXCLUDED.vendedor,
-                data_registro = EXCLUDED.data_registro;
-        """
-
-        for i in range(0, len(variacoes_valores), batch_size):
-            try:
-                execute_values(cursor, query_variacao, variacoes_valores[i:i+batch_size], page_size=batch_size)
-            except Exception as e:
-                print(f"Erro ao inserir batch de variacoes ({i}): {e}")
-
+        data_registro = agora()
+        checkpoints.promover(cursor, vendedor, TABELAS_COLETA, data_registro)
         conn.commit()
         print("Dados salvos no banco de dados.")
-
-    except Exception as e:
+    except Exception:
         conn.rollback()
-        print(f"\nErro ao salvar no banco de dados: {e}")
+        raise
     finally:
         cursor.close()
         conn.close()
 
-# Salva os erros no banco de dados
-def salvar_erros_no_banco(df_erros_gerais, vendedor):
+# Colunas de erros_qualidade copiadas entre dias pela verificação incremental
+COLUNAS_ERROS = [
+    "sku_id", "vendedor", "produto", "status", "titulo", "qtd_imagem", "resolucao_imagem",
+    "descricao", "garantia", "atributos", "imagens_duplicadas", "hash_entradas"
+]
+
+# Salva os erros no banco de dados. 'df_erros_gerais' traz só os SKUs reavaliados (com a
+# coluna hash_entradas); 'skus' são todos os SKUs do dia e 'ultimo'/'anteriores' vêm de
+# qualidade.ultimos_hashes, para manter as linhas dos SKUs inalterados.
+def salvar_erros_no_banco(df_erros_gerais, vendedor, skus=None, ultimo=None, anteriores=None):
     conn = get_connection()
     if not conn:
         print("Erro ao conectar para salvar os erros.")
@@ -514,24 +553,30 @@ def salvar_erros_no_banco(df_erros_gerais, vendedor):
         cursor = conn.cursor()
         fuso_brasilia = pytz.timezone("America/Sao_Paulo")
         data_registro = datetime.now(fuso_brasilia).replace(tzinfo=None)
+        copiados = qualidade.preparar_dia(
+            cursor, "erros_qualidade", COLUNAS_ERROS, vendedor, data_registro, ultimo, anteriores or {},
+            df_erros_gerais['sku_id'] if skus is None else skus, df_erros_gerais['sku_id']
+        )
         valores = [
             (
-                row['sku_id'], vendedor, row['produto'], row['status'], row['titulo'], 
-                row['qtd_imagem'], row['resolucao_imagem'], 
-                row['descricao'], row['garantia'], row['atributos'], data_registro
+                row.sku_id, vendedor, row.produto, row.status, row.titulo,
+                row.qtd_imagem, row.resolucao_imagem,
+                row.descricao, row.garantia, row.atributos, row.imagens_duplicadas, row.hash_entradas, data_registro
             )
-            for _, row in df_erros_gerais.iterrows()
+            for row in df_erros_gerais.itertuples(index=False)
         ]
+        print(f"Erros de qualidade: {len(valores)} SKUs reavaliados, {copiados} inalterados copiados do último dia.")
         query = """
             INSERT INTO erros_qualidade (
                 sku_id, vendedor, produto, status, titulo, 
                 qtd_imagem, resolucao_imagem, 
-                descricao, garantia, atributos, data_registro
+                descricao, garantia, atributos, imagens_duplicadas, hash_entradas, data_registro
             ) VALUES %s;
         """
 
-        execute_values(cursor, query, valores)
-        conn.commit()
+        with metricas.cronometrar_escrita("mercadolivre", "erros_qualidade", len(valores)):
+            execute_values(cursor, query, valores)
+            conn.commit()
         
     except Exception as e:
         conn.rollback()
@@ -542,137 +587,91 @@ def salvar_erros_no_banco(df_erros_gerais, vendedor):
 
 # ------------------------- BUSCAR NO BANCO DE DADOS PARA DOWNLOAD ----------------------------
 
+# As buscas geram lotes de linhas lidos por cursor nomeado (relatorios.ler_em_lotes)
+
 # Busca os dados do dia para download
 def buscar_produtos_do_dia(vendedor):
-    conn = get_connection()
-    if not conn:
-        return []
-    try:
-        cursor = conn.cursor()
-        fuso_brasilia = pytz.timezone("America/Sao_Paulo")
-        data_hoje = datetime.now(fuso_brasilia)
-        cursor.execute("""
-            SELECT * FROM produtos WHERE vendedor = %s AND DATE(data_registro) = %s
-        """, (vendedor, data_hoje.date()))
-        colunas = [desc[0] for desc in cursor.description]
-        return [dict(zip(colunas, row)) for row in cursor.fetchall()]
-    finally:
-        cursor.close()
-        conn.close()
+    return relatorios.ler_em_lotes(get_connection, """
+        SELECT * FROM produtos WHERE vendedor = %s AND data_registro >= %s AND data_registro < %s
+    """, (vendedor, *particoes.intervalo_dia(agora())))
 
-# Busca os atributos do dia para download
+# Busca os atributos do dia para download (documentos expandidos em uma linha por atributo)
 def buscar_atributos_do_dia(vendedor):
-    conn = get_connection()
-    if not conn:
-        return []
-    try:
-        cursor = conn.cursor()
-        fuso_brasilia = pytz.timezone("America/Sao_Paulo")
-        data_hoje = datetime.now(fuso_brasilia)
-        cursor.execute("""
-            SELECT * FROM atributos WHERE vendedor = %s AND DATE(data_registro) = %s
-        """, (vendedor, data_hoje.date()))
-        colunas = [desc[0] for desc in cursor.description]
-        return [dict(zip(colunas, row)) for row in cursor.fetchall()]
-    finally:
-        cursor.close()
-        conn.close()
+    return documentos.expandir_atributos(relatorios.ler_em_lotes(get_connection, """
+        SELECT sku_id, atributos, vendedor, data_registro FROM atributos
+        WHERE vendedor = %s AND data_registro >= %s AND data_registro < %s
+    """, (vendedor, *particoes.intervalo_dia(agora()))))
 
 # Busca as imagens do dia para download
 def buscar_imagens_do_dia(vendedor):
-    conn = get_connection()
-    if not conn:
-        return []
-    try:
-        cursor = conn.cursor()
-        fuso_brasilia = pytz.timezone("America/Sao_Paulo")
-        data_hoje = datetime.now(fuso_brasilia)
-        cursor.execute("""
-            SELECT * FROM imagens WHERE vendedor = %s AND DATE(data_registro) = %s
-        """, (vendedor, data_hoje.date()))
-        colunas = [desc[0] for desc in cursor.description]
-        return [dict(zip(colunas, row)) for row in cursor.fetchall()]
-    finally:
-        cursor.close()
-        conn.close()
+    return relatorios.ler_em_lotes(get_connection, """
+        SELECT * FROM imagens WHERE vendedor = %s AND data_registro >= %s AND data_registro < %s
+    """, (vendedor, *particoes.intervalo_dia(agora())))
 
-# Busca as variações do dia para download
+# Busca as variações do dia para download (documentos expandidos em uma linha por atributo)
 def buscar_variacoes_do_dia(vendedor):
-    conn = get_connection()
-    if not conn:
-        return []
-    try:
-        cursor = conn.cursor()
-        fuso_brasilia = pytz.timezone("America/Sao_Paulo")
-        data_hoje = datetime.now(fuso_brasilia)
-        cursor.execute("""
-            SELECT * FROM variacoes WHERE vendedor = %s AND DATE(data_registro) = %s
-        """, (vendedor, data_hoje.date()))
-        colunas = [desc[0] for desc in cursor.description]
-        return [dict(zip(colunas, row)) for row in cursor.fetchall()]
-    finally:
-        cursor.close()
-        conn.close()
+    return documentos.expandir_variacoes(relatorios.ler_em_lotes(get_connection, """
+        SELECT sku_id, variacoes, vendedor, data_registro FROM variacoes
+        WHERE vendedor = %s AND data_registro >= %s AND data_registro < %s
+    """, (vendedor, *particoes.intervalo_dia(agora()))))
 
 # Busca os erros do dia para download
 def buscar_erros_do_dia(vendedor):
-    conn = get_connection()
-    if not conn:
-        return []
-    try:
-        cursor = conn.cursor()
-        fuso_brasilia = pytz.timezone("America/Sao_Paulo")
-        data_hoje = datetime.now(fuso_brasilia)
-        cursor.execute("""
-            SELECT * FROM erros_qualidade WHERE vendedor = %s AND DATE(data_registro) = %s
-        """, (vendedor, data_hoje.date()))
-        colunas = [desc[0] for desc in cursor.description]
-        return [dict(zip(colunas, row)) for row in cursor.fetchall()]
-    finally:
-        cursor.close()
-        conn.close()
+    return relatorios.ler_em_lotes(get_connection, """
+        SELECT * FROM erros_qualidade WHERE vendedor = %s AND data_registro >= %s AND data_registro < %s
+    """, (vendedor, *particoes.intervalo_dia(agora())))
 
 # ------------------------- GERAR XLSX E ZIP----------------------------
 
-# Gera um arquivo ZIP com os relatórios do dia
+# Gera um arquivo ZIP com os relatórios do dia, planilha por planilha
+@metricas.rastrear_zip("mercadolivre")
 def gerar_zip_relatorios_do_dia(vendedor):
-
-    produtos = buscar_produtos_do_dia(vendedor)
-    atributos = buscar_atributos_do_dia(vendedor)
-    imagens = buscar_imagens_do_dia(vendedor)
-    variacoes = buscar_variacoes_do_dia(vendedor)
-    erros = buscar_erros_do_dia(vendedor)
-
-    def df_to_xlsx_bytes(df):
-        output = io.BytesIO()
-        with pd.ExcelWriter(output, engine='xlsxwriter') as writer:
-            df.to_excel(writer, index=False)
-        output.seek(0)
-        return output.read()
-
-    zip_stream = io.BytesIO()
-    with zipfile.ZipFile(zip_stream, "w") as zf:
-        if produtos:
-            df_produtos = pd.DataFrame(produtos)
-            zf.writestr(f"produtos_{vendedor}.xlsx", df_to_xlsx_bytes(df_produtos))
-        if imagens:
-            df_imagens = pd.DataFrame(imagens)
-            zf.writestr(f"imagens_{vendedor}.xlsx", df_to_xlsx_bytes(df_imagens))
-        if atributos:
-            df_atributos = pd.DataFrame(atributos)
-            zf.writestr(f"atributos_{vendedor}.xlsx", df_to_xlsx_bytes(df_atributos))
-        if variacoes:
-            df_variacoes = pd.DataFrame(variacoes)
-            zf.writestr(f"variacoes_{vendedor}.xlsx", df_to_xlsx_bytes(df_variacoes))
-        if erros:
-            df_erros = pd.DataFrame(erros)
-            zf.writestr(f"erros_gerais_{vendedor}.xlsx", df_to_xlsx_bytes(df_erros))
-    zip_stream.seek(0)
-    return zip_stream
+    return relatorios.gerar_zip([
+        (f"produtos_{vendedor}.xlsx", buscar_produtos_do_dia(vendedor)),
+        (f"imagens_{vendedor}.xlsx", buscar_imagens_do_dia(vendedor)),
+        (f"atributos_{vendedor}.xlsx", buscar_atributos_do_dia(vendedor)),
+        (f"variacoes_{vendedor}.xlsx", buscar_variacoes_do_dia(vendedor)),
+        (f"erros_gerais_{vendedor}.xlsx", buscar_erros_do_dia(vendedor))
+    ])
 
 # -------------------------------- EXECUÇÃO PRINCIPAL --------------------------------
 
+# Verifica a qualidade dos dados do dia gravados para o vendedor e salva os erros. Só os
+# SKUs com entradas alteradas desde a última verificação são reavaliados e regravados
+# (qualidade.ultimos_hashes). Com somente_cache, os hashes das imagens vêm só do cache
+# (sem baixar imagens).
+def verificar_qualidade(vendedor, somente_cache=False):
+    with tempos.etapa("qualidade"):
+        df_produtos = relatorios.para_dataframe(buscar_produtos_do_dia(vendedor))
+        df_imagens = relatorios.para_dataframe(buscar_imagens_do_dia(vendedor))
+        df_atributos = relatorios.para_dataframe(buscar_atributos_do_dia(vendedor))
+
+    # Imagens repetidas entre anúncios (etapa opcional)
+    duplicadas = None
+    if imagens_duplicadas.ATIVA and not df_imagens.empty:
+        with tempos.etapa("imagens_duplicadas"):
+            duplicadas = imagens_duplicadas.contar_duplicadas(
+                list(zip(df_imagens['sku_id'], df_imagens['secure_url'])), get_connection, somente_cache
+            )
+    with tempos.etapa("qualidade"):
+        df_erros, skus, ultimo, anteriores = pd.DataFrame(columns=COLUNAS_ERROS), [], None, {}
+        if not df_produtos.empty:
+            skus = df_produtos['sku_id']
+            alterados, hashes, ultimo, anteriores = qualidade.selecionar(
+                get_connection, "mercadolivre", "erros_qualidade", vendedor, df_produtos, colunas=['status'],
+                extras=[imagens_duplicadas.mensagem(duplicadas, sku_id) for sku_id in skus],
+                imagens=df_imagens, atributos=df_atributos
+            )
+            df_erros = tratar_dados(
+                df_produtos[alterados], *qualidade.filtrar([df_imagens, df_atributos], set(skus[alterados])), duplicadas
+            )
+            df_erros['hash_entradas'] = hashes[alterados].tolist()
+    with tempos.etapa("gravacao_erros"):
+        salvar_erros_no_banco(df_erros, vendedor, skus, ultimo, anteriores)
+
 # Função principal para coletar dados do Mercado Livre
+@metricas.rastrear_coleta("mercadolivre")
+@arquivo_bruto.arquivar("mercadolivre")
 def coletar_dados_ml(vendedor: str):
 
     print(f"\nIniciando coleta Mercado Livre para o vendedor: {vendedor}")
@@ -690,17 +689,58 @@ def coletar_dados_ml(vendedor: str):
     refresh_token = seller_data['refresh_token']
     seller_id = seller_data['seller_id']
 
-    # Obtém todos os dados
-    produtos, imagens, atributos, variacoes = obter_todos_os_dados(
-        seller_id, access_token, refresh_token, vendedor
-    )
-    salvar_no_banco(produtos, imagens, atributos, variacoes, vendedor)
+    # Cria as partições do dia antes de gravar (transação curta e própria)
+    with tempos.etapa("particoes"):
+        particoes.preparar(get_connection, TABELAS_PARTICIONADAS, "mercadolivre")
 
-    df_produtos = pd.DataFrame(produtos)
-    df_imagens = pd.DataFrame(imagens)
-    df_atributos = pd.DataFrame(atributos)
-    df_erros = tratar_dados(df_produtos, df_imagens, df_atributos)
-    salvar_erros_no_banco(df_erros, vendedor)
+    # Obtém todos os dados (gravados no staging, retomando do checkpoint se houver)
+    obter_todos_os_dados(seller_id, access_token, refresh_token, vendedor)
+    with tempos.etapa("gravacao_banco"):
+        promover_staging(vendedor)
 
+    verificar_qualidade(vendedor)
+
+    arquivo_bruto.concluir()
     print(f"\nColeta Mercado Livre finalizada para {vendedor}")
     return f"\nColeta Mercado Livre finalizada para {vendedor}"
+
+# Reprocessa a última coleta arquivada do vendedor (arquivo_bruto) com as funções atuais
+# de transformação e qualidade, sem acessar a API
+def reprocessar(vendedor):
+    execucoes = arquivo_bruto.selecionar(arquivo_bruto.listar_execucoes("mercadolivre", vendedor))
+    if not execucoes:
+        return f"Nenhuma coleta completa arquivada para {vendedor}."
+
+    # Um item coletado de novo ao retomar um checkpoint fica com a versão mais recente
+    itens = {}
+    for registro in arquivo_bruto.ler("mercadolivre", vendedor, "itens", execucoes):
+        itens[registro["detalhes"].get("id")] = registro
+    particoes.preparar(get_connection, TABELAS_PARTICIONADAS, "mercadolivre")
+
+    conn = get_connection()
+    if not conn:
+        raise Exception("Erro ao conectar com o banco de dados no Supabase.")
+    try:
+        # O staging é do vendedor: não sobrescreve uma coleta interrompida esperando retomada
+        if checkpoints.carregar(conn, vendedor, TABELAS_COLETA, agora()):
+            return f"Coleta de {vendedor} interrompida aguardando retomada; reprocessamento não executado."
+        checkpoints.iniciar(conn, vendedor, list(itens), TABELAS_COLETA, agora())
+    finally:
+        conn.close()
+
+    produtos, imagens, atributos, variacoes = [], [], [], []
+    for registro in itens.values():
+        produto, imagens_item, atributos_item, variacoes_item = montar_registros_item(
+            registro["detalhes"], registro["descricao"], registro["nome_categoria"]
+        )
+        produtos.append(produto)
+        imagens.extend(imagens_item)
+        atributos.extend(atributos_item)
+        variacoes.extend(variacoes_item)
+
+    sonda_imagens.atualizar_resolucoes(imagens, get_connection, somente_cache=True)
+    salvar_no_staging(produtos, imagens, atributos, variacoes, vendedor, len(itens))
+    promover_staging(vendedor)
+    verificar_qualidade(vendedor, somente_cache=True)
+
+    return f"Reprocessados {len(produtos)} itens de {vendedor} ({len(execucoes)} execução(ões) arquivada(s))."
@@ -0,0 +1,288 @@
+import os
+import re
+import time
+import threading
+from functools import wraps
+from contextlib import contextmanager
+from urllib.parse import urlparse
+
+# ------------------------- MÉTRICAS EM PROCESSO ----------------------------
+
+# Métricas no formato de exposição do Prometheus, mantidas em memória no próprio processo.
+# Não dependem de coletor externo: o endpoint /metrics apenas renderiza o estado atual.
+
+BUCKETS_SEGUNDOS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 600)
+BUCKETS_BYTES = (1024, 10240, 102400, 1048576, 5242880, 10485760, 52428800, 104857600, 524288000)
+
+_registro = []
+_registro_lock = threading.Lock()
+
+# Escapa valores de labels conforme o formato texto do Prometheus
+def _escapar(valor):
+    return str(valor).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+# Formata um conjunto de labels como {a="1",b="2"}
+def _formatar_labels(nomes, valores, extra=None):
+    pares = [f'{n}="{_escapar(v)}"' for n, v in zip(nomes, valores)]
+    if extra:
+        pares.extend(f'{n}="{_escapar(v)}"' for n, v in extra)
+    return "{" + ",".join(pares) + "}" if pares else ""
+
+# Formata números sem notação desnecessária (inteiros sem ".0")
+def _formatar_numero(valor):
+    if valor == float("inf"):
+        return "+Inf"
+    if float(valor).is_integer():
+        return str(int(valor))
+    return repr(float(valor))
+
+class _Metrica:
+    tipo = ""
+
+    def __init__(self, nome, descricao, labels=()):
+        self.nome = nome
+        self.descricao = descricao
+        self.labels = tuple(labels)
+        self._lock = threading.Lock()
+        self._valores = {}
+        with _registro_lock:
+            _registro.append(self)
+
+    def _chave(self, labels):
+        if set(labels) != set(self.labels):
+            raise ValueError(f"Labels inválidos para {self.nome}: {sorted(labels)}")
+        return tuple(str(labels[n]) for n in self.labels)
+
+    def renderizar(self):
+        linhas = [f"# HELP {self.nome} {self.descricao}", f"# TYPE {self.nome} {self.tipo}"]
+        with self._lock:
+            itens = list(self._valores.items())
+        for chave, valor in sorted(itens):
+            linhas.extend(self._renderizar_serie(chave, valor))
+        return linhas
+
+    def _renderizar_serie(self, chave, valor):
+        return [f"{self.nome}{_formatar_labels(self.labels, chave)} {_formatar_numero(valor)}"]
+
+class Counter(_Metrica):
+    tipo = "counter"
+
+    def inc(self, valor=1, **labels):
+        if valor < 0:
+            raise ValueError("Counter só pode ser incrementado.")
+        chave = self._chave(labels)
+        with self._lock:
+            self._valores[chave] = self._valores.get(chave, 0) + valor
+
+class Gauge(_Metrica):
+    tipo = "gauge"
+
+    def inc(self, valor=1, **labels):
+        chave = self._chave(labels)
+        with self._lock:
+            self._valores[chave] = self._valores.get(chave, 0) + valor
+
+    def dec(self, valor=1, **labels):
+        self.inc(-valor, **labels)
+
+    def set(self, valor, **labels):
+        chave = self._chave(labels)
+        with self._lock:
+            self._valores[chave] = valor
+
+    # Incrementa durante a execução do bloco e decrementa ao sair
+    @contextmanager
+    def em_andamento(self, **labels):
+        self.inc(**labels)
+        try:
+            yield
+        finally:
+            self.dec(**labels)
+
+class Histogram(_Metrica):
+    tipo = "histogram"
+
+    def __init__(self, nome, descricao, labels=(), buckets=BUCKETS_SEGUNDOS):
+        super().__init__(nome, descricao, labels)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, valor, **labels):
+        chave = self._chave(labels)
+        with self._lock:
+            serie = self._valores.get(chave)
+            if serie is None:
+                serie = {"contagens": [0] * len(self.buckets), "soma": 0.0, "total": 0}
+                self._valores[chave] = serie
+            for i, limite in enumerate(self.buckets):
+                if valor <= limite:
+                    serie["contagens"][i] += 1
+            serie["soma"] += valor
+            serie["total"] += 1
+
+    # Mede a duração do bloco em segundos
+    @contextmanager
+    def cronometrar(self, **labels):
+        inicio = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - inicio, **labels)
+
+    # Estima o quantil q (0-1) por interpolação linear nos buckets, como o histogram_quantile
+    # do Prometheus, somando as séries que casam com os labels informados
+    def quantil(self, q, **filtro):
+        indices = [self.labels.index(n) for n in filtro]
+        contagens = [0] * len(self.buckets)
+        total = 0
+        with self._lock:
+            for chave, serie in self._valores.items():
+                if all(chave[i] == str(v) for i, v in zip(indices, filtro.values())):
+                    contagens = [a + b for a, b in zip(contagens, serie["contagens"])]
+                    total += serie["total"]
+        if total == 0:
+            return None
+        alvo = q * total
+        anterior_limite, anterior_contagem = 0.0, 0
+        for limite, contagem in zip(self.buckets, contagens):
+            if contagem >= alvo:
+                if contagem == anterior_contagem:
+                    return limite
+                return anterior_limite + (limite - anterior_limite) * (alvo - anterior_contagem) / (contagem - anterior_contagem)
+            anterior_limite, anterior_contagem = limite, contagem
+        return self.buckets[-1]
+
+    # Total de observações das séries que casam com os labels informados
+    def contagem(self, **filtro):
+        indices = [self.labels.index(n) for n in filtro]
+        with self._lock:
+            return sum(
+                serie["total"] for chave, serie in self._valores.items()
+                if all(chave[i] == str(v) for i, v in zip(indices, filtro.values()))
+            )
+
+    def _renderizar_serie(self, chave, serie):
+        linhas = []
+        for limite, contagem in zip(self.buckets, serie["contagens"]):
+            labels = _formatar_labels(self.labels, chave, [("le", _formatar_numero(limite))])
+            linhas.append(f"{self.nome}_bucket{labels} {contagem}")
+        labels_inf = _formatar_labels(self.labels, chave, [("le", "+Inf")])
+        linhas.append(f"{self.nome}_bucket{labels_inf} {serie['total']}")
+        labels = _formatar_labels(self.labels, chave)
+        linhas.append(f"{self.nome}_sum{labels} {_formatar_numero(serie['soma'])}")
+        linhas.append(f"{self.nome}_count{labels} {serie['total']}")
+        return linhas
+
+# Renderiza todas as métricas registradas no formato texto do Prometheus
+def renderizar():
+    with _registro_lock:
+        metricas = list(_registro)
+    linhas = []
+    for metrica in metricas:
+        linhas.extend(metrica.renderizar())
+    return "\n".join(linhas) + "\n"
+
+# ------------------------- MÉTRICAS DA APLICAÇÃO ----------------------------
+
+requisicao_duracao = Histogram(
+    "marketplace_request_duration_seconds",
+    "Latência das requisições às APIs dos marketplaces.",
+    ("plataforma", "endpoint", "status")
+)
+renovacoes_token = Counter(
+    "marketplace_token_refresh_total",
+    "Renovações de token de acesso.",
+    ("plataforma", "resultado")
+)
+db_escrita_linhas = Counter(
+    "db_write_rows_total",
+    "Linhas enviadas ao banco pelas funções salvar_*.",
+    ("plataforma", "tabela")
+)
+db_escrita_duracao = Histogram(
+    "db_write_duration_seconds",
+    "Duração das escritas no banco pelas funções salvar_*.",
+    ("plataforma", "tabela")
+)
+tratamento_duracao = Histogram(
+    "tratar_dados_duration_seconds",
+    "Duração do tratamento e das verificações de qualidade.",
+    ("plataforma", "funcao")
+)
+zip_duracao = Histogram(
+    "zip_build_duration_seconds",
+    "Duração da geração do ZIP de relatórios.",
+    ("plataforma",)
+)
+zip_bytes = Histogram(
+    "zip_build_bytes",
+    "Tamanho do ZIP de relatórios gerado.",
+    ("plataforma",),
+    buckets=BUCKETS_BYTES
+)
+coletas_ativas = Gauge(
+    "coletas_ativas",
+    "Coletas em andamento.",
+    ("plataforma",)
+)
+
+# ------------------------- AUXILIARES ----------------------------
+
+_segmento_versao = re.compile(r"^(v\d+|\d{4}-\d{2}-\d{2})$")
+
+# Normaliza a URL para um endpoint de baixa cardinalidade (IDs viram {id})
+def normalizar_endpoint(url):
+    caminho = urlparse(url).path
+    segmentos = []
+    for segmento in caminho.split("/"):
+        if segmento and not _segmento_versao.match(segmento) and any(c.isdigit() for c in segmento):
+            segmento = "{id}"
+        segmentos.append(segmento)
+    return "/".join(segmentos) or "/"
+
+# Registra a latência de uma requisição a um marketplace
+def observar_requisicao(plataforma, url, status, duracao):
+    requisicao_duracao.observe(
+        duracao, plataforma=plataforma, endpoint=normalizar_endpoint(url), status=status
+    )
+
+# Registra uma escrita no banco (linhas e duração)
+@contextmanager
+def cronometrar_escrita(plataforma, tabela, linhas):
+    db_escrita_linhas.inc(linhas, plataforma=plataforma, tabela=tabela)
+    with db_escrita_duracao.cronometrar(plataforma=plataforma, tabela=tabela):
+        yield
+
+# Decorador que mantém o gauge de coletas ativas durante a execução da coleta
+def rastrear_coleta(plataforma):
+    def decorador(func):
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            with coletas_ativas.em_andamento(plataforma=plataforma):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorador
+
+# Decorador que mede a duração das funções de tratamento/qualidade
+def cronometrar_tratamento(plataforma):
+    def decorador(func):
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            with tratamento_duracao.cronometrar(plataforma=plataforma, funcao=func.__name__):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorador
+
+# Decorador que mede duração e tamanho do ZIP retornado pela função
+def rastrear_zip(plataforma):
+    def decorador(func):
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            inicio = time.perf_counter()
+            zip_stream = func(*args, **kwargs)
+            zip_duracao.observe(time.perf_counter() - inicio, plataforma=plataforma)
+            zip_stream.seek(0, os.SEEK_END)
+            zip_bytes.observe(zip_stream.tell(), plataforma=plataforma)
+            zip_stream.seek(0)
+            return zip_stream
+        return wrapper
+    return decorador
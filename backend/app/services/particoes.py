@@ -0,0 +1,322 @@
+import os
+import re
+import sys
+import importlib
+import threading
+import pytz
+from time import monotonic
+from datetime import date, datetime, time, timedelta
+
+# ------------------------- PARTIÇÕES POR DIA ----------------------------
+
+# As tabelas de dados coletados (produtos, imagens, pedidos, estoque, erros...) são
+# particionadas por dia de data_registro (PARTITION BY RANGE, uma partição
+# <tabela>_AAAAMMDD por dia). Cada coleta substitui
+# só as linhas do vendedor no dia em que grava; as leituras do dia usam intervalos
+# (data_registro >= dia AND data_registro < dia + 1) e o Postgres lê apenas a partição
+# do dia. O histórico sai por dia inteiro: aplicar_retencao remove (DROP) ou desanexa
+# (DETACH) as partições mais antigas que a retenção, sem DELETE linha a linha. A retenção
+# não roda nas coletas: o agendador e o worker chamam manutencao_periodica(), que também
+# cria com antecedência as partições dos próximos dias.
+#
+# Criar uma partição trava a tabela-mãe (ACCESS EXCLUSIVE) até o fim da transação. Por
+# isso as coletas chamam preparar() antes de gravar: as partições de hoje e dos próximos
+# PARTICOES_DIAS_ADIANTADOS dias (no dia da plataforma, FUSOS) são criadas em uma transação
+# curta e própria, com lock_timeout, e a gravação do dia já as encontra. garantir() ainda
+# cria dentro da transação de dados o que faltar (uma coleta que atravessou os dias
+# adiantados), sob um advisory lock que serializa as criações entre coletas simultâneas.
+#
+# Bancos criados antes do particionamento são convertidos com (a partir de backend/):
+#   python -m app.services.particoes mercadolivre|magalu|amazon
+# Se as tabelas atributos/variacoes ainda estiverem no formato de uma linha por atributo,
+# rode antes app.services.documentos, que já as recria particionadas.
+#
+# Variáveis de ambiente:
+#   PARTICOES_RETENCAO_DIAS   dias de histórico mantidos (padrão 30)
+#   PARTICOES_DESANEXAR       "1" para desanexar as partições antigas em vez de removê-las
+#   PARTICOES_DIAS_ADIANTADOS dias seguintes criados junto com o de hoje em preparar (padrão 1)
+#   PARTICOES_LOCK_TIMEOUT_MS espera máxima pela trava da tabela-mãe em preparar e na retenção (padrão 5000)
+#   PARTICOES_INTERVALO_MANUTENCAO segundos entre manutenções (retenção e próximos dias) (padrão 3600)
+
+RETENCAO_DIAS = max(1, int(os.getenv("PARTICOES_RETENCAO_DIAS", 30)))
+DESANEXAR = os.getenv("PARTICOES_DESANEXAR", "0") == "1"
+DIAS_ADIANTADOS = max(0, int(os.getenv("PARTICOES_DIAS_ADIANTADOS", 1)))
+LOCK_TIMEOUT_MS = max(0, int(os.getenv("PARTICOES_LOCK_TIMEOUT_MS", 5000)))
+INTERVALO_MANUTENCAO = max(60, int(os.getenv("PARTICOES_INTERVALO_MANUTENCAO", 3600)))
+
+# Fuso do data_registro gravado por cada plataforma (o "dia" das partições)
+FUSOS = {"mercadolivre": "America/Sao_Paulo", "magalu": "America/Sao_Paulo", "amazon": "UTC"}
+
+# Chaves dos advisory locks da criação de partições e da retenção no banco
+TRAVA_CRIACAO = 7283641
+TRAVA_RETENCAO = 7283642
+
+_trava_manutencao = threading.Lock()
+_ultima_manutencao = None
+
+DIR_SQL = os.path.join(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))), "sql")
+
+def hoje(plataforma):
+    return datetime.now(pytz.timezone(FUSOS[plataforma])).date()
+
+def dia_de(valor):
+    return valor.date() if isinstance(valor, datetime) else valor
+
+def nome_particao(tabela, dia):
+    return f"{tabela}_{dia_de(dia):%Y%m%d}"
+
+# Limites [início, fim) do dia. Comparar data_registro com eles (em vez de DATE(data_registro))
+# permite ao Postgres descartar as partições dos outros dias.
+def intervalo_dia(dia):
+    inicio = datetime.combine(dia_de(dia), time.min)
+    return inicio, inicio + timedelta(days=1)
+
+# ------------------------- CRIAÇÃO ----------------------------
+
+# Consulta o catálogo (pg_class) e não to_regclass: depois de esperar o advisory lock, só
+# a leitura da tabela enxerga a partição que outra coleta acabou de criar
+def _faltando(cur, tabela, dias):
+    nomes = {nome_particao(tabela, dia): dia for dia in dias}
+    cur.execute(
+        "SELECT relname FROM pg_class WHERE relnamespace = current_schema()::regnamespace AND relname = ANY(%s)",
+        (list(nomes),)
+    )
+    existentes = {nome for nome, in cur.fetchall()}
+    return [dia for nome, dia in nomes.items() if nome not in existentes]
+
+# Cria as partições dos dias informados que ainda não existem. A criação espera o advisory
+# lock (liberado no fim da transação) e confere de novo: duas coletas que chegam juntas ao
+# primeiro dia não tentam criar a mesma partição
+def garantir(cur, tabela, dias):
+    if isinstance(dias, (date, datetime)):
+        dias = [dias]
+    faltando = _faltando(cur, tabela, sorted({dia_de(d) for d in dias}))
+    if not faltando:
+        return
+    cur.execute("SELECT pg_advisory_xact_lock(%s)", (TRAVA_CRIACAO,))
+    for dia in _faltando(cur, tabela, faltando):
+        inicio, fim = intervalo_dia(dia)
+        cur.execute(
+            f"CREATE TABLE {nome_particao(tabela, dia)} PARTITION OF {tabela} "
+            f"FOR VALUES FROM ('{inicio:%Y-%m-%d}') TO ('{fim:%Y-%m-%d}')"
+        )
+
+# Cria as partições de hoje e dos próximos dias da plataforma em uma transação própria,
+# confirmada logo em seguida. Retorna False se não conseguiu (a gravação cria o que faltar).
+def preparar(get_connection, tabelas, plataforma, dias_adiantados=None):
+    dia = hoje(plataforma)
+    dias_adiantados = DIAS_ADIANTADOS if dias_adiantados is None else dias_adiantados
+    dias = [dia + timedelta(days=n) for n in range(dias_adiantados + 1)]
+    conn = get_connection()
+    if not conn:
+        print("Erro ao conectar com o banco para preparar as partições.")
+        return False
+    try:
+        with conn.cursor() as cur:
+            cur.execute(f"SET LOCAL lock_timeout = {LOCK_TIMEOUT_MS}")
+            for tabela in tabelas:
+                garantir(cur, tabela, dias)
+        conn.commit()
+        return True
+    except Exception as e:
+        conn.rollback()
+        print(f"Erro ao preparar as partições ({plataforma}): {e}")
+        return False
+    finally:
+        conn.close()
+
+# Garante a partição do dia e remove as linhas do vendedor nesse dia antes de regravá-las:
+# todas, ou só as das chaves informadas (coluna = ANY(chaves)) nas gravações parciais
+def limpar_dia(cur, tabela, vendedor, dia, coluna=None, chaves=None):
+    garantir(cur, tabela, dia)
+    inicio, fim = intervalo_dia(dia)
+    if coluna is None:
+        cur.execute(f"""
+            DELETE FROM {tabela} WHERE vendedor = %s AND data_registro >= %s AND data_registro < %s
+        """, (vendedor, inicio, fim))
+    else:
+        cur.execute(f"""
+            DELETE FROM {tabela}
+            WHERE vendedor = %s AND data_registro >= %s AND data_registro < %s AND {coluna} = ANY(%s)
+        """, (vendedor, inicio, fim, list(chaves)))
+
+# ------------------------- RETENÇÃO ----------------------------
+
+# Partições da tabela: [(nome, dia)]
+def listar(cur, tabela):
+    cur.execute("""
+        SELECT c.relname FROM pg_inherits i JOIN pg_class c ON c.oid = i.inhrelid
+        WHERE i.inhparent = to_regclass(%s)
+    """, (tabela,))
+    particoes = []
+    for (nome,) in cur.fetchall():
+        encontrado = re.fullmatch(rf"{re.escape(tabela)}_(\d{{8}})", nome)
+        if encontrado:
+            particoes.append((nome, datetime.strptime(encontrado.group(1), "%Y%m%d").date()))
+    return sorted(particoes, key=lambda p: p[1])
+
+# Remove (ou desanexa) as partições com mais de 'dias' dias, contados no dia da plataforma.
+# Cada partição sai em uma transação própria com lock_timeout: a trava da tabela-mãe dura
+# só o DROP/DETACH, e uma partição ocupada fica para a próxima manutenção. Um advisory lock
+# de sessão evita que duas instâncias apliquem a retenção no mesmo banco ao mesmo tempo.
+# Retorna os nomes afetados.
+def aplicar_retencao(get_connection, tabelas, plataforma, dias=None, desanexar=None, dia=None):
+    dia = dia_de(dia) if dia else hoje(plataforma)
+    dias = RETENCAO_DIAS if dias is None else dias
+    desanexar = DESANEXAR if desanexar is None else desanexar
+    limite = dia - timedelta(days=dias)
+    afetadas = []
+    conn = get_connection()
+    if not conn:
+        print("Erro ao conectar com o banco para aplicar a retenção das partições.")
+        return []
+    try:
+        with conn.cursor() as cur:
+            cur.execute("SELECT pg_try_advisory_lock(%s)", (TRAVA_RETENCAO,))
+            if not cur.fetchone()[0]:
+                conn.rollback()
+                return []
+            try:
+                antigas = []
+                for tabela in tabelas:
+                    antigas += [(tabela, particao) for particao, d in listar(cur, tabela) if d < limite]
+                conn.commit()
+                for tabela, particao in antigas:
+                    try:
+                        cur.execute(f"SET LOCAL lock_timeout = {LOCK_TIMEOUT_MS}")
+                        if desanexar:
+                            cur.execute(f"ALTER TABLE {tabela} DETACH PARTITION {particao}")
+                        else:
+                            cur.execute(f"DROP TABLE {particao}")
+                        conn.commit()
+                        afetadas.append(particao)
+                    except Exception as e:
+                        conn.rollback()
+                        print(f"Erro ao aplicar retenção em {particao}: {e}")
+            finally:
+                conn.rollback()
+                cur.execute("SELECT pg_advisory_unlock(%s)", (TRAVA_RETENCAO,))
+                conn.commit()
+    except Exception as e:
+        conn.rollback()
+        print(f"Erro ao aplicar retenção das partições: {e}")
+    finally:
+        conn.close()
+    if afetadas:
+        print(f"Partições {'desanexadas' if desanexar else 'removidas'} (antes de {limite}): {', '.join(afetadas)}")
+    return afetadas
+
+# ------------------------- MANUTENÇÃO ----------------------------
+
+# Cria as partições dos próximos dias e aplica a retenção no banco da plataforma
+def manter(plataforma):
+    modulo = importlib.import_module(f"app.services.{plataforma}")
+    preparar(modulo.get_connection, modulo.TABELAS_PARTICIONADAS, plataforma)
+    return aplicar_retencao(modulo.get_connection, modulo.TABELAS_PARTICIONADAS, plataforma)
+
+# Chamada em laço pelo agendador e pelo worker: roda manter() para cada plataforma no
+# máximo uma vez a cada PARTICOES_INTERVALO_MANUTENCAO segundos por processo
+def manutencao_periodica():
+    global _ultima_manutencao
+    with _trava_manutencao:
+        if _ultima_manutencao is not None and monotonic() - _ultima_manutencao < INTERVALO_MANUTENCAO:
+            return
+        _ultima_manutencao = monotonic()
+    for plataforma in FUSOS:
+        try:
+            manter(plataforma)
+        except Exception as e:
+            print(f"Erro na manutenção das partições ({plataforma}): {e}")
+
+# ------------------------- MIGRAÇÃO ----------------------------
+
+# Colunas da tabela, na ordem em que estão no banco
+def colunas_tabela(cur, tabela):
+    cur.execute("""
+        SELECT attname FROM pg_attribute
+        WHERE attrelid = to_regclass(%s) AND attnum > 0 AND NOT attisdropped
+        ORDER BY attnum
+    """, (tabela,))
+    return [row[0] for row in cur.fetchall()]
+
+# A chave primária da tabela recriada ganha outro nome enquanto a antiga existe
+def restaurar_nome_chave(cur, tabela):
+    cur.execute("""
+        SELECT conname FROM pg_constraint WHERE conrelid = to_regclass(%s) AND contype = 'p'
+    """, (tabela,))
+    row = cur.fetchone()
+    if row and row[0] != f"{tabela}_pkey":
+        cur.execute(f"ALTER TABLE {tabela} RENAME CONSTRAINT {row[0]} TO {tabela}_pkey")
+
+# Converte as tabelas comuns (não particionadas) do banco para o esquema particionado,
+# copiando os dados para as partições dos seus dias. Linhas sem data_registro não têm
+# partição e são descartadas. Tudo roda em uma única transação.
+def migrar(conn, tabelas, arquivo_sql):
+    with open(arquivo_sql, encoding="utf-8") as f:
+        esquema = f.read()
+    try:
+        with conn.cursor() as cur:
+            antigas = []
+            for tabela in tabelas:
+                cur.execute("SELECT relkind FROM pg_class WHERE oid = to_regclass(%s)", (tabela,))
+                row = cur.fetchone()
+                if row and row[0] == "r":
+                    cur.execute(f"ALTER TABLE {tabela} RENAME TO {tabela}_antiga")
+                    antigas.append(tabela)
+            if not antigas:
+                print("Nenhuma tabela a converter.")
+                return []
+
+            # Cria as tabelas particionadas (os índices nomeados voltam na segunda aplicação,
+            # depois que as tabelas antigas, donas dos nomes, forem removidas)
+            cur.execute(esquema)
+
+            for tabela in antigas:
+                antiga = f"{tabela}_antiga"
+                cur.execute(f"SELECT DISTINCT data_registro::date FROM {antiga} WHERE data_registro IS NOT NULL")
+                garantir(cur, tabela, [row[0] for row in cur.fetchall()])
+
+                novas = colunas_tabela(cur, tabela)
+                colunas = ", ".join(c for c in colunas_tabela(cur, antiga) if c in novas)
+                cur.execute(f"INSERT INTO {tabela} ({colunas}) SELECT {colunas} FROM {antiga} WHERE data_registro IS NOT NULL")
+                copiadas = cur.rowcount
+                cur.execute(f"SELECT count(*) FROM {antiga} WHERE data_registro IS NULL")
+                descartadas = cur.fetchone()[0]
+
+                for coluna in novas:
+                    cur.execute("SELECT pg_get_serial_sequence(%s, %s)", (tabela, coluna))
+                    sequencia = cur.fetchone()[0]
+                    if sequencia:
+                        cur.execute(f"SELECT setval(%s, COALESCE(max({coluna}), 0) + 1, false) FROM {tabela}", (sequencia,))
+
+                cur.execute(f"DROP TABLE {antiga} CASCADE")
+                restaurar_nome_chave(cur, tabela)
+                print(f"{tabela}: {copiadas} linhas copiadas, {descartadas} sem data_registro descartadas.")
+
+            cur.execute(esquema)
+        conn.commit()
+        return antigas
+    except Exception:
+        conn.rollback()
+        raise
+
+# python -m app.services.particoes <plataforma>
+def main(argv=None):
+    argv = sys.argv[1:] if argv is None else argv
+    if len(argv) != 1 or argv[0] not in ("mercadolivre", "magalu", "amazon"):
+        print("Uso: python -m app.services.particoes mercadolivre|magalu|amazon")
+        return 1
+    plataforma = argv[0]
+    modulo = importlib.import_module(f"app.services.{plataforma}")
+    conn = modulo.get_connection()
+    if not conn:
+        print("Erro ao conectar com o banco de dados.")
+        return 1
+    try:
+        migrar(conn, modulo.TABELAS_PARTICIONADAS, os.path.join(DIR_SQL, f"{plataforma}.sql"))
+    finally:
+        conn.close()
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
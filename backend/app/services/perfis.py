@@ -0,0 +1,113 @@
+import marshal
+import pstats
+import cProfile
+import threading
+from contextlib import contextmanager
+from contextvars import ContextVar
+from app.services import cliente_async
+
+# ------------------------- PERFIL DA COLETA (cProfile) ----------------------------
+
+# O cProfile só mede a thread em que foi ligado. O perfil de uma execução junta um
+# profiler por thread: o da thread que roda a coleta, o de cada thread de gravação em
+# segundo plano (escrita_staging, que herda o contexto da coleta e chama perfis.thread())
+# e o da thread do event loop de cliente_async, onde rodam as requisições. Ao final as
+# estatísticas são somadas em um único perfil no formato do pstats.
+#
+# A thread do event loop é compartilhada: o perfil dela inclui as requisições de outras
+# coletas que rodaram ao mesmo tempo, e só uma execução por vez a mede (as demais
+# ficam sem essa parte).
+
+_perfil_atual = ContextVar("perfil_coleta", default=None)
+_loop_em_uso = threading.Lock()
+
+# Espera máxima (segundos) para o event loop ligar ou desligar o seu profiler
+ESPERA_LOOP = 5
+
+class PerfilColeta:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._profilers = []
+        self._principal = None
+        self._loop = None
+        self._token = None
+
+    def _novo(self):
+        profiler = cProfile.Profile()
+        with self._lock:
+            self._profilers.append(profiler)
+        return profiler
+
+    # Mede um bloco na thread atual
+    @contextmanager
+    def medir(self):
+        profiler = self._novo()
+        profiler.enable()
+        try:
+            yield
+        finally:
+            profiler.disable()
+
+    # Executa funcao na thread do event loop e espera terminar
+    def _no_loop(self, loop, funcao):
+        feito = threading.Event()
+        def executar():
+            try:
+                funcao()
+            finally:
+                feito.set()
+        loop.call_soon_threadsafe(executar)
+        return feito.wait(ESPERA_LOOP)
+
+    # Liga o profiler da thread atual e o da thread do event loop, e torna o perfil
+    # visível às threads que herdarem o contexto
+    def iniciar(self):
+        self._token = _perfil_atual.set(self)
+        if _loop_em_uso.acquire(blocking=False):
+            loop = cliente_async.obter_loop()
+            profiler = self._novo()
+            if self._no_loop(loop, profiler.enable):
+                self._loop = (loop, profiler)
+            else:
+                _loop_em_uso.release()
+                with self._lock:
+                    self._profilers.remove(profiler)
+        self._principal = self._novo()
+        self._principal.enable()
+
+    def parar(self):
+        self._principal.disable()
+        if self._loop is not None:
+            loop, profiler = self._loop
+            if not self._no_loop(loop, profiler.disable):
+                # O loop não respondeu: o perfil sai sem a parte do event loop
+                with self._lock:
+                    self._profilers.remove(profiler)
+            self._loop = None
+            _loop_em_uso.release()
+        _perfil_atual.reset(self._token)
+
+    # Soma os perfis das threads e serializa no formato do pstats (carregável com pstats.Stats)
+    def serializar(self):
+        estatisticas = None
+        with self._lock:
+            profilers = list(self._profilers)
+        for profiler in profilers:
+            profiler.create_stats()
+            if not profiler.stats:
+                continue
+            if estatisticas is None:
+                estatisticas = pstats.Stats(profiler)
+            else:
+                estatisticas.add(profiler)
+        return marshal.dumps(estatisticas.stats if estatisticas else {})
+
+# Mede o bloco na thread atual se a execução (contexto) atual tiver perfil
+@contextmanager
+def thread():
+    perfil = _perfil_atual.get()
+    if perfil is None:
+        yield
+        return
+    with perfil.medir():
+        yield
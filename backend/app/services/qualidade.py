@@ -0,0 +1,391 @@
+import os
+import json
+import string
+import hashlib
+import numpy as np
+import pandas as pd
+from app.services import particoes
+
+# ------------------------- REGRAS DE QUALIDADE ----------------------------
+
+# As verificações de qualidade de cada plataforma são regras declaradas em configuração
+# (REGRAS_PADRAO abaixo, sobrescritas por um arquivo JSON opcional) e compiladas uma vez
+# em expressões sobre colunas do pandas. A avaliação de um vendedor percorre cada tabela
+# uma única vez: as regras sobre imagens e atributos viram colunas auxiliares agregadas
+# por SKU em um só groupby, e as regras sobre o produto são operações vetorizadas nas
+# colunas da tabela de produtos. O resultado tem uma coluna de mensagem por regra (a
+# coluna correspondente em erros_qualidade), na ordem das regras e alinhada às linhas
+# dos produtos.
+#
+# Cada regra é um dict com "coluna" (saída), "tipo" e as opções do tipo:
+#   tamanho      "campo" com "minimo"/"maximo" caracteres; "nao_vazio" recusa textos em branco
+#   preenchido   "campo" não nulo e não vazio; "invalidos" lista textos tratados como vazios
+#                (comparação sem maiúsculas e espaços nas pontas)
+#   zero         "campo" nulo ou igual a zero
+#   dimensoes    todos os "campos" numéricos com pelo menos "minimo"
+#   quantidade   linhas da "tabela" filha por SKU, pelo menos "minimo"
+#   resolucao    imagens da "tabela" com "campo" 'LxA' abaixo de "minimo" px em algum lado (máximo 0)
+#   vazios       linhas da "tabela" com "campo" nulo ou vazio (máximo 0)
+# e as mensagens "ok" (padrão "OK"; null para usar sempre a mensagem de erro) e "erro",
+# que pode usar {quantidade} (contagem da regra), {faltam} (minimo - quantidade) e
+# {valor} (valor do campo).
+#
+# Variáveis de ambiente:
+#   QUALIDADE_REGRAS   arquivo JSON {plataforma: {entidade: [regras]}}; regras com a mesma
+#                      "coluna" substituem as padrão e as novas são acrescentadas
+#   QUALIDADE_INCREMENTAL  "0" reavalia e regrava todos os SKUs a cada verificação (padrão "1":
+#                      só os SKUs com entradas alteradas, ver VERIFICAÇÃO INCREMENTAL)
+
+ARQUIVO_REGRAS = os.getenv("QUALIDADE_REGRAS", "")
+INCREMENTAL = os.getenv("QUALIDADE_INCREMENTAL", "1") != "0"
+
+TEXTO_PREENCHER = "Necessário preencher"
+
+REGRAS_PADRAO = {
+    "mercadolivre": {
+        "produtos": [
+            {"coluna": "titulo", "tipo": "tamanho", "campo": "titulo", "minimo": 50, "maximo": 60, "erro": TEXTO_PREENCHER},
+            {"coluna": "qtd_imagem", "tipo": "quantidade", "tabela": "imagens", "minimo": 6,
+             "erro": "Necessário adicionar mais {faltam} imagens"},
+            {"coluna": "resolucao_imagem", "tipo": "resolucao", "tabela": "imagens", "campo": "resolucao", "minimo": 1000,
+             "erro": "{quantidade} imagens com a qualidade baixa"},
+            {"coluna": "descricao", "tipo": "tamanho", "campo": "descricao", "minimo": 501, "nao_vazio": True, "erro": TEXTO_PREENCHER},
+            {"coluna": "garantia", "tipo": "preenchido", "campo": "garantia", "invalidos": ["null", "sem garantia informada"],
+             "erro": "Sem garantia informada"},
+            {"coluna": "atributos", "tipo": "vazios", "tabela": "atributos", "campo": "valor", "ok": None,
+             "erro": "{quantidade} campos vazios"}
+        ]
+    },
+    "magalu": {
+        "produtos": [
+            {"coluna": "titulo", "tipo": "tamanho", "campo": "titulo", "minimo": 10, "maximo": 60, "erro": TEXTO_PREENCHER},
+            {"coluna": "qtd_imagem", "tipo": "quantidade", "tabela": "imagens", "minimo": 4,
+             "erro": "Necessário adicionar mais {faltam} imagens"},
+            {"coluna": "resolucao_imagem", "tipo": "resolucao", "tabela": "imagens", "campo": "resolucao", "minimo": 1000,
+             "erro": "{quantidade} imagens com qualidade baixa"},
+            {"coluna": "descricao", "tipo": "tamanho", "campo": "descricao", "minimo": 501, "nao_vazio": True, "erro": TEXTO_PREENCHER},
+            {"coluna": "atributos", "tipo": "vazios", "tabela": "atributos", "campo": "valor", "ok": None,
+             "erro": "{quantidade} campos vazios"},
+            {"coluna": "marca", "tipo": "preenchido", "campo": "marca", "erro": TEXTO_PREENCHER}
+        ]
+    },
+    "amazon": {
+        "produtos": [
+            {"coluna": "resolucao_imagem", "tipo": "dimensoes", "campos": ["imagem_largura", "imagem_altura"], "minimo": 500,
+             "erro": "Resolução baixa"}
+        ],
+        "estoque": [
+            {"coluna": "disponivel_vendavel", "tipo": "preenchido", "campo": "disponivel_vendavel", "erro": "Sem estoque"},
+            {"coluna": "inutilizavel_total", "tipo": "zero", "campo": "inutilizavel_total", "erro": "{valor} itens inutilizáveis"}
+        ]
+    }
+}
+
+# ------------------------- CONFIGURAÇÃO ----------------------------
+
+# Regras padrão com as do arquivo de configuração aplicadas por cima
+def carregar_regras(arquivo=None):
+    arquivo = ARQUIVO_REGRAS if arquivo is None else arquivo
+    regras = {p: {e: list(lista) for e, lista in entidades.items()} for p, entidades in REGRAS_PADRAO.items()}
+    if not arquivo:
+        return regras
+    try:
+        with open(arquivo, encoding="utf-8") as f:
+            configuradas = json.load(f)
+    except (OSError, ValueError) as e:
+        print(f"Erro ao ler as regras de qualidade de {arquivo}, usando as padrão: {e}")
+        return regras
+    for plataforma, entidades in configuradas.items():
+        for entidade, lista in entidades.items():
+            atuais = regras.setdefault(plataforma, {}).setdefault(entidade, [])
+            for regra in lista:
+                posicao = next((i for i, r in enumerate(atuais) if r["coluna"] == regra["coluna"]), None)
+                if posicao is None:
+                    atuais.append(regra)
+                else:
+                    atuais[posicao] = regra
+    return regras
+
+# ------------------------- COMPILAÇÃO ----------------------------
+
+class Regras:
+    # 'regras' é a lista de regras de uma entidade; 'chave' liga as tabelas filhas ao produto
+    def __init__(self, regras, chave="sku_id"):
+        self.chave = chave
+        self.colunas = [regra["coluna"] for regra in regras]
+        # Colunas lidas por tabela ("" é a tabela principal), para o hash das entradas
+        self._campos = {"": set()}
+        # tabela filha -> [(coluna auxiliar, função da tabela -> Series)]
+        self._auxiliares = {}
+        self._assinatura = _assinatura(regras)
+        self._avaliacoes = [self._compilar(regra) for regra in regras]
+
+    # Coluna auxiliar somada por SKU no groupby da tabela filha
+    def _auxiliar(self, tabela, nome, funcao):
+        self._auxiliares.setdefault(tabela, []).append((nome, funcao))
+        return nome
+
+    def _compilar(self, regra):
+        tipo = regra["tipo"]
+        ok = regra.get("ok", "OK")
+        erro = regra["erro"]
+
+        if tipo in ("quantidade", "resolucao", "vazios"):
+            tabela = regra["tabela"]
+            self._campos.setdefault(tabela, set()).update(filter(None, [regra.get("campo")]))
+            if tipo == "quantidade":
+                auxiliar = self._auxiliar(tabela, f"_{regra['coluna']}", lambda df: pd.Series(1, index=df.index))
+                minimo = regra["minimo"]
+                def avaliar(produtos, agregados):
+                    quantidade = agregados(tabela, auxiliar)
+                    return _mensagem(quantidade >= minimo, ok, erro, quantidade=quantidade, faltam=minimo - quantidade)
+                return avaliar
+            if tipo == "resolucao":
+                campo, minimo = regra["campo"], regra["minimo"]
+                auxiliar = self._auxiliar(tabela, f"_{regra['coluna']}", lambda df: _resolucao_baixa(df, campo, minimo))
+            else:
+                campo = regra["campo"]
+                auxiliar = self._auxiliar(tabela, f"_{regra['coluna']}", lambda df: _vazios(df, campo))
+            def avaliar(produtos, agregados):
+                quantidade = agregados(tabela, auxiliar)
+                return _mensagem(quantidade == 0, ok, erro, quantidade=quantidade)
+            return avaliar
+
+        self._campos[""].update(regra.get("campos") or filter(None, [regra.get("campo")]))
+
+        if tipo == "tamanho":
+            campo = regra["campo"]
+            minimo, maximo, nao_vazio = regra.get("minimo"), regra.get("maximo"), regra.get("nao_vazio", False)
+            def avaliar(produtos, agregados):
+                serie = _coluna(produtos, campo)
+                texto = serie.astype(str)
+                tamanho = texto.str.len()
+                valido = serie.notna()
+                if nao_vazio:
+                    valido &= texto.str.strip() != ""
+                if minimo is not None:
+                    valido &= tamanho >= minimo
+                if maximo is not None:
+                    valido &= tamanho <= maximo
+                return _mensagem(valido, ok, erro, valor=serie)
+            return avaliar
+
+        if tipo == "preenchido":
+            campo = regra["campo"]
+            invalidos = {""} | {str(v).strip().lower() for v in regra.get("invalidos", [])}
+            def avaliar(produtos, agregados):
+                serie = _coluna(produtos, campo)
+                valido = serie.notna() & ~serie.astype(str).str.strip().str.lower().isin(invalidos)
+                return _mensagem(valido, ok, erro, valor=serie)
+            return avaliar
+
+        if tipo == "zero":
+            campo = regra["campo"]
+            def avaliar(produtos, agregados):
+                serie = _coluna(produtos, campo)
+                valido = serie.isna() | (pd.to_numeric(serie, errors="coerce") == 0)
+                return _mensagem(valido, ok, erro, valor=serie)
+            return avaliar
+
+        if tipo == "dimensoes":
+            campos, minimo = regra["campos"], regra["minimo"]
+            def avaliar(produtos, agregados):
+                valido = pd.Series(True, index=produtos.index)
+                for campo in campos:
+                    valido &= pd.to_numeric(_coluna(produtos, campo), errors="coerce").fillna(0) >= minimo
+                return _mensagem(valido, ok, erro)
+            return avaliar
+
+        raise ValueError(f"Tipo de regra de qualidade desconhecido: {tipo}")
+
+    # Mensagens de cada regra para as linhas de 'produtos'; 'tabelas' são as tabelas filhas
+    # (imagens, atributos) com a coluna da chave
+    def avaliar(self, produtos, **tabelas):
+        chaves = _coluna(produtos, self.chave)
+        somas = {}
+        for tabela, auxiliares in self._auxiliares.items():
+            df = tabelas.get(tabela)
+            if df is None or df.empty or self.chave not in df:
+                somas[tabela] = None
+                continue
+            colunas = pd.DataFrame({nome: funcao(df) for nome, funcao in auxiliares}, index=df.index)
+            colunas[self.chave] = df[self.chave]
+            somas[tabela] = colunas.groupby(self.chave, sort=False).sum()
+
+        def agregados(tabela, auxiliar):
+            soma = somas.get(tabela)
+            if soma is None:
+                return pd.Series(0, index=produtos.index)
+            return chaves.map(soma[auxiliar]).fillna(0).astype(int)
+
+        resultado = pd.DataFrame(index=produtos.index)
+        for coluna, avaliar in zip(self.colunas, self._avaliacoes):
+            resultado[coluna] = avaliar(produtos, agregados)
+        return resultado
+
+    # Hash (int64) das entradas de cada linha de 'produtos': as colunas lidas pelas regras e as
+    # 'colunas' extras da linha, as linhas das tabelas filhas do SKU nas colunas usadas (somadas,
+    # sem depender da ordem), os valores de 'extras' (um por linha) e as próprias regras
+    def hashes(self, produtos, colunas=(), extras=None, **tabelas):
+        chaves = _coluna(produtos, self.chave)
+        partes = pd.DataFrame({"_produto": _hash_linhas(produtos, [self.chave, *sorted(self._campos[""] | set(colunas))])})
+        for tabela in sorted(t for t in self._campos if t):
+            df = tabelas.get(tabela)
+            if df is None or df.empty or self.chave not in df:
+                partes[tabela] = np.uint64(0)
+                continue
+            por_linha = pd.Series(_hash_linhas(df, [self.chave, *sorted(self._campos[tabela])]), index=df[self.chave].to_numpy())
+            partes[tabela] = por_linha.groupby(level=0, sort=False).sum().reindex(chaves.to_numpy(), fill_value=0).to_numpy()
+        if extras is not None:
+            partes["_extras"] = pd.Series(list(extras), dtype=object).astype(str).to_numpy()
+        partes["_regras"] = self._assinatura
+        return pd.util.hash_pandas_object(partes, index=False).to_numpy().view(np.int64)
+
+# ------------------------- EXPRESSÕES ----------------------------
+
+# Hash por linha das colunas informadas, lidas como texto (o tipo inferido pelo pandas
+# pode variar entre execuções sem que o valor mude)
+def _hash_linhas(df, campos):
+    return pd.util.hash_pandas_object(
+        pd.DataFrame({campo: _coluna(df, campo).astype(object).astype(str).to_numpy() for campo in campos}),
+        index=False
+    ).to_numpy()
+
+def _assinatura(regras):
+    texto = json.dumps(regras, sort_keys=True, ensure_ascii=False, default=str)
+    return int.from_bytes(hashlib.sha1(texto.encode("utf-8")).digest()[:8], "big", signed=True)
+
+def _coluna(df, campo):
+    if campo in df:
+        return df[campo]
+    return pd.Series(None, index=df.index, dtype=object)
+
+def _vazios(df, campo):
+    serie = _coluna(df, campo)
+    return (serie.isna() | (serie == "")).astype(int)
+
+# Imagens 'LxA' com algum lado abaixo do mínimo; textos fora do formato não contam
+def _resolucao_baixa(df, campo, minimo):
+    serie = _coluna(df, campo)
+    texto = serie.where(serie.map(lambda v: isinstance(v, str)), None).astype(object)
+    partes = texto.str.lower().str.extract(r"^\s*([+-]?\d+)\s*x\s*([+-]?\d+)\s*$")
+    largura = pd.to_numeric(partes[0], errors="coerce")
+    altura = pd.to_numeric(partes[1], errors="coerce")
+    return ((largura < minimo) | (altura < minimo)).astype(int)
+
+# "ok" onde 'valido', senão o texto de erro com os valores de cada linha no lugar de {nome}
+def _mensagem(valido, ok, erro, **valores):
+    erros = _formatar(erro, valido.index, valores)
+    if ok is None:
+        return erros
+    return erros.where(~valido.astype(bool), ok)
+
+def _formatar(modelo, indice, valores):
+    resultado = pd.Series("", index=indice, dtype=object)
+    for literal, nome, _, _ in string.Formatter().parse(modelo):
+        if literal:
+            resultado = resultado + literal
+        if nome is not None:
+            resultado = resultado + valores[nome].map(str)
+    return resultado
+
+# ------------------------- REGRAS COMPILADAS ----------------------------
+
+REGRAS = carregar_regras()
+
+# Chave das tabelas filhas por entidade
+CHAVES = {"produtos": "sku_id", "estoque": "asin"}
+
+_compiladas = {
+    (plataforma, entidade): Regras(lista, CHAVES.get(entidade, "sku_id"))
+    for plataforma, entidades in REGRAS.items()
+    for entidade, lista in entidades.items()
+}
+
+# Avalia as regras da plataforma sobre a tabela da entidade (produtos, estoque) e as
+# tabelas filhas informadas (imagens=..., atributos=...)
+def avaliar(plataforma, entidade, tabela, **tabelas):
+    return _compiladas[(plataforma, entidade)].avaliar(tabela, **tabelas)
+
+def colunas(plataforma, entidade):
+    return _compiladas[(plataforma, entidade)].colunas
+
+def hashes(plataforma, entidade, tabela, colunas=(), extras=None, **tabelas):
+    return _compiladas[(plataforma, entidade)].hashes(tabela, colunas, extras, **tabelas)
+
+# ------------------------- VERIFICAÇÃO INCREMENTAL ----------------------------
+
+# Cada linha de erros_qualidade guarda em hash_entradas o hash do que a produziu (hashes
+# acima). Uma verificação lê os hashes do último dia verificado do vendedor e só avalia
+# os SKUs novos ou com hash diferente. No mesmo dia, apaga apenas as linhas desses SKUs e
+# as dos SKUs que saíram do catálogo; na primeira verificação do dia, copia no banco
+# (INSERT ... SELECT) as linhas inalteradas do último dia para o dia corrente. Os
+# registros gravados ficam proporcionais ao que mudou.
+
+# (último dia com erros do vendedor, {sku_id: hash_entradas}); (None, {}) sem histórico ou desligado
+def ultimos_hashes(get_connection, tabela, vendedor):
+    if not INCREMENTAL:
+        return None, {}
+    conn = get_connection()
+    if not conn:
+        print("Erro ao conectar para ler os hashes da verificação de qualidade.")
+        return None, {}
+    try:
+        with conn.cursor() as cursor:
+            cursor.execute(f"SELECT max(data_registro) FROM {tabela} WHERE vendedor = %s", (vendedor,))
+            ultimo = cursor.fetchone()[0]
+            if ultimo is None:
+                return None, {}
+            cursor.execute(f"""
+                SELECT sku_id, hash_entradas FROM {tabela}
+                WHERE vendedor = %s AND data_registro >= %s AND data_registro < %s
+            """, (vendedor, *particoes.intervalo_dia(ultimo)))
+            return ultimo, dict(cursor.fetchall())
+    except Exception as e:
+        conn.rollback()
+        print(f"Erro ao ler os hashes da verificação de qualidade, verificando tudo: {e}")
+        return None, {}
+    finally:
+        conn.close()
+
+# Máscara das linhas cujo hash difere do gravado
+def alterados(chaves, hashes_atuais, anteriores):
+    return np.fromiter(
+        (anteriores.get(chave) != valor for chave, valor in zip(chaves, hashes_atuais.tolist())),
+        dtype=bool, count=len(hashes_atuais)
+    )
+
+# Seleciona as linhas de 'produtos' a reavaliar: (máscara, hashes de todas as linhas, último
+# dia verificado, {sku_id: hash} do último dia). 'colunas', 'extras' e 'tabelas' como em hashes.
+def selecionar(get_connection, plataforma, tabela_erros, vendedor, produtos, colunas=(), extras=None, **tabelas):
+    hashes_atuais = hashes(plataforma, "produtos", produtos, colunas, extras, **tabelas)
+    ultimo, anteriores = ultimos_hashes(get_connection, tabela_erros, vendedor)
+    return alterados(produtos["sku_id"], hashes_atuais, anteriores), hashes_atuais, ultimo, anteriores
+
+# Linhas das tabelas filhas que pertencem aos SKUs informados
+def filtrar(tabelas, skus, chave="sku_id"):
+    return [df if df is None or df.empty or chave not in df else df[df[chave].isin(skus)] for df in tabelas]
+
+# Prepara o dia corrente para receber as linhas de 'avaliados' (SKUs reavaliados): no mesmo
+# dia do último, remove as linhas desses SKUs e as dos que não estão mais em 'atuais'; em
+# outro dia, copia as linhas inalteradas do último dia. 'colunas' são as colunas da tabela
+# copiadas além de data_registro. Retorna o número de linhas copiadas.
+def preparar_dia(cursor, tabela, colunas, vendedor, data_registro, ultimo, anteriores, atuais, avaliados):
+    avaliados = set(avaliados)
+    if ultimo is not None and particoes.dia_de(ultimo) == particoes.dia_de(data_registro):
+        removidos = avaliados | (set(anteriores) - set(atuais))
+        if removidos:
+            particoes.limpar_dia(cursor, tabela, vendedor, data_registro, "sku_id", removidos)
+        return 0
+
+    particoes.limpar_dia(cursor, tabela, vendedor, data_registro)
+    inalterados = [sku for sku in set(atuais) - avaliados if sku in anteriores]
+    if ultimo is None or not inalterados:
+        return 0
+    lista = ", ".join(colunas)
+    cursor.execute(f"""
+        INSERT INTO {tabela} ({lista}, data_registro)
+        SELECT {lista}, %s FROM {tabela}
+        WHERE vendedor = %s AND data_registro >= %s AND data_registro < %s AND sku_id = ANY(%s)
+    """, (data_registro, vendedor, *particoes.intervalo_dia(ultimo), inalterados))
+    return cursor.rowcount
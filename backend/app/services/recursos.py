@@ -0,0 +1,124 @@
+import os
+import time
+import asyncio
+import threading
+import psycopg2
+from psycopg2 import pool as pg_pool
+
+# ------------------------- RECURSOS COMPARTILHADOS POR PLATAFORMA ----------------------------
+
+# Coletas da mesma plataforma (inclusive de vendedores diferentes, rodando em paralelo)
+# compartilham o orçamento de requisições por segundo e o pool de conexões com o banco.
+# As conexões HTTP são compartilhadas pelo cliente de cliente_async.py.
+#
+# Variáveis de ambiente (por plataforma, ex.: MAGALU_RPS):
+#   {PLATAFORMA}_RPS          requisições por segundo (0 = sem limite; padrão em RPS_PADRAO)
+#   {PLATAFORMA}_RAJADA       requisições liberadas de uma vez (padrão: 1 segundo de RPS)
+#   {PLATAFORMA}_DB_POOL      conexões com o banco mantidas abertas
+
+# Orçamento padrão das plataformas cujas chamadas saem em paralelo sem outro limite (as
+# janelas de offset da paginação da Magalu); as demais partem sem limite
+RPS_PADRAO = {"magalu": 10}
+
+_lock = threading.Lock()
+_limites = {}
+_pools = {}
+
+def _config(plataforma, nome, padrao):
+    return float(os.getenv(f"{plataforma.upper()}_{nome}", padrao))
+
+# ------------------------- ORÇAMENTO DE REQUISIÇÕES ----------------------------
+
+# Token bucket: libera rps fichas por segundo, acumulando até 'rajada' fichas (padrão:
+# 1 segundo de rps). Cada chamada reserva uma ficha (o saldo pode ficar negativo) e
+# recebe quanto tempo deve esperar, o que serve tanto para threads (time.sleep) quanto
+# para corrotinas (asyncio.sleep).
+class LimiteTaxa:
+    def __init__(self, rps, rajada=None):
+        self.rps = rps
+        self.rajada = rajada or rps
+        self.fichas = self.rajada
+        self.ultimo = time.monotonic()
+        self.lock = threading.Lock()
+
+    def reservar(self):
+        if self.rps <= 0:
+            return 0
+        with self.lock:
+            agora = time.monotonic()
+            self.fichas = min(self.rajada, self.fichas + (agora - self.ultimo) * self.rps)
+            self.ultimo = agora
+            self.fichas -= 1
+            return max(0, -self.fichas / self.rps)
+
+    def aguardar(self):
+        espera = self.reservar()
+        if espera:
+            time.sleep(espera)
+
+    async def aguardar_async(self):
+        espera = self.reservar()
+        if espera:
+            await asyncio.sleep(espera)
+
+# Orçamento compartilhado de uma plataforma ou de um endpoint com cota própria
+# (ex.: limite("amazon_itens") lê AMAZON_ITENS_RPS e AMAZON_ITENS_RAJADA)
+def limite(plataforma, rps_padrao=0, rajada_padrao=0):
+    with _lock:
+        if plataforma not in _limites:
+            _limites[plataforma] = LimiteTaxa(
+                _config(plataforma, "RPS", rps_padrao or RPS_PADRAO.get(plataforma, 0)),
+                _config(plataforma, "RAJADA", rajada_padrao)
+            )
+        return _limites[plataforma]
+
+# ------------------------- POOL DE CONEXÕES COM O BANCO ----------------------------
+
+# Conexão emprestada do pool: close() devolve ao pool em vez de fechar. Leitura e escrita
+# de atributos (autocommit, isolation_level...) e o bloco with (commit ou rollback da
+# transação, como na conexão do psycopg2) vão para a conexão real; o autocommit ligado
+# por quem pegou a conexão é desfeito na devolução.
+class ConexaoPool:
+    _PROPRIOS = ("_pool", "_conn")
+
+    def __init__(self, pool, conn):
+        self._pool = pool
+        self._conn = conn
+
+    def __getattr__(self, nome):
+        return getattr(self._conn, nome)
+
+    def __setattr__(self, nome, valor):
+        if nome in self._PROPRIOS:
+            object.__setattr__(self, nome, valor)
+        else:
+            setattr(self._conn, nome, valor)
+
+    def __enter__(self):
+        self._conn.__enter__()
+        return self
+
+    def __exit__(self, tipo, erro, rastro):
+        return self._conn.__exit__(tipo, erro, rastro)
+
+    def close(self):
+        if self._conn is None:
+            return
+        conn, self._conn = self._conn, None
+        if not conn.closed and conn.autocommit:
+            conn.autocommit = False
+        self._pool.putconn(conn, close=bool(conn.closed))
+
+# Retorna uma conexão do pool da plataforma (criado na primeira chamada)
+def conectar(plataforma, **parametros):
+    with _lock:
+        if plataforma not in _pools:
+            tamanho = int(_config(plataforma, "DB_POOL", 4))
+            _pools[plataforma] = pg_pool.ThreadedConnectionPool(0, tamanho, **parametros)
+        db_pool = _pools[plataforma]
+    try:
+        conn = db_pool.getconn()
+    except pg_pool.PoolError:
+        # Pool esgotado: usa uma conexão avulsa, fechada normalmente no close()
+        return psycopg2.connect(**parametros)
+    return ConexaoPool(db_pool, conn)
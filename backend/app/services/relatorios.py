@@ -0,0 +1,120 @@
+import os
+import json
+import zipfile
+import tempfile
+import itertools
+import pandas as pd
+import xlsxwriter
+
+# ------------------------- RELATÓRIOS EM STREAMING ----------------------------
+
+# As consultas dos relatórios do dia usam cursores nomeados (server-side): o Postgres
+# entrega as linhas em lotes de fetchmany e nenhuma tabela é carregada inteira na
+# memória. Cada lote vira linhas de uma planilha XLSX escrita em modo constant_memory
+# diretamente dentro do ZIP, que fica em um arquivo temporário (em memória só até
+# RELATORIOS_ZIP_MEMORIA_MB). Assim o pico de memória não cresce com o número de linhas.
+#
+# Variáveis de ambiente:
+#   RELATORIOS_LINHAS_POR_LOTE   linhas trazidas do banco por fetchmany (padrão 2000)
+#   RELATORIOS_ZIP_MEMORIA_MB    tamanho do ZIP mantido em memória antes de ir para disco (padrão 8)
+
+LINHAS_POR_LOTE = int(os.getenv("RELATORIOS_LINHAS_POR_LOTE", 2000))
+ZIP_MEMORIA_MB = float(os.getenv("RELATORIOS_ZIP_MEMORIA_MB", 8))
+BLOCO_DOWNLOAD = 64 * 1024
+
+# ------------------------- LEITURA EM LOTES ----------------------------
+
+# Executa a consulta em um cursor nomeado e gera (colunas, linhas) a cada lote.
+# A conexão só é aberta quando o primeiro lote é pedido e é devolvida ao final
+# (ou quando o consumidor para antes).
+def ler_em_lotes(get_connection, sql, parametros=()):
+    conn = get_connection()
+    if not conn:
+        return
+    cursor = None
+    try:
+        cursor = conn.cursor(name="relatorio_do_dia")
+        cursor.itersize = LINHAS_POR_LOTE
+        cursor.execute(sql, parametros)
+        while True:
+            linhas = cursor.fetchmany(LINHAS_POR_LOTE)
+            if not linhas:
+                break
+            yield [desc[0] for desc in cursor.description], linhas
+    finally:
+        if cursor is not None:
+            cursor.close()
+        conn.rollback()
+        conn.close()
+
+# Junta os lotes em um DataFrame (para as etapas que precisam da tabela inteira)
+def para_dataframe(lotes):
+    colunas = None
+    linhas = []
+    for colunas, lote in lotes:
+        linhas.extend(lote)
+    if colunas is None:
+        return pd.DataFrame()
+    return pd.DataFrame.from_records(linhas, columns=colunas)
+
+# ------------------------- PLANILHAS E ZIP ----------------------------
+
+# Converte os tipos que o xlsxwriter não escreve sozinho (JSON, listas, UUID...)
+def _valor_celula(valor):
+    if valor is None or isinstance(valor, (str, int, float, bool)):
+        return valor
+    if isinstance(valor, (dict, list)):
+        return json.dumps(valor, ensure_ascii=False, default=str)
+    if hasattr(valor, "isoformat") or hasattr(valor, "as_tuple"):
+        return valor
+    return str(valor)
+
+# Escreve os lotes como planilha 'nome' dentro do ZIP. Tabelas vazias não geram arquivo.
+# Textos são gravados como texto: links viram hiperlinks guardados em memória até o fim
+# da planilha (e o Excel aceita só 65.530 por planilha). Retorna o número de linhas escritas.
+def escrever_planilha(zf, nome, lotes):
+    lotes = iter(lotes)
+    primeiro = next(lotes, None)
+    if primeiro is None:
+        return 0
+    total = 0
+    with zf.open(nome, "w") as destino:
+        workbook = xlsxwriter.Workbook(destino, {
+            "constant_memory": True,
+            "remove_timezone": True,
+            "nan_inf_to_errors": True,
+            "strings_to_urls": False,
+            "strings_to_formulas": False,
+            "default_date_format": "yyyy-mm-dd hh:mm:ss"
+        })
+        planilha = workbook.add_worksheet()
+        cabecalho = workbook.add_format({"bold": True, "border": 1, "align": "center", "valign": "top"})
+        colunas, _ = primeiro
+        planilha.write_row(0, 0, colunas, cabecalho)
+        for _, linhas in itertools.chain([primeiro], lotes):
+            for linha in linhas:
+                total += 1
+                planilha.write_row(total, 0, [_valor_celula(v) for v in linha])
+        workbook.close()
+    return total
+
+# Gera o ZIP com uma planilha por item de 'planilhas' ([(nome_arquivo, lotes)]).
+# As consultas rodam uma por vez, na ordem da lista.
+def gerar_zip(planilhas):
+    zip_stream = tempfile.SpooledTemporaryFile(max_size=int(ZIP_MEMORIA_MB * 1024 * 1024))
+    with zipfile.ZipFile(zip_stream, "w") as zf:
+        for nome, lotes in planilhas:
+            escrever_planilha(zf, nome, lotes)
+    zip_stream.seek(0)
+    return zip_stream
+
+# Percorre o ZIP em blocos para a resposta HTTP, fechando o arquivo ao final
+def iterar_arquivo(arquivo):
+    try:
+        while True:
+            bloco = arquivo.read(BLOCO_DOWNLOAD)
+            if not bloco:
+                break
+            yield bloco
+    finally:
+        arquivo.close()
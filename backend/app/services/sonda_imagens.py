@@ -0,0 +1,207 @@
+import os
+import time
+import struct
+import asyncio
+import httpx
+from datetime import datetime, timedelta
+from psycopg2.extras import execute_values
+from app.services import metricas, recursos, cliente_async
+
+# ------------------------- SONDAGEM DE DIMENSÕES DAS IMAGENS ----------------------------
+
+# As verificações de resolução usavam os metadados das APIs (size do Mercado Livre,
+# mainImage da Amazon, type da Magalu — que nem é uma resolução). Aqui a resolução é
+# lida da própria imagem: uma requisição com Range traz só o começo do arquivo e o
+# cabeçalho (JPEG, PNG, GIF ou WebP) é decodificado assim que chega, encerrando o download.
+#
+# O resultado fica na tabela imagens_sondadas do banco da plataforma, por URL e ETag
+# (a mesma tabela guarda o hash perceptual de imagens_duplicadas, descartado quando a
+# ETag muda).
+# Dentro da validade a imagem não é consultada; depois dela, a consulta é condicional
+# (If-None-Match) e uma resposta 304 reaproveita as dimensões gravadas.
+#
+# Variáveis de ambiente:
+#   IMAGENS_SONDAGEM               "1" para sondar as imagens nas coletas (padrão "1")
+#   IMAGENS_PARALELAS              sondagens simultâneas (padrão 16)
+#   IMAGENS_BYTES_MAXIMOS          bytes lidos no máximo por imagem (padrão 65536)
+#   IMAGENS_CACHE_VALIDADE_HORAS   tempo sem reconsultar uma imagem já sondada (padrão 168)
+#   IMAGENS_RPS, IMAGENS_HTTP_POOL orçamento e conexões do cliente "imagens"
+
+ATIVA = os.getenv("IMAGENS_SONDAGEM", "1") == "1"
+PARALELAS = max(1, int(os.getenv("IMAGENS_PARALELAS", 16)))
+BYTES_MAXIMOS = int(os.getenv("IMAGENS_BYTES_MAXIMOS", 65536))
+VALIDADE_HORAS = float(os.getenv("IMAGENS_CACHE_VALIDADE_HORAS", 168))
+
+# Marcadores JPEG de início de quadro (SOFn), que trazem altura e largura
+_MARCADORES_SOF = {0xC0, 0xC1, 0xC2, 0xC3, 0xC5, 0xC6, 0xC7, 0xC9, 0xCA, 0xCB, 0xCD, 0xCE, 0xCF}
+
+# ------------------------- DECODIFICAÇÃO DO CABEÇALHO ----------------------------
+
+def _dimensoes_jpeg(dados):
+    i = 2
+    while i + 9 < len(dados):
+        if dados[i] != 0xFF:
+            return None
+        marcador = dados[i + 1]
+        if marcador == 0xFF:
+            i += 1
+            continue
+        if marcador in (0x01, 0xD8) or 0xD0 <= marcador <= 0xD7:
+            i += 2
+            continue
+        if marcador in _MARCADORES_SOF:
+            altura, largura = struct.unpack(">HH", dados[i + 5:i + 9])
+            return largura, altura
+        i += 2 + struct.unpack(">H", dados[i + 2:i + 4])[0]
+    return None
+
+def _dimensoes_webp(dados):
+    formato = dados[12:16]
+    if formato == b"VP8 " and len(dados) >= 30:
+        largura, altura = struct.unpack("<HH", dados[26:30])
+        return largura & 0x3FFF, altura & 0x3FFF
+    if formato == b"VP8L" and len(dados) >= 25:
+        bits = int.from_bytes(dados[21:25], "little")
+        return (bits & 0x3FFF) + 1, ((bits >> 14) & 0x3FFF) + 1
+    if formato == b"VP8X" and len(dados) >= 30:
+        return int.from_bytes(dados[24:27], "little") + 1, int.from_bytes(dados[27:30], "little") + 1
+    return None
+
+# (largura, altura) a partir dos primeiros bytes da imagem, ou None se ainda não for possível
+def dimensoes(dados):
+    if dados[:8] == b"\x89PNG\r\n\x1a\n" and len(dados) >= 24:
+        return struct.unpack(">II", dados[16:24])
+    if dados[:2] == b"\xff\xd8":
+        return _dimensoes_jpeg(dados)
+    if dados[:4] == b"GIF8" and len(dados) >= 10:
+        return struct.unpack("<HH", dados[6:10])
+    if dados[:4] == b"RIFF" and dados[8:12] == b"WEBP":
+        return _dimensoes_webp(dados)
+    return None
+
+# ------------------------- SONDAGEM ----------------------------
+
+# Lê o começo da imagem até decodificar as dimensões. Com a ETag gravada, a requisição
+# é condicional e o 304 devolve as dimensões do cache.
+async def sondar_async(url, anterior=None):
+    headers = {"Range": f"bytes=0-{BYTES_MAXIMOS - 1}"}
+    if anterior and anterior.get("etag"):
+        headers["If-None-Match"] = anterior["etag"]
+    origem = httpx.URL(url)
+    inicio = time.perf_counter()
+    status = "erro"
+    try:
+        await recursos.limite("imagens").aguardar_async()
+        async with cliente_async.cliente("imagens").stream("GET", url, headers=headers, follow_redirects=True) as response:
+            status = response.status_code
+            if response.status_code == 304 and anterior:
+                return {**anterior, "url": url}
+            if response.status_code not in (200, 206):
+                return None
+            dados = b""
+            resultado = None
+            async for pedaco in response.aiter_bytes():
+                dados += pedaco
+                resultado = dimensoes(dados)
+                if resultado or len(dados) >= BYTES_MAXIMOS:
+                    break
+            if not resultado:
+                return None
+            return {"url": url, "etag": response.headers.get("etag"), "largura": resultado[0], "altura": resultado[1]}
+    except httpx.HTTPError as e:
+        print(f"Erro ao sondar imagem {url}: {e}")
+        return None
+    finally:
+        metricas.observar_requisicao("imagens", f"{origem.scheme}://{origem.host}/", status, time.perf_counter() - inicio)
+
+async def sondar_varias_async(urls, anteriores):
+    semaforo = asyncio.Semaphore(PARALELAS)
+
+    async def sondar(url):
+        async with semaforo:
+            return await sondar_async(url, anteriores.get(url))
+
+    return await asyncio.gather(*(sondar(url) for url in urls))
+
+# ------------------------- CACHE ----------------------------
+
+def carregar_cache(conn, urls):
+    with conn.cursor() as cur:
+        cur.execute("""
+            SELECT url, etag, largura, altura, verificado_em FROM imagens_sondadas WHERE url = ANY(%s)
+        """, (urls,))
+        return {
+            row[0]: {"url": row[0], "etag": row[1], "largura": row[2], "altura": row[3], "verificado_em": row[4]}
+            for row in cur.fetchall()
+        }
+
+def salvar_cache(conn, sondagens):
+    if not sondagens:
+        return
+    agora = datetime.now()
+    with conn.cursor() as cur:
+        execute_values(cur, """
+            INSERT INTO imagens_sondadas (url, etag, largura, altura, verificado_em)
+            VALUES %s
+            ON CONFLICT (url) DO UPDATE SET
+                etag = EXCLUDED.etag,
+                largura = EXCLUDED.largura,
+                altura = EXCLUDED.altura,
+                hash_perceptual = CASE
+                    WHEN imagens_sondadas.etag IS NOT DISTINCT FROM EXCLUDED.etag THEN imagens_sondadas.hash_perceptual
+                END,
+                verificado_em = EXCLUDED.verificado_em
+        """, [(s["url"], s.get("etag"), s["largura"], s["altura"], agora) for s in sondagens])
+    conn.commit()
+
+# Dimensões das imagens: do cache quando válido, sondando as demais. Com somente_cache
+# (reprocessamento sem rede) usa o cache mesmo vencido e não sonda nada.
+# Retorna {url: (largura, altura)}; imagens que falharam ficam de fora.
+def sondar_imagens(urls, get_connection, somente_cache=False):
+    urls = sorted({u for u in urls if u})
+    if not urls:
+        return {}
+    conn = get_connection()
+    try:
+        cache = carregar_cache(conn, urls) if conn else {}
+        limite_validade = datetime.now() - timedelta(hours=VALIDADE_HORAS)
+        validos = {u: c for u, c in cache.items() if somente_cache or c["verificado_em"] > limite_validade}
+        pendentes = [] if somente_cache else [u for u in urls if u not in validos]
+
+        sondagens = []
+        if pendentes:
+            resultados = cliente_async.executar_sync(sondar_varias_async(pendentes, cache))
+            sondagens = [r for r in resultados if r]
+            if conn:
+                try:
+                    salvar_cache(conn, sondagens)
+                except Exception as e:
+                    conn.rollback()
+                    print(f"Erro ao salvar cache de imagens: {e}")
+        print(f"Imagens: {len(validos)} do cache, {len(sondagens)} de {len(pendentes)} sondadas.")
+
+        return {s["url"]: (s["largura"], s["altura"]) for s in list(validos.values()) + sondagens}
+    finally:
+        if conn:
+            conn.close()
+
+# Substitui a resolução informada pela API ('LxA') pela lida das imagens
+def atualizar_resolucoes(imagens, get_connection, campo_url="secure_url", campo_resolucao="resolucao", somente_cache=False):
+    if not ATIVA or not imagens:
+        return
+    medidas = sondar_imagens([img.get(campo_url) for img in imagens], get_connection, somente_cache)
+    for img in imagens:
+        medida = medidas.get(img.get(campo_url))
+        if medida:
+            img[campo_resolucao] = f"{medida[0]}x{medida[1]}"
+
+# O mesmo para as imagens de um lote colunar (colunar.Lote)
+def atualizar_resolucoes_lote(lote, get_connection, campo_url="secure_url", campo_resolucao="resolucao", somente_cache=False):
+    if not ATIVA or not len(lote):
+        return
+    urls = lote.coluna(campo_url)
+    medidas = sondar_imagens(urls, get_connection, somente_cache)
+    for i, url in enumerate(urls):
+        medida = medidas.get(url)
+        if medida:
+            lote.definir(campo_resolucao, i, f"{medida[0]}x{medida[1]}")
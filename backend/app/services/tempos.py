@@ -0,0 +1,65 @@
+import time
+import threading
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+# ------------------------- TEMPOS POR ETAPA ----------------------------
+
+# Relatório de tempos da coleta em andamento. Os serviços marcam as etapas com
+# tempos.etapa("nome") e, fora de uma execução rastreada, a marcação não faz nada.
+_relatorio_atual = ContextVar("relatorio_tempos", default=None)
+
+class RelatorioTempos:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._etapas = {}
+        self._inicio = time.perf_counter()
+        self._fim = None
+
+    # Acumula a duração de um bloco na etapa informada
+    @contextmanager
+    def etapa(self, nome):
+        inicio = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.registrar(nome, time.perf_counter() - inicio)
+
+    def registrar(self, nome, segundos, chamadas=1):
+        with self._lock:
+            dados = self._etapas.setdefault(nome, {"segundos": 0.0, "chamadas": 0})
+            dados["segundos"] += segundos
+            dados["chamadas"] += chamadas
+
+    def finalizar(self):
+        self._fim = time.perf_counter()
+
+    # Retorna o relatório em formato serializável (JSON)
+    def como_dict(self):
+        fim = self._fim if self._fim is not None else time.perf_counter()
+        with self._lock:
+            etapas = {
+                nome: {"segundos": round(d["segundos"], 4), "chamadas": d["chamadas"]}
+                for nome, d in self._etapas.items()
+            }
+        return {"total_segundos": round(fim - self._inicio, 4), "etapas": etapas}
+
+# Define o relatório da execução atual (retorna o token para restaurar depois)
+def ativar(relatorio):
+    return _relatorio_atual.set(relatorio)
+
+def desativar(token):
+    _relatorio_atual.reset(token)
+
+def relatorio_atual():
+    return _relatorio_atual.get()
+
+# Marca um bloco como pertencente a uma etapa da coleta atual
+@contextmanager
+def etapa(nome):
+    relatorio = _relatorio_atual.get()
+    if relatorio is None:
+        yield
+        return
+    with relatorio.etapa(nome):
+        yield
@@ -0,0 +1,82 @@
+import os
+import time
+import signal
+import argparse
+import threading
+from dotenv import load_dotenv
+from app.services import fila, particoes
+
+# ------------------------- WORKER DA FILA DE COLETAS ----------------------------
+
+# Processa os jobs da tabela fila_coletas. Vários processos podem rodar em paralelo
+# (inclusive em máquinas diferentes): a reivindicação usa FOR UPDATE SKIP LOCKED.
+#
+# Uso (a partir de backend/):
+#   python -m app.worker --threads 2
+#
+# No SIGTERM/SIGINT o worker para de reivindicar, aguarda os jobs em andamento por até
+# WORKER_TEMPO_DESLIGAMENTO segundos e devolve à fila os que não terminaram.
+
+load_dotenv()
+
+INTERVALO_OCIOSO = float(os.getenv("WORKER_INTERVALO_OCIOSO", 5))
+INTERVALO_EXPIRADOS = float(os.getenv("WORKER_INTERVALO_EXPIRADOS", 60))
+TEMPO_DESLIGAMENTO = float(os.getenv("WORKER_TEMPO_DESLIGAMENTO", 25))
+
+_parar = threading.Event()
+
+def executar_thread():
+    worker = fila.identificador_worker()
+    while not _parar.is_set():
+        job = fila.reivindicar(worker)
+        if job is None:
+            _parar.wait(INTERVALO_OCIOSO)
+            continue
+        print(f"[{worker}] Job {job['id']}: {job['plataforma']}/{job['vendedor']} (tentativa {job['tentativas']})")
+        fila.processar(job, worker)
+
+# Devolve à fila, periodicamente, os jobs com lease expirado
+def reenfileirar_expirados():
+    while not _parar.is_set():
+        try:
+            quantidade = fila.reenfileirar_expirados()
+            if quantidade:
+                print(f"{quantidade} job(s) com lease expirado devolvido(s) à fila.")
+        except Exception as e:
+            print(f"Erro ao reenfileirar jobs expirados: {e}")
+        _parar.wait(INTERVALO_EXPIRADOS)
+
+# Retenção e criação antecipada das partições (no máximo uma vez por intervalo)
+def manter_particoes():
+    while not _parar.is_set():
+        particoes.manutencao_periodica()
+        _parar.wait(INTERVALO_EXPIRADOS)
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Worker da fila de coletas.")
+    parser.add_argument("--threads", type=int, default=int(os.getenv("WORKER_THREADS", 1)))
+    args = parser.parse_args(argv)
+
+    signal.signal(signal.SIGTERM, lambda *_: _parar.set())
+    signal.signal(signal.SIGINT, lambda *_: _parar.set())
+
+    threads = [threading.Thread(target=executar_thread, daemon=True) for _ in range(args.threads)]
+    threads.append(threading.Thread(target=reenfileirar_expirados, daemon=True))
+    threads.append(threading.Thread(target=manter_particoes, daemon=True))
+    for thread in threads:
+        thread.start()
+    print(f"Worker iniciado com {args.threads} thread(s).")
+
+    while not _parar.is_set():
+        _parar.wait(1)
+
+    print("Encerrando worker...")
+    limite = time.monotonic() + TEMPO_DESLIGAMENTO
+    for thread in threads:
+        thread.join(max(0, limite - time.monotonic()))
+    devolvidos = fila.devolver_processo(fila.identificador_processo())
+    if devolvidos:
+        print(f"{devolvidos} job(s) em andamento devolvido(s) à fila.")
+
+if __name__ == "__main__":
+    main()
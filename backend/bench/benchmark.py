@@ -0,0 +1,276 @@
+import os
+import sys
+import json
+import time
+import shutil
+import socket
+import argparse
+import resource
+import tempfile
+import subprocess
+import urllib.request
+import psycopg2
+
+# ------------------------- BENCHMARK PONTA A PONTA ----------------------------
+
+# Executa cada coletar_dados_* contra o servidor falso (bench/fake_marketplace.py) e um
+# Postgres descartável, registrando vazão, latência p50/p99 das requisições e pico de RSS.
+# Cada plataforma roda em um subprocesso próprio para que o pico de RSS seja isolado.
+#
+# Uso (a partir de backend/):
+#   python -m bench.benchmark --catalogo 500 --latencia-ms 20
+#   python -m bench.benchmark --pg-host localhost --pg-user postgres   # servidor existente
+
+DIR_BACKEND = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+DIR_SQL = os.path.join(DIR_BACKEND, "sql")
+VENDEDOR = "bench"
+
+PLATAFORMAS = {
+    "mercadolivre": {"prefixo": "MERCADOLIVRE", "modulo": "mercadolivre", "coletor": "coletar_dados_ml"},
+    "magalu": {"prefixo": "MAGALU", "modulo": "magalu", "coletor": "coletar_dados_magalu"},
+    "amazon": {"prefixo": "AMAZON", "modulo": "amazon", "coletor": "coletar_dados_amazon"}
+}
+
+def porta_livre():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+def aguardar_url(url, tentativas=100):
+    for _ in range(tentativas):
+        try:
+            with urllib.request.urlopen(url, timeout=1):
+                return True
+        except Exception:
+            time.sleep(0.1)
+    raise RuntimeError(f"Servidor não respondeu em {url}")
+
+# ------------------------- POSTGRES DESCARTÁVEL ----------------------------
+
+class PostgresDescartavel:
+    def __init__(self, args):
+        self.args = args
+        self.diretorio = None
+        self.bin = None
+        self.conexao = {}
+        self.bancos = []
+
+    def iniciar(self):
+        if self.args.pg_host:
+            self.conexao = {
+                "host": self.args.pg_host,
+                "port": str(self.args.pg_port),
+                "user": self.args.pg_user,
+                "password": self.args.pg_password or ""
+            }
+            return self
+        self.bin = self.args.pg_bin or os.path.dirname(shutil.which("initdb") or "")
+        if not self.bin or not os.path.exists(os.path.join(self.bin, "initdb")):
+            raise RuntimeError("initdb não encontrado: informe --pg-bin ou --pg-host.")
+        self.diretorio = tempfile.mkdtemp(prefix="bench_pg_")
+        dados = os.path.join(self.diretorio, "dados")
+        porta = porta_livre()
+        subprocess.run(
+            [os.path.join(self.bin, "initdb"), "-D", dados, "-U", "postgres", "-A", "trust"],
+            check=True, stdout=subprocess.DEVNULL
+        )
+        subprocess.run([
+            os.path.join(self.bin, "pg_ctl"), "-D", dados, "-l", os.path.join(self.diretorio, "log"), "-w",
+            "-o", f"-p {porta} -k {self.diretorio} -c listen_addresses=''", "start"
+        ], check=True, stdout=subprocess.DEVNULL)
+        self.conexao = {"host": self.diretorio, "port": str(porta), "user": "postgres", "password": ""}
+        return self
+
+    def _conectar(self, dbname):
+        return psycopg2.connect(dbname=dbname, sslmode="disable", **self.conexao)
+
+    # Cria um banco com o esquema do arquivo sql/<esquema>.sql
+    def criar_banco(self, esquema):
+        nome = f"bench_{os.getpid()}_{esquema}"
+        conn = self._conectar("postgres")
+        conn.autocommit = True
+        with conn.cursor() as cur:
+            cur.execute(f'DROP DATABASE IF EXISTS "{nome}"')
+            cur.execute(f'CREATE DATABASE "{nome}"')
+        conn.close()
+        self.bancos.append(nome)
+        conn = self._conectar(nome)
+        with conn.cursor() as cur, open(os.path.join(DIR_SQL, f"{esquema}.sql")) as f:
+            cur.execute(f.read())
+        conn.commit()
+        conn.close()
+        return nome
+
+    def env(self, prefixo, banco):
+        return {
+            f"{prefixo}_DB_HOST": self.conexao["host"],
+            f"{prefixo}_DB_PORT": self.conexao["port"],
+            f"{prefixo}_DB_NAME": banco,
+            f"{prefixo}_DB_USER": self.conexao["user"],
+            f"{prefixo}_DB_PASSWORD": self.conexao["password"],
+            f"{prefixo}_DB_SSLMODE": "disable"
+        }
+
+    def encerrar(self):
+        if self.diretorio:
+            subprocess.run([
+                os.path.join(self.bin, "pg_ctl"), "-D", os.path.join(self.diretorio, "dados"), "-m", "immediate", "stop"
+            ], stdout=subprocess.DEVNULL)
+            shutil.rmtree(self.diretorio, ignore_errors=True)
+            return
+        conn = self._conectar("postgres")
+        conn.autocommit = True
+        with conn.cursor() as cur:
+            for nome in self.bancos:
+                cur.execute(f'DROP DATABASE IF EXISTS "{nome}"')
+        conn.close()
+
+# ------------------------- AMBIENTE DOS SERVIÇOS ----------------------------
+
+def env_servicos(url_fake):
+    tokens = {VENDEDOR: {"access_token": "bench", "refresh_token": "bench", "seller_id": "1"}}
+    return {
+        "MERCADOLIVRE_URL_BASE": f"{url_fake}/ml",
+        "MERCADOLIVRE_CLIENT_ID": "bench",
+        "MERCADOLIVRE_CLIENT_SECRET": "bench",
+        "MERCADOLIVRE_TOKENS": json.dumps(tokens),
+        "MAGALU_URL_BASE_AUTH": f"{url_fake}/magalu",
+        "MAGALU_URL_BASE_API": f"{url_fake}/magalu",
+        "MAGALU_CLIENT_ID": "bench",
+        "MAGALU_CLIENT_SECRET": "bench",
+        "MAGALU_TOKENS": json.dumps(tokens),
+        "AMAZON_URL_BASE_AUTH": f"{url_fake}/amazon/auth/o2/token",
+        "AMAZON_URL_BASE_API": f"{url_fake}/amazon",
+        "AMAZON_CLIENT_ID": "bench",
+        "AMAZON_CLIENT_SECRET": "bench",
+        "AMAZON_MARKETPLACE_ID": "A2Q3Y263D00KWC",
+        "AMAZON_TOKENS": json.dumps(tokens),
+        # As cotas reais do getOrderItems e do catálogo (e o orçamento padrão da Magalu) tornariam o
+        # benchmark uma medida da espera, não da coleta
+        "AMAZON_ITENS_RPS": "0",
+        "AMAZON_CATALOGO_RPS": "0",
+        "AMAZON_PEDIDOS_RPS": "0",
+        "MAGALU_RPS": "0"
+    }
+
+# ------------------------- EXECUÇÃO DE UMA PLATAFORMA (SUBPROCESSO) ----------------------------
+
+def executar_plataforma(plataforma):
+    import importlib
+    from app.services import metricas, tempos
+
+    dados = PLATAFORMAS[plataforma]
+    modulo = importlib.import_module(f"app.services.{dados['modulo']}")
+    coletor = getattr(modulo, dados["coletor"])
+
+    relatorio = tempos.RelatorioTempos()
+    token = tempos.ativar(relatorio)
+    erro = None
+    inicio = time.perf_counter()
+    try:
+        coletor(VENDEDOR)
+    except Exception as e:
+        erro = f"{type(e).__name__}: {e}"
+    duracao = time.perf_counter() - inicio
+    relatorio.finalizar()
+    tempos.desativar(token)
+
+    conn = modulo.get_connection()
+    with conn.cursor() as cur:
+        cur.execute("SELECT count(*) FROM produtos WHERE vendedor = %s", (VENDEDOR,))
+        produtos = cur.fetchone()[0]
+    conn.close()
+
+    requisicoes = metricas.requisicao_duracao.contagem(plataforma=plataforma)
+    p50 = metricas.requisicao_duracao.quantil(0.5, plataforma=plataforma)
+    p99 = metricas.requisicao_duracao.quantil(0.99, plataforma=plataforma)
+    return {
+        "plataforma": plataforma,
+        "duracao_segundos": round(duracao, 3),
+        "produtos_gravados": produtos,
+        "produtos_por_segundo": round(produtos / duracao, 2) if duracao else None,
+        "requisicoes": requisicoes,
+        "requisicoes_por_segundo": round(requisicoes / duracao, 2) if duracao else None,
+        "latencia_p50_ms": round(p50 * 1000, 2) if p50 is not None else None,
+        "latencia_p99_ms": round(p99 * 1000, 2) if p99 is not None else None,
+        "pico_rss_mb": round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1),
+        "etapas": relatorio.como_dict(),
+        "erro": erro
+    }
+
+# ------------------------- ORQUESTRAÇÃO ----------------------------
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark ponta a ponta das coletas contra o servidor falso.")
+    parser.add_argument("--plataformas", nargs="+", default=list(PLATAFORMAS), choices=list(PLATAFORMAS))
+    parser.add_argument("--catalogo", type=int, default=200)
+    parser.add_argument("--pedidos", type=int, default=200)
+    parser.add_argument("--latencia-ms", type=float, default=20.0)
+    parser.add_argument("--jitter-ms", type=float, default=5.0)
+    parser.add_argument("--rps", type=float, default=0.0)
+    parser.add_argument("--taxa-429", type=float, default=0.0)
+    parser.add_argument("--taxa-5xx", type=float, default=0.0)
+    parser.add_argument("--pg-bin", help="Diretório com initdb/pg_ctl para o cluster descartável")
+    parser.add_argument("--pg-host", help="Usa um servidor existente (bancos temporários são removidos ao final)")
+    parser.add_argument("--pg-port", type=int, default=5432)
+    parser.add_argument("--pg-user", default="postgres")
+    parser.add_argument("--pg-password", default="")
+    parser.add_argument("--saida", help="Arquivo JSON com os resultados")
+    parser.add_argument("--executar-plataforma", help=argparse.SUPPRESS)
+    return parser.parse_args(argv)
+
+def main(argv=None):
+    args = parse_args(argv)
+
+    if args.executar_plataforma:
+        resultado = executar_plataforma(args.executar_plataforma)
+        print("RESULTADO " + json.dumps(resultado))
+        return
+
+    porta = porta_livre()
+    url_fake = f"http://127.0.0.1:{porta}"
+    servidor = subprocess.Popen([
+        sys.executable, "-m", "bench.fake_marketplace", "--porta", str(porta),
+        "--catalogo", str(args.catalogo), "--pedidos", str(args.pedidos),
+        "--latencia-ms", str(args.latencia_ms), "--jitter-ms", str(args.jitter_ms),
+        "--rps", str(args.rps), "--taxa-429", str(args.taxa_429), "--taxa-5xx", str(args.taxa_5xx)
+    ], cwd=DIR_BACKEND)
+    postgres = PostgresDescartavel(args)
+    resultados = []
+    try:
+        aguardar_url(f"{url_fake}/saude")
+        postgres.iniciar()
+        for plataforma in args.plataformas:
+            dados = PLATAFORMAS[plataforma]
+            banco = postgres.criar_banco(dados["modulo"])
+            env = {**os.environ, **env_servicos(url_fake), **postgres.env(dados["prefixo"], banco)}
+            processo = subprocess.run(
+                [sys.executable, "-m", "bench.benchmark", "--executar-plataforma", plataforma],
+                cwd=DIR_BACKEND, env=env, capture_output=True, text=True
+            )
+            linha = next((l for l in processo.stdout.splitlines() if l.startswith("RESULTADO ")), None)
+            if linha is None:
+                print(processo.stdout[-2000:], processo.stderr[-2000:])
+                raise RuntimeError(f"Falha no benchmark de {plataforma}")
+            resultado = json.loads(linha[len("RESULTADO "):])
+            resultados.append(resultado)
+            print(
+                f"{plataforma:<13} {resultado['duracao_segundos']:>9.2f}s "
+                f"{resultado['produtos_por_segundo']:>9} prod/s "
+                f"{resultado['requisicoes_por_segundo']:>9} req/s "
+                f"p50 {resultado['latencia_p50_ms']} ms  p99 {resultado['latencia_p99_ms']} ms  "
+                f"RSS {resultado['pico_rss_mb']} MB"
+                + (f"  ERRO: {resultado['erro']}" if resultado["erro"] else "")
+            )
+    finally:
+        servidor.terminate()
+        servidor.wait()
+        postgres.encerrar()
+
+    if args.saida:
+        with open(args.saida, "w") as f:
+            json.dump({"parametros": vars(args), "resultados": resultados}, f, indent=2, default=str)
+    return resultados
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,513 @@
+import os
+import time
+import zlib
+import random
+import struct
+import asyncio
+import argparse
+import threading
+from datetime import datetime, timedelta, timezone
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, Response
+
+# ------------------------- SERVIDOR FALSO DOS MARKETPLACES ----------------------------
+
+# Servidor local que imita os endpoints usados pelos serviços (Mercado Livre em /ml,
+# Magalu em /magalu e Amazon em /amazon). Os dados são gerados de forma determinística
+# a partir da semente, sem guardar o catálogo em memória.
+
+CONFIG_PADRAO = {
+    "catalogo": 200,
+    "pedidos": 200,
+    "latencia_ms": 20.0,
+    "jitter_ms": 5.0,
+    "rps": 0.0,
+    "taxa_429": 0.0,
+    "taxa_5xx": 0.0,
+    "semente": 42,
+    "url_imagens": "https://img.exemplo"
+}
+
+PLATAFORMAS = ("ml", "magalu", "amazon")
+
+# Token bucket simples: rps fichas por segundo, capacidade de 1 segundo
+class LimiteTaxa:
+    def __init__(self, rps):
+        self.rps = rps
+        self.fichas = rps
+        self.ultimo = time.monotonic()
+        self.lock = threading.Lock()
+
+    def consumir(self):
+        if self.rps <= 0:
+            return True
+        with self.lock:
+            agora = time.monotonic()
+            self.fichas = min(self.rps, self.fichas + (agora - self.ultimo) * self.rps)
+            self.ultimo = agora
+            if self.fichas >= 1:
+                self.fichas -= 1
+                return True
+            return False
+
+def _rng(config, *chave):
+    return random.Random(f"{config['semente']}:{':'.join(str(c) for c in chave)}")
+
+def _data(config, *chave, dias=365):
+    base = datetime(2025, 1, 1, tzinfo=timezone.utc)
+    return (base + timedelta(minutes=_rng(config, "data", *chave).randint(0, dias * 24 * 60))).strftime("%Y-%m-%dT%H:%M:%SZ")
+
+def _indice(identificador, prefixo):
+    try:
+        return int(str(identificador).replace(prefixo, ""))
+    except ValueError:
+        return None
+
+# ------------------------- MERCADO LIVRE ----------------------------
+
+def ml_item(config, indice):
+    rng = _rng(config, "ml", indice)
+    item_id = f"MLB{indice}"
+    tamanho = rng.choice(["1200x1200", "800x600", "500x500", "1000x1000"])
+    variacoes = [
+        {
+            "id": indice * 100 + v,
+            "price": round(rng.uniform(10, 500), 2),
+            "attribute_combinations": [
+                {"name": "Cor", "value_name": rng.choice(["Azul", "Preto", "Branco"])},
+                {"name": "Tamanho", "value_name": rng.choice(["P", "M", "G"])}
+            ]
+        }
+        for v in range(rng.randint(0, 3))
+    ]
+    return {
+        "id": item_id,
+        "title": f"Produto de teste {indice} " + "x" * rng.randint(0, 50),
+        "category_id": f"MLB{1000 + indice % 20}",
+        "price": round(rng.uniform(10, 500), 2),
+        "status": rng.choice(["active", "paused", "closed"]),
+        "health": round(rng.random(), 2),
+        "initial_quantity": rng.randint(0, 100),
+        "sold_quantity": rng.randint(0, 100),
+        "available_quantity": rng.randint(0, 100),
+        "permalink": f"https://produto.mercadolivre.com.br/{item_id}",
+        "accepts_mercadopago": True,
+        "warranty": rng.choice([None, "Garantia de fábrica: 90 dias"]),
+        "pictures": [
+            {"id": f"{indice}-{p}", "secure_url": f"{config['url_imagens']}/ml/{indice}/{p}_{tamanho}.jpg", "size": tamanho}
+            for p in range(rng.randint(1, 8))
+        ],
+        "attributes": [
+            {"id": "GTIN", "name": "Código universal", "value_name": str(7890000000000 + indice)},
+            {"id": "BRAND", "name": "Marca", "value_name": rng.choice(["Marca A", "Marca B"])},
+            {"id": "MODEL", "name": "Modelo", "value_name": rng.choice(["", f"M{indice}"])}
+        ],
+        "variations": variacoes
+    }
+
+def registrar_ml(app, config):
+    tamanho_pagina = 100
+
+    @app.post("/ml/oauth/token")
+    async def ml_token():
+        return {"access_token": "ml-access", "refresh_token": "ml-refresh"}
+
+    @app.get("/ml/users/{seller_id}")
+    async def ml_usuario(seller_id: str):
+        return {"id": seller_id, "nickname": f"vendedor-{seller_id}"}
+
+    @app.get("/ml/users/{seller_id}/items/search")
+    async def ml_busca(seller_id: str, scroll_id: str = None):
+        inicio = int(scroll_id) if scroll_id else 0
+        fim = min(inicio + tamanho_pagina, config["catalogo"])
+        return {
+            "results": [f"MLB{i}" for i in range(inicio, fim)],
+            "scroll_id": str(fim) if fim < config["catalogo"] else None
+        }
+
+    @app.get("/ml/items/{item_id}")
+    async def ml_detalhes(item_id: str):
+        indice = _indice(item_id, "MLB")
+        if indice is None or indice >= config["catalogo"]:
+            return JSONResponse({"message": "not_found"}, status_code=404)
+        return ml_item(config, indice)
+
+    @app.get("/ml/items/{item_id}/description")
+    async def ml_descricao(item_id: str):
+        indice = _indice(item_id, "MLB") or 0
+        return {"plain_text": "Descrição detalhada. " * _rng(config, "desc", indice).randint(0, 40)}
+
+    @app.get("/ml/categories/{category_id}")
+    async def ml_categoria(category_id: str):
+        return {"id": category_id, "name": f"Categoria {category_id}"}
+
+# ------------------------- MAGALU ----------------------------
+
+def magalu_sku(config, indice):
+    rng = _rng(config, "magalu", indice)
+    return {
+        "sku": f"SKU{indice}",
+        "title": f"Produto Magalu {indice} " + "y" * rng.randint(0, 50),
+        "description": "Descrição do produto. " * rng.randint(0, 40),
+        "brand": rng.choice(["", "Marca A", "Marca B"]),
+        "status": rng.choice(["PUBLISHED", "UNPUBLISHED", "INACTIVE", "BLOCKED"]),
+        "created_at": _data(config, "magalu", indice),
+        "updated_at": _data(config, "magalu-upd", indice),
+        "datasheet": [{"name": "Material", "value": rng.choice(["Algodão", "Poliéster"])}, {"name": "Voltagem", "value": ""}],
+        "extra_data": [{"name": "update_only_front", "value": "false"}],
+        "dimensions": {
+            "height": {"value": rng.randint(1, 50)},
+            "width": {"value": rng.randint(1, 50)},
+            "length": {"value": rng.randint(1, 50)},
+            "weight": {"value": rng.randint(100, 5000)}
+        },
+        "images": [
+            {"reference": f"{config['url_imagens']}/magalu/{indice}/{i}_{lado}x{lado}.png", "type": "image"}
+            for i, lado in enumerate(rng.choice([600, 1000, 1200]) for _ in range(rng.randint(1, 6)))
+        ]
+    }
+
+def magalu_pedido(config, indice):
+    rng = _rng(config, "magalu-pedido", indice)
+    return {
+        "id": f"PED{indice}",
+        "status": rng.choice(["created", "finished", "cancelled"]),
+        "created_at": _data(config, "magalu-pedido", indice),
+        "amounts": {"total": rng.randint(1000, 100000), "normalizer": 100},
+        "payments": [{"method": rng.choice(["credit_card", "bank_slip"]), "currency": "BRL"}]
+    }
+
+def registrar_magalu(app, config):
+    @app.post("/magalu/oauth/token")
+    async def magalu_token():
+        return {"access_token": "magalu-access", "refresh_token": "magalu-refresh"}
+
+    @app.get("/magalu/seller/v1/portfolios/skus")
+    async def magalu_skus(_limit: int = 100, _offset: int = 0):
+        fim = min(_offset + _limit, config["catalogo"])
+        return {
+            "results": [
+                {"sku": f"SKU{i}", "attributes": [{"name": "color", "value": "Azul"}, {"name": "fulfillment", "value": "x"}]}
+                for i in range(_offset, fim)
+            ]
+        }
+
+    @app.get("/magalu/seller/v1/portfolios/skus/{sku}")
+    async def magalu_sku_detalhes(sku: str):
+        indice = _indice(sku, "SKU")
+        if indice is None or indice >= config["catalogo"]:
+            return JSONResponse({"message": "not_found"}, status_code=404)
+        return magalu_sku(config, indice)
+
+    @app.get("/magalu/seller/v1/portfolios/prices/{sku}")
+    async def magalu_preco(sku: str):
+        indice = _indice(sku, "SKU") or 0
+        return {"results": [{"price": _rng(config, "preco", indice).randint(1000, 50000)}]}
+
+    @app.get("/magalu/seller/v1/portfolios/stocks/{sku}")
+    async def magalu_estoque(sku: str):
+        indice = _indice(sku, "SKU") or 0
+        return {"results": [{"quantity": _rng(config, "estoque", indice).randint(0, 100)}]}
+
+    @app.get("/magalu/seller/v1/orders")
+    async def magalu_pedidos(_limit: int = 100, _offset: int = 0):
+        fim = min(_offset + _limit, config["pedidos"])
+        return {"results": [magalu_pedido(config, i) for i in range(_offset, fim)]}
+
+# ------------------------- AMAZON ----------------------------
+
+def amazon_listagem(config, indice):
+    rng = _rng(config, "amazon", indice)
+    lado = rng.choice([300, 500, 1000, 1500])
+    return {
+        "sku": f"AMZSKU{indice}",
+        "summaries": [{
+            "asin": f"B0{indice:08d}",
+            "productType": rng.choice(["SHIRT", "SHOES", "HEADPHONES", "OUTRO"]),
+            "conditionType": "new_new",
+            "status": ["BUYABLE", "DISCOVERABLE"],
+            "itemName": f"Produto Amazon {indice}",
+            "createdDate": _data(config, "amazon", indice),
+            "lastUpdatedDate": _data(config, "amazon-upd", indice),
+            "mainImage": {"link": f"{config['url_imagens']}/amazon/{indice}_{lado}x{lado}.jpg", "width": lado, "height": lado}
+        }]
+    }
+
+def amazon_catalogo(config, indice):
+    rng = _rng(config, "amazon-catalogo", indice)
+    asin = f"B0{indice:08d}"
+    imagens = []
+    for n in range(rng.randint(1, 7)):
+        variante = "MAIN" if n == 0 else f"PT{n:02d}"
+        for lado in (75, 500, rng.choice([800, 1000, 1500])):
+            imagens.append({"variant": variante, "link": f"{config['url_imagens']}/amazon/{indice}_{n}_{lado}x{lado}.jpg", "height": lado, "width": lado})
+    atributos = {
+        nome: [{"value": f"{nome} {indice}", "marketplace_id": "A2Q3Y263D00KWC"}]
+        for nome in ("brand", "item_name", "bullet_point", "product_description", "manufacturer", "model_number")
+        if rng.random() < 0.8
+    }
+    return {
+        "asin": asin,
+        "images": [{"marketplaceId": "A2Q3Y263D00KWC", "images": imagens}],
+        "attributes": atributos,
+        "classifications": [{"marketplaceId": "A2Q3Y263D00KWC", "classifications": [{"displayName": "Casa", "classificationId": "123"}]}] if rng.random() < 0.9 else [],
+        "summaries": [{"marketplaceId": "A2Q3Y263D00KWC", "brand": atributos["brand"][0]["value"]}] if "brand" in atributos else []
+    }
+
+def amazon_pedido(config, indice):
+    rng = _rng(config, "amazon-pedido", indice)
+    compra = config["inicio"] - timedelta(minutes=rng.randint(0, 7 * 24 * 60))
+    return {
+        "AmazonOrderId": f"701-{indice:07d}",
+        "OrderStatus": rng.choice(["Shipped", "Canceled", "Pending", "Unshipped"]),
+        "PurchaseDate": compra.strftime("%Y-%m-%dT%H:%M:%SZ"),
+        "LastUpdateDate": (compra + timedelta(hours=rng.randint(0, 48))).strftime("%Y-%m-%dT%H:%M:%SZ"),
+        "SalesChannel": "Amazon.com.br",
+        "FulfillmentChannel": rng.choice(["AFN", "MFN"]),
+        "PaymentMethodDetails": ["CreditCard"],
+        "OrderTotal": {"Amount": f"{rng.uniform(20, 800):.2f}", "CurrencyCode": "BRL"},
+        "NumberOfItemsShipped": rng.randint(0, 3),
+        "NumberOfItemsUnshipped": rng.randint(0, 3),
+        "IsPrime": rng.random() < 0.3,
+        "IsBusinessOrder": False,
+        "ShippingAddress": {"StateOrRegion": "SP", "City": "São Paulo"},
+        "BuyerInfo": {"BuyerCounty": "----------"}
+    }
+
+def amazon_estoque(config, indice):
+    rng = _rng(config, "amazon-estoque", indice)
+    return {
+        "asin": f"B0{indice:08d}",
+        "fnSku": f"X00{indice:07d}",
+        "sellerSku": f"AMZSKU{indice}",
+        "condition": "NewItem",
+        "inventoryDetails": {
+            "fulfillableQuantity": rng.randint(0, 100),
+            "inboundReceivingQuantity": rng.randint(0, 10),
+            "reservedQuantity": {
+                "totalReservedQuantity": 2, "pendingCustomerOrderQuantity": 1,
+                "pendingTransshipmentQuantity": 1, "fcProcessingQuantity": 0
+            },
+            "researchingQuantity": {"totalResearchingQuantity": 0},
+            "unfulfillableQuantity": {
+                "totalUnfulfillableQuantity": rng.choice([0, 0, 1, 3]), "customerDamagedQuantity": 0,
+                "warehouseDamagedQuantity": 0, "distributorDamagedQuantity": 0,
+                "carrierDamagedQuantity": 0, "defectiveQuantity": 0, "expiredQuantity": 0
+            },
+            "futureSupplyQuantity": {"reservedFutureSupplyQuantity": 0, "futureSupplyBuyableQuantity": 0}
+        },
+        "productName": f"Produto Amazon {indice}",
+        "totalQuantity": rng.randint(0, 120),
+        "lastUpdatedTime": _data(config, "amazon-estoque", indice)
+    }
+
+def registrar_amazon(app, config):
+    @app.post("/amazon/auth/o2/token")
+    async def amazon_token():
+        return {"access_token": "amazon-access", "token_type": "bearer", "expires_in": 3600}
+
+    def paginar(token, tamanho, total):
+        inicio = int(token) if token else 0
+        fim = min(inicio + tamanho, total)
+        return range(inicio, fim), (str(fim) if fim < total else None)
+
+    @app.get("/amazon/listings/2021-08-01/items/{seller_id}")
+    async def amazon_listagens(seller_id: str, pageToken: str = None, pageSize: int = 20):
+        indices, proximo = paginar(pageToken, pageSize, config["catalogo"])
+        resposta = {"numberOfResults": config["catalogo"], "items": [amazon_listagem(config, i) for i in indices]}
+        if proximo:
+            resposta["pagination"] = {"nextToken": proximo}
+        return resposta
+
+    # O NextToken guarda a janela pedida e a posição dentro dela
+    @app.get("/amazon/orders/v0/orders")
+    async def amazon_pedidos(CreatedAfter: str = "", CreatedBefore: str = "", NextToken: str = None):
+        if NextToken:
+            CreatedAfter, CreatedBefore, posicao = NextToken.split("|")
+        else:
+            posicao = None
+        pedidos = [
+            p for p in (amazon_pedido(config, i) for i in range(config["pedidos"]))
+            if (not CreatedAfter or p["PurchaseDate"] >= CreatedAfter[:19] + "Z")
+            and (not CreatedBefore or p["PurchaseDate"] < CreatedBefore[:19] + "Z")
+        ]
+        indices, proximo = paginar(posicao, 100, len(pedidos))
+        payload = {"Orders": [pedidos[i] for i in indices]}
+        if proximo:
+            payload["NextToken"] = f"{CreatedAfter}|{CreatedBefore}|{proximo}"
+        return {"payload": payload}
+
+    @app.get("/amazon/catalog/2022-04-01/items")
+    async def amazon_catalogo_busca(identifiers: str = ""):
+        indices = [_indice(asin, "B0") for asin in identifiers.split(",") if asin]
+        itens = [amazon_catalogo(config, i) for i in indices if i is not None and i < config["catalogo"]]
+        return {"numberOfResults": len(itens), "items": itens}
+
+    @app.get("/amazon/orders/v0/orders/{order_id}/orderItems")
+    async def amazon_itens_pedido(order_id: str):
+        indice = _indice(order_id, "701-")
+        if indice is None or indice >= config["pedidos"]:
+            return JSONResponse({"errors": [{"code": "InvalidInput"}]}, status_code=400)
+        rng = _rng(config, "amazon-itens", indice)
+        itens = []
+        for n in range(rng.randint(1, 3)):
+            produto = rng.randrange(config["catalogo"])
+            quantidade = rng.randint(1, 4)
+            itens.append({
+                "ASIN": f"B0{produto:08d}",
+                "SellerSKU": f"AMZSKU{produto}",
+                "OrderItemId": f"{indice:07d}{n:02d}",
+                "Title": f"Produto {produto}",
+                "QuantityOrdered": quantidade,
+                "QuantityShipped": rng.randint(0, quantidade),
+                "ItemPrice": {"CurrencyCode": "BRL", "Amount": f"{rng.uniform(10, 300) * quantidade:.2f}"},
+                "ItemTax": {"CurrencyCode": "BRL", "Amount": "0.00"},
+                "PromotionDiscount": {"CurrencyCode": "BRL", "Amount": "0.00"}
+            })
+        return {"payload": {"AmazonOrderId": order_id, "OrderItems": itens}}
+
+    @app.get("/amazon/fba/inventory/v1/summaries")
+    async def amazon_inventario(nextToken: str = None, sellerSkus: str = None):
+        if sellerSkus:
+            indices = [_indice(sku, "AMZSKU") for sku in sellerSkus.split(",")]
+            itens = [amazon_estoque(config, i) for i in indices if i is not None and i < config["catalogo"]]
+            return {"payload": {"inventorySummaries": itens}}
+        indices, proximo = paginar(nextToken, 50, config["catalogo"])
+        resposta = {"payload": {"inventorySummaries": [amazon_estoque(config, i) for i in indices]}}
+        if proximo:
+            resposta["pagination"] = {"nextToken": proximo}
+        return resposta
+
+    @app.get("/amazon/sales/v1/orderMetrics")
+    async def amazon_metricas(interval: str = "", granularity: str = "Month"):
+        hoje = datetime.now(timezone.utc).replace(day=1, hour=0, minute=0, second=0, microsecond=0)
+        inicio_pedido, _, fim_pedido = interval.partition("--")
+        payload = []
+        for m in range(13):
+            total = hoje.year * 12 + hoje.month - 1 - m
+            inicio = hoje.replace(year=total // 12, month=total % 12 + 1)
+            dia = inicio.strftime("%Y-%m-%d")
+            if inicio_pedido and not inicio_pedido[:10] <= dia < (fim_pedido[:10] or "9999"):
+                continue
+            rng = _rng(config, "metricas", inicio.date())
+            payload.append({
+                "interval": f"{inicio.strftime('%Y-%m-%dT00:00-03:00')}--{inicio.strftime('%Y-%m-%dT23:59-03:00')}",
+                "unitCount": rng.randint(0, 1000),
+                "orderItemCount": rng.randint(0, 1000),
+                "orderCount": rng.randint(0, 1000),
+                "averageUnitPrice": {"amount": round(rng.uniform(10, 300), 2), "currencyCode": "BRL"},
+                "totalSales": {"amount": round(rng.uniform(1000, 90000), 2), "currencyCode": "BRL"}
+            })
+        return {"payload": payload}
+
+# ------------------------- IMAGENS ----------------------------
+
+# Gera um arquivo com cabeçalho válido (PNG ou JPEG) e as dimensões indicadas no nome
+# (..._LARGURAxALTURA.ext), completado com bytes de preenchimento
+def imagem_falsa(caminho):
+    nome = caminho.rsplit("/", 1)[-1]
+    base, _, extensao = nome.rpartition(".")
+    try:
+        largura, altura = (int(v) for v in base.rsplit("_", 1)[-1].split("x"))
+    except ValueError:
+        largura, altura = 800, 800
+    if extensao == "png":
+        ihdr = struct.pack(">IIBBBBB", largura, altura, 8, 2, 0, 0, 0)
+        cabecalho = b"\x89PNG\r\n\x1a\n" + struct.pack(">I", 13) + b"IHDR" + ihdr + struct.pack(">I", zlib.crc32(b"IHDR" + ihdr))
+    else:
+        app0 = b"\xff\xe0" + struct.pack(">H", 16) + b"JFIF\x00\x01\x01\x00\x00\x01\x00\x01\x00\x00"
+        exif = b"\xff\xe1" + struct.pack(">H", 2 + 4000) + b"\x00" * 4000
+        sof = b"\xff\xc0" + struct.pack(">HBHHB", 17, 8, altura, largura, 3) + b"\x01\x22\x00\x02\x11\x01\x03\x11\x01"
+        cabecalho = b"\xff\xd8" + app0 + exif + sof
+    return cabecalho + b"\x00" * 60000
+
+def registrar_imagens(app, config):
+    @app.get("/imagens/{caminho:path}")
+    async def imagem(caminho: str, request: Request):
+        config["imagens_servidas"] = config.get("imagens_servidas", 0) + 1
+        etag = f'"{zlib.crc32(caminho.encode()):08x}"'
+        if request.headers.get("if-none-match") == etag:
+            return Response(status_code=304, headers={"ETag": etag})
+        dados = imagem_falsa(caminho)
+        intervalo = request.headers.get("range", "")
+        if intervalo.startswith("bytes="):
+            inicio, _, fim = intervalo[6:].partition("-")
+            inicio, fim = int(inicio or 0), min(int(fim or len(dados) - 1), len(dados) - 1)
+            return Response(
+                dados[inicio:fim + 1], status_code=206, media_type="application/octet-stream",
+                headers={"ETag": etag, "Content-Range": f"bytes {inicio}-{fim}/{len(dados)}"}
+            )
+        return Response(dados, media_type="application/octet-stream", headers={"ETag": etag})
+
+# ------------------------- APLICAÇÃO ----------------------------
+
+# Cria o app com latência, limite de taxa e injeção de erros aplicados a todas as rotas
+def criar_app(config=None):
+    config = {**CONFIG_PADRAO, **(config or {})}
+    config.setdefault("inicio", datetime.now(timezone.utc).replace(microsecond=0))
+    app = FastAPI()
+    limites = {p: LimiteTaxa(config["rps"]) for p in PLATAFORMAS}
+    sorteio = random.Random(config["semente"])
+    contadores = {"requisicoes": 0, "429": 0, "5xx": 0}
+
+    @app.middleware("http")
+    async def simular_rede(request: Request, call_next):
+        partes = request.url.path.strip("/").split("/")
+        plataforma = partes[0] if partes else ""
+        if plataforma not in limites or request.method != "GET":
+            return await call_next(request)
+
+        contadores["requisicoes"] += 1
+        atraso = max(0.0, config["latencia_ms"] + sorteio.uniform(-1, 1) * config["jitter_ms"]) / 1000
+        if atraso:
+            await asyncio.sleep(atraso)
+        if not limites[plataforma].consumir() or sorteio.random() < config["taxa_429"]:
+            contadores["429"] += 1
+            return JSONResponse({"message": "Too Many Requests"}, status_code=429, headers={"Retry-After": "1"})
+        if sorteio.random() < config["taxa_5xx"]:
+            contadores["5xx"] += 1
+            return JSONResponse({"message": "Internal error"}, status_code=sorteio.choice([500, 502, 503]))
+        return await call_next(request)
+
+    @app.get("/saude")
+    async def saude():
+        return {"status": "ok", "config": config, "contadores": contadores}
+
+    registrar_ml(app, config)
+    registrar_magalu(app, config)
+    registrar_amazon(app, config)
+    registrar_imagens(app, config)
+    return app
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Servidor falso dos marketplaces para benchmarks locais.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--porta", type=int, default=int(os.getenv("FAKE_MARKETPLACE_PORTA", 8900)))
+    parser.add_argument("--catalogo", type=int, default=CONFIG_PADRAO["catalogo"], help="SKUs por vendedor")
+    parser.add_argument("--pedidos", type=int, default=CONFIG_PADRAO["pedidos"], help="Pedidos por vendedor")
+    parser.add_argument("--latencia-ms", type=float, default=CONFIG_PADRAO["latencia_ms"])
+    parser.add_argument("--jitter-ms", type=float, default=CONFIG_PADRAO["jitter_ms"])
+    parser.add_argument("--rps", type=float, default=CONFIG_PADRAO["rps"], help="Limite por plataforma (0 = sem limite)")
+    parser.add_argument("--taxa-429", type=float, default=CONFIG_PADRAO["taxa_429"])
+    parser.add_argument("--taxa-5xx", type=float, default=CONFIG_PADRAO["taxa_5xx"])
+    parser.add_argument("--semente", type=int, default=CONFIG_PADRAO["semente"])
+    parser.add_argument("--url-imagens", default=None, help="Base das URLs de imagens (padrão: o próprio servidor)")
+    return parser.parse_args(argv)
+
+def config_de_args(args):
+    return {
+        "catalogo": args.catalogo,
+        "pedidos": args.pedidos,
+        "latencia_ms": args.latencia_ms,
+        "jitter_ms": args.jitter_ms,
+        "rps": args.rps,
+        "taxa_429": args.taxa_429,
+        "taxa_5xx": args.taxa_5xx,
+        "semente": args.semente,
+        "url_imagens": args.url_imagens or f"http://{args.host}:{args.porta}/imagens"
+    }
+
+if __name__ == "__main__":
+    import uvicorn
+    args = parse_args()
+    uvicorn.run(criar_app(config_de_args(args)), host=args.host, port=args.porta, log_level="warning")
@@ -0,0 +1,399 @@
+import gc
+import json
+import time
+import argparse
+from datetime import datetime, timezone
+from bench.fake_marketplace import CONFIG_PADRAO, amazon_estoque, amazon_pedido, magalu_sku, ml_item
+from app.services import amazon, magalu, mercadolivre
+
+# ------------------------- MICRO-BENCHMARK DOS MAPEAMENTOS ----------------------------
+
+# Custo por registro do achatamento dos payloads: as funções atuais, com os mapeamentos
+# compilados (mapeamento.py), contra as implementações anteriores escritas à mão (mantidas
+# abaixo apenas como referência). Os payloads sintéticos são os do servidor falso, com
+# alguns blocos opcionais removidos, repetidos até o total pedido. Antes de medir, confere
+# que as duas versões produzem os mesmos registros.
+#
+# Uso (a partir de backend/):
+#   python -m bench.mapeamento --registros 100000
+
+DISTINTOS = 2000
+
+# ------------------------- IMPLEMENTAÇÕES ANTERIORES ----------------------------
+
+def pedidos_anterior(pedidos, vendedor, data_consultada=None):
+    pedidos_tratados = []
+    for p in pedidos:
+        status_traduzido = amazon.traduzir_status_pedido(p.get("OrderStatus"))
+        cancelado = status_traduzido == "Cancelado"
+        pendente = status_traduzido == "Pendente"
+        pedido = {
+            "id_pedido": p.get("AmazonOrderId"),
+            "municipio_comprador": p.get("BuyerInfo", {}).get("BuyerCounty") if p.get("BuyerInfo", {}).get("BuyerCounty") and p.get("BuyerInfo", {}).get("BuyerCounty") != "----------" else "Não informado",
+            "status": status_traduzido,
+            "data_compra": p.get("PurchaseDate"),
+            "data_aprovacao": p.get("LastUpdateDate"),
+            "canal_venda": p.get("SalesChannel"),
+            "canal_fulfillment": p.get("FulfillmentChannel"),
+            "detalhes_pagamento": amazon.traduzir_detalhes_pagamento(p.get("PaymentMethodDetails")),
+            "total_pedido": "Pedido cancelado" if cancelado else "Pendente" if pendente else p.get("OrderTotal", {}).get("Amount"),
+            "moeda": "Pedido cancelado" if cancelado else "Pendente" if pendente else p.get("OrderTotal", {}).get("CurrencyCode"),
+            "itens_enviados": p.get("NumberOfItemsShipped"),
+            "itens_nao_enviados": p.get("NumberOfItemsUnshipped"),
+            "prime": p.get("IsPrime"),
+            "pedido_empresarial": p.get("IsBusinessOrder"),
+            "estado_entrega": "Pedido cancelado" if cancelado else "Pendente" if pendente else p.get("ShippingAddress", {}).get("StateOrRegion"),
+            "cidade_entrega": "Pedido cancelado" if cancelado else "Pendente" if pendente else p.get("ShippingAddress", {}).get("City"),
+            "vendedor": vendedor,
+            "data_registro": datetime.now(timezone.utc).replace(tzinfo=None),
+            "data_consultada": data_consultada.replace(tzinfo=None) if data_consultada else None
+        }
+        pedidos_tratados.append(pedido)
+    return pedidos_tratados
+def estoque_anterior(estoque, vendedor, data_consultada=None):
+    estoque_tratado = []
+    for e in estoque:
+        item = {
+            "asin": e.get("asin"),
+            "fnsku": e.get("fnSku"),
+            "condicao": e.get("condition"),
+            "disponivel_vendavel": e.get("inventoryDetails", {}).get("fulfillableQuantity"),
+            "recebendo_em_estoque": e.get("inventoryDetails", {}).get("inboundReceivingQuantity"),
+            "reservado_total": e.get("inventoryDetails", {}).get("reservedQuantity", {}).get("totalReservedQuantity"),
+            "reservado_cliente": e.get("inventoryDetails", {}).get("reservedQuantity", {}).get("pendingCustomerOrderQuantity"),
+            "reservado_transito": e.get("inventoryDetails", {}).get("reservedQuantity", {}).get("pendingTransshipmentQuantity"),
+            "reservado_processamento": e.get("inventoryDetails", {}).get("reservedQuantity", {}).get("fcProcessingQuantity"),
+            "em_pesquisa_total": e.get("inventoryDetails", {}).get("researchingQuantity", {}).get("totalResearchingQuantity"),
+            "pesquisa_curto_prazo": 0,
+            "pesquisa_medio_prazo": 0,
+            "pesquisa_longo_prazo": 0,
+            "inutilizavel_total": e.get("inventoryDetails", {}).get("unfulfillableQuantity", {}).get("totalUnfulfillableQuantity"),
+            "inutilizavel_danificado_cliente": e.get("inventoryDetails", {}).get("unfulfillableQuantity", {}).get("customerDamagedQuantity"),
+            "inutilizavel_danificado_armazem": e.get("inventoryDetails", {}).get("unfulfillableQuantity", {}).get("warehouseDamagedQuantity"),
+            "inutilizavel_danificado_distribuidor": e.get("inventoryDetails", {}).get("unfulfillableQuantity", {}).get("distributorDamagedQuantity"),
+            "inutilizavel_danificado_transportadora": e.get("inventoryDetails", {}).get("unfulfillableQuantity", {}).get("carrierDamagedQuantity"),
+            "inutilizavel_defeituoso": e.get("inventoryDetails", {}).get("unfulfillableQuantity", {}).get("defectiveQuantity"),
+            "inutilizavel_vencido": e.get("inventoryDetails", {}).get("unfulfillableQuantity", {}).get("expiredQuantity"),
+            "fornecimento_futuro_reservado": e.get("inventoryDetails", {}).get("futureSupplyQuantity", {}).get("reservedFutureSupplyQuantity"),
+            "fornecimento_futuro_compravel": e.get("inventoryDetails", {}).get("futureSupplyQuantity", {}).get("futureSupplyBuyableQuantity"),
+            "nome_produto": e.get("productName"),
+            "quantidade_total": e.get("totalQuantity"),
+            "ultima_atualizacao": e.get("lastUpdatedTime"),
+            "vendedor": vendedor,
+            "data_registro": datetime.now(timezone.utc).replace(tzinfo=None),
+            "data_consultada": data_consultada.replace(tzinfo=None) if data_consultada else None
+        }
+        estoque_tratado.append(item)
+    return estoque_tratado
+
+def magalu_anterior(item, info, preco, estoque):
+    sku_id = item.get("sku")
+    atributos = []
+    imagens = []
+
+    preco_info = preco.get("results", [{}])[0] if preco and "results" in preco else {}
+    estoque_info = estoque.get("results", [{}])[0] if estoque and "results" in estoque else {}
+
+    # Tradução do status
+    status_map = {
+        "INACTIVE": "Inativo",
+        "UNPUBLISHED": "Não publicado",
+        "PUBLISHED": "Publicado",
+        "BLOCKED": "Bloqueado"
+    }
+    status_original = info.get("status", "") if info else ""
+    status_traduzido = status_map.get(status_original.upper(), status_original)
+
+    # PRODUTOS
+    produto = {
+        "sku_id": sku_id,
+        "titulo": info.get("title", "") if info else "",
+        "descricao": info.get("description", "") if info else "",
+        "marca": info.get("brand", "") if info else "",
+        "status": status_traduzido,
+        "data_criacao": info.get("created_at") if info else None,
+        "data_atualizacao": info.get("updated_at") if info else None,
+        "preco": round(preco_info.get("price", 0) / 100, 2),
+        "estoque_disponivel": estoque_info.get("quantity", 0)
+    }
+
+    # ATRIBUTOS
+    for attr in item.get("attributes", []):
+        nome = attr.get("name", "")
+        valor = attr.get("value", "")
+        # Tradução dos nomes dos atributos
+        if nome == "update_only_front":
+            nome_traduzido = "Apenas atualização no frontend"
+        elif nome == "color":
+            nome_traduzido = "Cor"
+        else:
+            nome_traduzido = nome
+        if nome and valor and nome != "IdProduct" and nome != "fulfillment":
+            atributos.append({
+                "sku_id": sku_id,
+                "atributo": nome_traduzido,
+                "valor": valor
+            })
+
+    # DATASHEET
+    for attr in info.get("datasheet", []) if info else []:
+        nome = attr.get("name", "")
+        valor = attr.get("value", "")
+        if nome == "update_only_front":
+            nome_traduzido = "Apenas atualização no frontend"
+        elif nome == "color":
+            nome_traduzido = "Cor"
+        else:
+            nome_traduzido = nome
+        if nome and valor and nome != "IdProduct" and nome != "fulfillment":
+            atributos.append({
+                "sku_id": sku_id,
+                "atributo": nome_traduzido,
+                "valor": valor
+            })
+
+    # EXTRA_DATA
+    for attr in info.get("extra_data", []) if info else []:
+        nome = attr.get("name", "")
+        valor = attr.get("value", "")
+        if nome == "update_only_front":
+            nome_traduzido = "Apenas atualização no frontend"
+        elif nome == "color":
+            nome_traduzido = "Cor"
+        else:
+            nome_traduzido = nome
+        if nome and valor and nome != "IdProduct" and nome != "fulfillment":
+            atributos.append({
+                "sku_id": sku_id,
+                "atributo": nome_traduzido,
+                "valor": valor
+            })
+
+    # DIMENSIONS
+    dim = info.get("dimensions", {})
+    if isinstance(dim, dict):
+        if dim.get("height", {}).get("value"):
+            atributos.append({
+                "sku_id": sku_id,
+                "atributo": "Altura (cm)",
+                "valor": dim["height"]["value"]
+            })
+        if dim.get("width", {}).get("value"):
+            atributos.append({
+                "sku_id": sku_id,
+                "atributo": "Largura (cm)",
+                "valor": dim["width"]["value"]
+            })
+        if dim.get("length", {}).get("value"):
+            atributos.append({
+                "sku_id": sku_id,
+                "atributo": "Comprimento (cm)",
+                "valor": dim["length"]["value"]
+            })
+        if dim.get("weight", {}).get("value"):
+            atributos.append({
+                "sku_id": sku_id,
+                "atributo": "Peso (g)",
+                "valor": dim["weight"]["value"]
+            })
+
+    # IMAGENS
+    for idx, img in enumerate(info.get("images", []) if info else []):
+        imagens.append({
+            "id_imagem": f"{sku_id}_{idx}",
+            "sku_id": sku_id,
+            "secure_url": img.get("reference"),
+            "resolucao": img.get("type")
+        })
+
+    return produto, atributos, imagens
+
+def mercadolivre_anterior(detalhes, descricao, nome_categoria):
+    descricao_tratada = mercadolivre.tratar_descricao(descricao)
+    imagens = []
+    atributos = []
+    variacoes = []
+
+    imagens_item = detalhes.get('pictures', [])
+    atributos_item = detalhes.get('attributes', [])
+    variacoes_item = detalhes.get('variations', [])
+
+    # Garantia
+    garantia_valor = detalhes.get('warranty')
+    if garantia_valor is None or str(garantia_valor).lower() == "null":
+        garantia_valor = "Sem garantia informada"
+
+    # PRODUTOS
+    produto = {
+        "sku_id": detalhes.get('id'),
+        "titulo": detalhes.get('title', ''),
+        "descricao": descricao_tratada,
+        "categoria_id": detalhes.get('category_id'),
+        "nome_categoria": nome_categoria,
+        "preco": detalhes.get('price', 0),
+        "quantidade_variacoes": len(variacoes_item),
+        "status": mercadolivre.traduzir_status(detalhes.get('status', '')),
+        "health": detalhes.get('health', ''),
+        "quantidade_inicial": detalhes.get('initial_quantity', 0),
+        "quantidade_vendida": detalhes.get('sold_quantity', 0),
+        "quantidade_disponivel": detalhes.get('available_quantity', 0),
+        "gtin": next((a.get('value_name') for a in atributos_item if a.get('id') == 'GTIN'), ''),
+        "marca": next((a.get('value_name') for a in atributos_item if a.get('id') == 'BRAND'), ''),
+        "permalink": detalhes.get('permalink', ''),
+        "aceita_mercado_pago": detalhes.get('accepts_mercadopago', False),
+        "garantia": garantia_valor,
+        "imagens": len(imagens_item),
+        "link_imagem": ', '.join([img.get('secure_url') for img in imagens_item if img.get('secure_url')])
+    }
+
+    # ATRIBUTOS
+    for attr in atributos_item:
+        nome = attr.get("name", "")
+        valor = attr.get("value_name", "")
+        if nome and valor and nome != "IdProduct":
+            atributos.append({
+                "sku_id": detalhes.get('id'),
+                "atributo": nome,
+                "valor": valor
+            })
+
+    # IMAGENS
+    for img in imagens_item:
+        imagens.append({
+            "id_imagem": img.get("id"),
+            "sku_id": detalhes.get('id'),
+            "secure_url": img.get("secure_url"),
+            "resolucao": img.get("size")
+        })
+
+    # VARIAÇÕES
+    for variacao in variacoes_item:
+        id_variacao = variacao.get('id')
+        preco_variacao = variacao.get('price')
+        atributos_var = variacao.get('attribute_combinations', [])
+        for atributo in atributos_var:
+            variacoes.append({
+                'sku_id': detalhes.get('id'),
+                'id_variacao': id_variacao,
+                'preco_variacao': preco_variacao,
+                'atributo': atributo.get('name'),
+                'valor': atributo.get('value_name')
+            })
+
+    return produto, imagens, atributos, variacoes
+
+# ------------------------- PAYLOADS ----------------------------
+
+def _json(dados):
+    return json.loads(json.dumps(dados))
+
+def payloads_estoque():
+    lista = []
+    for i in range(DISTINTOS):
+        e = _json(amazon_estoque(CONFIG_PADRAO, i))
+        if i % 7 == 0:
+            del e["inventoryDetails"]["unfulfillableQuantity"]
+        if i % 11 == 0:
+            del e["inventoryDetails"]
+        lista.append(e)
+    return lista
+
+def payloads_pedidos():
+    config = {**CONFIG_PADRAO, "inicio": datetime(2025, 6, 1, tzinfo=timezone.utc)}
+    lista = []
+    for i in range(DISTINTOS):
+        p = _json(amazon_pedido(config, i))
+        if i % 5 == 0:
+            p["BuyerInfo"] = {"BuyerCounty": f"Município {i}"}
+        if i % 9 == 0:
+            del p["BuyerInfo"]
+            p["OrderStatus"] = None
+        lista.append(p)
+    return lista
+
+def payloads_magalu():
+    lista = []
+    for i in range(DISTINTOS):
+        info = _json(magalu_sku(CONFIG_PADRAO, i))
+        item = {"sku": info["sku"], "attributes": [{"name": "color", "value": "Azul"}, {"name": "fulfillment", "value": "x"}]}
+        preco = {"results": [{"price": 1000 + i}]} if i % 13 else None
+        estoque = {"results": [{"quantity": i % 100}]}
+        if i % 17 == 0:
+            del info["dimensions"], info["datasheet"]
+        lista.append((item, info, preco, estoque))
+    return lista
+
+def payloads_mercadolivre():
+    return [(_json(ml_item(CONFIG_PADRAO, i)), "Descrição" if i % 3 else "", "Categoria") for i in range(DISTINTOS)]
+
+# (nome, payloads, função anterior, função atual); cada função trata uma lista de payloads
+def casos():
+    return [
+        ("amazon.estoque", payloads_estoque(),
+         lambda lista: estoque_anterior(lista, "vendedor"),
+         lambda lista: amazon.tratar_dados_estoque(lista, "vendedor")),
+        ("amazon.pedidos", payloads_pedidos(),
+         lambda lista: pedidos_anterior(lista, "vendedor"),
+         lambda lista: amazon.tratar_dados_pedidos(lista, "vendedor")),
+        ("magalu.skus", payloads_magalu(),
+         lambda lista: [magalu_anterior(*p) for p in lista],
+         lambda lista: [magalu.montar_registros_sku(*p) for p in lista]),
+        ("mercadolivre.itens", payloads_mercadolivre(),
+         lambda lista: [mercadolivre_anterior(*p) for p in lista],
+         lambda lista: [mercadolivre.montar_registros_item(*p) for p in lista])
+    ]
+
+# ------------------------- MEDIDA ----------------------------
+
+# data_registro é a hora da chamada (por registro na versão anterior): fica fora da comparação
+def _sem_data_registro(resultado):
+    if isinstance(resultado, dict):
+        return {k: v for k, v in resultado.items() if k != "data_registro"}
+    if isinstance(resultado, (list, tuple)):
+        return [_sem_data_registro(r) for r in resultado]
+    return resultado
+
+def medir(funcao, lista, repeticoes):
+    melhor = None
+    for _ in range(repeticoes):
+        gc.collect()
+        inicio = time.perf_counter()
+        funcao(lista)
+        duracao = time.perf_counter() - inicio
+        melhor = duracao if melhor is None else min(melhor, duracao)
+    return melhor
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Custo por registro do achatamento dos payloads: mapeamentos compilados x versão anterior.")
+    parser.add_argument("--registros", type=int, default=100000)
+    parser.add_argument("--repeticoes", type=int, default=3)
+    parser.add_argument("--saida", help="Arquivo JSON com os resultados")
+    return parser.parse_args(argv)
+
+def main(argv=None):
+    args = parse_args(argv)
+    resultados = []
+    for nome, distintos, anterior, atual in casos():
+        if _sem_data_registro(anterior(distintos)) != _sem_data_registro(atual(distintos)):
+            raise RuntimeError(f"{nome}: os registros do mapeamento diferem da versão anterior")
+        lista = (distintos * (args.registros // len(distintos) + 1))[:args.registros]
+        tempos = {"anterior": medir(anterior, lista, args.repeticoes), "mapeamento": medir(atual, lista, args.repeticoes)}
+        resultado = {
+            "entidade": nome,
+            "registros": len(lista),
+            **{f"{versao}_us_por_registro": round(t / len(lista) * 1e6, 2) for versao, t in tempos.items()},
+            "aceleracao": round(tempos["anterior"] / tempos["mapeamento"], 2)
+        }
+        resultados.append(resultado)
+        print(
+            f"{nome:<20} {len(lista):>8} registros  anterior {resultado['anterior_us_por_registro']:>7.2f} µs  "
+            f"mapeamento {resultado['mapeamento_us_por_registro']:>7.2f} µs  ({resultado['aceleracao']}x)"
+        )
+
+    if args.saida:
+        with open(args.saida, "w") as f:
+            json.dump({"parametros": vars(args), "resultados": resultados}, f, indent=2, default=str)
+    return resultados
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,130 @@
+import sys
+import json
+import time
+import argparse
+import resource
+import subprocess
+from bench.benchmark import DIR_BACKEND
+from bench.fake_marketplace import CONFIG_PADRAO, magalu_sku
+
+# ------------------------- BENCHMARK DE MEMÓRIA DOS LOTES COLUNARES ----------------------------
+
+# Passa N SKUs sintéticos da Magalu (os mesmos payloads do servidor falso, decodificados
+# de JSON como na coleta) por montar_registros_sku e mantém o catálogo em memória até os
+# DataFrames da verificação de qualidade, medindo o pico de RSS acima do processo ocioso.
+# Cada medida roda em um subprocesso próprio. O modo "dicts" reproduz o acúmulo antigo
+# (listas de dicts e pd.DataFrame delas) para comparação com o modo "colunar" atual
+# (lotes por página juntados em colunar.Lote e para_dataframe). Não usa banco nem rede.
+#
+# Uso (a partir de backend/):
+#   python -m bench.memoria_colunar --skus 20000 100000
+
+MODOS = ["colunar", "dicts"]
+SKUS_POR_PAGINA = 100
+
+def payloads(total):
+    for indice in range(total):
+        info = json.loads(json.dumps(magalu_sku(CONFIG_PADRAO, indice)))
+        item = json.loads(json.dumps(
+            {"sku": info["sku"], "attributes": [{"name": "color", "value": "Azul"}, {"name": "fulfillment", "value": "x"}]}
+        ))
+        preco = {"results": [{"price": 1000 + indice % 50000}]}
+        estoque = {"results": [{"quantity": indice % 100}]}
+        yield item, info, preco, estoque
+
+# Acúmulo antigo, mantido aqui apenas como referência de memória
+def acumular_dicts(magalu, total):
+    import pandas as pd
+    produtos, atributos, imagens = [], [], []
+    for payload in payloads(total):
+        produto, atributos_sku, imagens_sku = magalu.montar_registros_sku(*payload)
+        produtos.append(produto)
+        atributos.extend(atributos_sku)
+        imagens.extend(imagens_sku)
+    dataframes = [pd.DataFrame(produtos), pd.DataFrame(imagens), pd.DataFrame(atributos)]
+    return (produtos, atributos, imagens), dataframes
+
+def acumular_colunar(magalu, total):
+    acumulados = magalu.lotes_skus()
+    pagina = magalu.lotes_skus()
+    for numero, payload in enumerate(payloads(total), start=1):
+        produto, atributos_sku, imagens_sku = magalu.montar_registros_sku(*payload)
+        pagina[0].acrescentar(produto)
+        pagina[1].estender(atributos_sku)
+        pagina[2].estender(imagens_sku)
+        if numero % SKUS_POR_PAGINA == 0 or numero == total:
+            for acumulado, lote in zip(acumulados, pagina):
+                acumulado.estender_lote(lote)
+            pagina = magalu.lotes_skus()
+    produtos, atributos, imagens = acumulados
+    dataframes = [produtos.para_dataframe(), imagens.para_dataframe(), atributos.para_dataframe()]
+    return acumulados, dataframes
+
+def executar_medida(modo, total):
+    from app.services import magalu
+    import pandas  # noqa: F401
+
+    # Aquece o gerador e o pandas antes de tomar a referência
+    acumular_colunar(magalu, 10)
+    base = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+    inicio = time.perf_counter()
+    if modo == "colunar":
+        registros, dataframes = acumular_colunar(magalu, total)
+    else:
+        registros, dataframes = acumular_dicts(magalu, total)
+    duracao = time.perf_counter() - inicio
+    pico = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return {
+        "modo": modo,
+        "produtos": len(registros[0]),
+        "atributos": len(registros[1]),
+        "imagens": len(registros[2]),
+        "duracao_segundos": round(duracao, 2),
+        "rss_base_mb": round(base / 1024, 1),
+        "rss_pico_mb": round(pico / 1024, 1),
+        "rss_acrescimo_mb": round((pico - base) / 1024, 1)
+    }
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Pico de memória do acúmulo dos SKUs da Magalu: dicts x lotes colunares.")
+    parser.add_argument("--skus", type=int, nargs="+", default=[20000, 100000])
+    parser.add_argument("--modos", nargs="+", default=MODOS, choices=MODOS)
+    parser.add_argument("--saida", help="Arquivo JSON com os resultados")
+    parser.add_argument("--executar-medida", nargs=2, metavar=("MODO", "SKUS"), help=argparse.SUPPRESS)
+    return parser.parse_args(argv)
+
+def main(argv=None):
+    args = parse_args(argv)
+
+    if args.executar_medida:
+        modo, total = args.executar_medida
+        print("RESULTADO " + json.dumps(executar_medida(modo, int(total))))
+        return
+
+    resultados = []
+    for total in args.skus:
+        for modo in args.modos:
+            processo = subprocess.run(
+                [sys.executable, "-m", "bench.memoria_colunar", "--executar-medida", modo, str(total)],
+                cwd=DIR_BACKEND, capture_output=True, text=True
+            )
+            linha = next((l for l in processo.stdout.splitlines() if l.startswith("RESULTADO ")), None)
+            if linha is None:
+                print(processo.stdout[-2000:], processo.stderr[-2000:])
+                raise RuntimeError(f"Falha na medida {modo} com {total} SKUs")
+            resultado = {"skus": total, **json.loads(linha[len("RESULTADO "):])}
+            resultados.append(resultado)
+            print(
+                f"{total:>8} SKUs  {modo:<8} {resultado['duracao_segundos']:>7.2f}s  "
+                f"{resultado['atributos']:>8} atributos  {resultado['imagens']:>7} imagens  "
+                f"RSS +{resultado['rss_acrescimo_mb']} MB (pico {resultado['rss_pico_mb']} MB)"
+            )
+
+    if args.saida:
+        with open(args.saida, "w") as f:
+            json.dump({"parametros": vars(args), "resultados": resultados}, f, indent=2, default=str)
+    return resultados
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,160 @@
+import io
+import os
+import sys
+import json
+import time
+import argparse
+import resource
+import zipfile
+import subprocess
+import pytz
+from datetime import datetime
+from bench.benchmark import DIR_BACKEND, VENDEDOR, PostgresDescartavel
+from app.services import particoes
+
+# ------------------------- BENCHMARK DE MEMÓRIA DOS RELATÓRIOS ----------------------------
+
+# Preenche o banco do Mercado Livre com N produtos (e 3 imagens por produto) e gera o ZIP
+# de relatórios do dia, medindo o pico de RSS acima do processo ocioso. Cada medida roda
+# em um subprocesso próprio. O modo "materializado" reproduz a leitura antiga (fetchall,
+# lista de dicts e DataFrame por tabela) para comparação com o modo "streaming" atual.
+#
+# Uso (a partir de backend/):
+#   python -m bench.memoria_relatorios --linhas 5000 20000 80000
+#   python -m bench.memoria_relatorios --pg-host localhost --pg-user postgres
+
+MODOS = ["streaming", "materializado"]
+
+def popular(conn, linhas):
+    data_registro = datetime.now(pytz.timezone("America/Sao_Paulo")).replace(tzinfo=None)
+    with conn.cursor() as cur:
+        particoes.garantir(cur, "produtos", data_registro)
+        particoes.garantir(cur, "imagens", data_registro)
+        cur.execute("""
+            INSERT INTO produtos (
+                sku_id, titulo, descricao, categoria_id, nome_categoria, preco, quantidade_variacoes,
+                status, health, quantidade_inicial, quantidade_vendida, quantidade_disponivel,
+                gtin, marca, permalink, aceita_mercado_pago, garantia, imagens, link_imagem,
+                vendedor, data_registro
+            )
+            SELECT
+                'MLB' || g, 'Produto de teste número ' || g || ' com título de tamanho comum',
+                repeat('Descrição detalhada do produto. ', 20), 'MLB1000', 'Categoria',
+                (g %% 1000) + 0.99, g %% 5, 'active', '0.8', 100, g %% 50, 50,
+                lpad(g::text, 13, '7'), 'Marca', 'https://produto.exemplo/MLB' || g, true,
+                'Garantia de 90 dias', 3, 'https://img.exemplo/' || g || '.jpg',
+                %s, %s
+            FROM generate_series(1, %s) AS g
+        """, (VENDEDOR, data_registro, linhas))
+        cur.execute("""
+            INSERT INTO imagens (id_imagem, sku_id, secure_url, resolucao, vendedor, data_registro)
+            SELECT g || '-' || i, 'MLB' || g, 'https://img.exemplo/' || g || '/' || i || '.jpg', '1200x1200', %s, %s
+            FROM generate_series(1, %s) AS g, generate_series(1, 3) AS i
+        """, (VENDEDOR, data_registro, linhas))
+    conn.commit()
+
+# Leitura antiga, mantida aqui apenas como referência de memória
+def zip_materializado(modulo):
+    import pandas as pd
+    zip_stream = io.BytesIO()
+    with zipfile.ZipFile(zip_stream, "w") as zf:
+        for tabela in ["produtos", "imagens", "atributos", "variacoes", "erros_qualidade"]:
+            conn = modulo.get_connection()
+            with conn.cursor() as cur:
+                cur.execute(f"SELECT * FROM {tabela} WHERE vendedor = %s", (VENDEDOR,))
+                colunas = [desc[0] for desc in cur.description]
+                registros = [dict(zip(colunas, row)) for row in cur.fetchall()]
+            conn.close()
+            if registros:
+                saida = io.BytesIO()
+                with pd.ExcelWriter(saida, engine="xlsxwriter") as writer:
+                    pd.DataFrame(registros).to_excel(writer, index=False)
+                zf.writestr(f"{tabela}.xlsx", saida.getvalue())
+    zip_stream.seek(0)
+    return zip_stream
+
+def executar_medida(modo):
+    from app.services import mercadolivre
+
+    # Aquece imports e o pool antes de tomar a referência
+    conn = mercadolivre.get_connection()
+    conn.close()
+    import pandas  # noqa: F401
+    import xlsxwriter  # noqa: F401
+    base = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+    inicio = time.perf_counter()
+    if modo == "streaming":
+        zip_stream = mercadolivre.gerar_zip_relatorios_do_dia(VENDEDOR)
+    else:
+        zip_stream = zip_materializado(mercadolivre)
+    duracao = time.perf_counter() - inicio
+    zip_stream.seek(0, os.SEEK_END)
+    pico = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return {
+        "modo": modo,
+        "duracao_segundos": round(duracao, 2),
+        "zip_mb": round(zip_stream.tell() / 1024 / 1024, 2),
+        "rss_base_mb": round(base / 1024, 1),
+        "rss_pico_mb": round(pico / 1024, 1),
+        "rss_acrescimo_mb": round((pico - base) / 1024, 1)
+    }
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Pico de memória da geração do ZIP de relatórios por número de linhas.")
+    parser.add_argument("--linhas", type=int, nargs="+", default=[5000, 20000, 80000])
+    parser.add_argument("--modos", nargs="+", default=MODOS, choices=MODOS)
+    parser.add_argument("--pg-bin")
+    parser.add_argument("--pg-host")
+    parser.add_argument("--pg-port", type=int, default=5432)
+    parser.add_argument("--pg-user", default="postgres")
+    parser.add_argument("--pg-password", default="")
+    parser.add_argument("--saida", help="Arquivo JSON com os resultados")
+    parser.add_argument("--executar-medida", help=argparse.SUPPRESS)
+    return parser.parse_args(argv)
+
+def main(argv=None):
+    args = parse_args(argv)
+
+    if args.executar_medida:
+        print("RESULTADO " + json.dumps(executar_medida(args.executar_medida)))
+        return
+
+    postgres = PostgresDescartavel(args).iniciar()
+    resultados = []
+    try:
+        for linhas in args.linhas:
+            # O banco tem nome fixo por processo: criar de novo descarta o da medida anterior
+            banco = postgres.criar_banco("mercadolivre")
+            conn = postgres._conectar(banco)
+            try:
+                popular(conn, linhas)
+            finally:
+                conn.close()
+            env = {**os.environ, **postgres.env("MERCADOLIVRE", banco)}
+            for modo in args.modos:
+                processo = subprocess.run(
+                    [sys.executable, "-m", "bench.memoria_relatorios", "--executar-medida", modo],
+                    cwd=DIR_BACKEND, env=env, capture_output=True, text=True
+                )
+                linha = next((l for l in processo.stdout.splitlines() if l.startswith("RESULTADO ")), None)
+                if linha is None:
+                    print(processo.stdout[-2000:], processo.stderr[-2000:])
+                    raise RuntimeError(f"Falha na medida {modo} com {linhas} linhas")
+                resultado = {"linhas": linhas, **json.loads(linha[len("RESULTADO "):])}
+                resultados.append(resultado)
+                print(
+                    f"{linhas:>8} produtos  {modo:<13} {resultado['duracao_segundos']:>7.2f}s  "
+                    f"ZIP {resultado['zip_mb']:>7.2f} MB  RSS +{resultado['rss_acrescimo_mb']} MB "
+                    f"(pico {resultado['rss_pico_mb']} MB)"
+                )
+    finally:
+        postgres.encerrar()
+
+    if args.saida:
+        with open(args.saida, "w") as f:
+            json.dump({"parametros": vars(args), "resultados": resultados}, f, indent=2, default=str)
+    return resultados
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,161 @@
+import gc
+import json
+import time
+import argparse
+import pandas as pd
+from bench.fake_marketplace import CONFIG_PADRAO, magalu_sku, ml_item
+from app.services import magalu, mercadolivre, imagens_duplicadas
+
+# ------------------------- MICRO-BENCHMARK DA VERIFICAÇÃO DE QUALIDADE ----------------------------
+
+# Tempo da verificação de qualidade de um catálogo (produtos, imagens e atributos já em
+# DataFrames, como em verificar_qualidade): as regras compiladas de qualidade.py contra a
+# implementação anterior, que percorria os produtos com iterrows e filtrava as imagens e os
+# atributos de cada SKU (mantida abaixo apenas como referência). Os SKUs sintéticos são os
+# do servidor falso, com resoluções variadas nas imagens. Antes de medir, confere que as
+# duas versões produzem o mesmo relatório.
+#
+# Uso (a partir de backend/):
+#   python -m bench.qualidade --skus 1000 5000
+
+RESOLUCOES = ["1200x1200", "800x1200", "1000x1000", "640x480", None, "desconhecida"]
+
+# ------------------------- IMPLEMENTAÇÃO ANTERIOR ----------------------------
+
+# Mesmas verificações, uma linha de produto por vez. 'limites' traz o que mudava entre as
+# plataformas; a mensagem de imagens faltantes já usa o mínimo de cada uma.
+def tratar_dados_anterior(df_produtos, df_imagens, df_atributos, duplicadas, limites):
+    def contar_imagens_baixa_resolucao(resolucoes):
+        baixa = 0
+        for r in resolucoes:
+            try:
+                w, h = map(int, r.lower().split('x'))
+                if w < 1000 or h < 1000:
+                    baixa += 1
+            except:
+                continue
+        return baixa
+
+    erros = []
+    for _, row in df_produtos.iterrows():
+        sku_id = row['sku_id']
+        titulo = row['titulo']
+        descricao = row['descricao']
+        imagens_produto = df_imagens[df_imagens['sku_id'] == sku_id]
+        qtd_imagens = len(imagens_produto)
+        minimo = limites["imagens"]
+        baixa_qtd = contar_imagens_baixa_resolucao(imagens_produto['resolucao'].dropna().tolist())
+        atributos_produto = df_atributos[df_atributos['sku_id'] == sku_id]
+        atributos_vazios = atributos_produto['valor'].isna().sum() + (atributos_produto['valor'] == '').sum()
+        erro = {
+            'sku_id': sku_id,
+            'produto': titulo,
+            'status': row.get('status', ''),
+            'titulo': "OK" if pd.notna(titulo) and limites["titulo"] <= len(str(titulo)) <= 60 else "Necessário preencher",
+            'qtd_imagem': "OK" if qtd_imagens >= minimo else f"Necessário adicionar mais {minimo - qtd_imagens} imagens",
+            'resolucao_imagem': "OK" if baixa_qtd == 0 else f"{baixa_qtd} {limites['baixa']}",
+            'descricao': "OK" if pd.notna(descricao) and str(descricao).strip() != "" and len(str(descricao)) > 500 else "Necessário preencher"
+        }
+        if "garantia" in limites:
+            garantia = row.get('garantia', '')
+            erro['garantia'] = "Sem garantia informada" if garantia is None or str(garantia).strip().lower() in ["", "null", "sem garantia informada"] else "OK"
+        erro['atributos'] = f"{atributos_vazios} campos vazios"
+        if "marca" in limites:
+            erro['marca'] = "OK" if pd.notna(row['marca']) and row['marca'].strip() != "" else "Necessário preencher"
+        erro['imagens_duplicadas'] = imagens_duplicadas.mensagem(duplicadas, sku_id)
+        erros.append(erro)
+    return pd.DataFrame(erros)
+
+LIMITES = {
+    "magalu": {"imagens": 4, "titulo": 10, "baixa": "imagens com qualidade baixa", "marca": True},
+    "mercadolivre": {"imagens": 6, "titulo": 50, "baixa": "imagens com a qualidade baixa", "garantia": True}
+}
+
+# ------------------------- CATÁLOGOS ----------------------------
+
+def _json(dados):
+    return json.loads(json.dumps(dados))
+
+def tabelas_magalu(total):
+    produtos, atributos, imagens = [], [], []
+    for i in range(total):
+        info = _json(magalu_sku(CONFIG_PADRAO, i))
+        item = {"sku": info["sku"], "attributes": [{"name": "color", "value": "" if i % 4 == 0 else "Azul"}]}
+        produto, atributos_sku, imagens_sku = magalu.montar_registros_sku(
+            item, info, {"results": [{"price": 1000 + i}]}, {"results": [{"quantity": i % 100}]}
+        )
+        produtos.append(produto)
+        atributos.extend(atributos_sku)
+        imagens.extend(imagens_sku[:i % 6 + 1])
+    for j, imagem in enumerate(imagens):
+        imagem["resolucao"] = RESOLUCOES[j % len(RESOLUCOES)]
+    return pd.DataFrame(produtos), pd.DataFrame(imagens), pd.DataFrame(atributos)
+
+def tabelas_mercadolivre(total):
+    produtos, atributos, imagens = [], [], []
+    for i in range(total):
+        produto, imagens_item, atributos_item, _ = mercadolivre.montar_registros_item(
+            _json(ml_item(CONFIG_PADRAO, i)), "Descrição " * (i % 80), "Categoria"
+        )
+        produtos.append(produto)
+        atributos.extend(atributos_item)
+        imagens.extend(imagens_item[:i % 8 + 1])
+    for j, imagem in enumerate(imagens):
+        imagem["resolucao"] = RESOLUCOES[j % len(RESOLUCOES)]
+    return pd.DataFrame(produtos), pd.DataFrame(imagens), pd.DataFrame(atributos)
+
+# ------------------------- MEDIDA ----------------------------
+
+def medir(funcao, repeticoes):
+    melhor = None
+    for _ in range(repeticoes):
+        gc.collect()
+        inicio = time.perf_counter()
+        funcao()
+        duracao = time.perf_counter() - inicio
+        melhor = duracao if melhor is None else min(melhor, duracao)
+    return melhor
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Tempo da verificação de qualidade: regras compiladas x iterrows anterior.")
+    parser.add_argument("--skus", type=int, nargs="+", default=[1000, 5000])
+    parser.add_argument("--repeticoes", type=int, default=3)
+    parser.add_argument("--saida", help="Arquivo JSON com os resultados")
+    return parser.parse_args(argv)
+
+def main(argv=None):
+    args = parse_args(argv)
+    resultados = []
+    for total in args.skus:
+        for plataforma, tabelas, servico in [("magalu", tabelas_magalu, magalu), ("mercadolivre", tabelas_mercadolivre, mercadolivre)]:
+            df_produtos, df_imagens, df_atributos = tabelas(total)
+            duplicadas = {df_produtos['sku_id'].iloc[0]: 2}
+            # Argumentos fixados como padrão: as funções não dependem das variáveis do laço
+            anterior = lambda p=df_produtos, i=df_imagens, a=df_atributos, d=duplicadas, limites=LIMITES[plataforma]: \
+                tratar_dados_anterior(p, i, a, d, limites)
+            atual = lambda p=df_produtos, i=df_imagens, a=df_atributos, d=duplicadas, servico=servico: \
+                servico.tratar_dados(p, i, a, d)
+            if not anterior().astype(object).equals(atual().astype(object)):
+                raise RuntimeError(f"{plataforma}: o relatório das regras compiladas difere da versão anterior")
+            tempos = {"anterior": medir(anterior, args.repeticoes), "regras": medir(atual, args.repeticoes)}
+            resultado = {
+                "plataforma": plataforma,
+                "skus": total,
+                "imagens": len(df_imagens),
+                "atributos": len(df_atributos),
+                **{f"{versao}_segundos": round(t, 4) for versao, t in tempos.items()},
+                "aceleracao": round(tempos["anterior"] / tempos["regras"], 1)
+            }
+            resultados.append(resultado)
+            print(
+                f"{plataforma:<13} {total:>7} SKUs  {len(df_imagens):>7} imagens  {len(df_atributos):>7} atributos  "
+                f"anterior {tempos['anterior']:>8.3f}s  regras {tempos['regras']:>7.3f}s  ({resultado['aceleracao']}x)"
+            )
+
+    if args.saida:
+        with open(args.saida, "w") as f:
+            json.dump({"parametros": vars(args), "resultados": resultados}, f, indent=2, default=str)
+    return resultados
+
+if __name__ == "__main__":
+    main()
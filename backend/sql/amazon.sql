@@ -0,0 +1,175 @@
+-- Banco Amazon
+
+-- Tabelas de dados coletados particionadas por dia de data_registro; as partições
+-- (<tabela>_AAAAMMDD) são criadas pela aplicação (app/services/particoes.py).
+-- Itens de pedidos, controle e faturamento continuam sem partições.
+
+CREATE TABLE IF NOT EXISTS produtos (
+    asin TEXT NOT NULL,
+    sku TEXT,
+    tipo_produto TEXT,
+    tipo_condicao TEXT,
+    status TEXT,
+    nome_item TEXT,
+    data_criacao TIMESTAMPTZ,
+    data_atualizacao TIMESTAMPTZ,
+    imagem_url TEXT,
+    imagem_largura INTEGER,
+    imagem_altura INTEGER,
+    vendedor TEXT NOT NULL,
+    data_registro TIMESTAMP NOT NULL,
+    data_consultada TIMESTAMP,
+    PRIMARY KEY (asin, vendedor, data_registro)
+) PARTITION BY RANGE (data_registro);
+
+CREATE TABLE IF NOT EXISTS pedidos (
+    id_pedido TEXT NOT NULL,
+    municipio_comprador TEXT,
+    status TEXT,
+    data_compra TIMESTAMPTZ,
+    data_aprovacao TIMESTAMPTZ,
+    canal_venda TEXT,
+    canal_fulfillment TEXT,
+    detalhes_pagamento TEXT,
+    total_pedido TEXT,
+    moeda TEXT,
+    itens_enviados INTEGER,
+    itens_nao_enviados INTEGER,
+    prime BOOLEAN,
+    pedido_empresarial BOOLEAN,
+    estado_entrega TEXT,
+    cidade_entrega TEXT,
+    vendedor TEXT NOT NULL,
+    data_registro TIMESTAMP NOT NULL,
+    data_consultada TIMESTAMP,
+    PRIMARY KEY (id_pedido, vendedor, data_registro)
+) PARTITION BY RANGE (data_registro);
+
+-- Itens dos pedidos (getOrderItems)
+CREATE TABLE IF NOT EXISTS pedido_itens (
+    id_pedido TEXT NOT NULL,
+    id_item_pedido TEXT NOT NULL,
+    asin TEXT,
+    sku TEXT,
+    titulo TEXT,
+    quantidade_pedida INTEGER,
+    quantidade_enviada INTEGER,
+    preco_item NUMERIC,
+    moeda TEXT,
+    imposto_item NUMERIC,
+    desconto_promocional NUMERIC,
+    vendedor TEXT NOT NULL,
+    data_registro TIMESTAMP,
+    PRIMARY KEY (id_pedido, id_item_pedido, vendedor)
+);
+
+-- Versão (LastUpdateDate) e status de cada pedido na última consulta de itens.
+-- Não é limpa na coleta completa: pedidos finalizados não têm os itens consultados de novo.
+CREATE TABLE IF NOT EXISTS pedido_itens_controle (
+    id_pedido TEXT NOT NULL,
+    vendedor TEXT NOT NULL,
+    status TEXT,
+    ultima_atualizacao TIMESTAMPTZ,
+    data_registro TIMESTAMP,
+    PRIMARY KEY (id_pedido, vendedor)
+);
+
+CREATE TABLE IF NOT EXISTS estoque (
+    asin TEXT NOT NULL,
+    fnsku TEXT,
+    condicao TEXT,
+    disponivel_vendavel INTEGER,
+    recebendo_em_estoque INTEGER,
+    reservado_total INTEGER,
+    reservado_cliente INTEGER,
+    reservado_transito INTEGER,
+    reservado_processamento INTEGER,
+    em_pesquisa_total INTEGER,
+    pesquisa_curto_prazo INTEGER,
+    pesquisa_medio_prazo INTEGER,
+    pesquisa_longo_prazo INTEGER,
+    inutilizavel_total INTEGER,
+    inutilizavel_danificado_cliente INTEGER,
+    inutilizavel_danificado_armazem INTEGER,
+    inutilizavel_danificado_distribuidor INTEGER,
+    inutilizavel_danificado_transportadora INTEGER,
+    inutilizavel_defeituoso INTEGER,
+    inutilizavel_vencido INTEGER,
+    fornecimento_futuro_reservado INTEGER,
+    fornecimento_futuro_compravel INTEGER,
+    nome_produto TEXT,
+    quantidade_total INTEGER,
+    ultima_atualizacao TIMESTAMPTZ,
+    vendedor TEXT NOT NULL,
+    data_registro TIMESTAMP NOT NULL,
+    data_consultada TIMESTAMP,
+    PRIMARY KEY (asin, vendedor, data_registro)
+) PARTITION BY RANGE (data_registro);
+
+CREATE TABLE IF NOT EXISTS faturamento (
+    periodo_inicio TIMESTAMPTZ,
+    periodo_fim TIMESTAMPTZ,
+    unidades_vendidas INTEGER,
+    itens_vendidos INTEGER,
+    pedidos INTEGER,
+    preco_medio_unitario NUMERIC,
+    moeda_unitario TEXT,
+    total_vendas NUMERIC,
+    moeda_vendas TEXT,
+    vendedor TEXT NOT NULL,
+    data_registro TIMESTAMP,
+    UNIQUE (periodo_inicio, periodo_fim, vendedor)
+);
+
+CREATE TABLE IF NOT EXISTS erros_qualidade_produtos (
+    asin TEXT NOT NULL,
+    sku TEXT,
+    titulo TEXT,
+    status TEXT,
+    url_imagem_principal TEXT,
+    resolucao_imagem TEXT,
+    qtd_imagem TEXT,
+    atributos TEXT,
+    marca TEXT,
+    classificacao TEXT,
+    vendedor TEXT NOT NULL,
+    data_registro TIMESTAMP NOT NULL,
+    data_consultada TIMESTAMP,
+    PRIMARY KEY (asin, vendedor, data_registro)
+) PARTITION BY RANGE (data_registro);
+
+ALTER TABLE erros_qualidade_produtos ADD COLUMN IF NOT EXISTS qtd_imagem TEXT;
+ALTER TABLE erros_qualidade_produtos ADD COLUMN IF NOT EXISTS atributos TEXT;
+ALTER TABLE erros_qualidade_produtos ADD COLUMN IF NOT EXISTS marca TEXT;
+ALTER TABLE erros_qualidade_produtos ADD COLUMN IF NOT EXISTS classificacao TEXT;
+
+-- Dados do Catalog Items API por ASIN (compartilhados entre vendedores), reaproveitados
+-- enquanto estiverem dentro da validade (AMAZON_CATALOGO_VALIDADE_HORAS)
+CREATE TABLE IF NOT EXISTS catalogo_cache (
+    asin TEXT PRIMARY KEY,
+    dados JSONB NOT NULL,
+    atualizado_em TIMESTAMP NOT NULL
+);
+
+CREATE TABLE IF NOT EXISTS erros_qualidade_estoque (
+    asin TEXT NOT NULL,
+    disponivel_vendavel TEXT,
+    inutilizavel_total TEXT,
+    vendedor TEXT NOT NULL,
+    data_registro TIMESTAMP NOT NULL,
+    data_consultada TIMESTAMP,
+    PRIMARY KEY (asin, vendedor, data_registro)
+) PARTITION BY RANGE (data_registro);
+
+-- Dimensões lidas das imagens (cache da sondagem, por URL e ETag) e hash perceptual
+-- usado na detecção de imagens duplicadas
+CREATE TABLE IF NOT EXISTS imagens_sondadas (
+    url TEXT PRIMARY KEY,
+    etag TEXT,
+    largura INTEGER,
+    altura INTEGER,
+    hash_perceptual BIGINT,
+    verificado_em TIMESTAMP NOT NULL
+);
+
+ALTER TABLE imagens_sondadas ADD COLUMN IF NOT EXISTS hash_perceptual BIGINT;
@@ -0,0 +1,60 @@
+-- Banco de controle: registro das execuções de coleta, agendamentos e fila de coletas
+
+CREATE TABLE IF NOT EXISTS execucoes (
+    id BIGSERIAL PRIMARY KEY,
+    plataforma TEXT NOT NULL,
+    vendedor TEXT NOT NULL,
+    status TEXT NOT NULL,
+    mensagem TEXT,
+    perfil_solicitado BOOLEAN NOT NULL DEFAULT FALSE,
+    incremental BOOLEAN NOT NULL DEFAULT FALSE,
+    tempos JSONB,
+    perfil BYTEA,
+    inicio TIMESTAMP NOT NULL,
+    fim TIMESTAMP
+);
+
+CREATE INDEX IF NOT EXISTS idx_execucoes_plataforma_vendedor ON execucoes (plataforma, vendedor, id DESC);
+
+ALTER TABLE execucoes ADD COLUMN IF NOT EXISTS incremental BOOLEAN NOT NULL DEFAULT FALSE;
+
+-- Agendamentos periódicos (expressão cron no fuso America/Sao_Paulo).
+-- vendedor NULL agenda todos os vendedores configurados da plataforma.
+-- tipo: 'completa' (catálogo inteiro) ou 'incremental' (pedidos/estoque).
+CREATE TABLE IF NOT EXISTS agendamentos (
+    id SERIAL PRIMARY KEY,
+    plataforma TEXT NOT NULL,
+    vendedor TEXT,
+    tipo TEXT NOT NULL DEFAULT 'completa' CHECK (tipo IN ('completa', 'incremental')),
+    cron TEXT NOT NULL,
+    jitter_segundos INTEGER NOT NULL DEFAULT 0,
+    recuperar_perdidas BOOLEAN NOT NULL DEFAULT TRUE,
+    ativo BOOLEAN NOT NULL DEFAULT TRUE,
+    ultima_execucao TIMESTAMP,
+    proxima_execucao TIMESTAMP
+);
+
+-- Fila durável de coletas (processada por python -m app.worker)
+CREATE TABLE IF NOT EXISTS fila_coletas (
+    id BIGSERIAL PRIMARY KEY,
+    lote TEXT,
+    plataforma TEXT NOT NULL,
+    vendedor TEXT NOT NULL,
+    incremental BOOLEAN NOT NULL DEFAULT FALSE,
+    perfil BOOLEAN NOT NULL DEFAULT FALSE,
+    status TEXT NOT NULL DEFAULT 'pendente' CHECK (status IN ('pendente', 'em_andamento', 'concluida', 'erro')),
+    tentativas INTEGER NOT NULL DEFAULT 0,
+    worker TEXT,
+    execucao_id BIGINT,
+    mensagem TEXT,
+    criado_em TIMESTAMPTZ NOT NULL DEFAULT now(),
+    disponivel_em TIMESTAMPTZ NOT NULL DEFAULT now(),
+    iniciado_em TIMESTAMPTZ,
+    heartbeat TIMESTAMPTZ,
+    lease_ate TIMESTAMPTZ,
+    finalizado_em TIMESTAMPTZ
+);
+
+CREATE INDEX IF NOT EXISTS idx_fila_coletas_pendentes ON fila_coletas (disponivel_em, id) WHERE status = 'pendente';
+CREATE INDEX IF NOT EXISTS idx_fila_coletas_em_andamento ON fila_coletas (lease_ate) WHERE status = 'em_andamento';
+CREATE INDEX IF NOT EXISTS idx_fila_coletas_lote ON fila_coletas (lote) WHERE lote IS NOT NULL;
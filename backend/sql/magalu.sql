@@ -0,0 +1,94 @@
+-- Banco Magalu
+
+-- Tabelas de dados coletados particionadas por dia de data_registro; as partições
+-- (<tabela>_AAAAMMDD) são criadas pela aplicação (app/services/particoes.py)
+
+CREATE TABLE IF NOT EXISTS produtos (
+    sku_id TEXT NOT NULL,
+    titulo TEXT,
+    descricao TEXT,
+    marca TEXT,
+    status TEXT,
+    preco NUMERIC,
+    estoque_disponivel INTEGER,
+    data_criacao TIMESTAMPTZ,
+    data_atualizacao TIMESTAMPTZ,
+    vendedor TEXT NOT NULL,
+    data_registro TIMESTAMP NOT NULL,
+    PRIMARY KEY (sku_id, vendedor, data_registro)
+) PARTITION BY RANGE (data_registro);
+
+CREATE TABLE IF NOT EXISTS imagens (
+    id_imagem TEXT NOT NULL,
+    sku_id TEXT NOT NULL,
+    secure_url TEXT,
+    resolucao TEXT,
+    vendedor TEXT NOT NULL,
+    data_registro TIMESTAMP NOT NULL,
+    PRIMARY KEY (id_imagem, sku_id, vendedor, data_registro)
+) PARTITION BY RANGE (data_registro);
+
+-- Um documento por SKU: {"atributo": "valor", ...} (app/services/documentos.py)
+CREATE TABLE IF NOT EXISTS atributos (
+    sku_id TEXT NOT NULL,
+    atributos JSONB NOT NULL,
+    vendedor TEXT NOT NULL,
+    data_registro TIMESTAMP NOT NULL,
+    PRIMARY KEY (sku_id, vendedor, data_registro)
+) PARTITION BY RANGE (data_registro);
+
+CREATE INDEX IF NOT EXISTS idx_atributos_documento ON atributos USING GIN (atributos jsonb_path_ops);
+
+CREATE TABLE IF NOT EXISTS pedidos (
+    id TEXT NOT NULL,
+    status TEXT,
+    data_criacao TIMESTAMPTZ,
+    valor NUMERIC,
+    pagamento_status TEXT,
+    metodo_pagamento TEXT,
+    moeda TEXT,
+    vendedor TEXT NOT NULL,
+    data_registro TIMESTAMP NOT NULL,
+    PRIMARY KEY (id, data_registro)
+) PARTITION BY RANGE (data_registro);
+
+CREATE TABLE IF NOT EXISTS erros_qualidade (
+    sku_id TEXT NOT NULL,
+    produto TEXT,
+    status TEXT,
+    titulo TEXT,
+    qtd_imagem TEXT,
+    resolucao_imagem TEXT,
+    descricao TEXT,
+    atributos TEXT,
+    marca TEXT,
+    imagens_duplicadas TEXT,
+    vendedor TEXT NOT NULL,
+    data_registro TIMESTAMP NOT NULL,
+    PRIMARY KEY (sku_id, vendedor, data_registro)
+) PARTITION BY RANGE (data_registro);
+
+ALTER TABLE erros_qualidade ADD COLUMN IF NOT EXISTS imagens_duplicadas TEXT;
+
+-- Hash das entradas de cada linha (produto, imagens, atributos e regras), usado pela
+-- verificação de qualidade incremental para reavaliar só os SKUs alterados
+ALTER TABLE erros_qualidade ADD COLUMN IF NOT EXISTS hash_entradas BIGINT;
+
+-- Staging da coleta em andamento (mesmas colunas das tabelas definitivas, sem partições:
+-- recebe as páginas de SKUs durante a coleta e é promovido ao final, com uma linha por chave)
+CREATE TABLE IF NOT EXISTS stg_produtos (LIKE produtos INCLUDING DEFAULTS, PRIMARY KEY (sku_id, vendedor));
+CREATE TABLE IF NOT EXISTS stg_imagens (LIKE imagens INCLUDING DEFAULTS, PRIMARY KEY (id_imagem, sku_id, vendedor));
+CREATE TABLE IF NOT EXISTS stg_atributos (LIKE atributos INCLUDING DEFAULTS, PRIMARY KEY (sku_id, vendedor));
+
+-- Dimensões lidas das imagens (cache da sondagem, por URL e ETag) e hash perceptual
+-- usado na detecção de imagens duplicadas
+CREATE TABLE IF NOT EXISTS imagens_sondadas (
+    url TEXT PRIMARY KEY,
+    etag TEXT,
+    largura INTEGER,
+    altura INTEGER,
+    hash_perceptual BIGINT,
+    verificado_em TIMESTAMP NOT NULL
+);
+
+ALTER TABLE imagens_sondadas ADD COLUMN IF NOT EXISTS hash_perceptual BIGINT;
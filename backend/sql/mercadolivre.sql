@@ -0,0 +1,115 @@
+-- Banco Mercado Livre
+
+-- Tabelas de dados coletados particionadas por dia de data_registro; as partições
+-- (<tabela>_AAAAMMDD) são criadas pela aplicação (app/services/particoes.py)
+
+CREATE TABLE IF NOT EXISTS produtos (
+    sku_id TEXT NOT NULL,
+    titulo TEXT,
+    descricao TEXT,
+    categoria_id TEXT,
+    nome_categoria TEXT,
+    preco NUMERIC,
+    quantidade_variacoes INTEGER,
+    status TEXT,
+    health TEXT,
+    quantidade_inicial INTEGER,
+    quantidade_vendida INTEGER,
+    quantidade_disponivel INTEGER,
+    gtin TEXT,
+    marca TEXT,
+    permalink TEXT,
+    aceita_mercado_pago BOOLEAN,
+    garantia TEXT,
+    imagens INTEGER,
+    link_imagem TEXT,
+    vendedor TEXT NOT NULL,
+    data_registro TIMESTAMP NOT NULL,
+    PRIMARY KEY (sku_id, vendedor, data_registro)
+) PARTITION BY RANGE (data_registro);
+
+CREATE TABLE IF NOT EXISTS imagens (
+    id_imagem TEXT NOT NULL,
+    sku_id TEXT NOT NULL,
+    secure_url TEXT,
+    resolucao TEXT,
+    vendedor TEXT NOT NULL,
+    data_registro TIMESTAMP NOT NULL,
+    PRIMARY KEY (id_imagem, sku_id, vendedor, data_registro)
+) PARTITION BY RANGE (data_registro);
+
+-- Um documento por SKU: {"atributo": "valor", ...} (app/services/documentos.py)
+CREATE TABLE IF NOT EXISTS atributos (
+    sku_id TEXT NOT NULL,
+    atributos JSONB NOT NULL,
+    vendedor TEXT NOT NULL,
+    data_registro TIMESTAMP NOT NULL,
+    PRIMARY KEY (sku_id, vendedor, data_registro)
+) PARTITION BY RANGE (data_registro);
+
+CREATE INDEX IF NOT EXISTS idx_atributos_documento ON atributos USING GIN (atributos jsonb_path_ops);
+
+-- Um documento por SKU: [{"id_variacao", "preco_variacao", "atributos": {"atributo": "valor"}}, ...]
+CREATE TABLE IF NOT EXISTS variacoes (
+    sku_id TEXT NOT NULL,
+    variacoes JSONB NOT NULL,
+    vendedor TEXT NOT NULL,
+    data_registro TIMESTAMP NOT NULL,
+    PRIMARY KEY (sku_id, vendedor, data_registro)
+) PARTITION BY RANGE (data_registro);
+
+CREATE INDEX IF NOT EXISTS idx_variacoes_documento ON variacoes USING GIN (variacoes jsonb_path_ops);
+
+CREATE TABLE IF NOT EXISTS erros_qualidade (
+    id BIGSERIAL,
+    sku_id TEXT NOT NULL,
+    vendedor TEXT NOT NULL,
+    produto TEXT,
+    status TEXT,
+    titulo TEXT,
+    qtd_imagem TEXT,
+    resolucao_imagem TEXT,
+    descricao TEXT,
+    garantia TEXT,
+    atributos TEXT,
+    imagens_duplicadas TEXT,
+    data_registro TIMESTAMP NOT NULL,
+    PRIMARY KEY (id, data_registro)
+) PARTITION BY RANGE (data_registro);
+
+ALTER TABLE erros_qualidade ADD COLUMN IF NOT EXISTS imagens_duplicadas TEXT;
+
+-- Hash das entradas de cada linha (produto, imagens, atributos e regras), usado pela
+-- verificação de qualidade incremental para reavaliar só os SKUs alterados
+ALTER TABLE erros_qualidade ADD COLUMN IF NOT EXISTS hash_entradas BIGINT;
+
+CREATE INDEX IF NOT EXISTS idx_erros_qualidade_vendedor ON erros_qualidade (vendedor, data_registro);
+
+-- Staging das coletas retomáveis (mesmas colunas das tabelas definitivas, sem partições:
+-- guarda só a coleta em andamento, com uma linha por chave)
+CREATE TABLE IF NOT EXISTS stg_produtos (LIKE produtos INCLUDING DEFAULTS, PRIMARY KEY (sku_id, vendedor));
+CREATE TABLE IF NOT EXISTS stg_imagens (LIKE imagens INCLUDING DEFAULTS, PRIMARY KEY (id_imagem, sku_id, vendedor));
+CREATE TABLE IF NOT EXISTS stg_atributos (LIKE atributos INCLUDING DEFAULTS, PRIMARY KEY (sku_id, vendedor));
+CREATE TABLE IF NOT EXISTS stg_variacoes (LIKE variacoes INCLUDING DEFAULTS, PRIMARY KEY (sku_id, vendedor));
+
+-- Checkpoint da coleta em andamento de cada vendedor
+CREATE TABLE IF NOT EXISTS checkpoints_coleta (
+    vendedor TEXT PRIMARY KEY,
+    ids JSONB NOT NULL,
+    posicao INTEGER NOT NULL DEFAULT 0,
+    iniciado_em TIMESTAMP NOT NULL,
+    atualizado_em TIMESTAMP NOT NULL
+);
+
+-- Dimensões lidas das imagens (cache da sondagem, por URL e ETag) e hash perceptual
+-- usado na detecção de imagens duplicadas
+CREATE TABLE IF NOT EXISTS imagens_sondadas (
+    url TEXT PRIMARY KEY,
+    etag TEXT,
+    largura INTEGER,
+    altura INTEGER,
+    hash_perceptual BIGINT,
+    verificado_em TIMESTAMP NOT NULL
+);
+
+ALTER TABLE imagens_sondadas ADD COLUMN IF NOT EXISTS hash_perceptual BIGINT;